@@ -1,12 +1,66 @@
-from flask import Flask
+import time
+from flask import Flask, Response, g, request
 from flask_cors import CORS
 
 def create_app():
     app = Flask(__name__)
     CORS(app)  # 启用跨域资源共享
-    
+
+    # 先解析配置（环境变量与.env），日志配置才能读到其中的FLOORPLAN_LOG_*选项
+    from app.services import config
+    config.get_settings()
+
+    # 统一日志配置：队列异步写出、请求体截断与采样、结构化JSON输出、按模块设置级别、密钥脱敏
+    from app.services import log_setup
+    log_setup.init_app(app)
+
+    # 记录启动时的配置（.env变更或收到SIGHUP时自动重新加载）
+    config.init_app(app)
+
     # 导入并注册蓝图
     from app.routes import api_bp
     app.register_blueprint(api_bp)
-    
-    return app 
\ No newline at end of file
+
+    # 请求耗时统计与Prometheus指标导出
+    from app.services import metrics
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('request_start', None)
+        if start is not None and request.endpoint != 'metrics':
+            metrics.HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                endpoint=request.endpoint or 'unknown',
+                method=request.method,
+                status=str(response.status_code))
+        return response
+
+    @app.route('/metrics', methods=['GET'], endpoint='metrics')
+    def metrics_endpoint():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    # 响应缓存预热接口
+    from app.services import response_cache
+    response_cache.init_app(app)
+
+    # 响应格式协商、压缩与ETag
+    from app.services import encoding
+    encoding.init_app(app)
+
+    # 按需性能剖析（默认关闭，需设置FLOORPLAN_PROFILING=1）
+    from app.services import profiling
+    profiling.init_app(app)
+
+    # 其余服务在首次使用时才初始化；只在后台预热FLOORPLAN_PREWARM中配置的部分（默认为LLM连接池）
+    from app.services import startup
+    startup.init_app(app)
+
+    # 常见户型的预生成平面图池（FLOORPLAN_POOL=1时在空闲时段按令牌预算后台填充）
+    from app.services import plan_pool
+    plan_pool.init_app(app)
+
+    return app
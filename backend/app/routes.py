@@ -1,55 +1,152 @@
-from flask import Blueprint, request, jsonify, Response, stream_with_context
-from app.services import floor_plan_service
+from flask import Blueprint, request, jsonify, Response, stream_with_context, g
+from app.services import floor_plan_service, split_tree, tracing, log_setup, admission, plan_store, plan_feed, startup, plan_pool, \
+    boundary_registry
 import traceback
 import logging
 import os
 import json
 import datetime
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
+# Setup logging (configured once by log_setup in create_app)
 logger = logging.getLogger(__name__)
 
+# numpy-backed services are imported by the first request that uses them
+apartment_builder = startup.lazy_module("app.services.apartment_builder")
+plan_render = startup.lazy_module("app.services.plan_render")
+spatial_index = startup.lazy_module("app.services.spatial_index")
+plan_metrics = startup.lazy_module("app.services.plan_metrics")
+wall_graph = startup.lazy_module("app.services.wall_graph")
+boundary = startup.lazy_module("app.services.boundary")
+
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
+@api_bp.before_request
+def start_request_trace():
+    """
+    Assign a trace ID to every API request (continuing the caller's trace when it sends a
+    traceparent header) and make the request span current for the services it calls
+    """
+    g.trace_span = tracing.start_trace(
+        f"{request.method} {request.path}",
+        request.headers.get('traceparent'),
+        endpoint=request.endpoint
+    )
+    g.trace_token = tracing.attach(g.trace_span)
+
+@api_bp.after_request
+def add_trace_header(response):
+    span = g.get('trace_span')
+    if span is not None:
+        span.set_attribute('status_code', response.status_code)
+        response.headers['X-Trace-Id'] = span.trace_id
+    return response
+
+@api_bp.teardown_request
+def end_request_trace(exc):
+    token = g.pop('trace_token', None)
+    if token is not None:
+        tracing.detach(token)
+    # Streamed responses take the span over and end it when the stream finishes
+    span = g.pop('trace_span', None)
+    if span is not None and not g.pop('trace_streamed', False):
+        span.end(error=exc)
+
+def _variants_arg(data):
+    """Number of layouts asked for in a generation request body (1 when missing)"""
+    variants = data.get('variants', 1)
+    if isinstance(variants, bool) or not isinstance(variants, int) \
+            or not 1 <= variants <= floor_plan_service.MAX_VARIANTS:
+        raise ValueError(f"variants must be an integer from 1 to {floor_plan_service.MAX_VARIANTS}")
+    return variants
+
+def _check_boundary(boundary_data):
+    """
+    Reject boundaries the layout cannot use (not a list of shape objects, no area, separate parts
+    or holes) before any work starts
+
+    Returns:
+    - Error message, or None when the boundary is usable
+    """
+    if not isinstance(boundary_data, list) or not all(isinstance(shape, dict) for shape in boundary_data):
+        return 'Invalid boundary data: expected a list of shape objects'
+    try:
+        boundary.boundary_polygon(boundary_data)
+    except (ValueError, TypeError, KeyError, IndexError) as e:
+        return f'Invalid boundary data: {str(e)}'
+    return None
+
+def _registered_boundary(data):
+    """
+    Boundary of a generation request body: boundary_data as sent, or the boundary registered under
+    boundary_id together with its processed form (waiting for the analysis if still running)
+
+    Returns:
+    - (boundary_data, processed_boundary); boundary_data is None for an unknown boundary_id
+    """
+    boundary_data = data.get('boundary_data')
+    if boundary_data or not data.get('boundary_id'):
+        return boundary_data, None
+    registry = boundary_registry.get_registry()
+    entry = registry.get(str(data['boundary_id']))
+    if entry is None:
+        return None, None
+    return entry['boundary_data'], registry.processed_boundary(entry)
+
 @api_bp.route('/generate-floor-plan', methods=['POST'])
+@admission.admit
 def generate_floor_plan():
     """
     Receive boundary data and description from frontend to generate a floor plan
     
     Request body should contain:
-    - boundary_data: Boundary shape data array
+    - boundary_data: Boundary shape data array (or boundary_id of a boundary registered with POST /api/boundaries)
     - description: Floor plan text description
     - preferences: Optional preference settings
+    - variants: Optional number of different layouts to generate in one model call (default 1)
     
     Returns:
-    - Generated floor plan JSON data
+    - Generated floor plan JSON data (with several variants: the best one plus all of them ranked)
     """
     try:
         data = request.get_json()
-        logger.info(f"Received request data: {data}")
+        logger.info("Received request data: %s", log_setup.payload(data), extra=log_setup.SAMPLED)
         
         if not data:
             return jsonify({'error': 'Missing request data'}), 400
             
         # Extract necessary inputs
-        boundary_data = data.get('boundary_data')
+        boundary_data, processed_boundary = _registered_boundary(data)
         description = data.get('description')
         preferences = data.get('preferences', {})
         
         # Validate inputs
+        if not boundary_data and data.get('boundary_id'):
+            return jsonify({'error': f"Unknown boundary id: {data['boundary_id']}"}), 404
+        
         if not boundary_data:
             return jsonify({'error': 'Missing boundary data'}), 400
             
         if not description:
             return jsonify({'error': 'Missing description text'}), 400
+        
+        # Registered boundaries were checked when they were registered
+        boundary_error = _check_boundary(boundary_data) if processed_boundary is None else None
+        if boundary_error:
+            return jsonify({'error': boundary_error}), 400
+        
+        try:
+            variants = _variants_arg(data)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid request parameter: {str(e)}'}), 400
             
         # Call service to process request
-        logger.info(f"Starting floor plan generation, description: {description[:50]}...")
+        logger.info("Starting floor plan generation, description: %.50s...", description)
         floor_plan_json, success, message = floor_plan_service.generate_floor_plan(
             boundary_data, 
             description,
-            preferences
+            preferences,
+            variants=variants,
+            processed_boundary=processed_boundary
         )
         
         if not success:
@@ -72,41 +169,56 @@ def generate_floor_plan():
 
 
 @api_bp.route('/generate-floor-plan-stream', methods=['POST'])
+@admission.admit
 def generate_floor_plan_stream():
     """
     Stream floor plan generation
     
     Request body should contain:
-    - boundary_data: Boundary shape data array
+    - boundary_data: Boundary shape data array (or boundary_id of a boundary registered with POST /api/boundaries)
     - description: Floor plan text description
     - preferences: Optional preference settings
+    - variants: Optional number of different layouts to generate in one model call (default 1)
     
     Returns:
     - SSE (Server-Sent Events) formatted streaming response
     """
     try:
         data = request.get_json()
-        logger.info(f"Received streaming request data: {data}")
+        logger.info("Received streaming request data: %s", log_setup.payload(data), extra=log_setup.SAMPLED)
         
         if not data:
             return jsonify({'error': 'Missing request data'}), 400
             
         # Extract necessary inputs
-        boundary_data = data.get('boundary_data')
+        boundary_data, processed_boundary = _registered_boundary(data)
         description = data.get('description')
         preferences = data.get('preferences', {})
         
         # Validate inputs
+        if not boundary_data and data.get('boundary_id'):
+            return jsonify({'error': f"Unknown boundary id: {data['boundary_id']}"}), 404
+        
         if not boundary_data:
             return jsonify({'error': 'Missing boundary data'}), 400
             
         if not description:
             return jsonify({'error': 'Missing description text'}), 400
         
+        # Registered boundaries were checked when they were registered
+        boundary_error = _check_boundary(boundary_data) if processed_boundary is None else None
+        if boundary_error:
+            return jsonify({'error': boundary_error}), 400
+        
+        try:
+            variants = _variants_arg(data)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid request parameter: {str(e)}'}), 400
+        
         def generate():
             try:
                 # Call streaming generation service
-                logger.info(f"Starting streaming floor plan generation, description: {description[:50]}...")
+                logger.info("Starting streaming floor plan generation, description: %.50s...", description)
                 
                 # Send initial status
                 yield 'data: {"type": "start", "message": "Starting floor plan generation..."}\n\n'
@@ -115,7 +227,9 @@ def generate_floor_plan_stream():
                 for chunk in floor_plan_service.generate_floor_plan_stream(
                     boundary_data, 
                     description,
-                    preferences
+                    preferences,
+                    variants=variants,
+                    processed_boundary=processed_boundary
                 ):
                     # Send each chunk as SSE format
                     yield f'data: {chunk}\n\n'
@@ -127,9 +241,10 @@ def generate_floor_plan_stream():
                 logger.error(f"Error during streaming generation: {error_msg}")
                 yield f'data: {{"type": "error", "error": "{error_msg}"}}\n\n'
         
-        # Return streaming response
+        # Return streaming response, traced until the last chunk is sent
+        g.trace_streamed = True
         return Response(
-            stream_with_context(generate()), 
+            stream_with_context(tracing.traced_stream(g.trace_span, generate())), 
             mimetype='text/event-stream',
             headers={
                 'Cache-Control': 'no-cache',
@@ -151,9 +266,11 @@ def save_floor_plan_to_local():
     Request body should contain:
     - data: Floor plan JSON data to save
     - path: Target path (default is Grasshopper Libraries folder)
+    - session: Optional session ID (or X-Session-Id header)
+    - description: Optional floor plan description, indexed for search
     
     Returns:
-    - Result of save operation
+    - Result of save operation, with the plan store record
     """
     try:
         data = request.get_json()
@@ -169,34 +286,783 @@ def save_floor_plan_to_local():
         if not floor_plan_data:
             return jsonify({'error': 'Missing floor plan data'}), 400
         
-        # Ensure target directory exists
-        os.makedirs(path, exist_ok=True)
-        
-        # Fixed filename for the floor plan
-        filename = "floor_plan.json"
-        file_path = os.path.join(path, filename)
-        
-        # Remove any existing floor plan JSON files
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                logger.info(f"Removed existing floor plan file: {file_path}")
-        except Exception as e:
-            logger.warning(f"Error removing existing file: {str(e)}")
-        
-        # Save JSON data to file
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(floor_plan_data, f, ensure_ascii=False, indent=2)
-        
-        logger.info(f"Floor plan data saved to: {file_path}")
+        # Keep the save in the plan store, then replace floor_plan.json atomically so that
+        # readers never see a half-written file
+        store = plan_store.get_store()
+        record = store.save(
+            floor_plan_data,
+            session=data.get('session') or request.headers.get('X-Session-Id'),
+            description=data.get('description'),
+            target_path=path
+        )
+        file_path = store.publish(record['id'], floor_plan_data, path)
+        plan_feed.get_feed().notify()
+        if file_path is None:
+            file_path = os.path.join(path, plan_store.TARGET_FILENAME)
+            logger.info(f"Newer floor plan already written to {file_path}, plan {record['id']} kept in store only")
+        else:
+            logger.info(f"Floor plan data saved to: {file_path}")
         
         return jsonify({
             'success': True,
             'message': f'Floor plan saved to {file_path}',
-            'file_path': file_path
+            'file_path': file_path,
+            'plan': record
         })
         
     except Exception as e:
         error_detail = traceback.format_exc()
         logger.error(f"Error saving floor plan data: {str(e)}\n{error_detail}")
-        return jsonify({'error': str(e), 'detail': error_detail}), 500 
\ No newline at end of file
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+def _int_arg(name, default=None):
+    value = request.args.get(name)
+    if value in (None, ''):
+        return default
+    return int(value)
+
+def _time_arg(name):
+    """Unix timestamp or ISO 8601 query parameter"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+@api_bp.route('/plans', methods=['GET'])
+def list_plans():
+    """
+    List saved floor plans, newest first
+    
+    Query parameters:
+    - limit / offset: Pagination (default 20, at most 200)
+    - session, q (description text), rooms, bedrooms, path: Filters
+    - since / until: Time range (Unix timestamp or ISO 8601)
+    
+    Returns:
+    - Plan records, total count and the offset of the next page
+    """
+    try:
+        limit = _int_arg('limit', plan_store.DEFAULT_PAGE_SIZE)
+        offset = _int_arg('offset', 0)
+        plans, total = plan_store.get_store().list(
+            limit, offset,
+            session=request.args.get('session'),
+            query=request.args.get('q'),
+            rooms=_int_arg('rooms'),
+            bedrooms=_int_arg('bedrooms'),
+            target_path=request.args.get('path'),
+            since=_time_arg('since'),
+            until=_time_arg('until')
+        )
+        next_offset = offset + len(plans)
+        return jsonify({
+            'plans': plans,
+            'total': total,
+            'offset': offset,
+            'next_offset': next_offset if next_offset < total else None
+        })
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {str(e)}'}), 400
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error listing floor plans: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/plans/latest', methods=['GET'])
+def get_latest_plan():
+    """
+    Latest saved floor plan, optionally for one target path (?path=) or session (?session=).
+    Readers can use this instead of reading floor_plan.json.
+    """
+    try:
+        record, plan = plan_store.get_store().latest(request.args.get('path'), request.args.get('session'))
+        if record is None:
+            return jsonify({'error': 'No saved floor plan'}), 404
+        return jsonify({'plan': record, 'data': plan})
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error loading latest floor plan: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+def _rect_arg():
+    """Root rectangle from ?rect=x,y,width,height"""
+    value = request.args.get('rect')
+    if not value:
+        return None
+    x, y, width, height = (float(v) for v in value.split(','))
+    return {'x': x, 'y': y, 'width': width, 'height': height}
+
+@api_bp.route('/plans/feed', methods=['GET'])
+def plan_feed_poll():
+    """
+    Long-poll for the next plan version of a target path (?path=) or session (?session=)
+    
+    Query parameters:
+    - since: Version (plan ID) the caller already has, 0 for the whole plan
+    - timeout: Seconds to wait for a newer version (default 25, at most 60)
+    - rect: Optional root rectangle "x,y,width,height" to include moved rooms and their rectangles
+    
+    Returns:
+    - Structural diff from version since (or the whole plan), 204 when nothing changed in time
+      or the new version was deleted before it could be read
+    """
+    try:
+        since = _int_arg('since', 0)
+        timeout = min(float(request.args.get('timeout', plan_feed.DEFAULT_WAIT_SECONDS)), plan_feed.MAX_WAIT_SECONDS)
+        rect = _rect_arg()
+        feed = plan_feed.get_feed()
+        record = feed.wait(since, timeout, request.args.get('path'), request.args.get('session'))
+        message = feed.update(record, since, rect) if record is not None else None
+        if message is None:
+            return Response(status=204)
+        return jsonify(message)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {str(e)}'}), 400
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error polling plan feed: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/plans/feed/stream', methods=['GET'])
+def plan_feed_stream():
+    """
+    Server-Sent Events version of /plans/feed: one event per new version (the event ID is the
+    version, so reconnecting clients resume with Last-Event-ID), and a comment as keep-alive
+    """
+    try:
+        since = int(request.headers.get('Last-Event-ID') or request.args.get('since') or 0)
+        rect = _rect_arg()
+        target_path = request.args.get('path')
+        session = request.args.get('session')
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {str(e)}'}), 400
+
+    def generate(since):
+        feed = plan_feed.get_feed()
+        while True:
+            record = feed.wait(since, plan_feed.DEFAULT_WAIT_SECONDS, target_path, session)
+            if record is None:
+                yield ': keep-alive\n\n'
+                continue
+            message = feed.update(record, since, rect)
+            since = record['id']
+            if message is None:
+                # Deleted before it could be read, keep waiting for the next version
+                continue
+            yield f"id: {since}\ndata: {json.dumps(message, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+    g.trace_streamed = True
+    return Response(
+        stream_with_context(tracing.traced_stream(g.trace_span, generate(since))),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',  # Prevent Nginx buffering
+            'Connection': 'keep-alive'
+        }
+    )
+
+
+@api_bp.route('/plans/diff', methods=['GET'])
+def plan_diff():
+    """
+    Structural diff between two saved plans (?from=<id>&to=<id>, optional rect)
+    """
+    try:
+        store = plan_store.get_store()
+        old_record, old_plan = store.get(_int_arg('from'))
+        new_record, new_plan = store.get(_int_arg('to'))
+        if old_record is None or new_record is None:
+            return jsonify({'error': 'Floor plan not found'}), 404
+        diff = split_tree.diff_trees(old_plan, new_plan, _rect_arg())
+        diff['from_version'] = old_record['id']
+        diff['to_version'] = new_record['id']
+        return jsonify(diff)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid query parameter: {str(e)}'}), 400
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error comparing floor plans: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/plans/<int:plan_id>', methods=['GET', 'DELETE'])
+def plan_detail(plan_id):
+    """
+    GET: Saved floor plan and its record
+    DELETE: Remove the save (its data is removed once no other save shares it)
+    """
+    try:
+        store = plan_store.get_store()
+        if request.method == 'DELETE':
+            if not store.delete(plan_id):
+                return jsonify({'error': f'Floor plan {plan_id} not found'}), 404
+            return jsonify({'success': True, 'message': f'Floor plan {plan_id} deleted'})
+        record, plan = store.get(plan_id)
+        if record is None:
+            return jsonify({'error': f'Floor plan {plan_id} not found'}), 404
+        return jsonify({'plan': record, 'data': plan})
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error accessing floor plan {plan_id}: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/edit-floor-plan', methods=['POST'])
+def edit_floor_plan():
+    """
+    Apply geometric edits to a split tree locally, without another LLM generation
+
+    Request body should contain:
+    - split: Split tree to edit (or an object containing it under split/root/json_result)
+    - operations: List of edits, e.g. {"op": "move_partition", "path": "rootL", "ratio": 0.4},
+      {"op": "swap", "path": "rootR"}, {"op": "merge", "path": "rootLR"},
+      {"op": "rename", "name": "rootLL", "new_name": "study", "mergeid": "extra"}
+    - rect or boundary_data: Rectangle of the root node
+
+    Returns:
+    - Updated split tree, laid-out rooms and the node paths that changed
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Missing request data'}), 400
+
+        if not data.get('split'):
+            return jsonify({'error': 'Missing split tree'}), 400
+
+        result, success, message = split_tree.edit_floor_plan(
+            data.get('split'),
+            data.get('operations', []),
+            rect=data.get('rect'),
+            boundary_data=data.get('boundary_data')
+        )
+
+        if not success:
+            return jsonify({'error': message}), 400
+
+        result['message'] = message
+        return jsonify(result)
+
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error editing floor plan: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/apartments/build', methods=['POST'])
+def build_apartments():
+    """
+    Build Spatial OS apartment objects (bounds, facade, circulation, split) from split trees
+
+    Request body should contain:
+    - apartments: List of apartment specs, each with a split tree and a boundary
+      (bounds.corners, corners or boundary_data); facade/circulation are inferred when missing
+
+    Returns:
+    - Apartment objects in the database export format and per-item errors
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Missing request data'}), 400
+
+        specs = data.get('apartments')
+        if not isinstance(specs, list) or not specs:
+            return jsonify({'error': 'Missing apartments'}), 400
+
+        apartments, errors = apartment_builder.build_apartments(specs)
+        return jsonify({
+            'apartments': apartments,
+            'errors': errors
+        })
+
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error building apartments: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/apartments/walls', methods=['POST'])
+def build_wall_graph():
+    """
+    Convert split trees into the rooms / walls / openings format (see example_floorplan.json)
+    
+    Request body should contain:
+    - apartments: List of apartment specs as for /apartments/build, or
+    - database: List of database apartment IDs
+    All apartments are converted together, walls between neighbouring apartments are shared
+    
+    Returns:
+    - rooms, walls, openings, nodes, unplaced (door/open requests without a shared wall) and per-item errors
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Missing request data'}), 400
+
+        specs = data.get('apartments')
+        if specs is None and isinstance(data.get('database'), list):
+            specs = [plan_render.find_apartment(i) for i in data['database']]
+            missing = [i for i, spec in zip(data['database'], specs) if spec is None]
+            if missing:
+                return jsonify({'error': f'Apartments not found: {missing[:20]}'}), 404
+        if not isinstance(specs, list) or not specs:
+            return jsonify({'error': 'Missing apartments'}), 400
+
+        graph, errors = wall_graph.build_wall_graph(specs)
+        graph['errors'] = errors
+        return jsonify(graph)
+
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error building wall graph: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+def _render_options(default_width, default_labels):
+    width = _int_arg('width', default_width)
+    labels = request.args.get('labels')
+    labels = default_labels if labels is None else labels.lower() not in ('0', 'false', 'no', 'off')
+    return width, labels
+
+def _svg_response(svg, key):
+    """SVG with its content hash as ETag, so unchanged thumbnails are answered with 304"""
+    response = Response(svg, mimetype='image/svg+xml')
+    response.set_etag(key, weak=True)
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response
+
+@api_bp.route('/render', methods=['POST'])
+def render_plan():
+    """
+    Render a plan to SVG
+    
+    Request body: apartment or plan with a split tree and optionally a boundary
+    (bounds.corners, corners, boundary_data or rect) and facade/circulation segments
+    Query parameters: width (pixels, default 480), labels (default on)
+    
+    Returns:
+    - image/svg+xml
+    """
+    try:
+        spec = request.get_json()
+        if not spec:
+            return jsonify({'error': 'Missing request data'}), 400
+        width, labels = _render_options(plan_render.DEFAULT_WIDTH, True)
+        svg, key = plan_render.render_cached(spec, width, labels)
+        return _svg_response(svg, key)
+    except (ValueError, TypeError, KeyError, IndexError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error rendering floor plan: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/render/plans/<int:plan_id>.svg', methods=['GET'])
+def render_saved_plan(plan_id):
+    """Render a saved plan (optional ?rect=x,y,width,height for its boundary)"""
+    try:
+        record, plan = plan_store.get_store().get(plan_id)
+        if record is None:
+            return jsonify({'error': f'Floor plan {plan_id} not found'}), 404
+        width, labels = _render_options(plan_render.DEFAULT_WIDTH, True)
+        spec = dict(plan) if isinstance(plan, dict) else {'split': plan}
+        rect = _rect_arg()
+        if rect:
+            spec['rect'] = rect
+        svg, key = plan_render.render_cached(spec, width, labels)
+        return _svg_response(svg, key)
+    except (ValueError, TypeError, KeyError, IndexError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error rendering floor plan {plan_id}: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/render/database/<apartment_id>.svg', methods=['GET'])
+def render_database_apartment(apartment_id):
+    """Render an apartment of the database export"""
+    try:
+        apartment = plan_render.find_apartment(apartment_id)
+        if apartment is None:
+            return jsonify({'error': f'Apartment {apartment_id} not found'}), 404
+        width, labels = _render_options(plan_render.DEFAULT_WIDTH, True)
+        svg, key = plan_render.render_cached(apartment, width, labels)
+        return _svg_response(svg, key)
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error rendering apartment {apartment_id}: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/render/database', methods=['GET'])
+def database_gallery():
+    """
+    Page of database apartments with SVG thumbnails
+    
+    Query parameters:
+    - limit / offset: Pagination (default 50, at most 200)
+    - bedrooms: Optional filter
+    - width / labels: Thumbnail options (default 160 pixels, no labels)
+    """
+    try:
+        limit = min(max(_int_arg('limit', 50), 1), plan_store.MAX_PAGE_SIZE)
+        offset = max(_int_arg('offset', 0), 0)
+        bedrooms = _int_arg('bedrooms')
+        width, labels = _render_options(plan_render.THUMBNAIL_WIDTH, False)
+        apartments = [a for a in plan_render.load_database()
+                      if bedrooms is None or a.get('bedrooms') == bedrooms]
+        page = apartments[offset:offset + limit]
+        svgs, errors, cached = plan_render.render_many(page, width, labels)
+        return jsonify({
+            'apartments': [{
+                'id': a.get('id'),
+                'bedrooms': a.get('bedrooms'),
+                'bathrooms': a.get('bathrooms'),
+                'area': a.get('area'),
+                'svg': svg
+            } for a, svg in zip(page, svgs)],
+            'errors': errors,
+            'cached': cached,
+            'total': len(apartments),
+            'next_offset': offset + len(page) if offset + len(page) < len(apartments) else None
+        })
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {str(e)}'}), 400
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error rendering database gallery: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/render/bulk', methods=['POST'])
+def render_bulk():
+    """
+    Render many plans at once, in parallel worker processes
+    
+    Request body should contain:
+    - plans: List of plans/apartments (as for /render), or
+    - database: List of database apartment IDs
+    - width / labels: Optional thumbnail options (default 160 pixels, no labels)
+    
+    Returns:
+    - SVG strings in request order (null where rendering failed), per-item errors and the cache hit count
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Missing request data'}), 400
+        specs = data.get('plans')
+        if specs is None and isinstance(data.get('database'), list):
+            specs = [plan_render.find_apartment(i) for i in data['database']]
+            missing = [i for i, spec in zip(data['database'], specs) if spec is None]
+            if missing:
+                return jsonify({'error': f'Apartments not found: {missing[:20]}'}), 404
+        if not isinstance(specs, list) or not specs:
+            return jsonify({'error': 'Missing plans'}), 400
+        try:
+            width = int(data.get('width', plan_render.THUMBNAIL_WIDTH))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid request parameter: width must be an integer'}), 400
+        svgs, errors, cached = plan_render.render_many(specs, width, bool(data.get('labels', False)))
+        return jsonify({'svgs': svgs, 'errors': errors, 'cached': cached})
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error rendering floor plans: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+def _floats_arg(name, count):
+    """Comma-separated numbers from a query parameter, e.g. ?bbox=minx,miny,maxx,maxy"""
+    value = request.args.get(name)
+    if not value:
+        raise ValueError(f"Missing {name}")
+    numbers = [float(v) for v in value.split(',')]
+    if len(numbers) != count:
+        raise ValueError(f"{name} needs {count} numbers")
+    return numbers
+
+def _spatial_response(results):
+    return jsonify({'results': results, 'count': len(results)})
+
+@api_bp.route('/spatial/window', methods=['GET'])
+def spatial_window():
+    """
+    Database apartments, rooms or facade/circulation segments intersecting a box (world coordinates)
+    
+    Query parameters:
+    - bbox: "min_x,min_y,max_x,max_y"
+    - layer: apartments (default), rooms, facade or circulation
+    """
+    try:
+        box = _floats_arg('bbox', 4)
+        return _spatial_response(spatial_index.get_index().window(box, request.args.get('layer', 'apartments')))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {str(e)}'}), 400
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error querying spatial index: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/spatial/nearest', methods=['GET'])
+def spatial_nearest():
+    """
+    Items closest to a point, closest first, each with its distance (0 inside a polygon)
+    
+    Query parameters:
+    - x / y: The point
+    - k: Number of items (default 1, at most 200)
+    - max_distance: Optional search radius
+    - layer: apartments (default), rooms, facade or circulation
+    """
+    try:
+        x, y = float(request.args['x']), float(request.args['y'])
+        k = min(max(_int_arg('k', 1), 1), plan_store.MAX_PAGE_SIZE)
+        max_distance = float(request.args.get('max_distance', 'inf'))
+        return _spatial_response(spatial_index.get_index().nearest(
+            x, y, request.args.get('layer', 'apartments'), k, max_distance))
+    except (KeyError, ValueError) as e:
+        return jsonify({'error': f'Invalid query parameter: {str(e)}'}), 400
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error querying spatial index: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/spatial/intersect', methods=['GET'])
+def spatial_intersect():
+    """
+    Items touched or crossed by a line segment
+    
+    Query parameters:
+    - line: "x0,y0,x1,y1"
+    - layer: facade (default), circulation, apartments or rooms
+    """
+    try:
+        segment = _floats_arg('line', 4)
+        return _spatial_response(spatial_index.get_index().intersect_segment(
+            segment, request.args.get('layer', 'facade')))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {str(e)}'}), 400
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error querying spatial index: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/spatial/facing', methods=['GET'])
+def spatial_facing():
+    """
+    Facade segments facing a line (e.g. a street edge or a neighbouring facade)
+    
+    Query parameters:
+    - line: "x0,y0,x1,y1"
+    - distance: Maximum distance from the line (default 20)
+    - angle: Maximum deviation from parallel in degrees (default 15)
+    - layer: facade (default) or circulation
+    
+    Returns:
+    - Segments sorted by distance, each with its distance and overlap length along the line
+    """
+    try:
+        segment = _floats_arg('line', 4)
+        results = spatial_index.get_index().facing(
+            segment,
+            float(request.args.get('distance', spatial_index.DEFAULT_FACING_DISTANCE)),
+            float(request.args.get('angle', spatial_index.DEFAULT_FACING_ANGLE)),
+            request.args.get('layer', 'facade')
+        )
+        return _spatial_response(results)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {str(e)}'}), 400
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error querying spatial index: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/metrics/plans', methods=['POST'])
+def plan_layout_metrics():
+    """
+    Layout metrics of many plans at once, and their ranking by score
+    
+    Request body should contain:
+    - plans: List of plans/apartments (as for /render), or
+    - database: List of database apartment IDs
+    - targets: Optional list (one per plan) of {room name: target area}
+    - rooms: Whether to include per-room metrics and shared walls (default false)
+    
+    Returns:
+    - Plan metrics in request order, the plan indices ordered by score, per-plan errors
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Missing request data'}), 400
+        specs = data.get('plans')
+        if specs is None and isinstance(data.get('database'), list):
+            specs = [plan_render.find_apartment(i) for i in data['database']]
+            missing = [i for i, spec in zip(data['database'], specs) if spec is None]
+            if missing:
+                return jsonify({'error': f'Apartments not found: {missing[:20]}'}), 404
+        if not isinstance(specs, list) or not specs:
+            return jsonify({'error': 'Missing plans'}), 400
+        targets = data.get('targets')
+        if targets is not None and (not isinstance(targets, list) or len(targets) != len(specs)):
+            return jsonify({'error': 'targets needs one entry per plan'}), 400
+        result = plan_metrics.compute(specs, targets)
+        response = {
+            'plans': result.plan_records(),
+            'ranking': [int(i) for i in result.ranking()],
+            'errors': result.errors
+        }
+        if data.get('rooms'):
+            response['rooms'] = result.room_records()
+            response['walls'] = result.wall_records()
+        return jsonify(response)
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error computing plan metrics: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/metrics/database', methods=['GET'])
+def database_layout_metrics():
+    """
+    Layout metrics of the database apartments, for auditing
+    
+    Query parameters:
+    - sort: Plan metric to sort by (default score), prefix with - for descending (default -score)
+    - limit / offset: Pagination (default 50, at most 200)
+    - bedrooms: Optional filter
+    """
+    try:
+        limit = min(max(_int_arg('limit', 50), 1), plan_store.MAX_PAGE_SIZE)
+        offset = max(_int_arg('offset', 0), 0)
+        bedrooms = _int_arg('bedrooms')
+        sort = request.args.get('sort', '-score')
+        field = sort.lstrip('-')
+        if field not in plan_metrics.PLAN_FIELDS:
+            raise ValueError(f"Unknown metric '{field}'")
+        apartments = plan_render.load_database()
+        result = plan_metrics.database_metrics()
+        records = result.plan_records()
+        for record, apartment in zip(records, apartments):
+            record['id'] = apartment.get('id')
+            record['bedrooms'] = apartment.get('bedrooms')
+            record['bathrooms'] = apartment.get('bathrooms')
+        records = [r for r in records if bedrooms is None or r['bedrooms'] == bedrooms]
+        # Missing values sort last in either direction
+        present = sorted((r for r in records if r[field] is not None), key=lambda r: r[field],
+                         reverse=sort.startswith('-'))
+        records = present + [r for r in records if r[field] is None]
+        page = records[offset:offset + limit]
+        return jsonify({
+            'apartments': page,
+            'total': len(records),
+            'next_offset': offset + len(page) if offset + len(page) < len(records) else None
+        })
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {str(e)}'}), 400
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error computing database metrics: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/pool', methods=['GET'])
+def plan_pool_status():
+    """
+    State of the pre-generated plan pool
+    
+    Returns:
+    - enabled, and when enabled: plans, fresh plans, scores and demand per (program, shape
+      class) key, hits/misses and the tokens spent in the last hour against the budget
+    """
+    try:
+        if not plan_pool.pool_enabled():
+            return jsonify({'enabled': False})
+        status = plan_pool.get_pool().status()
+        status['enabled'] = True
+        return jsonify(status)
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error reading plan pool status: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/boundaries', methods=['POST'])
+def register_boundary():
+    """
+    Register a boundary before the description is submitted; its analysis (area, decomposition,
+    similar database apartments, plan pool candidates) starts right away in the background
+    
+    Request body should contain:
+    - boundary_data: Boundary shape data array
+    
+    Returns:
+    - id (content hash, the same boundary always gets the same id) to send as boundary_id with
+      generation requests, status and whether it was newly registered (201) or known (200)
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Missing request data'}), 400
+        
+        boundary_data = data.get('boundary_data')
+        if not isinstance(boundary_data, list) or not boundary_data:
+            return jsonify({'error': 'Missing boundary data'}), 400
+        
+        boundary_error = _check_boundary(boundary_data)
+        if boundary_error:
+            return jsonify({'error': boundary_error}), 400
+        
+        registry = boundary_registry.get_registry()
+        entry, created = registry.register(boundary_data)
+        record = registry.record(entry)
+        record['created'] = created
+        return jsonify(record), 201 if created else 200
+    
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error registering boundary: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
+
+
+@api_bp.route('/boundaries/<boundary_id>', methods=['GET'])
+def get_boundary(boundary_id):
+    """
+    Analysis of a registered boundary
+    
+    Query parameters:
+    - wait: Seconds to wait for a pending analysis (default 0, at most 30)
+    
+    Returns:
+    - id, status (pending, ready or failed) and, once ready, the processed boundary, the prompt
+      outline, similar database apartments and plan pool candidates
+    """
+    try:
+        timeout = min(float(request.args.get('wait') or 0), 30.0)
+        registry = boundary_registry.get_registry()
+        entry = registry.get(boundary_id)
+        if entry is None:
+            return jsonify({'error': f'Unknown boundary id: {boundary_id}'}), 404
+        return jsonify(registry.record(entry, timeout))
+    
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {str(e)}'}), 400
+    except Exception as e:
+        error_detail = traceback.format_exc()
+        logger.error(f"Error reading boundary {boundary_id}: {str(e)}\n{error_detail}")
+        return jsonify({'error': str(e), 'detail': error_detail}), 500
@@ -0,0 +1,8 @@
+def authorized(request, token, header="X-Admin-Token"):
+    """
+    Access check for admin endpoints: the given token in the given header, or a local caller
+    when no token is configured
+    """
+    if token:
+        return request.headers.get(header) == token
+    return request.remote_addr in ('127.0.0.1', '::1')
@@ -0,0 +1,217 @@
+import math
+import hashlib
+import time
+import logging
+import threading
+import functools
+from collections import OrderedDict
+
+from flask import request, jsonify, make_response
+
+from app.services import config, metrics
+from app.services.config import (DEFAULT_MAX_INFLIGHT, DEFAULT_MAX_QUEUE, DEFAULT_QUEUE_TIMEOUT,
+                                 DEFAULT_RATE_PER_MINUTE, DEFAULT_BURST)
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Buckets kept for this many distinct clients, least recently seen ones are dropped first
+MAX_CLIENTS = 10000
+# Hex digits of the SHA-256 of an API key shown in log lines
+KEY_HASH_LENGTH = 12
+
+INFLIGHT = metrics.REGISTRY.gauge(
+    "floorplan_admission_inflight",
+    "Generation requests currently admitted")
+QUEUE_DEPTH = metrics.REGISTRY.gauge(
+    "floorplan_admission_queue_depth",
+    "Generation requests waiting for a free slot")
+LIMITS = metrics.REGISTRY.gauge(
+    "floorplan_admission_limit",
+    "Configured admission limits",
+    ("limit",))
+REJECTIONS = metrics.REGISTRY.counter(
+    "floorplan_admission_rejections_total",
+    "Generation requests rejected with 429",
+    ("reason",))
+QUEUE_WAIT = metrics.REGISTRY.histogram(
+    "floorplan_admission_queue_wait_seconds",
+    "Time admitted requests waited for a slot",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0))
+
+
+class TokenBucket(object):
+    """Refills `rate` tokens per second up to `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self):
+        """
+        Returns:
+        - 0 when a token was taken, otherwise the seconds until one is available
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController(object):
+    """
+    Admission in front of the generation routes:
+    - per-client token buckets (rate_per_minute, burst; 0 disables)
+    - a global cap on admitted requests (max_inflight; 0 disables) with a bounded wait queue
+      (max_queue requests for at most queue_timeout seconds)
+    Requests over a limit are rejected right away instead of piling up behind the provider.
+    """
+
+    def __init__(self, max_inflight=DEFAULT_MAX_INFLIGHT, max_queue=DEFAULT_MAX_QUEUE,
+                 queue_timeout=DEFAULT_QUEUE_TIMEOUT, rate_per_minute=DEFAULT_RATE_PER_MINUTE, burst=DEFAULT_BURST):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.inflight = 0
+        self.waiting = 0
+        self._buckets = OrderedDict()
+        self._bucket_lock = threading.Lock()
+        self._slots = threading.Condition()
+        LIMITS.set(max_inflight, limit="max_inflight")
+        LIMITS.set(max_queue, limit="max_queue")
+        LIMITS.set(queue_timeout, limit="queue_timeout_seconds")
+        LIMITS.set(rate_per_minute, limit="rate_per_minute")
+        LIMITS.set(burst, limit="burst")
+
+    def check_rate(self, client):
+        """
+        Returns:
+        - 0 when the client may proceed, otherwise the seconds to wait
+        """
+        if not self.rate_per_minute:
+            return 0.0
+        with self._bucket_lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate_per_minute / 60.0, max(self.burst, 1))
+                if len(self._buckets) > MAX_CLIENTS:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+            return bucket.take()
+
+    def acquire(self):
+        """
+        Take an in-flight slot, waiting in the bounded queue if needed
+
+        Returns:
+        - Whether a slot was taken
+        """
+        if not self.max_inflight:
+            return True
+        start = time.monotonic()
+        with self._slots:
+            if self.inflight >= self.max_inflight:
+                if self.waiting >= self.max_queue:
+                    return False
+                self.waiting += 1
+                QUEUE_DEPTH.set(self.waiting)
+                try:
+                    deadline = start + self.queue_timeout
+                    while self.inflight >= self.max_inflight:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False
+                        self._slots.wait(remaining)
+                finally:
+                    self.waiting -= 1
+                    QUEUE_DEPTH.set(self.waiting)
+            self.inflight += 1
+            INFLIGHT.set(self.inflight)
+        QUEUE_WAIT.observe(time.monotonic() - start)
+        return True
+
+    def release(self):
+        if not self.max_inflight:
+            return
+        with self._slots:
+            self.inflight -= 1
+            INFLIGHT.set(self.inflight)
+            self._slots.notify()
+
+    def retry_after(self):
+        """Retry-After hint for saturated requests: roughly how long the queue takes to move"""
+        return max(1, int(math.ceil(self.queue_timeout)))
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_controller():
+    """Process-wide admission controller configured from the FLOORPLAN_* limits in the settings"""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                settings = config.get_settings()
+                _controller = AdmissionController(settings.max_inflight, settings.max_queue, settings.queue_timeout,
+                                                  settings.rate_limit, settings.rate_burst)
+    return _controller
+
+
+def client_id(request):
+    """
+    Rate limit bucket of a request: its address. The X-API-Key header is not checked against
+    any configured keys, so a client could pick a fresh one for every request; it is not used
+    to tell clients apart.
+    """
+    return f"ip:{request.remote_addr}"
+
+
+def client_label(request):
+    """Client in log lines: the address, and a short hash of the X-API-Key header when one is sent"""
+    api_key = request.headers.get('X-API-Key')
+    if api_key:
+        return f"{client_id(request)} key:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:KEY_HASH_LENGTH]}"
+    return client_id(request)
+
+
+def admit(view):
+    """
+    Route decorator applying admission control. The in-flight slot is held until the response
+    is closed, so streamed responses keep it until the last chunk is sent.
+    """
+    def reject(reason, message, retry_after):
+        REJECTIONS.inc(reason=reason)
+        logger.warning(f"Rejected generation request from {client_label(request)}: {message}")
+        response = jsonify({'error': message})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        controller = get_controller()
+        wait = controller.check_rate(client_id(request))
+        if wait:
+            return reject("rate_limit", "Too many generation requests, please retry later",
+                          max(1, int(math.ceil(wait))))
+        if not controller.acquire():
+            return reject("saturated", "Server is busy, please retry later", controller.retry_after())
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            controller.release()
+            raise
+        response.call_on_close(controller.release)
+        return response
+
+    return wrapper
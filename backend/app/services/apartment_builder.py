@@ -0,0 +1,348 @@
+import time
+import logging
+import numpy as np
+
+from app.services import geometry, boundary
+from app.services.split_tree import get_split_root, is_leaf, node_area
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Room categories used by the database export's mergeid (bed_1, bath_2, living, kitchen, foyer, extra_1)
+ROOM_KEYWORDS = [
+    ("bath", ("bath", "toilet", "wc", "washroom", "ensuite", "powder")),
+    ("bed", ("bed", "master", "guest", "nursery")),
+    ("kitchen", ("kitchen", "pantry")),
+    ("foyer", ("foyer", "entry", "entrance", "hall", "corridor", "circulation", "lobby", "vestibule")),
+    ("living", ("living", "lounge", "dining", "family", "great")),
+]
+
+# Rooms that want daylight and therefore sit on the facade when no facade is given
+FACADE_CATEGORIES = ("bed", "living", "kitchen")
+CIRCULATION_CATEGORIES = ("foyer",)
+
+APARTMENT_DEFAULTS = {
+    "database": "default",
+    "country": "US",
+    "city": "Berkeley",
+    "name": "Generated Floor Plan"
+}
+
+
+def room_category(node):
+    """Room category of a leaf from its mergeid, type or name"""
+    label = str(node.get("mergeid") or node.get("type") or node.get("name") or "").lower()
+    for category, keywords in ROOM_KEYWORDS:
+        if any(keyword in label for keyword in keywords):
+            return category
+    return "extra"
+
+
+def count_rooms(root):
+    """
+    Count bedrooms and bathrooms. Leaves sharing a mergeid (bed_1 split in two) are one room.
+    """
+    seen = {"bed": set(), "bath": set()}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if is_leaf(node):
+            category = room_category(node)
+            if category in seen:
+                seen[category].add(node.get("mergeid") or node.get("name") or id(node))
+            continue
+        stack.extend(node["children"])
+    return len(seen["bed"]), len(seen["bath"])
+
+
+def boundary_polygon(spec):
+    """
+    Boundary polygon of an apartment spec, from bounds.corners, corners or frontend boundary_data.
+
+    Returns:
+    - (polygon array, y_up) where y_up tells whether y grows upwards (world) or downwards (screen)
+    """
+    corners = (spec.get("bounds") or {}).get("corners") or spec.get("corners")
+    if corners:
+        return geometry.polygon_array(corners), True
+    boundary_data = spec.get("boundary_data")
+    if boundary_data:
+        return boundary.boundary_polygon(boundary_data), False
+    raise ValueError("Apartment needs bounds.corners, corners or boundary_data")
+
+
+def boundary_contacts(polygons, leaves, tolerance=1e-4):
+    """
+    Find where rooms touch the boundary, for many plans at once
+
+    Parameters:
+    - polygons: List of (n, 2) boundary corners, one per plan
+    - leaves: List of (node, rectangle array) lists for the laid-out rooms of each plan
+
+    Returns:
+    - (edge, category, start, end) arrays, one interval per rectangle side lying on a boundary edge:
+      edge indexes geometry.polygons_edges(polygons), start/end run along the edge's varying coordinate
+    """
+    edges, edge_plan = geometry.polygons_edges(polygons)
+    vertical = np.abs(edges[:, 0] - edges[:, 2]) < tolerance
+    horizontal = np.abs(edges[:, 1] - edges[:, 3]) < tolerance
+    # Fixed coordinate and span of each axis-aligned edge
+    fixed = np.where(vertical, edges[:, 0], edges[:, 1])
+    span_low = np.where(vertical, np.minimum(edges[:, 1], edges[:, 3]), np.minimum(edges[:, 0], edges[:, 2]))
+    span_high = np.where(vertical, np.maximum(edges[:, 1], edges[:, 3]), np.maximum(edges[:, 0], edges[:, 2]))
+
+    rects, rect_plan, rect_category = [np.zeros((0, 4))], [], []
+    for plan, plan_leaves in enumerate(leaves):
+        for node, node_rects in plan_leaves:
+            rects.append(node_rects)
+            rect_plan += [plan] * len(node_rects)
+            rect_category += [room_category(node)] * len(node_rects)
+    rects = np.concatenate(rects)
+    rect_category = np.array(rect_category, dtype=str)
+
+    # For every (edge, rectangle) pair of a plan: does a rectangle side lie on the edge, and how much of it
+    edge, rect = geometry.group_pairs(edge_plan, rect_plan, len(polygons))
+    v = vertical[edge]
+    side_low = np.where(v, rects[rect, 0], rects[rect, 1])
+    side_high = np.where(v, rects[rect, 2], rects[rect, 3])
+    on_edge = (np.abs(side_low - fixed[edge]) < tolerance) | (np.abs(side_high - fixed[edge]) < tolerance)
+    on_edge &= v | horizontal[edge]
+    start = np.maximum(np.where(v, rects[rect, 1], rects[rect, 0]), span_low[edge])
+    end = np.minimum(np.where(v, rects[rect, 3], rects[rect, 2]), span_high[edge])
+    hits = on_edge & (end - start > tolerance)
+    return edge[hits], rect_category[rect[hits]], start[hits], end[hits]
+
+
+def _merge_intervals(group, start, end, tolerance=1e-4):
+    """
+    Merge overlapping or touching intervals within each group
+
+    Returns:
+    - (group, start, end) of the merged intervals, sorted by group and start
+    """
+    order = np.lexsort((end, start, group))
+    group, start, end = group[order], start[order], end[order]
+    if not len(group):
+        return group, start, end
+    # Running maximum of the ends within each group, kept exact by working on the ranks of the ends
+    by_end = np.argsort(end, kind="stable")
+    rank = np.empty(len(end), dtype=np.int64)
+    rank[by_end] = np.arange(len(end))
+    offset = group.astype(np.int64) * len(end)
+    reach = end[by_end[np.maximum.accumulate(offset + rank) - offset]]
+    opens = np.ones(len(group), dtype=bool)
+    opens[1:] = (group[1:] != group[:-1]) | (start[1:] > reach[:-1] + tolerance)
+    first = np.nonzero(opens)[0]
+    return group[first], start[first], np.maximum.reduceat(end, first)
+
+
+def _subtract_intervals(group, start, end, removed_group, removed_start, removed_end, tolerance=1e-4):
+    """
+    Remove intervals from merged intervals of the same group, dropping pieces no longer than tolerance.
+    Both sets must be merged (see _merge_intervals).
+
+    Returns:
+    - (group, start, end) of the remaining pieces, sorted by group and start
+    """
+    # Removed intervals cutting into each interval, in order
+    groups = int(max(group.max(initial=-1), removed_group.max(initial=-1))) + 1
+    interval, removed = geometry.group_pairs(group, removed_group, groups)
+    cuts = (removed_end[removed] > start[interval]) & (removed_start[removed] < end[interval])
+    interval, removed = interval[cuts], removed[cuts]
+    # The pieces lie between the interval's start, the cuts and the interval's end
+    every = np.arange(len(group))
+    piece_interval = np.concatenate([every, interval])
+    piece_start = np.concatenate([start, removed_end[removed]])
+    piece_end = np.concatenate([removed_start[removed], end])
+    start_order = np.lexsort((np.concatenate([np.full(len(group), -np.inf), removed_start[removed]]), piece_interval))
+    end_order = np.lexsort((np.concatenate([removed_start[removed], np.full(len(group), np.inf)]),
+                            np.concatenate([interval, every])))
+    piece_interval, piece_start, piece_end = piece_interval[start_order], piece_start[start_order], piece_end[end_order]
+    keep = piece_end - piece_start > tolerance
+    return group[piece_interval[keep]], piece_start[keep], piece_end[keep]
+
+
+def contact_segments(polygons, edge, start, end, tolerance=1e-4):
+    """
+    Turn intervals along boundary edges into segments, following the boundary's direction
+    and joining pieces that continue across collinear corners
+
+    Parameters:
+    - polygons: Boundaries of the plans
+    - edge / start / end: Intervals as returned by boundary_contacts
+
+    Returns:
+    - List of (x0, y0, x1, y1) segment lists, one per polygon
+    """
+    edges, edge_plan = geometry.polygons_edges(polygons)
+    edge, start, end = _merge_intervals(edge, start, end, tolerance)
+    x0, y0, x1, y1 = edges[edge].T
+    vertical = np.abs(x0 - x1) < tolerance
+    forward = np.where(vertical, y1 >= y0, x1 >= x0)
+    # Along the boundary direction: backward edges run from their high end down
+    order = np.lexsort((np.where(forward, start, -start), edge))
+    edge, start, end, x0, y0, vertical, forward = \
+        edge[order], start[order], end[order], x0[order], y0[order], vertical[order], forward[order]
+    a, b = np.where(forward, start, end), np.where(forward, end, start)
+    pieces = np.column_stack([np.where(vertical, x0, a), np.where(vertical, a, y0),
+                              np.where(vertical, x0, b), np.where(vertical, b, y0)])
+    plan = edge_plan[edge]
+    result = [[] for _ in polygons]
+    if not len(pieces):
+        return result
+
+    def joins(previous, following):
+        continues = (np.abs(previous[:, 2] - following[:, 0]) < tolerance) & \
+            (np.abs(previous[:, 3] - following[:, 1]) < tolerance)
+        cross = (previous[:, 2] - previous[:, 0]) * (following[:, 3] - following[:, 1]) - \
+            (previous[:, 3] - previous[:, 1]) * (following[:, 2] - following[:, 0])
+        return continues & (np.abs(cross) < tolerance)
+
+    opens = np.ones(len(pieces), dtype=bool)
+    opens[1:] = (plan[1:] != plan[:-1]) | ~joins(pieces[:-1], pieces[1:])
+    first = np.nonzero(opens)[0]
+    last = np.append(first[1:], len(pieces)) - 1
+    segments = np.column_stack([pieces[first, :2], pieces[last, 2:]])
+    plan = plan[first]
+    # The boundary is closed, so the last segment of a plan may continue into its first
+    plan_first = np.nonzero(np.append(True, plan[1:] != plan[:-1]))[0]
+    plan_last = np.append(plan_first[1:], len(plan)) - 1
+    wraps = plan_last > plan_first
+    wraps[wraps] = joins(segments[plan_last[wraps]], segments[plan_first[wraps]])
+    segments[plan_first[wraps], :2] = segments[plan_last[wraps], :2]
+    keep = np.ones(len(segments), dtype=bool)
+    keep[plan_last[wraps]] = False
+    for p, segment in zip(plan[keep].tolist(), segments[keep].tolist()):
+        result[p].append(tuple(segment))
+    return result
+
+
+def infer_site_segments(polygons, leaves):
+    """
+    Estimate facade and circulation segments of many plans when the site does not provide them:
+    circulation is where entry rooms touch the boundary, facade is where living rooms,
+    bedrooms and kitchens touch it
+
+    Parameters:
+    - polygons: List of boundary corner arrays
+    - leaves: List of (node, rectangle array) lists for the laid-out rooms of each plan
+
+    Returns:
+    - List of (facade segments, circulation segments), one per plan
+    """
+    edge, category, start, end = boundary_contacts(polygons, leaves)
+    at_circulation = np.isin(category, CIRCULATION_CATEGORIES)
+    at_facade = np.isin(category, FACADE_CATEGORIES)
+    circulation = _merge_intervals(edge[at_circulation], start[at_circulation], end[at_circulation])
+    facade = _subtract_intervals(*_merge_intervals(edge[at_facade], start[at_facade], end[at_facade]), *circulation)
+    return list(zip(contact_segments(polygons, *facade), contact_segments(polygons, *circulation)))
+
+
+def infer_facade_and_circulation(polygon, leaves):
+    """infer_site_segments for a single plan"""
+    return infer_site_segments([polygon], [leaves])[0]
+
+
+def _segment(x0, y0, x1, y1):
+    return {"start": geometry.to_point(x0, y0), "end": geometry.to_point(x1, y1)}
+
+
+def _normalize_segments(segments):
+    normalized = []
+    for segment in segments:
+        x0, y0 = geometry.to_xy(segment["start"])
+        x1, y1 = geometry.to_xy(segment["end"])
+        normalized.append(_segment(x0, y0, x1, y1))
+    return normalized
+
+
+def _infer_batch(items):
+    """Lay out the prepared specs together and infer their facade and circulation"""
+    polygons = [polygon for _, _, _, polygon, _ in items]
+    rects, rect_plan = geometry.decompose_polygons(polygons)
+    placed = geometry.layout_regions([root for _, _, root, _, _ in items], rects, rect_plan,
+                                     [y_up for _, _, _, _, y_up in items])
+    leaves = [[(node, region) for node, region in plan.values() if is_leaf(node)] for plan in placed]
+    return infer_site_segments(polygons, leaves)
+
+
+def build_apartments(specs):
+    """
+    Build Spatial OS apartment objects from split trees and boundaries. The boundaries, layouts
+    and facade/circulation inference of all specs are computed together in array passes.
+
+    Parameters:
+    - specs: List of apartment specs, each with a split tree ("split" or any format the LLM returns),
+      a boundary (bounds.corners, corners or boundary_data), and optionally facade, circulation,
+      id, name, database, country and city
+
+    Returns:
+    - apartments: List of apartment objects (None where the spec failed)
+    - errors: List of {"index", "error"} for the specs that failed
+    """
+    apartments = [None] * len(specs)
+    errors = []
+    prepared = []
+    for index, spec in enumerate(specs):
+        try:
+            root = get_split_root(spec.get("split", spec))
+            if root is None:
+                raise ValueError("Missing split tree")
+            polygon, y_up = boundary_polygon(spec)
+            if len(polygon) < 3:
+                raise ValueError("Boundary needs at least 3 corners")
+            # Only the root gets written (its area), the rest of the tree is shared with the spec
+            prepared.append((index, spec, dict(root), polygon, y_up))
+        except (ValueError, TypeError, KeyError) as e:
+            errors.append({"index": index, "error": str(e)})
+
+    # Areas of every boundary in one pass
+    areas = geometry.polygon_areas([item[3] for item in prepared])
+
+    # Layout and facade/circulation inference for the specs without site data, in one batch
+    missing = [item for item in prepared if item[1].get("facade") is None or item[1].get("circulation") is None]
+    try:
+        inferred = dict(zip([item[0] for item in missing], _infer_batch(missing)))
+    except (ValueError, TypeError, KeyError, IndexError):
+        # A malformed tree fails the whole batch: redo the specs one at a time to find it
+        inferred = {}
+        for item in missing:
+            try:
+                inferred[item[0]] = _infer_batch([item])[0]
+            except (ValueError, TypeError, KeyError, IndexError) as e:
+                errors.append({"index": item[0], "error": str(e)})
+
+    for (index, spec, root, polygon, y_up), area in zip(prepared, areas):
+        try:
+            facade = spec.get("facade")
+            circulation = spec.get("circulation")
+            if facade is None or circulation is None:
+                if index not in inferred:
+                    continue
+                inferred_facade, inferred_circulation = inferred[index]
+                if facade is None:
+                    facade = [_segment(*s) for s in inferred_facade]
+                if circulation is None:
+                    circulation = [_segment(*s) for s in inferred_circulation]
+
+            bedrooms, bathrooms = count_rooms(root)
+            apartment = {key: spec.get(key, default) for key, default in APARTMENT_DEFAULTS.items()}
+            apartment["id"] = spec.get("id") or f"apartment-{int(time.time() * 1000)}-{index}"
+            apartment["area"] = float(area)
+            apartment["bedrooms"] = bedrooms
+            apartment["bathrooms"] = bathrooms
+            apartment["bounds"] = {
+                "corners": [geometry.to_point(x, y) for x, y in polygon],
+                "id": (spec.get("bounds") or {}).get("id", "")
+            }
+            apartment["facade"] = _normalize_segments(facade)
+            apartment["circulation"] = _normalize_segments(circulation)
+            if not root.get("area"):
+                root["area"] = node_area(root)
+            apartment["split"] = root
+            apartments[index] = apartment
+        except (ValueError, TypeError, KeyError, IndexError) as e:
+            errors.append({"index": index, "error": str(e)})
+
+    logger.info(f"Built {len(specs) - len(errors)} apartment(s), {len(errors)} failed")
+    return apartments, sorted(errors, key=lambda item: item["index"])
@@ -0,0 +1,181 @@
+import math
+import logging
+
+import numpy as np
+
+from app.services import geometry
+from app.services.split_tree import child_path, ROOT_PATH
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Precision of areas and coordinates written into prompts
+PROMPT_DIGITS = 2
+
+
+def shape_polygon(shape):
+    """
+    Corners of one boundary_data shape in plan units. Shapes are rectangles (x, y, width, height
+    scaled by widthInUnits / width), polygons with points relative to x, y in the same scale
+    (as sent by the frontend), or polygons with absolute corners already in units
+    """
+    corners = shape.get('corners')
+    if corners:
+        return geometry.polygon_array(corners)
+    width = shape.get('width') or shape.get('widthInUnits', 0)
+    # Work in units so that areas are comparable with the LLM's room areas
+    scale = shape.get('widthInUnits', width) / width if width else 1.0
+    x, y = shape.get('x', 0) * scale, shape.get('y', 0) * scale
+    points = shape.get('points')
+    if points:
+        return np.array([(x + px * scale, y + py * scale) for px, py in map(geometry.to_xy, points)], dtype=float)
+    w = shape.get('widthInUnits', width)
+    h = shape.get('heightInUnits', shape.get('height', 0))
+    return np.array([(x, y), (x + w, y), (x + w, y + h), (x, y + h)], dtype=float)
+
+
+def boundary_polygon(boundary_data):
+    """
+    Outline of the union of the boundary shapes, in plan units and frontend orientation (y down).
+    A single shape keeps its exact corners; several are merged on their rectangle decomposition
+    and must overlap or share edges to form one outline without holes (ValueError otherwise).
+    """
+    polygons = [shape_polygon(shape) for shape in boundary_data]
+    polygons = [p for p, area in zip(polygons, geometry.polygon_areas(polygons)) if area > geometry.EPSILON]
+    if not polygons:
+        raise ValueError("Boundary shapes have no area")
+    if len(polygons) == 1:
+        return geometry.simplify_polygon(polygons[0])
+    rects = geometry.decompose_polygons(polygons)[0]
+    pinches = geometry.rects_pinch_points(rects)
+    if pinches:
+        x, y = pinches[0]
+        raise ValueError(f"Boundary shapes touch only at a corner ({x:g}, {y:g}), they must share an edge "
+                         "to form one outline")
+    loops = geometry.rects_outlines(rects)
+    # Parts run counter-clockwise, holes clockwise
+    signed = [np.sum(loop[:, 0] * np.roll(loop[:, 1], -1) - np.roll(loop[:, 0], -1) * loop[:, 1]) for loop in loops]
+    parts = sum(1 for area in signed if area > 0)
+    if parts > 1:
+        raise ValueError(f"Boundary shapes form {parts} separate parts, they must overlap or touch to form one outline")
+    if parts < len(loops):
+        raise ValueError("Boundary shapes enclose a hole, the outline must be a single polygon without holes")
+    return geometry.simplify_polygon(loops[0])
+
+
+def _guillotine_cut(rects):
+    """
+    Axis-aligned line leaving every rectangle on one side, the most balanced one by area
+
+    Returns:
+    - (axis, position), or None when no such line exists
+    """
+    areas = (rects[:, 2] - rects[:, 0]) * (rects[:, 3] - rects[:, 1])
+    best = None
+    for axis in (0, 1):
+        for position in np.unique(rects[:, axis])[1:]:
+            first = rects[:, axis + 2] <= position + geometry.EPSILON
+            second = rects[:, axis] >= position - geometry.EPSILON
+            if not np.all(first | second):
+                continue
+            balance = min(areas[first].sum(), areas[~first].sum())
+            if best is None or balance > best[0]:
+                best = (balance, axis, float(position))
+    return None if best is None else best[1:]
+
+
+def partition_root(rects, y_up=False, path=ROOT_PATH):
+    """
+    Split tree over the rectangles of a partition, cutting along lines that leave every rectangle
+    on one side (rectangles are cut further where no such line exists). Leaves are the rectangles,
+    laid out exactly where they are by geometry.layout_region since areas follow the rectangles.
+
+    Returns:
+    - Root node in the LLM format (angle on the node being cut), leaves carry a "region" rectangle
+    """
+    node = {"name": path, "area": round(geometry.rects_area(rects), PROMPT_DIGITS)}
+    if len(rects) == 1:
+        x0, y0, x1, y1 = (round(float(v), PROMPT_DIGITS) for v in rects[0])
+        node.update(final=False, region={"x": x0, "y": y0, "width": round(x1 - x0, PROMPT_DIGITS),
+                                         "height": round(y1 - y0, PROMPT_DIGITS)})
+        return node
+    cut = _guillotine_cut(rects)
+    if cut is None:
+        # No clean cut, split the rectangles crossing the middle vertical edge
+        edges = np.unique(rects[:, [0, 2]])
+        axis, position = 0, float(edges[len(edges) // 2])
+        low, high = rects.copy(), rects.copy()
+        low[:, 2] = np.minimum(low[:, 2], position)
+        high[:, 0] = np.maximum(high[:, 0], position)
+        rects = np.vstack([low[low[:, 2] - low[:, 0] > geometry.EPSILON],
+                           high[high[:, 2] - high[:, 0] > geometry.EPSILON]])
+    else:
+        axis, position = cut
+    low = rects[rects[:, axis + 2] <= position + geometry.EPSILON]
+    high = rects[rects[:, axis] >= position - geometry.EPSILON]
+    # Vertical cuts put the first child left; horizontal cuts put it on top (high y in world coordinates)
+    first, second = (high, low) if axis == 1 and y_up else (low, high)
+    node.update(angle=round(math.pi / 2, 4) if axis == 0 else 0, final=False,
+                children=[partition_root(first, y_up, child_path(path, 0, 2)),
+                          partition_root(second, y_up, child_path(path, 1, 2))])
+    return node
+
+
+def analyze(boundary_data):
+    """
+    Exact geometry of a boundary: outline, area and bounding box from the polygon itself, and its
+    decomposition into the fewest rectangles with a split tree over them
+
+    Returns:
+    - Dict with polygon (array), area, bounds (x, y, width, height), rectilinear, rects (array)
+      and root (pre-split tree, None for a plain rectangle)
+    """
+    polygon = boundary_polygon(boundary_data)
+    area = float(geometry.polygon_areas([polygon])[0])
+    min_x, min_y = polygon.min(axis=0)
+    max_x, max_y = polygon.max(axis=0)
+    rects = geometry.rectilinear_partition(polygon)
+    return {
+        "polygon": polygon,
+        "area": area,
+        "bounds": {"x": float(min_x), "y": float(min_y), "width": float(max_x - min_x), "height": float(max_y - min_y)},
+        "rectilinear": geometry.is_rectilinear(polygon),
+        "rects": rects,
+        "root": partition_root(rects) if len(rects) > 1 else None,
+    }
+
+
+def shape_features(polygons):
+    """
+    Shape descriptors the database similarity lookup compares: log area, log aspect ratio (long
+    over short side of the bounding box) and the share of the bounding box the outline fills
+
+    Returns:
+    - Array of shape (len(polygons), 3)
+    """
+    areas = geometry.polygon_areas(polygons)
+    bounds = geometry.polygon_bounds(polygons)
+    sides = np.stack([bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1]], axis=1)
+    long_side, short_side = sides.max(axis=1), np.maximum(sides.min(axis=1), geometry.EPSILON)
+    areas = np.maximum(areas, geometry.EPSILON)
+    return np.stack([np.log(areas), np.log(long_side / short_side), areas / (long_side * short_side)], axis=1)
+
+
+# Weights of the descriptors: a 2x area difference costs about as much as a full extra notch
+SIMILARITY_WEIGHTS = np.array([1.0, 1.0, 2.0])
+
+
+def similar_shapes(features, candidates, k=5):
+    """
+    The k candidate outlines closest to one outline by weighted descriptor distance
+
+    Parameters:
+    - features: Descriptors of the outline (see shape_features)
+    - candidates: Descriptors of the candidates, one row each
+
+    Returns:
+    - List of (candidate index, distance), closest first
+    """
+    distances = (np.abs(candidates - features) * SIMILARITY_WEIGHTS).sum(axis=1)
+    order = np.argsort(distances, kind="stable")[:k]
+    return [(int(i), float(distances[i])) for i in order]
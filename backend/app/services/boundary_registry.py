@@ -0,0 +1,197 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from app.services import config, metrics, startup, plan_pool
+from app.services.plan_store import content_hash
+
+# Setup logging (configured once by log_setup in create_app)
+logger = logging.getLogger(__name__)
+
+# numpy-backed modules, imported by the first analysis
+boundary = startup.lazy_module("app.services.boundary")
+plan_render = startup.lazy_module("app.services.plan_render")
+apartment_builder = startup.lazy_module("app.services.apartment_builder")
+plan_metrics = startup.lazy_module("app.services.plan_metrics")
+
+CACHE_NAME = "boundary_registry"
+DEFAULT_MAX_ENTRIES = config.DEFAULT_BOUNDARY_REGISTRY_SIZE
+DEFAULT_WORKERS = config.DEFAULT_BOUNDARY_WORKERS
+DEFAULT_SIMILAR = config.DEFAULT_BOUNDARY_SIMILAR
+# Characters of the content hash used as boundary id
+ID_LENGTH = 24
+
+_database_features = None
+_database_lock = threading.Lock()
+
+
+def boundary_id(boundary_data):
+    """Id of a boundary: its content hash, so the same outline always gets the same id"""
+    return content_hash(boundary_data)[:ID_LENGTH]
+
+
+def database_features():
+    """
+    Shape descriptors of the database apartments (see boundary.shape_features), computed once
+
+    Returns:
+    - (indices into the database of the apartments with an outline, descriptor array)
+    """
+    global _database_features
+    if _database_features is None:
+        with _database_lock:
+            if _database_features is None:
+                indices, polygons = [], []
+                for index, apartment in enumerate(plan_render.load_database()):
+                    try:
+                        polygon, _ = apartment_builder.boundary_polygon(apartment)
+                    except ValueError:
+                        continue
+                    indices.append(index)
+                    polygons.append(polygon)
+                _database_features = (indices, boundary.shape_features(polygons))
+    return _database_features
+
+
+def similar_apartments(polygon, k=DEFAULT_SIMILAR):
+    """
+    Database apartments with the most similar outline (area, aspect ratio, how much of the
+    bounding box it fills), with their layout score
+
+    Returns:
+    - List of {"id", "name", "bedrooms", "bathrooms", "area", "distance", "score"}, closest first
+    """
+    indices, features = database_features()
+    if not indices:
+        return []
+    apartments = plan_render.load_database()
+    scores = plan_metrics.database_metrics().plans["score"]
+    result = []
+    for row, distance in boundary.similar_shapes(boundary.shape_features([polygon])[0], features, k):
+        apartment = apartments[indices[row]]
+        score = float(scores[indices[row]])
+        result.append({"id": apartment.get("id"), "name": apartment.get("name"),
+                       "bedrooms": apartment.get("bedrooms"), "bathrooms": apartment.get("bathrooms"),
+                       "area": round(float(apartment.get("area") or 0), 2), "distance": round(distance, 4),
+                       "score": round(score, 6) if score == score else None})
+    return result
+
+
+class BoundaryRegistry(object):
+    """
+    Boundaries registered ahead of generation, keyed by content hash (LRU, max_entries of them).
+    Registering starts the boundary analysis in a worker thread, so it overlaps with the user
+    typing the description; generation requests then reference the id and reuse the result.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, workers=DEFAULT_WORKERS, similar=DEFAULT_SIMILAR):
+        self.max_entries = max_entries
+        self.similar = similar
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="floorplan-boundary")
+
+    def register(self, boundary_data):
+        """
+        Store a boundary and start its analysis, unless it is registered already
+
+        Returns:
+        - (entry, created)
+        """
+        key = boundary_id(boundary_data)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                metrics.record_cache(CACHE_NAME, True)
+                return entry, False
+            entry = {"id": key, "boundary_data": boundary_data, "created_at": time.time(),
+                     "processed": None, "processed_event": threading.Event()}
+            entry["future"] = self._executor.submit(self._analyze, entry)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        metrics.record_cache(CACHE_NAME, False)
+        return entry, True
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        return entry
+
+    def _analyze(self, entry):
+        """Processed boundary, prompt outline, similar database apartments and pool candidates"""
+        from app.services import floor_plan_service
+        start = time.perf_counter()
+        try:
+            with metrics.stage("boundary_processing", "register"):
+                processed = floor_plan_service.process_boundary_data(entry["boundary_data"])
+            entry["processed"] = processed
+        finally:
+            # Generation requests only wait for this part
+            entry["processed_event"].set()
+        analysis = {"processed": processed, "outline": floor_plan_service.describe_boundary(processed)}
+        # The lookups only add context, a failure leaves the boundary usable for generation
+        try:
+            analysis["similar"] = similar_apartments(boundary.boundary_polygon(entry["boundary_data"]), self.similar)
+        except Exception as e:
+            logger.warning(f"Similarity lookup for boundary {entry['id']} failed: {str(e)}")
+            analysis["similar"] = []
+        try:
+            analysis["pool_candidates"] = plan_pool.get_pool().candidates(processed) if plan_pool.pool_enabled() else []
+        except Exception as e:
+            logger.warning(f"Pool candidates for boundary {entry['id']} failed: {str(e)}")
+            analysis["pool_candidates"] = []
+        analysis["seconds"] = round(time.perf_counter() - start, 4)
+        logger.debug("Analyzed boundary %s in %.1f ms", entry["id"], analysis["seconds"] * 1000)
+        return analysis
+
+    def processed_boundary(self, entry, timeout=None):
+        """
+        Processed boundary of an entry (see floor_plan_service.process_boundary_data), waiting up
+        to timeout seconds (None: until done) when the analysis is still running
+
+        Returns:
+        - Processed boundary, or None when it is not ready or processing failed
+        """
+        entry["processed_event"].wait(timeout)
+        return entry["processed"]
+
+    def record(self, entry, timeout=0):
+        """JSON view of an entry: id, status, the analysis once done or the error"""
+        future = entry["future"]
+        if timeout:
+            wait([future], timeout)
+        result = {"id": entry["id"], "created_at": entry["created_at"]}
+        if not future.done():
+            result["status"] = "pending"
+        elif future.exception() is not None:
+            result.update(status="failed", error=str(future.exception()))
+        else:
+            analysis = dict(future.result())
+            processed = {k: v for k, v in analysis.pop("processed").items() if k != "shapes"}
+            result.update(status="ready", boundary=processed, **analysis)
+        return result
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Process-wide boundary registry (FLOORPLAN_BOUNDARY_REGISTRY_SIZE entries, FLOORPLAN_BOUNDARY_WORKERS threads)"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                settings = config.get_settings()
+                _registry = BoundaryRegistry(settings.boundary_registry_size, settings.boundary_workers,
+                                             settings.boundary_similar)
+    return _registry
@@ -0,0 +1,317 @@
+import os
+import time
+import signal
+import logging
+import threading
+
+from dotenv import dotenv_values, find_dotenv
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+DEFAULT_MODEL = "anthropic/claude-3.7-sonnet"
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_TEMPERATURE = 0.2
+DEFAULT_MAX_TOKENS = 4000  # Large enough for the model to finish the JSON
+# Pooled connections to OpenRouter
+DEFAULT_LLM_POOL_SIZE = 16
+# Admission control: concurrent generations, waiting requests, and per-client rate limits
+DEFAULT_MAX_INFLIGHT = 16
+DEFAULT_MAX_QUEUE = 16
+DEFAULT_QUEUE_TIMEOUT = 2.0
+DEFAULT_RATE_PER_MINUTE = 60
+DEFAULT_BURST = 20
+DEFAULT_MIN_COMPRESS_BYTES = 1024
+DEFAULT_LOG_LEVEL = "INFO"
+DEFAULT_PAYLOAD_CHARS = 500
+DEFAULT_PAYLOAD_ITEMS = 5
+DEFAULT_TRACE_FILE = os.path.join(BACKEND_DIR, 'logs', 'traces.jsonl')
+DEFAULT_TRACE_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_TRACE_BACKUPS = 5
+DEFAULT_JOURNAL_FILE = os.path.join(BACKEND_DIR, 'logs', 'journal', 'generations.jsonl')
+DEFAULT_JOURNAL_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_JOURNAL_BACKUPS = 20
+DEFAULT_PROFILE_DIR = os.path.join(BACKEND_DIR, 'logs', 'profiles')
+DEFAULT_PROFILE_INTERVAL_MS = 5
+# What create_app warms up in the background: comma-separated task names, "none" for nothing
+DEFAULT_PREWARM = "llm"
+DEFAULT_EXPORT = os.path.join(BACKEND_DIR, '..', '_250324_databaseExport.json')
+DEFAULT_STORE_DIR = os.path.join(BACKEND_DIR, 'data', 'plans')
+DEFAULT_THUMBNAIL_DIR = os.path.join(BACKEND_DIR, 'data', 'thumbnails')
+DEFAULT_BOUNDARY_REGISTRY_SIZE = 1000
+DEFAULT_BOUNDARY_WORKERS = 2
+DEFAULT_BOUNDARY_SIMILAR = 5
+DEFAULT_POOL_FILE = os.path.join(BACKEND_DIR, 'data', 'plan_pool.json')
+DEFAULT_POOL_PLANS_PER_KEY = 3
+DEFAULT_POOL_PROGRAMS = 6
+# Tokens the pool scheduler may spend per hour
+DEFAULT_POOL_TOKEN_BUDGET = 100000
+DEFAULT_POOL_INTERVAL = 30.0
+# The pool scheduler only generates when no request came in for this long and none is in flight
+DEFAULT_POOL_IDLE_SECONDS = 10.0
+DEFAULT_POOL_MAX_AGE = 7 * 24 * 3600
+DEFAULT_POOL_MIN_SCORE = 0.6
+# How often (seconds) get_settings() looks at the .env modification time
+RELOAD_CHECK_INTERVAL = 2.0
+
+
+def _float(value, default):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _bool(value, default):
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+class Settings(object):
+    """
+    Resolved settings of the service: the OpenRouter connection and every FLOORPLAN_* option.
+    Values come from the environment, then from the .env file; built once and replaced as a
+    whole when the file changes.
+    """
+
+    def __init__(self, values, env_file=None):
+        api_key = (values.get("OPENROUTER_API_KEY") or "").strip()
+        self.env_file = env_file
+        self.api_key = api_key or None
+        self.base_url = (values.get("OPENROUTER_BASE_URL") or DEFAULT_OPENROUTER_BASE_URL).rstrip("/")
+        self.model = values.get("OPENROUTER_MODEL") or DEFAULT_MODEL
+        self.timeout = _float(values.get("OPENROUTER_TIMEOUT"), DEFAULT_TIMEOUT)
+        self.temperature = _float(values.get("OPENROUTER_TEMPERATURE"), DEFAULT_TEMPERATURE)
+        self.max_tokens = _int(values.get("OPENROUTER_MAX_TOKENS"), DEFAULT_MAX_TOKENS)
+        self.llm_pool_size = _int(values.get("FLOORPLAN_LLM_POOL_SIZE"), DEFAULT_LLM_POOL_SIZE)
+        # "prompt" asks for several layouts in one completion, "n" for n completions
+        self.variants_mode = "n" if (values.get("FLOORPLAN_VARIANTS_MODE") or "").lower() == "n" else "prompt"
+
+        # Limits
+        self.max_inflight = _int(values.get("FLOORPLAN_MAX_INFLIGHT"), DEFAULT_MAX_INFLIGHT)
+        self.max_queue = _int(values.get("FLOORPLAN_MAX_QUEUE"), DEFAULT_MAX_QUEUE)
+        self.queue_timeout = _float(values.get("FLOORPLAN_QUEUE_TIMEOUT"), DEFAULT_QUEUE_TIMEOUT)
+        self.rate_limit = _float(values.get("FLOORPLAN_RATE_LIMIT"), DEFAULT_RATE_PER_MINUTE)
+        self.rate_burst = _int(values.get("FLOORPLAN_RATE_BURST"), DEFAULT_BURST)
+        self.admin_token = values.get("FLOORPLAN_ADMIN_TOKEN") or None
+        self.profiling_token = values.get("FLOORPLAN_PROFILING_TOKEN") or None
+
+        # Responses
+        self.response_cache_size = _int(values.get("FLOORPLAN_RESPONSE_CACHE_SIZE"), 0)
+        self.response_cache_ttl = _float(values.get("FLOORPLAN_RESPONSE_CACHE_TTL"), 0.0)
+        self.compression = _bool(values.get("FLOORPLAN_COMPRESSION"), True)
+        self.compress_min_bytes = _int(values.get("FLOORPLAN_COMPRESS_MIN_BYTES"), DEFAULT_MIN_COMPRESS_BYTES)
+
+        # Logging, tracing, journal and profiling
+        self.log_level = (values.get("FLOORPLAN_LOG_LEVEL") or DEFAULT_LOG_LEVEL).upper()
+        self.log_levels = values.get("FLOORPLAN_LOG_LEVELS") or ""
+        self.log_format = "json" if (values.get("FLOORPLAN_LOG_FORMAT") or "").lower() == "json" else "text"
+        self.log_file = values.get("FLOORPLAN_LOG_FILE") or None
+        self.log_async = _bool(values.get("FLOORPLAN_LOG_ASYNC"), True)
+        self.log_sample = _float(values.get("FLOORPLAN_LOG_SAMPLE"), 1.0)
+        self.log_payload_items = _int(values.get("FLOORPLAN_LOG_PAYLOAD_ITEMS"), DEFAULT_PAYLOAD_ITEMS)
+        self.log_payload_chars = _int(values.get("FLOORPLAN_LOG_PAYLOAD_CHARS"), DEFAULT_PAYLOAD_CHARS)
+        self.tracing = _bool(values.get("FLOORPLAN_TRACING"), False)
+        self.trace_file = values.get("FLOORPLAN_TRACE_FILE") or DEFAULT_TRACE_FILE
+        self.trace_max_bytes = _int(values.get("FLOORPLAN_TRACE_MAX_BYTES"), DEFAULT_TRACE_MAX_BYTES)
+        self.trace_backups = _int(values.get("FLOORPLAN_TRACE_BACKUPS"), DEFAULT_TRACE_BACKUPS)
+        self.journal = _bool(values.get("FLOORPLAN_JOURNAL"), False)
+        self.journal_file = values.get("FLOORPLAN_JOURNAL_FILE") or DEFAULT_JOURNAL_FILE
+        self.journal_max_bytes = _int(values.get("FLOORPLAN_JOURNAL_MAX_BYTES"), DEFAULT_JOURNAL_MAX_BYTES)
+        self.journal_backups = _int(values.get("FLOORPLAN_JOURNAL_BACKUPS"), DEFAULT_JOURNAL_BACKUPS)
+        self.profiling = _bool(values.get("FLOORPLAN_PROFILING"), False)
+        self.profile_dir = values.get("FLOORPLAN_PROFILE_DIR") or DEFAULT_PROFILE_DIR
+        self.profile_sample_rate = _float(values.get("FLOORPLAN_PROFILE_SAMPLE_RATE"), 0.0)
+        self.profile_interval_ms = _float(values.get("FLOORPLAN_PROFILE_INTERVAL_MS"), DEFAULT_PROFILE_INTERVAL_MS)
+        self.profile_allocations = values.get("FLOORPLAN_PROFILE_ALLOCATIONS") or "stream"
+
+        # Data and background services
+        self.prewarm = values.get("FLOORPLAN_PREWARM", DEFAULT_PREWARM)
+        self.database_export = values.get("FLOORPLAN_DATABASE_EXPORT") or DEFAULT_EXPORT
+        self.spatial_index = values.get("FLOORPLAN_SPATIAL_INDEX") or None
+        self.plan_store = values.get("FLOORPLAN_PLAN_STORE") or DEFAULT_STORE_DIR
+        self.thumbnail_dir = values.get("FLOORPLAN_THUMBNAIL_DIR") or DEFAULT_THUMBNAIL_DIR
+        # 0: one render process per CPU
+        self.render_workers = _int(values.get("FLOORPLAN_RENDER_WORKERS"), 0)
+        self.boundary_registry_size = _int(values.get("FLOORPLAN_BOUNDARY_REGISTRY_SIZE"),
+                                           DEFAULT_BOUNDARY_REGISTRY_SIZE)
+        self.boundary_workers = _int(values.get("FLOORPLAN_BOUNDARY_WORKERS"), DEFAULT_BOUNDARY_WORKERS)
+        self.boundary_similar = _int(values.get("FLOORPLAN_BOUNDARY_SIMILAR"), DEFAULT_BOUNDARY_SIMILAR)
+        self.pool = _bool(values.get("FLOORPLAN_POOL"), False)
+        self.pool_file = values.get("FLOORPLAN_POOL_FILE") or DEFAULT_POOL_FILE
+        self.pool_plans_per_key = _int(values.get("FLOORPLAN_POOL_PLANS_PER_KEY"), DEFAULT_POOL_PLANS_PER_KEY)
+        self.pool_programs = _int(values.get("FLOORPLAN_POOL_PROGRAMS"), DEFAULT_POOL_PROGRAMS)
+        self.pool_token_budget = _int(values.get("FLOORPLAN_POOL_TOKEN_BUDGET"), DEFAULT_POOL_TOKEN_BUDGET)
+        self.pool_interval = _float(values.get("FLOORPLAN_POOL_INTERVAL"), DEFAULT_POOL_INTERVAL)
+        self.pool_idle_seconds = _float(values.get("FLOORPLAN_POOL_IDLE_SECONDS"), DEFAULT_POOL_IDLE_SECONDS)
+        self.pool_max_age = _float(values.get("FLOORPLAN_POOL_MAX_AGE"), DEFAULT_POOL_MAX_AGE)
+        self.pool_min_score = _float(values.get("FLOORPLAN_POOL_MIN_SCORE"), DEFAULT_POOL_MIN_SCORE)
+
+    @property
+    def api_key_valid(self):
+        return bool(self.api_key) and self.api_key.startswith("sk-or-")
+
+    def describe(self):
+        """Settings safe to log (the key is reduced to its first characters)"""
+        return {
+            "env_file": self.env_file,
+            "api_key": f"{self.api_key[:10]}..." if self.api_key else None,
+            "base_url": self.base_url,
+            "model": self.model,
+            "timeout": self.timeout,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "max_inflight": self.max_inflight,
+            "max_queue": self.max_queue,
+            "rate_limit": self.rate_limit,
+            "tracing": self.tracing,
+            "journal": self.journal,
+            "pool": self.pool,
+        }
+
+
+def find_env_file():
+    """FLOORPLAN_ENV_FILE, else the nearest .env from the working directory up, else backend/.env"""
+    path = os.environ.get("FLOORPLAN_ENV_FILE") or find_dotenv(usecwd=True)
+    if not path:
+        path = os.path.join(BACKEND_DIR, '.env')
+    return path if os.path.exists(path) else None
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except (OSError, TypeError):
+        return None
+
+
+class ConfigProvider(object):
+    """
+    Loads .env once and caches the resulting Settings. Reloads when the file's modification
+    time changes, or a .env appears or goes away (checked at most every RELOAD_CHECK_INTERVAL
+    seconds), or after reload() (sent on SIGHUP).
+
+    .env values are also exported to os.environ, for subprocesses and libraries that read
+    the environment; variables that were already set in the real environment always win.
+    """
+
+    def __init__(self, env_file=None, check_interval=RELOAD_CHECK_INTERVAL):
+        self._env_file = env_file
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._settings = None
+        self._mtime = None
+        self._checked = 0.0
+        self._reload_requested = False
+        # Keys this provider put into os.environ, which a reload may update or remove
+        self._exported = {}
+
+    def get(self):
+        settings = self._settings
+        if settings is not None and not self._reload_requested:
+            now = time.monotonic()
+            if now - self._checked < self.check_interval:
+                return settings
+            self._checked = now
+            env_file = self._env_file or find_env_file()
+            if env_file == settings.env_file and _mtime(env_file) == self._mtime:
+                return settings
+        return self.reload()
+
+    def request_reload(self):
+        """Reload on next access; safe to call from a signal handler"""
+        self._reload_requested = True
+
+    def _export_env_file(self):
+        env_file = self._env_file or find_env_file()
+        file_values = {}
+        if env_file:
+            try:
+                file_values = {k: v for k, v in dotenv_values(env_file).items() if v is not None}
+            except (OSError, UnicodeDecodeError) as e:
+                logger.error(f"Failed to read {env_file}: {str(e)}")
+        self._export(file_values)
+        return env_file
+
+    def reload(self):
+        """
+        Read .env again and replace the settings. Only reloads are logged: the first load
+        happens before logging is configured, init_app logs it afterwards.
+        """
+        with self._lock:
+            self._reload_requested = False
+            env_file = self._export_env_file()
+            settings = Settings(os.environ, env_file)
+            if self._settings is not None:
+                log_settings(settings, f"Reloaded settings from {env_file}")
+            self._settings = settings
+            self._mtime = _mtime(env_file)
+            self._checked = time.monotonic()
+            return settings
+
+    def _export(self, file_values):
+        for key in list(self._exported):
+            if key not in file_values and os.environ.get(key) == self._exported[key]:
+                del os.environ[key]
+                del self._exported[key]
+        for key, value in file_values.items():
+            current = os.environ.get(key)
+            if current is None or current == self._exported.get(key):
+                os.environ[key] = value
+                self._exported[key] = value
+
+
+def log_settings(settings, message="Loaded settings"):
+    """Log the settings (see Settings.describe) and any problem with the API key"""
+    if not settings.api_key:
+        logger.error("OPENROUTER_API_KEY not set, please check .env file or environment variable")
+    elif not settings.api_key_valid:
+        logger.warning(f"API key has incorrect format: {settings.api_key[:10]}... should start with sk-or-")
+    logger.info(f"{message}: {settings.describe()}")
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = ConfigProvider()
+    return _provider
+
+
+def get_settings():
+    """Current settings; reads no files unless .env changed or a reload was requested"""
+    return get_provider().get()
+
+
+def install_reload_signal():
+    """Reload settings on SIGHUP (POSIX only, and only from the main thread)"""
+    if not hasattr(signal, "SIGHUP") or threading.current_thread() is not threading.main_thread():
+        return False
+    signal.signal(signal.SIGHUP, lambda signum, frame: get_provider().request_reload())
+    return True
+
+
+def init_app(app):
+    """Log the settings resolved at startup and reload them on SIGHUP"""
+    settings = get_settings()
+    log_settings(settings)
+    app.extensions['floorplan_settings'] = get_provider()
+    if install_reload_signal():
+        logger.info("Send SIGHUP to reload settings")
+    return settings
@@ -0,0 +1,170 @@
+import gzip
+import json
+import logging
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from app.services import config
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPES = ("application/msgpack", "application/x-msgpack")
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# "legacy" keeps floor_plan as a JSON string (what the frontend expects),
+# "structured" returns it as a nested object
+FORMATS = ("legacy", "structured")
+# exclude=thinking drops the model's full answer text, exclude=echo the request inputs sent back
+EXCLUDABLE = ("thinking", "echo")
+ECHO_FIELDS = ("boundary_data", "description")
+
+
+def _split(value):
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+def response_options(request):
+    """
+    Representation asked for by the client, from query parameters or X-Response-* headers
+
+    Returns:
+    - Dict with format, fields (list or None), exclude (list) and msgpack (bool)
+    """
+    fmt = (request.args.get("format") or request.headers.get("X-Response-Format") or "legacy").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown response format '{fmt}', expected one of {', '.join(FORMATS)}")
+    fields = _split(request.args.get("fields") or request.headers.get("X-Response-Fields")) or None
+    exclude = _split(request.args.get("exclude") or request.headers.get("X-Response-Exclude"))
+    unknown = [item for item in exclude if item not in EXCLUDABLE]
+    if unknown:
+        raise ValueError(f"Cannot exclude {', '.join(unknown)}, expected one of {', '.join(EXCLUDABLE)}")
+    best = request.accept_mimetypes.best_match((JSON_MIMETYPE,) + MSGPACK_MIMETYPES, default=JSON_MIMETYPE)
+    return {
+        "format": fmt,
+        "fields": fields,
+        "exclude": exclude,
+        "msgpack": msgpack is not None and best in MSGPACK_MIMETYPES,
+    }
+
+
+def _floor_plan_object(value):
+    """floor_plan as an object; answers without valid JSON become {"raw_response": text}"""
+    if not isinstance(value, str):
+        return value
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        return {"raw_response": value}
+    return parsed if isinstance(parsed, dict) else {"raw_response": value}
+
+
+def shape_payload(payload, fmt="legacy", fields=None, exclude=()):
+    """
+    Apply the negotiated format and field selection to a decoded JSON response body
+
+    Parameters:
+    - payload: Decoded response body
+    - fmt: "legacy" or "structured"
+    - fields: Top-level keys to keep, None for all
+    - exclude: Parts to drop ("thinking", "echo")
+
+    Returns:
+    - The reshaped body (payload itself when nothing applies)
+    """
+    if not isinstance(payload, dict):
+        return payload
+    payload = dict(payload)
+    if fields:
+        payload = {k: v for k, v in payload.items() if k in fields}
+    if "echo" in exclude:
+        for key in ECHO_FIELDS:
+            payload.pop(key, None)
+    if "floor_plan" in payload and (fmt == "structured" or "thinking" in exclude):
+        floor_plan = _floor_plan_object(payload["floor_plan"])
+        if "thinking" in exclude and isinstance(floor_plan, dict):
+            floor_plan = {k: v for k, v in floor_plan.items() if k != "thinking_steps"}
+        if fmt == "legacy" and not isinstance(payload["floor_plan"], dict):
+            floor_plan = json.dumps(floor_plan, ensure_ascii=False, separators=(",", ":"))
+        payload["floor_plan"] = floor_plan
+    return payload
+
+
+def compress(data, coding):
+    """Compress a body with "gzip" (reproducible output, so ETags stay stable) or "br" """
+    if coding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def init_app(app):
+    """
+    Negotiate the representation of every JSON response:
+    - compact JSON, with ?format=structured|legacy, ?fields=a,b and ?exclude=thinking,echo
+      (or the X-Response-Format / X-Response-Fields / X-Response-Exclude headers)
+    - MessagePack for Accept: application/msgpack, when the msgpack package is installed
+    - gzip or brotli (when installed) compression per Accept-Encoding for bodies of at least
+      FLOORPLAN_COMPRESS_MIN_BYTES (default 1024; FLOORPLAN_COMPRESSION=0 turns compression off)
+    - ETags on successful responses, with 304 for conditional GET/HEAD requests
+    Streamed responses (Server-Sent Events) are passed through unchanged.
+    """
+    from flask import g, request, jsonify
+
+    settings = config.get_settings()
+    compression, min_bytes = settings.compression, settings.compress_min_bytes
+    codings = (["br"] if brotli is not None else []) + ["gzip"]
+
+    # Compact JSON output (no indentation, even in debug mode)
+    app.config["JSONIFY_PRETTYPRINT_REGULAR"] = False
+    if hasattr(app, "json"):
+        app.json.compact = True
+
+    @app.before_request
+    def negotiate_response():
+        try:
+            g.response_options = response_options(request)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    @app.after_request
+    def encode_response(response):
+        if response.is_streamed or response.direct_passthrough or "Content-Encoding" in response.headers:
+            return response
+        vary = ["Accept-Encoding"]
+        if response.mimetype == JSON_MIMETYPE:
+            vary.append("Accept")
+            options = g.pop("response_options", None)
+            reshape = options and (options["format"] != "legacy" or options["fields"] or options["exclude"])
+            if reshape or (options and options["msgpack"]):
+                payload = response.get_json()
+                if reshape:
+                    payload = shape_payload(payload, options["format"], options["fields"], options["exclude"])
+                if options["msgpack"]:
+                    response.set_data(msgpack.packb(payload, use_bin_type=True))
+                    response.mimetype = MSGPACK_MIMETYPES[0]
+                else:
+                    response.set_data(json.dumps(payload, ensure_ascii=False, separators=(",", ":")))
+        for header in vary:
+            response.vary.add(header)
+
+        if compression and len(response.get_data()) >= min_bytes:
+            coding = request.accept_encodings.best_match(codings)
+            if coding:
+                response.set_data(compress(response.get_data(), coding))
+                response.headers["Content-Encoding"] = coding
+
+        if response.status_code == 200:
+            response.add_etag()
+            if request.method in ("GET", "HEAD"):
+                response.make_conditional(request)
+        return response
@@ -1,165 +1,157 @@
-import os
 import json
 import logging
-from dotenv import load_dotenv, find_dotenv
-import re
+import time
+import threading
 import traceback
-import requests  # Using requests library instead of OpenAI
+from contextlib import contextmanager
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
+from app.services import config, metrics, tracing, response_cache, request_journal, split_tree, startup, plan_pool
+
+# Setup logging (configured once by log_setup in create_app)
 logger = logging.getLogger(__name__)
 
-# Try multiple ways to get API key
+# numpy-backed modules, imported by the first generation (or by the "geometry" prewarm task)
+plan_metrics = startup.lazy_module("app.services.plan_metrics")
+boundary = startup.lazy_module("app.services.boundary")
+geometry = startup.lazy_module("app.services.geometry")
+
+# Most layouts a single generation request may ask for
+MAX_VARIANTS = 6
+
+# Pooled connections to OpenRouter; requests is imported when the session is first needed
+_http_session = None
+_http_session_lock = threading.Lock()
+
 def get_api_key():
-    # 0. First force load .env file
-    try:
-        # Try to load .env file from current and parent directories
-        dotenv_path = find_dotenv(usecwd=True)
-        if dotenv_path:
-            logger.info(f"Found .env file: {dotenv_path}")
-            load_dotenv(dotenv_path)
-        else:
-            logger.warning("find_dotenv() couldn't find .env file")
-            
-            # Try to load from fixed path
-            backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            env_path = os.path.join(backend_dir, '.env')
-            logger.info(f"Trying to load .env file from fixed path: {env_path}")
-            if os.path.exists(env_path):
-                load_dotenv(env_path)
-    except Exception as e:
-        logger.error(f"Failed to load .env file: {str(e)}")
-    
-    # 1. Get from environment variables
-    api_key = os.environ.get("OPENROUTER_API_KEY")
-    if api_key:
-        # Check API key format
-        if api_key.startswith("sk-or-"):
-            logger.info("Valid API key obtained from environment variables")
-            return api_key.strip()  # Ensure no whitespace
-        else:
-            logger.warning(f"API key in environment variables has incorrect format: {api_key[:10]}...")
-        
-    # 2. Try to read directly from .env file
-    try:
-        env_path = find_dotenv()
-        logger.info(f"Trying to read key from .env file: {env_path}")
-        if env_path and os.path.exists(env_path):
-            with open(env_path, 'r') as f:
-                content = f.read()
-                match = re.search(r'OPENROUTER_API_KEY=([^\s]+)', content)
-                if match:
-                    api_key = match.group(1).strip()
-                    if api_key.startswith("sk-or-"):
-                        logger.info("Successfully read API key from .env file")
-                        # Set to environment variable
-                        os.environ["OPENROUTER_API_KEY"] = api_key
-                        return api_key
-                    else:
-                        logger.warning(f"API key in .env file has incorrect format: {api_key[:10]}...")
-    except Exception as e:
-        logger.error(f"Failed to read .env file: {str(e)}")
-        
-    # 3. Try to read from predetermined path
+    """OpenRouter API key from the cached settings (see app/services/config.py)"""
+    return config.get_settings().api_key
+
+def get_base_url():
+    return config.get_settings().base_url
+
+def get_model():
+    return config.get_settings().model
+
+def get_http_session():
+    """Process-wide requests session for OpenRouter calls (FLOORPLAN_LLM_POOL_SIZE connections)"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                import requests  # Using requests library instead of OpenAI
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.get_settings().llm_pool_size,
+                                      max_retries=0)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _http_session = session
+    return _http_session
+
+def prewarm_connection():
+    """
+    Open a pooled connection (DNS, TCP and TLS) to the configured OpenRouter endpoint before the
+    first generation; does nothing without an API key
+    """
+    settings = config.get_settings()
+    if not settings.api_key:
+        return False
+    # Any status will do, only the connection is kept
+    get_http_session().head(settings.base_url, timeout=settings.timeout).close()
+    return True
+
+@contextmanager
+def _stage(name, mode):
+    """Time a block as a generation stage, both as a metric and as a span of the current trace"""
+    with tracing.span(name, mode=mode), metrics.stage(name, mode):
+        yield
+
+def _observe_stage(name, mode, start, end=None, parent=None):
+    """Record an already measured stage (time.perf_counter() readings)"""
+    end = time.perf_counter() if end is None else end
+    metrics.observe_stage(name, mode, end - start)
+    tracing.record_span(name, start, end, parent, mode=mode)
+
+def _journal(mode, boundary_data, description, preferences, variants, payload, status_code, **fields):
+    """Journal a generation request with the upstream request fields and the current trace"""
+    span = tracing.current_span()
+    request_journal.record_generation(
+        mode, boundary_data, description, preferences, payload, status_code,
+        trace_id=span.trace_id if span is not None else None, variants=variants, **fields)
+
+def score_plan(json_obj, boundary_data):
+    """Layout metrics and score of a generated plan (see plan_metrics.py), None when it cannot be laid out"""
+    root = split_tree.get_split_root(json_obj)
+    if root is None:
+        return None
     try:
-        current_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        env_path = os.path.join(current_dir, '.env')
-        logger.info(f"Trying to read key from specified path: {env_path}")
-        if os.path.exists(env_path):
-            with open(env_path, 'r') as f:
-                content = f.read()
-                match = re.search(r'OPENROUTER_API_KEY=([^\s]+)', content)
-                if match:
-                    api_key = match.group(1).strip()
-                    if api_key.startswith("sk-or-"):
-                        logger.info("Successfully read API key from specified path")
-                        # Set to environment variable
-                        os.environ["OPENROUTER_API_KEY"] = api_key
-                        return api_key
-                    else:
-                        logger.warning(f"API key in specified path has incorrect format: {api_key[:10]}...")
+        return plan_metrics.summarize({"split": root, "boundary_data": boundary_data})
     except Exception as e:
-        logger.error(f"Failed to read .env file from specified path: {str(e)}")
-    
-    return None
-
-# Get API key
-OPENROUTER_API_KEY = get_api_key()
-logger.info(f"API key loading status: {'success' if OPENROUTER_API_KEY else 'failure'}")
-if OPENROUTER_API_KEY:
-    logger.info(f"API key first 10 chars: {OPENROUTER_API_KEY[:10]}...")
-else:
-    logger.error("OPENROUTER_API_KEY not set, will try to get it again at runtime")
+        # Scoring is informational, a plan it cannot handle is still returned
+        logger.warning(f"Failed to score floor plan: {str(e)}")
+        return None
 
 def process_boundary_data(boundary_data):
     """
     Process boundary data, extract useful information for model prompt
+
+    Areas and the bounding box are computed on the actual outline (shoelace), so polygon and
+    L-shaped boundaries are measured exactly. Irregular outlines are decomposed into the fewest
+    rectangles and come with a pre-split root the model only has to refine.
     """
-    # Calculate total area and boundary box
-    total_area = 0
+    analysis = boundary.analyze(boundary_data)
+    digits = boundary.PROMPT_DIGITS
+    polygons = [boundary.shape_polygon(shape) for shape in boundary_data]
     shapes_info = []
-    
-    for shape in boundary_data:
-        width_units = shape.get('widthInUnits', 0)
-        height_units = shape.get('heightInUnits', 0)
-        area = width_units * height_units
-        total_area += area
-        
-        shape_info = {
+    for shape, polygon, area in zip(boundary_data, polygons, geometry.polygon_areas(polygons)):
+        min_x, min_y = polygon.min(axis=0)
+        max_x, max_y = polygon.max(axis=0)
+        shapes_info.append({
             'type': shape.get('type', 'rectangle'),
-            'width': width_units,
-            'height': height_units,
-            'area': area,
+            'width': round(float(max_x - min_x), digits),
+            'height': round(float(max_y - min_y), digits),
+            'area': round(float(area), digits),
             'position': {
-                'x': shape.get('x', 0),
-                'y': shape.get('y', 0)
+                'x': round(float(min_x), digits),
+                'y': round(float(min_y), digits)
             }
-        }
-        shapes_info.append(shape_info)
-    
+        })
+
+    bounds = analysis['bounds']
+    plain_rectangle = analysis['rectilinear'] and analysis['root'] is None and len(analysis['polygon']) == 4
     return {
-        'total_area': total_area,
+        'total_area': round(analysis['area'], digits),
         'shapes_count': len(boundary_data),
-        'shapes': shapes_info
+        'shapes': shapes_info,
+        'bounding_box': {key: round(value, digits) for key, value in bounds.items()},
+        'rectilinear': analysis['rectilinear'],
+        'corners': None if plain_rectangle else analysis['polygon'].round(digits).tolist(),
+        'subregions': len(analysis['rects']),
+        'root': analysis['root']
     }
 
-def generate_floor_plan(boundary_data, description, preferences=None):
+def describe_boundary(processed_boundary):
     """
-    Generate floor plan based on boundary data and description
-    
-    Parameters:
-    - boundary_data: Array of boundary shape data
-    - description: Text description of the floor plan
-    - preferences: Optional preferences
-    
-    Returns:
-    - floor_plan_json: Generated floor plan JSON
-    - success: Whether the operation was successful
-    - message: Status or error message
+    Compact prompt text for the boundary outline: the dimensions of a plain rectangle, or the
+    corners and the pre-split root of an irregular outline
     """
-    if not description:
-        return None, False, "Missing text description"
-    
-    if not boundary_data or len(boundary_data) == 0:
-        return None, False, "Missing boundary data"
-    
-    try:
-        # Check API key, might not be obtained at initialization
-        api_key = get_api_key()
-        if not api_key:
-            return None, False, "Cannot get API key, please check .env file or environment variable"
-        
-        # Check API key format
-        if not api_key.startswith("sk-or-"):
-            return None, False, f"API key format incorrect: {api_key[:10]}... should start with sk-or-"
-            
-        # Process boundary data
-        processed_boundary = process_boundary_data(boundary_data)
-        logger.info(f"Processed boundary data: Total area={processed_boundary['total_area']} square meters, shapes count={processed_boundary['shapes_count']}")
-        
-        # Build system prompt
-        system_prompt = """
+    bounds = processed_boundary['bounding_box']
+    if processed_boundary['corners'] is None:
+        return f"Rectangle {bounds['width']} x {bounds['height']} units"
+    corners = json.dumps(processed_boundary['corners'], separators=(',', ':'))
+    text = f"Polygon with corners (x, y; y pointing down) {corners}"
+    root = processed_boundary['root']
+    if root is not None:
+        skeleton = json.dumps(root, separators=(',', ':'))
+        text += (f"\n        - Pre-split into {processed_boundary['subregions']} rectangles. Start from this root and keep its"
+                 f" nodes, names, areas and angles; add children only below its leaves (each leaf's region is its"
+                 f" rectangle), and drop the region fields: {skeleton}")
+    elif not processed_boundary['rectilinear']:
+        text += "\n        - The outline has sloped edges, the rooms along them are cut by the outline"
+    return text
+
+# The prompt texts keep the indentation they were written with, changing it changes the prompts
+SYSTEM_PROMPT = """
         You are a floor plan design assistant. Your task is to create a recursive binary space partitioning tree based on the room requirements provided by the user.
 
         First, analyze the description to identify room types and their relative sizes. Then, create a binary tree where each node represents a rectangular area, with the root node being the entire boundary.
@@ -203,9 +195,9 @@ def generate_floor_plan(boundary_data, description, preferences=None):
 
         Keep your thinking steps clear and logical, and ensure the final JSON is valid and follows the specified format.
         """
-        
-        # Build user prompt, include boundary information and description
-        user_prompt = f"""
+
+def build_user_prompt(processed_boundary, description, preferences=None, variants=1):
+    prompt = f"""
         Please create a binary space partitioning tree for a floor plan based on the following description and boundary constraints:
 
         Description: {description}
@@ -213,7 +205,7 @@ def generate_floor_plan(boundary_data, description, preferences=None):
         Boundary Information:
         - Total area: {processed_boundary['total_area']} units
         - Number of shapes: {processed_boundary['shapes_count']}
-        - Shape details: {json.dumps(processed_boundary['shapes'], indent=2)}
+        - Outline: {describe_boundary(processed_boundary)}
         
         Additional preferences: {json.dumps(preferences, indent=2) if preferences else 'None'}
         
@@ -224,9 +216,284 @@ def generate_floor_plan(boundary_data, description, preferences=None):
         4. Ensure leaf nodes correspond to specific rooms from the description
         5. Use meaningful names for nodes (e.g., "livingRoom", "kitchen", etc.)
         """
+    if variants > 1:
+        prompt += f"""6. Produce {variants} clearly different layouts (different split order, orientation and room placement). Output each one as its own ```json block with the same structure, one after the other, each right after the thinking steps for it
+        """
+    return prompt
+
+def build_messages(boundary_data, description, preferences=None, variants=1):
+    """
+    Chat messages sent to the model for a generation request (variants: layouts asked for in the prompt)
+    """
+    processed_boundary = process_boundary_data(boundary_data)
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_user_prompt(processed_boundary, description, preferences, variants)}
+    ]
+
+def warm_response_cache(entries):
+    """
+    Pre-populate the response cache from journal entries, without calling the model
+
+    Parameters:
+    - entries: Journal entries (see request_journal.record_generation)
+
+    Returns:
+    - count: Number of cached responses
+    - success: Whether the operation was successful
+    - message: Status or error message
+    """
+    cache = response_cache.get_cache()
+    settings = config.get_settings()
+    if not cache.enabled:
+        return 0, False, "Response cache is disabled, set FLOORPLAN_RESPONSE_CACHE_SIZE"
+    count = 0
+    for entry in entries:
+        upstream = entry.get("upstream") or {}
+        request_data = entry.get("request") or {}
+        if upstream.get("status_code") != 200 or upstream.get("error") or not upstream.get("content"):
+            continue
+        if not request_data.get("boundary_data") or not request_data.get("description"):
+            continue
+        # Same key as the journaled request: its sampling fields, and the variants in the prompt
+        # unless they were asked for as n completions
+        variants = request_data.get("variants") or 1
+        payload = {
+            "model": upstream.get("model") or settings.model,
+            "messages": build_messages(request_data["boundary_data"], request_data["description"],
+                                       request_data.get("preferences"), 1 if upstream.get("n") else variants),
+            "temperature": upstream.get("temperature", settings.temperature),
+            "max_tokens": upstream.get("max_tokens") or settings.max_tokens,
+        }
+        if upstream.get("n"):
+            payload["n"] = upstream["n"]
+        cache.put(payload, upstream["content"], upstream.get("usage"))
+        count += 1
+    logger.info(f"Warmed response cache with {count} of {len(entries)} journal entries")
+    return count, True, f"Cached {count} response(s)"
+
+def extract_json_content(result_text):
+    """
+    Find the JSON part of a model response: a ```json block, any code block that parses,
+    or the first balanced {...} in the text
+
+    Returns:
+    - JSON string, or None when nothing was found
+    """
+    # Find JSON content - first try to find ```json and ``` between them
+    json_content = None
+    if "```json" in result_text and "```" in result_text:
+        # Find first ```json following content
+        json_block = result_text.split("```json", 1)[1].split("```", 1)[0].strip()
+        logger.debug("Extracting JSON content from ```json``` block")
+        json_content = json_block
+    elif "```" in result_text:
+        # Try to extract JSON from any code block
+        blocks = result_text.split("```")
+        for i in range(1, len(blocks), 2):
+            # Only process odd index blocks (code block content)
+            potential_json = blocks[i].strip()
+            # If block starts with json, remove it
+            if potential_json.startswith("json"):
+                potential_json = potential_json[4:].strip()
+            
+            try:
+                # Try to parse as JSON
+                json.loads(potential_json)
+                json_content = potential_json
+                logger.debug("Successfully extracted JSON content from code block")
+                break
+            except:
+                continue
+    
+    # If no valid JSON content found, try to extract JSON from entire text
+    if not json_content:
+        # Find first { and last } between them
+        open_brace = result_text.find("{")
+        if open_brace != -1:
+            # Find matching last brace
+            depth = 0
+            close_brace = -1
+            for i in range(open_brace, len(result_text)):
+                if result_text[i] == '{':
+                    depth += 1
+                elif result_text[i] == '}':
+                    depth -= 1
+                    if depth == 0:
+                        close_brace = i
+                        break
+            
+            if close_brace != -1:
+                json_content = result_text[open_brace:close_brace+1]
+                logger.debug("Extracted possible JSON content from text")
+    
+    return json_content
+
+def extract_json_blocks(text, start=0):
+    """
+    Complete ```json blocks of a model response from offset start, in order
+
+    Returns:
+    - List of (JSON string, offset just past the closing fence)
+    """
+    blocks = []
+    while True:
+        open_fence = text.find("```json", start)
+        if open_fence == -1:
+            return blocks
+        close_fence = text.find("```", open_fence + 7)
+        if close_fence == -1:
+            return blocks
+        blocks.append((text[open_fence + 7:close_fence].strip(), close_fence + 3))
+        start = close_fence + 3
+
+def variants_mode():
+    """
+    How several layouts are requested: "prompt" (default) asks for all of them as separate JSON
+    blocks of one completion, "n" asks the provider for n completions of the same prompt
+    """
+    return config.get_settings().variants_mode
+
+class VariantCollector(object):
+    """
+    Split trees of a multi-variant answer, each validated, scored and deduplicated by its
+    canonical tree hash as soon as its JSON block is complete
+    """
+
+    def __init__(self, boundary_data, mode):
+        self.boundary_data = boundary_data
+        self.mode = mode
+        self.variants = []
+        self.duplicates = 0
+        self.invalid = 0
+        self._hashes = set()
+        self._offsets = {}
+
+    def add(self, json_text, choice=0):
+        """Validate one candidate tree; returns the new variant, None when invalid or a duplicate"""
+        try:
+            json_obj = json.loads(json_text)
+        except json.JSONDecodeError:
+            json_obj = None
+        if split_tree.get_split_root(json_obj) is None:
+            self.invalid += 1
+            metrics.record_error("variant_invalid", self.mode)
+            return None
+        tree_hash = split_tree.tree_hash(json_obj)
+        if tree_hash in self._hashes:
+            self.duplicates += 1
+            return None
+        self._hashes.add(tree_hash)
+        variant = {"index": len(self.variants), "choice": choice, "hash": tree_hash, "json_result": json_obj,
+                   "metrics": score_plan(json_obj, self.boundary_data)}
+        self.variants.append(variant)
+        return variant
+
+    def feed(self, text, choice=0):
+        """New variants from the blocks completed in text (the text of one choice so far) since the last call"""
+        new = []
+        for json_text, end in extract_json_blocks(text, self._offsets.get(choice, 0)):
+            self._offsets[choice] = end
+            variant = self.add(json_text, choice)
+            if variant is not None:
+                new.append(variant)
+        return new
+
+    def finish(self, text, choice=0):
+        """For a choice without any ```json block, the JSON found elsewhere in its text"""
+        if choice in self._offsets:
+            return []
+        json_text = extract_json_content(text)
+        variant = self.add(json_text, choice) if json_text else None
+        return [variant] if variant is not None else []
+
+    def response(self, thinking_steps, usage=None):
+        """Full response of the best-scoring variant, with all variants ranked by score"""
+        ranked = sorted(self.variants, key=lambda v: -((v["metrics"] or {}).get("score") or -1.0))
+        full_response = {"thinking_steps": thinking_steps, "json_result": ranked[0]["json_result"]}
+        if usage is not None:
+            full_response["usage"] = usage
+        full_response.update(metrics=ranked[0]["metrics"], variants=ranked,
+                             duplicates=self.duplicates, invalid=self.invalid)
+        return full_response
+
+def _variant_event(variant):
+    """Stream event of a single completed variant"""
+    return json.dumps({
+        "type": "variant",
+        "index": variant["index"],
+        "hash": variant["hash"],
+        "floor_plan": json.dumps({"json_result": variant["json_result"], "metrics": variant["metrics"]},
+                                 separators=(",", ":"))
+    })
+
+def generate_floor_plan(boundary_data, description, preferences=None, use_pool=True, variants=1,
+                        processed_boundary=None):
+    """
+    Generate floor plan based on boundary data and description
+    
+    Parameters:
+    - boundary_data: Array of boundary shape data
+    - description: Text description of the floor plan
+    - preferences: Optional preferences
+    - use_pool: Answer from the plan pool when it has a matching plan (see plan_pool.py)
+    - variants: Number of different layouts to ask for in the same upstream call (1 to MAX_VARIANTS);
+      with more than one the response lists the distinct valid ones ranked by score
+    - processed_boundary: Result of process_boundary_data computed ahead, e.g. when the boundary
+      was registered (see boundary_registry.py)
+    
+    Returns:
+    - floor_plan_json: Generated floor plan JSON
+    - success: Whether the operation was successful
+    - message: Status or error message
+    """
+    if not description:
+        return None, False, "Missing text description"
+    
+    if not boundary_data or len(boundary_data) == 0:
+        return None, False, "Missing boundary data"
+    
+    mode = "generate"
+    try:
+        # Settings are cached, the .env file is only read again when it changes
+        settings = config.get_settings()
+        api_key = settings.api_key
+        if not api_key:
+            metrics.record_error("api_key", mode)
+            return None, False, "Cannot get API key, please check .env file or environment variable"
+        
+        # Check API key format
+        if not api_key.startswith("sk-or-"):
+            metrics.record_error("api_key", mode)
+            return None, False, f"API key format incorrect: {api_key[:10]}... should start with sk-or-"
+            
+        # Process boundary data, unless it was analyzed when the boundary was registered
+        if processed_boundary is None:
+            with _stage("boundary_processing", mode):
+                processed_boundary = process_boundary_data(boundary_data)
+        logger.debug("Processed boundary data: Total area=%s square meters, shapes count=%s",
+                     processed_boundary['total_area'], processed_boundary['shapes_count'])
+        
+        # Common programs on plain rectangles are answered from the pre-generated plan pool
+        if use_pool and variants == 1 and plan_pool.pool_enabled():
+            with _stage("pool_lookup", mode):
+                pooled = plan_pool.get_pool().lookup(boundary_data, processed_boundary, description, preferences)
+            if pooled is not None:
+                return json.dumps(pooled, separators=(",", ":")), True, "Served floor plan from the plan pool"
+        
+        # Build system prompt
+        prompt_start = time.perf_counter()
+        system_prompt = SYSTEM_PROMPT
+        variant_mode = variants_mode() if variants > 1 else None
+        
+        # Build user prompt, include boundary information and description
+        user_prompt = build_user_prompt(processed_boundary, description, preferences,
+                                        variants if variant_mode == "prompt" else 1)
+        _observe_stage("prompt_build", mode, prompt_start)
         
         # Send API request
-        logger.info("Sending API request to OpenRouter using requests library")
+        logger.debug("Sending API request to OpenRouter using requests library")
+        llm_span = tracing.start_span("llm_total", mode=mode)
         try:
             # Build request headers - ensure correct format
             headers = {
@@ -236,122 +503,136 @@ def generate_floor_plan(boundary_data, description, preferences=None):
                 "X-Title": "LLM Floor Plan Generator"
             }
             
-            logger.info(f"API request Authorization header: Bearer {api_key[:10]}...")
+            headers.update(tracing.propagation_headers(llm_span))
             
             # Build request body
             payload = {
-                "model": "anthropic/claude-3.7-sonnet",
+                "model": settings.model,
                 "messages": [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
-                "temperature": 0.2,
-                "max_tokens": 4000,  # Increase token count to ensure complete JSON generation
+                "temperature": settings.temperature,
+                "max_tokens": settings.max_tokens,
                 "stream": False  # Default non-streaming response
             }
+            if variant_mode == "prompt":
+                # All layouts come back in one completion
+                payload["max_tokens"] = settings.max_tokens * variants
+            elif variant_mode == "n":
+                payload["n"] = variants
             
-            # Send request
-            response = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=60  # Set 60 seconds timeout
-            )
-            
-            # Check response status
-            if response.status_code != 200:
-                error_msg = f"API request failed, status code: {response.status_code}, response: {response.text}"
-                logger.error(error_msg)
-                return None, False, error_msg
+            # Identical requests can be answered from the response cache
+            choice_texts = None
+            cached = response_cache.get_cache().get(payload)
+            if cached is not None:
+                logger.debug("Using cached model response")
+                result = {"choices": [{"message": {"content": cached["content"]}}], "usage": cached["usage"]}
+                llm_span.set_attribute("cached", True)
+                llm_span.end()
+                _journal(mode, boundary_data, description, preferences, variants, payload, 200,
+                         content=cached["content"], usage=cached["usage"], cached=True)
+            else:
+                # Send request
+                llm_start = time.perf_counter()
+                response = get_http_session().post(
+                    f"{settings.base_url}/chat/completions",
+                    headers=headers,
+                    json=payload,
+                    timeout=settings.timeout
+                )
+                # Without streaming the headers only arrive once the whole completion is generated
+                _observe_stage("upstream_connect", mode, llm_start, llm_start + response.elapsed.total_seconds(), llm_span)
                 
-            # Process response
-            result = response.json()
-            logger.info("Successfully received API response")
+                # Check response status
+                if response.status_code != 200:
+                    error_msg = f"API request failed, status code: {response.status_code}, response: {response.text}"
+                    logger.error(error_msg)
+                    metrics.record_error(f"upstream_{response.status_code}", mode)
+                    llm_span.end(error=error_msg)
+                    _journal(mode, boundary_data, description, preferences, variants, payload, response.status_code,
+                             latency_ms=(time.perf_counter() - llm_start) * 1000, error=response.text[:2000])
+                    return None, False, error_msg
+                    
+                # Process response
+                result = response.json()
+                llm_seconds = time.perf_counter() - llm_start
+                metrics.observe_stage("llm_total", mode, llm_seconds)
+                metrics.record_usage(result.get("usage"), mode, llm_seconds)
+                llm_span.set_attribute("usage", result.get("usage"))
+                llm_span.end()
+                logger.debug("Successfully received API response")
+                if variant_mode == "n":
+                    # One text for the cache and the journal, the completions one after the other
+                    choice_texts = [choice["message"]["content"] or "" for choice in result["choices"]]
+                    result["choices"] = [{"message": {"content": "\n\n".join(choice_texts)}}]
+                content = result["choices"][0]["message"]["content"]
+                response_cache.get_cache().put(payload, content, result.get("usage"))
+                _journal(mode, boundary_data, description, preferences, variants, payload, 200,
+                         content=content, usage=result.get("usage"), latency_ms=llm_seconds * 1000)
         except Exception as api_error:
             logger.error(f"API call failed: {str(api_error)}\n{traceback.format_exc()}")
+            metrics.record_error(type(api_error).__name__, mode)
+            llm_span.end(error=api_error)
+            _journal(mode, boundary_data, description, preferences, variants, {"model": get_model()}, None,
+                     error=str(api_error))
             return None, False, f"API call failed: {str(api_error)}"
         
         # Extract full response content
         result_text = result["choices"][0]["message"]["content"]
         
-        # Find JSON content - first try to find ```json and ``` between them
-        json_content = None
-        if "```json" in result_text and "```" in result_text:
-            # Find first ```json following content
-            json_block = result_text.split("```json", 1)[1].split("```", 1)[0].strip()
-            logger.info("Extracting JSON content from ```json``` block")
-            json_content = json_block
-        elif "```" in result_text:
-            # Try to extract JSON from any code block
-            blocks = result_text.split("```")
-            for i in range(1, len(blocks), 2):
-                # Only process odd index blocks (code block content)
-                potential_json = blocks[i].strip()
-                # If block starts with json, remove it
-                if potential_json.startswith("json"):
-                    potential_json = potential_json[4:].strip()
-                
-                try:
-                    # Try to parse as JSON
-                    json.loads(potential_json)
-                    json_content = potential_json
-                    logger.info("Successfully extracted JSON content from code block")
-                    break
-                except:
-                    continue
+        if variant_mode is not None:
+            collector = VariantCollector(boundary_data, mode)
+            with _stage("metrics", mode):
+                for choice, text in enumerate(choice_texts or [result_text]):
+                    collector.feed(text, choice)
+                    collector.finish(text, choice)
+            if collector.variants:
+                with _stage("serialization", mode):
+                    floor_plan_json = json.dumps(collector.response(result_text, result.get("usage")),
+                                                 separators=(",", ":"))
+                return floor_plan_json, True, f"Successfully generated {len(collector.variants)} floor plan variant(s)"
         
-        # If no valid JSON content found, try to extract JSON from entire text
-        if not json_content:
-            # Find first { and last } between them
-            open_brace = result_text.find("{")
-            if open_brace != -1:
-                # Find matching last brace
-                depth = 0
-                close_brace = -1
-                for i in range(open_brace, len(result_text)):
-                    if result_text[i] == '{':
-                        depth += 1
-                    elif result_text[i] == '}':
-                        depth -= 1
-                        if depth == 0:
-                            close_brace = i
-                            break
-                
-                if close_brace != -1:
-                    json_content = result_text[open_brace:close_brace+1]
-                    logger.info("Extracted possible JSON content from text")
+        with _stage("json_extraction", mode):
+            json_content = extract_json_content(result_text)
         
         # Validate JSON
         if json_content:
             try:
                 json_obj = json.loads(json_content)
-                formatted_json = json.dumps(json_obj, indent=2)
-                logger.info("JSON validation successful")
+                logger.debug("JSON validation successful")
                 
                 # Save original response for debugging
                 full_response = {
                     "thinking_steps": result_text,
-                    "json_result": json_obj
+                    "json_result": json_obj,
+                    "usage": result.get("usage")
                 }
+                with _stage("metrics", mode):
+                    full_response["metrics"] = score_plan(json_obj, boundary_data)
                 
                 # Return formatted JSON and full response
-                return json.dumps(full_response, indent=2), True, "Successfully generated floor plan"
+                with _stage("serialization", mode):
+                    floor_plan_json = json.dumps(full_response, separators=(",", ":"))
+                return floor_plan_json, True, "Successfully generated floor plan"
             except json.JSONDecodeError as json_error:
                 logger.error(f"JSON parsing failed: {str(json_error)}")
                 logger.error(f"Attempting to parse content: {json_content[:500]}...")
         
         # If no valid JSON could be extracted, return original text
         logger.warning("No valid JSON could be extracted, returning original response")
+        metrics.record_error("no_json", mode)
         return result_text, True, "Generated response without valid JSON structure"
         
     except Exception as e:
         error_detail = traceback.format_exc()
         logger.error(f"Error generating floor plan: {str(e)}\n{error_detail}")
+        metrics.record_error(type(e).__name__, mode)
         error_message = f"Error generating floor plan: {str(e)}"
         return None, False, error_message
 
 
-def generate_floor_plan_stream(boundary_data, description, preferences=None):
+def generate_floor_plan_stream(boundary_data, description, preferences=None, variants=1, processed_boundary=None):
     """
     Generate floor plan using streaming response
     
@@ -359,6 +640,9 @@ def generate_floor_plan_stream(boundary_data, description, preferences=None):
     - boundary_data: Array of boundary shape data
     - description: Text description of the floor plan
     - preferences: Optional preferences
+    - variants: Number of different layouts to ask for; each distinct valid one is sent as a
+      "variant" event as soon as its JSON block is complete
+    - processed_boundary: Result of process_boundary_data computed ahead (see boundary_registry.py)
     
     Returns:
     - Generator object, iterable to get each response fragment
@@ -371,91 +655,56 @@ def generate_floor_plan_stream(boundary_data, description, preferences=None):
         yield json.dumps({"error": "Missing boundary data"})
         return
     
+    mode = "stream"
+    metrics.ACTIVE_STREAMS.inc()
+    llm_span = tracing.NOOP_SPAN
     try:
-        # Check API key, might not be obtained at initialization
-        api_key = get_api_key()
+        # Settings are cached, the .env file is only read again when it changes
+        settings = config.get_settings()
+        api_key = settings.api_key
         if not api_key:
+            metrics.record_error("api_key", mode)
             yield json.dumps({"error": "Cannot get API key, please check .env file or environment variable"})
             return
             
         # Check API key format
         if not api_key.startswith("sk-or-"):
+            metrics.record_error("api_key", mode)
             yield json.dumps({"error": f"API key format incorrect: {api_key[:10]}... should start with sk-or-"})
             return
         
-        # Process boundary data
-        processed_boundary = process_boundary_data(boundary_data)
-        logger.info(f"Processed boundary data: Total area={processed_boundary['total_area']} square meters, shapes count={processed_boundary['shapes_count']}")
+        # Process boundary data, unless it was analyzed when the boundary was registered
+        if processed_boundary is None:
+            with _stage("boundary_processing", mode):
+                processed_boundary = process_boundary_data(boundary_data)
+        logger.debug("Processed boundary data: Total area=%s square meters, shapes count=%s",
+                     processed_boundary['total_area'], processed_boundary['shapes_count'])
+        
+        # Common programs on plain rectangles are answered from the pre-generated plan pool
+        if variants == 1 and plan_pool.pool_enabled():
+            with _stage("pool_lookup", mode):
+                pooled = plan_pool.get_pool().lookup(boundary_data, processed_boundary, description, preferences)
+            if pooled is not None:
+                yield json.dumps({
+                    "type": "final",
+                    "message": "Served floor plan from the plan pool",
+                    "floor_plan": json.dumps(pooled, separators=(",", ":"))
+                })
+                return
         
         # Build system prompt
-        system_prompt = """
-        You are a floor plan design assistant. Your task is to create a recursive binary space partitioning tree based on the room requirements provided by the user.
-
-        First, analyze the description to identify room types and their relative sizes. Then, create a binary tree where each node represents a rectangular area, with the root node being the entire boundary.
-
-        IMPORTANT: Output your response in TWO clearly separated parts:
-        1. Thinking steps: Detailed explanation of your reasoning process
-        2. Final JSON output: ONLY the binary partition tree structure
-
-        For the thinking steps, walk through:
-        0. Analysis of the description to list all room types and sizes you've identified
-        1. Calculate the total area of the given boundary
-        2. Validate if the sum of room areas matches the total area (adjust if needed)
-        3. For each node, choose a split direction (horizontal/vertical) and create two child nodes
-        4. Repeat recursively until each leaf node corresponds to a specific room
-
-        For the JSON output, follow this structure:
-        {
-          "split": {
-            "name": "root",
-            "area": total_area,
-            "angle": 0 or π/2 (0 for horizontal split, π/2 for vertical),
-            "final": false,
-            "children": [
-              {
-                "name": "rootL",
-                "area": area_left,
-                "angle": angle,
-                "final": false/true,
-                "children": [...]
-              },
-              {
-                "name": "rootR",
-                "area": area_right,
-                "angle": angle,
-                "final": false/true,
-                "children": [...]
-              }
-            ]
-          }
-        }
-
-        Keep your thinking steps clear and logical, and ensure the final JSON is valid and follows the specified format.
-        """
+        prompt_start = time.perf_counter()
+        system_prompt = SYSTEM_PROMPT
+        variant_mode = variants_mode() if variants > 1 else None
+        collector = VariantCollector(boundary_data, mode) if variant_mode else None
         
         # Build user prompt, include boundary information and description
-        user_prompt = f"""
-        Please create a binary space partitioning tree for a floor plan based on the following description and boundary constraints:
-
-        Description: {description}
-        
-        Boundary Information:
-        - Total area: {processed_boundary['total_area']} units
-        - Number of shapes: {processed_boundary['shapes_count']}
-        - Shape details: {json.dumps(processed_boundary['shapes'], indent=2)}
-        
-        Additional preferences: {json.dumps(preferences, indent=2) if preferences else 'None'}
-        
-        Remember to:
-        1. First output your THINKING STEPS in detail, showing how you analyze the room requirements and decide on partitioning
-        2. Then output ONLY the final JSON with the binary partition tree structure
-        3. Make sure each split divides the space efficiently according to the described room requirements
-        4. Ensure leaf nodes correspond to specific rooms from the description
-        5. Use meaningful names for nodes (e.g., "livingRoom", "kitchen", etc.)
-        """
+        user_prompt = build_user_prompt(processed_boundary, description, preferences,
+                                        variants if variant_mode == "prompt" else 1)
+        _observe_stage("prompt_build", mode, prompt_start)
         
         # Send API request
-        logger.info("Sending streaming API request to OpenRouter")
+        logger.debug("Sending streaming API request to OpenRouter")
         
         # Build request headers
         headers = {
@@ -465,149 +714,215 @@ def generate_floor_plan_stream(boundary_data, description, preferences=None):
             "X-Title": "LLM Floor Plan Generator"
         }
         
-        logger.info(f"API request Authorization header: Bearer {api_key[:10]}...")
+        llm_span = tracing.start_span("llm_total", mode=mode)
+        headers.update(tracing.propagation_headers(llm_span))
         
         # Build request body
         payload = {
-            "model": "anthropic/claude-3.7-sonnet",
+            "model": settings.model,
             "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
-            "temperature": 0.2,
-            "max_tokens": 4000,  # Increase token count to ensure complete JSON generation
+            "temperature": settings.temperature,
+            "max_tokens": settings.max_tokens,
             "stream": True  # Streaming response
         }
+        if variant_mode == "prompt":
+            # All layouts come back in one completion
+            payload["max_tokens"] = settings.max_tokens * variants
+        elif variant_mode == "n":
+            payload["n"] = variants
         
-        # Send streaming request
-        with requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=60,  # Set 60 seconds timeout
-            stream=True  # Enable streaming transmission
-        ) as response:
-            # Check response status
-            if response.status_code != 200:
-                error_msg = f"API request failed, status code: {response.status_code}, response: {response.text}"
-                logger.error(error_msg)
-                yield json.dumps({"error": error_msg})
-                return
+        # Identical requests can be answered from the response cache
+        cached = response_cache.get_cache().get(payload)
+        if cached is not None:
+            logger.debug("Using cached model response")
+            accumulated_text = cached["content"]
+            llm_span.set_attribute("cached", True)
+            llm_span.end()
+            _journal(mode, boundary_data, description, preferences, variants, payload, 200,
+                     content=accumulated_text, usage=cached["usage"], cached=True)
+            yield json.dumps({
+                "type": "chunk",
+                "content": accumulated_text,
+                "accumulated": accumulated_text
+            })
+            if collector is not None:
+                for variant in collector.feed(accumulated_text):
+                    yield _variant_event(variant)
+        else:
+            # Send streaming request
+            llm_start = time.perf_counter()
+            with get_http_session().post(
+                f"{settings.base_url}/chat/completions",
+                headers=headers,
+                json=payload,
+                timeout=settings.timeout,
+                stream=True  # Enable streaming transmission
+            ) as response:
+                _observe_stage("upstream_connect", mode, llm_start, parent=llm_span)
+                # Check response status
+                if response.status_code != 200:
+                    error_msg = f"API request failed, status code: {response.status_code}, response: {response.text}"
+                    logger.error(error_msg)
+                    metrics.record_error(f"upstream_{response.status_code}", mode)
+                    llm_span.end(error=error_msg)
+                    _journal(mode, boundary_data, description, preferences, variants, payload, response.status_code,
+                             latency_ms=(time.perf_counter() - llm_start) * 1000, error=response.text[:2000])
+                    yield json.dumps({"error": error_msg})
+                    return
             
-            # Process streaming response
-            accumulated_text = ""
-            for line in response.iter_lines():
-                if line:
-                    # Remove SSE prefix "data: "
-                    line_text = line.decode('utf-8')
-                    if line_text.startswith("data: "):
-                        line_data = line_text[6:]  # Remove "data: " prefix
+                # Process streaming response
+                accumulated_text = ""
+                # With n completions the chunks of all of them arrive interleaved, by choice index
+                choice_texts = {}
+                first_token_time = None
+                usage = None
+                finished = False
+                for line in response.iter_lines():
+                    if line:
+                        # Remove SSE prefix "data: "
+                        line_text = line.decode('utf-8')
+                        if line_text.startswith("data: "):
+                            line_data = line_text[6:]  # Remove "data: " prefix
                         
-                        # Process end marker
-                        if line_data == "[DONE]":
-                            break
+                            # Process end marker
+                            if line_data == "[DONE]":
+                                finished = True
+                                break
                             
-                        try:
-                            json_data = json.loads(line_data)
-                            chunk = json_data.get("choices", [{}])[0].get("delta", {}).get("content", "")
-                            if chunk:
-                                accumulated_text += chunk
-                                # Send incremental update
-                                yield json.dumps({
-                                    "type": "chunk", 
-                                    "content": chunk,
-                                    "accumulated": accumulated_text
-                                })
-                        except json.JSONDecodeError:
-                            logger.error(f"Failed to parse streaming response line: {line_data}")
-                        except Exception as e:
-                            logger.error(f"Error processing streaming response line: {str(e)}")
+                            try:
+                                json_data = json.loads(line_data)
+                                # Providers send token usage with the last chunk
+                                if json_data.get("usage"):
+                                    usage = json_data["usage"]
+                                choice_data = (json_data.get("choices") or [{}])[0]
+                                chunk = choice_data.get("delta", {}).get("content", "")
+                                if chunk:
+                                    if first_token_time is None:
+                                        first_token_time = time.perf_counter()
+                                        _observe_stage("time_to_first_token", mode, llm_start, first_token_time, llm_span)
+                                    if variant_mode == "n":
+                                        choice = choice_data.get("index", 0)
+                                        choice_texts[choice] = choice_texts.get(choice, "") + chunk
+                                        # Send incremental update
+                                        yield json.dumps({
+                                            "type": "chunk",
+                                            "choice": choice,
+                                            "content": chunk,
+                                            "accumulated": choice_texts[choice]
+                                        })
+                                        if "`" in chunk:
+                                            for variant in collector.feed(choice_texts[choice], choice):
+                                                yield _variant_event(variant)
+                                        continue
+                                    accumulated_text += chunk
+                                    # Send incremental update
+                                    yield json.dumps({
+                                        "type": "chunk", 
+                                        "content": chunk,
+                                        "accumulated": accumulated_text
+                                    })
+                                    # A JSON block can only be complete once its closing fence arrived
+                                    if collector is not None and "`" in chunk:
+                                        for variant in collector.feed(accumulated_text):
+                                            yield _variant_event(variant)
+                            except json.JSONDecodeError:
+                                logger.error(f"Failed to parse streaming response line: {line_data}")
+                            except Exception as e:
+                                logger.error(f"Error processing streaming response line: {str(e)}")
             
-            # Process full response
-            logger.info("Streaming response received, parsing JSON")
+            if choice_texts:
+                # One text for the cache and the journal, the completions one after the other
+                accumulated_text = "\n\n".join(choice_texts[choice] for choice in sorted(choice_texts))
             
-            # Extract JSON content
-            json_content = None
-            if "```json" in accumulated_text and "```" in accumulated_text:
-                json_block = accumulated_text.split("```json", 1)[1].split("```", 1)[0].strip()
-                logger.info("Extracting JSON content from ```json``` block")
-                json_content = json_block
-            elif "```" in accumulated_text:
-                # Try to extract JSON from any code block
-                blocks = accumulated_text.split("```")
-                for i in range(1, len(blocks), 2):
-                    # Only process odd index blocks (code block content)
-                    potential_json = blocks[i].strip()
-                    # If block starts with json, remove it
-                    if potential_json.startswith("json"):
-                        potential_json = potential_json[4:].strip()
-                    
-                    try:
-                        # Try to parse as JSON
-                        json.loads(potential_json)
-                        json_content = potential_json
-                        logger.info("Successfully extracted JSON content from code block")
-                        break
-                    except:
-                        continue
-            
-            # If no valid JSON content found, try to extract JSON from entire text
-            if not json_content:
-                # Find first { and last } between them
-                open_brace = accumulated_text.find("{")
-                if open_brace != -1:
-                    # Find matching last brace
-                    depth = 0
-                    close_brace = -1
-                    for i in range(open_brace, len(accumulated_text)):
-                        if accumulated_text[i] == '{':
-                            depth += 1
-                        elif accumulated_text[i] == '}':
-                            depth -= 1
-                            if depth == 0:
-                                close_brace = i
-                                break
-                    
-                    if close_brace != -1:
-                        json_content = accumulated_text[open_brace:close_brace+1]
-                        logger.info("Extracted possible JSON content from text")
-            
-            # Validate JSON
-            if json_content:
-                try:
-                    json_obj = json.loads(json_content)
-                    formatted_json = json.dumps(json_obj, indent=2)
-                    logger.info("JSON validation successful")
-                    
-                    # Send final result
-                    full_response = {
-                        "thinking_steps": accumulated_text,
-                        "json_result": json_obj
-                    }
-                    
-                    yield json.dumps({
+            # Process full response
+            llm_end = time.perf_counter()
+            metrics.observe_stage("llm_total", mode, llm_end - llm_start)
+            # Without a usage field from the provider nothing is counted (chunks are not tokens)
+            metrics.record_usage(usage, mode, llm_end - first_token_time if first_token_time else None)
+            llm_span.set_attribute("usage", usage)
+            llm_span.end(llm_end)
+            # Answers cut off before [DONE] are not worth caching
+            if finished:
+                response_cache.get_cache().put(payload, accumulated_text, usage)
+            _journal(mode, boundary_data, description, preferences, variants, payload, 200,
+                     content=accumulated_text, usage=usage, latency_ms=(llm_end - llm_start) * 1000,
+                     error=None if finished else "Stream ended without [DONE]")
+        
+        logger.debug("Streaming response received, parsing JSON")
+        
+        if collector is not None:
+            with _stage("metrics", mode):
+                if variant_mode == "n" and cached is None:
+                    for choice in sorted(choice_texts):
+                        for variant in collector.finish(choice_texts[choice], choice):
+                            yield _variant_event(variant)
+                else:
+                    for variant in collector.finish(accumulated_text):
+                        yield _variant_event(variant)
+            if collector.variants:
+                with _stage("serialization", mode):
+                    final_event = json.dumps({
                         "type": "final",
-                        "message": "Successfully generated floor plan",
-                        "floor_plan": json.dumps(full_response, indent=2)
+                        "message": f"Successfully generated {len(collector.variants)} floor plan variant(s)",
+                        "floor_plan": json.dumps(collector.response(accumulated_text), separators=(",", ":"))
                     })
-                except json.JSONDecodeError as json_error:
-                    logger.error(f"JSON parsing failed: {str(json_error)}")
-                    logger.error(f"Received content: {accumulated_text[:500]}...")
-                    yield json.dumps({
-                        "type": "error",
-                        "error": f"Cannot parse JSON generated by model: {str(json_error)}"
+                yield final_event
+                return
+        
+        # Extract JSON content
+        with _stage("json_extraction", mode):
+            json_content = extract_json_content(accumulated_text)
+        
+        # Validate JSON
+        if json_content:
+            try:
+                json_obj = json.loads(json_content)
+                logger.debug("JSON validation successful")
+                
+                # Send final result
+                full_response = {
+                    "thinking_steps": accumulated_text,
+                    "json_result": json_obj
+                }
+                with _stage("metrics", mode):
+                    full_response["metrics"] = score_plan(json_obj, boundary_data)
+                
+                with _stage("serialization", mode):
+                    final_event = json.dumps({
+                        "type": "final",
+                        "message": "Successfully generated floor plan",
+                        "floor_plan": json.dumps(full_response, separators=(",", ":"))
                     })
-            else:
-                # If no valid JSON could be extracted, return original text
-                logger.warning("No valid JSON could be extracted, returning original response")
+                yield final_event
+            except json.JSONDecodeError as json_error:
+                logger.error(f"JSON parsing failed: {str(json_error)}")
+                logger.error(f"Received content: {accumulated_text[:500]}...")
+                metrics.record_error("json_parse", mode)
                 yield json.dumps({
-                    "type": "final",
-                    "message": "Generated response without valid JSON structure",
-                    "floor_plan": json.dumps({"raw_response": accumulated_text})
+                    "type": "error",
+                    "error": f"Cannot parse JSON generated by model: {str(json_error)}"
                 })
-    
+        else:
+            # If no valid JSON could be extracted, return original text
+            logger.warning("No valid JSON could be extracted, returning original response")
+            metrics.record_error("no_json", mode)
+            yield json.dumps({
+                "type": "final",
+                "message": "Generated response without valid JSON structure",
+                "floor_plan": json.dumps({"raw_response": accumulated_text})
+            })
+
     except Exception as e:
         error_detail = traceback.format_exc()
         logger.error(f"Error generating floor plan: {str(e)}\n{error_detail}")
+        metrics.record_error(type(e).__name__, mode)
+        llm_span.end(error=e)
         error_message = f"Error generating floor plan: {str(e)}"
-        yield json.dumps({"error": error_message}) 
\ No newline at end of file
+        yield json.dumps({"error": error_message})
+    finally:
+        # Also closes the LLM span when the client goes away mid-stream
+        llm_span.end()
+        metrics.ACTIVE_STREAMS.dec()
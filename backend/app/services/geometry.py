@@ -0,0 +1,668 @@
+import math
+import numpy as np
+
+from app.services.split_tree import is_leaf, is_vertical_split, node_area, child_path, uses_child_angles, ROOT_PATH
+
+# Coordinates closer than this are treated as equal (database coordinates are in meters)
+EPSILON = 1e-6
+
+
+def to_xy(point):
+    """
+    Read a point in any of the formats used across the project:
+    {"X": .., "Y": ..} (database export), {"x": .., "y": ..} (frontend) or [x, y]
+    """
+    if isinstance(point, dict):
+        if "X" in point:
+            return float(point["X"]), float(point["Y"])
+        return float(point.get("x", 0)), float(point.get("y", 0))
+    return float(point[0]), float(point[1])
+
+
+def to_point(x, y, z=0.0):
+    """Point in the database export format, including its magnitude"""
+    x, y, z = float(x), float(y), float(z)
+    return {"X": x, "Y": y, "Z": z, "Mag": math.sqrt(x * x + y * y + z * z)}
+
+
+def polygon_array(corners):
+    """Corners as an (n, 2) float array"""
+    return np.array([to_xy(corner) for corner in corners], dtype=float).reshape(-1, 2)
+
+
+def polygon_areas(polygons):
+    """
+    Shoelace area of many polygons at once
+
+    Parameters:
+    - polygons: List of (n_i, 2) corner arrays
+
+    Returns:
+    - Array of absolute areas, one per polygon
+    """
+    if not polygons:
+        return np.zeros(0)
+    points = np.concatenate(polygons)
+    counts = np.array([len(p) for p in polygons])
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    # Index of the next corner, wrapping around within each polygon
+    following = np.arange(len(points)) + 1
+    following[starts + counts - 1] = starts
+    cross = points[:, 0] * points[following, 1] - points[following, 0] * points[:, 1]
+    return np.abs(np.add.reduceat(cross, starts)) / 2.0
+
+
+def polygon_bounds(polygons):
+    """Bounding boxes [min_x, min_y, max_x, max_y] of many polygons at once"""
+    if not polygons:
+        return np.zeros((0, 4))
+    points = np.concatenate(polygons)
+    counts = np.array([len(p) for p in polygons])
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    return np.column_stack([
+        np.minimum.reduceat(points[:, 0], starts),
+        np.minimum.reduceat(points[:, 1], starts),
+        np.maximum.reduceat(points[:, 0], starts),
+        np.maximum.reduceat(points[:, 1], starts)
+    ])
+
+
+def polygon_edges(polygon):
+    """Edges of a polygon as an (n, 4) array of [x0, y0, x1, y1]"""
+    return np.hstack([polygon, np.roll(polygon, -1, axis=0)])
+
+
+def polygons_edges(polygons):
+    """
+    Edges of many polygons at once
+
+    Returns:
+    - (edges (m, 4) grouped by polygon, index of the polygon of every edge)
+    """
+    if not polygons:
+        return np.zeros((0, 4)), np.zeros(0, dtype=np.int64)
+    points = np.concatenate(polygons)
+    counts = np.array([len(p) for p in polygons])
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    following = np.arange(len(points)) + 1
+    following[starts + counts - 1] = starts
+    return np.hstack([points, points[following]]), np.repeat(np.arange(len(polygons)), counts)
+
+
+def group_pairs(left_group, right_group, groups):
+    """
+    All (left, right) index pairs whose items belong to the same group
+
+    Parameters:
+    - left_group / right_group: Group of every item; right items must be sorted by group
+    - groups: Number of groups
+
+    Returns:
+    - (left indices, right indices)
+    """
+    left_group = np.asarray(left_group, dtype=np.int64)
+    right_counts = np.bincount(np.asarray(right_group, dtype=np.int64), minlength=groups)
+    right_starts = np.concatenate([[0], np.cumsum(right_counts)[:-1]])
+    per_left = right_counts[left_group]
+    left = np.repeat(np.arange(len(left_group)), per_left)
+    # Position of every pair within the run of its left item
+    offset = np.arange(len(left)) - np.repeat(np.cumsum(per_left) - per_left, per_left)
+    return left, right_starts[left_group[left]] + offset
+
+
+def decompose_polygon(polygon):
+    """
+    Split a simple polygon into rectangles [x0, y0, x1, y1] using vertical slabs between corners.
+
+    Rectilinear polygons are reproduced exactly. Sloped edges are sampled at the middle of each
+    slab, which keeps the area exact while approximating the shape.
+    """
+    return decompose_polygons([polygon])[0]
+
+
+def decompose_polygons(polygons):
+    """
+    decompose_polygon for many polygons in one pass
+
+    Returns:
+    - (rectangles (m, 4) grouped by polygon, index of the polygon of every rectangle)
+    """
+    edges, edge_polygon = polygons_edges(polygons)
+    if not len(edges):
+        return np.zeros((0, 4)), np.zeros(0, dtype=np.int64)
+
+    # Distinct corner x of every polygon, sorted; consecutive ones bound a slab
+    xs = np.round(edges[:, 0], 9)
+    order = np.lexsort((xs, edge_polygon))
+    xs, x_polygon = xs[order], edge_polygon[order]
+    distinct = np.ones(len(xs), dtype=bool)
+    distinct[1:] = (xs[1:] != xs[:-1]) | (x_polygon[1:] != x_polygon[:-1])
+    xs, x_polygon = xs[distinct], x_polygon[distinct]
+    in_polygon = x_polygon[1:] == x_polygon[:-1]
+    x0, x1, slab_polygon = xs[:-1][in_polygon], xs[1:][in_polygon], x_polygon[:-1][in_polygon]
+    middle = (x0 + x1) / 2.0
+
+    # Crossing height of every non-vertical edge at the middle of every slab of its polygon
+    slab, edge = group_pairs(slab_polygon, edge_polygon, len(polygons))
+    ex0, ey0, ex1, ey1 = edges[edge].T
+    at = middle[slab]
+    spans = (at > np.minimum(ex0, ex1)) & (at < np.maximum(ex0, ex1))
+    slab, ex0, ey0, ex1, ey1, at = slab[spans], ex0[spans], ey0[spans], ex1[spans], ey1[spans], at[spans]
+    ys = ey0 + (at - ex0) / (ex1 - ex0) * (ey1 - ey0)
+
+    # Crossings alternate between entering and leaving the polygon from the bottom of each slab up
+    order = np.lexsort((ys, slab))
+    ys, slab = ys[order], slab[order]
+    counts = np.bincount(slab, minlength=len(middle))
+    rank = np.arange(len(ys)) - np.repeat(np.cumsum(counts) - counts, counts)
+    bottom = np.nonzero((rank % 2 == 0) & (rank + 1 < counts[slab]))[0]
+    rects = np.column_stack([x0[slab[bottom]], ys[bottom], x1[slab[bottom]], ys[bottom + 1]])
+    keep = rects[:, 3] - rects[:, 1] > EPSILON
+    return rects[keep], slab_polygon[slab[bottom]][keep]
+
+
+def rects_area(rects):
+    return float(((rects[:, 2] - rects[:, 0]) * (rects[:, 3] - rects[:, 1])).sum())
+
+
+def cut_rects(rects, axis, fraction, first_low=True):
+    """
+    Cut a region made of rectangles with an axis-aligned line so that the first part
+    holds the given fraction of its area
+
+    Parameters:
+    - rects: (n, 4) array of [x0, y0, x1, y1]
+    - axis: 0 to cut with a vertical line (parts side by side), 1 with a horizontal line
+    - fraction: Share of the area that goes to the first part
+    - first_low: Whether the first part is on the low side of the line
+
+    Returns:
+    - (first, second) rectangle arrays
+    """
+    first, _, second, _ = cut_regions(rects, np.zeros(len(rects), dtype=np.int64), [axis], [fraction], [first_low])
+    return first, second
+
+
+def cut_regions(rects, region, axis, fraction, first_low):
+    """
+    cut_rects for many regions at once
+
+    Parameters:
+    - rects: (n, 4) rectangles of all regions, grouped by region
+    - region: Index of the region of every rectangle; every region needs at least one rectangle
+    - axis / fraction / first_low: One value per region, as for cut_rects
+
+    Returns:
+    - (first rectangles, their region, second rectangles, their region)
+    """
+    axis = np.asarray(axis, dtype=np.int64)
+    fraction = np.asarray(fraction, dtype=float)
+    first_low = np.asarray(first_low, dtype=bool)
+    regions = len(axis)
+    rows = np.arange(len(rects))
+    rect_axis = axis[region]
+    low, high = rects[rows, rect_axis], rects[rows, rect_axis + 2]
+    depth = rects[rows, 3 - rect_axis] - rects[rows, 1 - rect_axis]
+    total = np.bincount(region, (high - low) * depth, minlength=regions)
+    target = np.where(first_low, total * fraction, total * (1.0 - fraction))
+
+    # Area below a line is piecewise linear between rectangle edges, so find the segment and interpolate
+    candidates = np.concatenate([low, high])
+    owner = np.concatenate([region, region])
+    order = np.lexsort((candidates, owner))
+    candidates, owner = candidates[order], owner[order]
+    distinct = np.ones(len(candidates), dtype=bool)
+    distinct[1:] = (candidates[1:] != candidates[:-1]) | (owner[1:] != owner[:-1])
+    candidates, owner = candidates[distinct], owner[distinct]
+    candidate, rect = group_pairs(owner, region, regions)
+    below = np.bincount(candidate, np.clip(candidates[candidate] - low[rect], 0, (high - low)[rect]) * depth[rect],
+                        minlength=len(candidates))
+    counts = np.bincount(owner, minlength=regions)
+    starts = np.cumsum(counts) - counts
+    # Same as searchsorted: the candidates below the target come first within each region
+    k = starts + np.clip(np.bincount(owner, below < target[owner], minlength=regions).astype(np.int64), 1, counts - 1)
+    span = below[k] - below[k - 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        step = np.where(span > 0, (target - below[k - 1]) / span * (candidates[k] - candidates[k - 1]), 0.0)
+    line = (candidates[k - 1] + step)[region]
+
+    low_part = rects.copy()
+    low_part[rows, rect_axis + 2] = np.minimum(high, line)
+    high_part = rects.copy()
+    high_part[rows, rect_axis] = np.maximum(low, line)
+    low_keep = low_part[rows, rect_axis + 2] - low_part[rows, rect_axis] > EPSILON
+    high_keep = high_part[rows, rect_axis + 2] - high_part[rows, rect_axis] > EPSILON
+    rect_first_low = first_low[region][:, None]
+    first, first_keep = np.where(rect_first_low, low_part, high_part), np.where(rect_first_low[:, 0], low_keep, high_keep)
+    second, second_keep = np.where(rect_first_low, high_part, low_part), np.where(rect_first_low[:, 0], high_keep, low_keep)
+    return first[first_keep], region[first_keep], second[second_keep], region[second_keep]
+
+
+def layout_region(root, rects, y_up=True):
+    """
+    Lay out a split tree inside a region made of rectangles, cutting by area.
+
+    The first child goes left for vertical cuts and on top for horizontal cuts, like the frontend.
+    With y_up (world coordinates such as the database export) top is the high y side.
+
+    Returns:
+    - Dict of node path -> (node, rectangle array)
+    """
+    child_angles = uses_child_angles(root)
+    placed = {}
+    stack = [(root, ROOT_PATH, rects)]
+    while stack:
+        node, path, region = stack.pop()
+        placed[path] = (node, region)
+        if is_leaf(node) or len(region) == 0:
+            continue
+        children = node["children"]
+        vertical = is_vertical_split(node, child_angles)
+        axis = 0 if vertical else 1
+        first_low = True if vertical else not y_up
+        remaining = region
+        remaining_area = sum(node_area(child) for child in children)
+        for i, child in enumerate(children):
+            if i == len(children) - 1:
+                part = remaining
+            else:
+                fraction = node_area(child) / remaining_area if remaining_area else 1.0 / (len(children) - i)
+                part, remaining = cut_rects(remaining, axis, fraction, first_low)
+                remaining_area -= node_area(child)
+            stack.append((child, child_path(path, i, len(children)), part))
+    return placed
+
+
+def layout_regions(roots, rects, rect_tree, y_up):
+    """
+    layout_region for many split trees at once. Every round cuts the next child off all open
+    regions in one cut_regions pass, so Python only walks the tree nodes.
+
+    Parameters:
+    - roots: List of split tree roots
+    - rects: (m, 4) rectangles of all regions (see decompose_polygons)
+    - rect_tree: Index of the tree of every rectangle
+    - y_up: One flag per tree, as for layout_region
+
+    Returns:
+    - List of dicts of node path -> (node, rectangle array), one per tree
+    """
+    child_angles = [uses_child_angles(root) for root in roots]
+    placed = [{} for _ in roots]
+    # Open items: (tree, node, path, next child to cut off, area of the children from there on)
+    items = [(tree, root, ROOT_PATH, 0, 0.0) for tree, root in enumerate(roots)]
+    owner = np.asarray(rect_tree, dtype=np.int64)
+    while items:
+        order = np.argsort(owner, kind="stable")
+        rects, owner = rects[order], owner[order]
+        counts = np.bincount(owner, minlength=len(items))
+        starts = np.cumsum(counts) - counts
+        next_items = []
+        # Where each item's rectangles go: the next item taking the whole region, or the cut
+        moved = np.full(len(items), -1, dtype=np.int64)
+        cut_items, cut_axis, cut_fraction, cut_first_low, cut_target = [], [], [], [], []
+        for index, (tree, node, path, i, remaining_area) in enumerate(items):
+            if i == 0:
+                placed[tree][path] = (node, rects[starts[index]:starts[index] + counts[index]])
+                if is_leaf(node) or counts[index] == 0:
+                    continue
+                remaining_area = sum(node_area(child) for child in node["children"])
+            children = node["children"]
+            if counts[index] == 0:
+                # Nothing left for the remaining children
+                for j in range(i, len(children)):
+                    next_items.append((tree, children[j], child_path(path, j, len(children)), 0, 0.0))
+                continue
+            if i == len(children) - 1:
+                moved[index] = len(next_items)
+                next_items.append((tree, children[i], child_path(path, i, len(children)), 0, 0.0))
+                continue
+            vertical = is_vertical_split(node, child_angles[tree])
+            area = node_area(children[i])
+            cut_items.append(index)
+            cut_axis.append(0 if vertical else 1)
+            cut_first_low.append(True if vertical else not y_up[tree])
+            cut_fraction.append(area / remaining_area if remaining_area else 1.0 / (len(children) - i))
+            cut_target.append(len(next_items))
+            next_items.append((tree, children[i], child_path(path, i, len(children)), 0, 0.0))
+            next_items.append((tree, node, path, i + 1, remaining_area - area))
+
+        kept = moved[owner] >= 0
+        parts, owners = [rects[kept]], [moved[owner[kept]]]
+        if cut_items:
+            cut_index = np.full(len(items), -1, dtype=np.int64)
+            cut_index[cut_items] = np.arange(len(cut_items))
+            cutting = cut_index[owner] >= 0
+            first, first_cut, second, second_cut = cut_regions(
+                rects[cutting], cut_index[owner[cutting]], cut_axis, cut_fraction, cut_first_low)
+            cut_target = np.array(cut_target, dtype=np.int64)
+            parts += [first, second]
+            owners += [cut_target[first_cut], cut_target[second_cut] + 1]
+        rects, owner = np.concatenate(parts), np.concatenate(owners)
+        items = next_items
+    return placed
+
+
+def region_bounds(rects):
+    return [float(rects[:, 0].min()), float(rects[:, 1].min()), float(rects[:, 2].max()), float(rects[:, 3].max())]
+
+
+def simplify_polygon(polygon, tolerance=EPSILON):
+    """Drop repeated and collinear corners"""
+    points = [tuple(p) for p in polygon]
+    changed = True
+    while changed and len(points) > 3:
+        changed = False
+        for i in range(len(points)):
+            a, b, c = points[i - 1], points[i], points[(i + 1) % len(points)]
+            cross = (b[0] - a[0]) * (c[1] - b[1]) - (b[1] - a[1]) * (c[0] - b[0])
+            if abs(cross) <= tolerance:
+                points.pop(i)
+                changed = True
+                break
+    return np.array(points, dtype=float).reshape(-1, 2)
+
+
+def rects_outline(rects):
+    """Outer outline of a union of axis-aligned rectangles, as a polygon (the largest loop of rects_outlines)"""
+    return simplify_polygon(max(rects_outlines(rects), key=lambda loop: polygon_areas([loop])[0]))
+
+
+def _rect_cells(rects):
+    """
+    Rasterize rectangles on the grid of their own coordinates
+
+    Returns:
+    - (xs, ys, filled) where cell (i, j) of filled spans xs[i-1]..xs[i] and ys[j-1]..ys[j],
+      padded by one empty cell on every side
+    """
+    xs = np.unique(np.concatenate([rects[:, 0], rects[:, 2]]))
+    ys = np.unique(np.concatenate([rects[:, 1], rects[:, 3]]))
+    filled = np.zeros((len(xs) + 1, len(ys) + 1), dtype=bool)
+    for x0, y0, x1, y1 in rects:
+        i0, i1 = np.searchsorted(xs, x0) + 1, np.searchsorted(xs, x1) + 1
+        j0, j1 = np.searchsorted(ys, y0) + 1, np.searchsorted(ys, y1) + 1
+        filled[i0:i1, j0:j1] = True
+    return xs, ys, filled
+
+
+def rects_pinch_points(rects):
+    """
+    Points where a union of axis-aligned rectangles touches itself only at a corner: of the
+    four cells around the point, two diagonally opposite ones are filled and the other two
+    empty. The outline passes such a point twice, rects_outlines cannot chain it.
+
+    Returns:
+    - List of (x, y)
+    """
+    xs, ys, filled = _rect_cells(rects)
+    # Cells below-left, above-right, below-right and above-left of point (xs[i], ys[j])
+    below_left, above_right = filled[:-1, :-1], filled[1:, 1:]
+    below_right, above_left = filled[1:, :-1], filled[:-1, 1:]
+    pinched = (below_left == above_right) & (below_right == above_left) & (below_left != below_right)
+    return [(float(xs[i]), float(ys[j])) for i, j in zip(*np.nonzero(pinched))]
+
+
+def rects_outlines(rects):
+    """
+    All outlines of a union of axis-aligned rectangles: one counter-clockwise loop (in y-up
+    orientation) around every connected part and one clockwise loop around every hole.
+    The union must not touch itself only at a corner (see rects_pinch_points).
+
+    Collects the sides between filled and empty cells of the rasterized rectangles and chains
+    them into loops.
+    """
+    xs, ys, filled = _rect_cells(rects)
+
+    following = {}
+    # Vertical sides between cells (i, j) and (i + 1, j), lying on xs[i]
+    left, right = filled[:-1, 1:-1], filled[1:, 1:-1]
+    for i, j in zip(*np.nonzero(right & ~left)):
+        following[(xs[i], ys[j + 1])] = (xs[i], ys[j])
+    for i, j in zip(*np.nonzero(left & ~right)):
+        following[(xs[i], ys[j])] = (xs[i], ys[j + 1])
+    # Horizontal sides between cells (i, j) and (i, j + 1), lying on ys[j]
+    below, above = filled[1:-1, :-1], filled[1:-1, 1:]
+    for i, j in zip(*np.nonzero(above & ~below)):
+        following[(xs[i], ys[j])] = (xs[i + 1], ys[j])
+    for i, j in zip(*np.nonzero(below & ~above)):
+        following[(xs[i + 1], ys[j])] = (xs[i], ys[j])
+
+    loops = []
+    while following:
+        start, point = next(iter(following.items()))
+        loop = [start]
+        following.pop(start)
+        while point != start and point in following:
+            loop.append(point)
+            point = following.pop(point)
+        loops.append(np.array(loop, dtype=float))
+    return loops
+
+
+def points_in_polygon(points, polygon):
+    """Even-odd test of many (x, y) points against one polygon, returns a bool array"""
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    x, y = points[:, 0:1], points[:, 1:2]
+    x0, y0 = polygon[:, 0][None, :], polygon[:, 1][None, :]
+    x1, y1 = np.roll(polygon[:, 0], -1)[None, :], np.roll(polygon[:, 1], -1)[None, :]
+    straddles = (y0 > y) != (y1 > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing_x = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+    return ((straddles & (x < crossing_x)).sum(axis=1) % 2) == 1
+
+
+def point_segments_distance(x, y, segments):
+    """Distance from a point to each segment of an (n, 4) [x0, y0, x1, y1] array"""
+    x0, y0, x1, y1 = segments.T
+    dx, dy = x1 - x0, y1 - y0
+    length2 = dx * dx + dy * dy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(length2 > 0, ((x - x0) * dx + (y - y0) * dy) / length2, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(x0 + t * dx - x, y0 + t * dy - y)
+
+
+def segments_intersect(segment, segments):
+    """Whether a segment [x0, y0, x1, y1] touches or crosses each segment of an (n, 4) array"""
+    ax0, ay0, ax1, ay1 = segment
+    bx0, by0, bx1, by1 = segments.T
+
+    def orientation(px, py, qx, qy, rx, ry):
+        value = (qx - px) * (ry - py) - (qy - py) * (rx - px)
+        return np.where(np.abs(value) <= EPSILON, 0, np.sign(value))
+
+    def on_segment(px, py, qx, qy, rx, ry):
+        # r lies within the bounding box of p-q (used for collinear cases)
+        return (np.minimum(px, qx) - EPSILON <= rx) & (rx <= np.maximum(px, qx) + EPSILON) & \
+            (np.minimum(py, qy) - EPSILON <= ry) & (ry <= np.maximum(py, qy) + EPSILON)
+
+    o1 = orientation(ax0, ay0, ax1, ay1, bx0, by0)
+    o2 = orientation(ax0, ay0, ax1, ay1, bx1, by1)
+    o3 = orientation(bx0, by0, bx1, by1, ax0, ay0)
+    o4 = orientation(bx0, by0, bx1, by1, ax1, ay1)
+    crossing = (o1 != o2) & (o3 != o4)
+    collinear = ((o1 == 0) & on_segment(ax0, ay0, ax1, ay1, bx0, by0)) | \
+        ((o2 == 0) & on_segment(ax0, ay0, ax1, ay1, bx1, by1)) | \
+        ((o3 == 0) & on_segment(bx0, by0, bx1, by1, ax0, ay0)) | \
+        ((o4 == 0) & on_segment(bx0, by0, bx1, by1, ax1, ay1))
+    return crossing | collinear
+
+
+def segments_cross_box(segments, box):
+    """
+    Whether each segment of an (n, 4) array has a point inside (or on) box [min_x, min_y, max_x, max_y],
+    by Liang-Barsky clipping
+    """
+    x0, y0, x1, y1 = segments.T
+    dx, dy = x1 - x0, y1 - y0
+    t_low = np.zeros(len(segments))
+    t_high = np.ones(len(segments))
+    inside = np.ones(len(segments), dtype=bool)
+    for p, q in ((-dx, x0 - box[0]), (dx, box[2] - x0), (-dy, y0 - box[1]), (dy, box[3] - y0)):
+        parallel = np.abs(p) <= EPSILON
+        inside &= ~(parallel & (q < -EPSILON))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.where(parallel, 0.0, q / np.where(parallel, 1.0, p))
+        t_low = np.where(~parallel & (p < 0), np.maximum(t_low, t), t_low)
+        t_high = np.where(~parallel & (p > 0), np.minimum(t_high, t), t_high)
+    return inside & (t_low <= t_high + EPSILON)
+
+
+def is_rectilinear(polygon, tolerance=EPSILON):
+    """Whether every edge of a polygon is horizontal or vertical"""
+    edges = polygon_edges(polygon)
+    return bool(np.all((np.abs(edges[:, 0] - edges[:, 2]) <= tolerance) | (np.abs(edges[:, 1] - edges[:, 3]) <= tolerance)))
+
+
+def _independent_chords(horizontal, vertical):
+    """
+    Largest set of pairwise non-intersecting chords: the complement of a minimum vertex cover
+    of the horizontal/vertical intersection graph, found from a maximum matching (König)
+
+    Parameters:
+    - horizontal: List of (y, x0, x1) chords
+    - vertical: List of (x, y0, y1) chords
+
+    Returns:
+    - (kept horizontal indices, kept vertical indices)
+    """
+    crossing = [[v for v, (x, y0, y1) in enumerate(vertical) if x0 <= x <= x1 and y0 <= y <= y1]
+                for y, x0, x1 in horizontal]
+    match_v = {}
+
+    def augment(h, seen):
+        for v in crossing[h]:
+            if v not in seen:
+                seen.add(v)
+                if v not in match_v or augment(match_v[v], seen):
+                    match_v[v] = h
+                    return True
+        return False
+
+    for h in range(len(horizontal)):
+        augment(h, set())
+    matched_h = set(match_v.values())
+    # Alternating paths from unmatched horizontal chords
+    reached_h = [h for h in range(len(horizontal)) if h not in matched_h]
+    reached_v = set()
+    stack = list(reached_h)
+    reached_h = set(reached_h)
+    while stack:
+        h = stack.pop()
+        for v in crossing[h]:
+            if v not in reached_v:
+                reached_v.add(v)
+                if v in match_v and match_v[v] not in reached_h:
+                    reached_h.add(match_v[v])
+                    stack.append(match_v[v])
+    return sorted(reached_h), [v for v in range(len(vertical)) if v not in reached_v]
+
+
+def rectilinear_partition(polygon):
+    """
+    Partition a rectilinear polygon (without holes) into the minimum number of rectangles:
+    cut along a largest set of non-crossing chords between reflex corners, then once from every
+    remaining reflex corner. Cuts run on the grid of the polygon's own coordinates.
+
+    Returns:
+    - (n, 4) array of rectangles [x0, y0, x1, y1]; other polygons get decompose_polygon's slabs
+    """
+    polygon = simplify_polygon(polygon)
+    if len(polygon) < 4 or not is_rectilinear(polygon):
+        return decompose_polygon(polygon)
+    if np.sum(polygon[:, 0] * np.roll(polygon[:, 1], -1) - np.roll(polygon[:, 0], -1) * polygon[:, 1]) < 0:
+        polygon = polygon[::-1]
+    xs = np.unique(np.round(polygon[:, 0], 9))
+    ys = np.unique(np.round(polygon[:, 1], 9))
+    nx, ny = len(xs) - 1, len(ys) - 1
+    centers = np.stack(np.meshgrid((xs[:-1] + xs[1:]) / 2, (ys[:-1] + ys[1:]) / 2, indexing="ij"), axis=-1)
+    inside = points_in_polygon(centers.reshape(-1, 2), polygon).reshape(nx, ny)
+
+    def filled(i, j):
+        return 0 <= i < nx and 0 <= j < ny and bool(inside[i, j])
+
+    # cut_x[i, j]: wall on x = xs[i] between cells (i - 1, j) and (i, j); cut_y[i, j] likewise on y = ys[j]
+    cut_x = np.zeros((nx + 1, ny), dtype=bool)
+    cut_y = np.zeros((nx, ny + 1), dtype=bool)
+
+    def on_boundary(i, j):
+        around = [filled(i - 1, j - 1), filled(i, j - 1), filled(i - 1, j), filled(i, j)]
+        return any(around) and not all(around)
+
+    def cuts_at(i, j):
+        return sum(int(bool(cut)) for cut in ((j > 0 and cut_x[i, j - 1]), (j < ny and cut_x[i, j]),
+                                              (i > 0 and cut_y[i - 1, j]), (i < nx and cut_y[i, j])))
+
+    corners = np.column_stack([np.searchsorted(xs, np.round(polygon[:, 0], 9)),
+                               np.searchsorted(ys, np.round(polygon[:, 1], 9))])
+    incoming = polygon - np.roll(polygon, 1, axis=0)
+    outgoing = np.roll(polygon, -1, axis=0) - polygon
+    reflex = incoming[:, 0] * outgoing[:, 1] - incoming[:, 1] * outgoing[:, 0] < 0
+    reflex_points = {(int(i), int(j)): index for index, (i, j) in enumerate(corners) if reflex[index]}
+
+    # Chords between consecutive reflex corners on a grid line, running through the interior only
+    horizontal, vertical = [], []
+    by_row, by_column = {}, {}
+    for i, j in reflex_points:
+        by_row.setdefault(j, []).append(i)
+        by_column.setdefault(i, []).append(j)
+    for j, row in by_row.items():
+        row.sort()
+        for a, b in zip(row, row[1:]):
+            if all(filled(i, j - 1) and filled(i, j) for i in range(a, b)):
+                horizontal.append((j, a, b))
+    for i, column in by_column.items():
+        column.sort()
+        for a, b in zip(column, column[1:]):
+            if all(filled(i - 1, j) and filled(i, j) for j in range(a, b)):
+                vertical.append((i, a, b))
+    kept_h, kept_v = _independent_chords(horizontal, vertical)
+    for h in kept_h:
+        j, a, b = horizontal[h]
+        cut_y[a:b, j] = True
+    for v in kept_v:
+        i, a, b = vertical[v]
+        cut_x[i, a:b] = True
+
+    # Every reflex corner without a cut yet gets one, continuing its incoming edge into the interior
+    for (i, j), index in sorted(reflex_points.items()):
+        if cuts_at(i, j):
+            continue
+        step_i, step_j = int(np.sign(incoming[index, 0])), int(np.sign(incoming[index, 1]))
+        while True:
+            if step_i:
+                cut_y[min(i, i + step_i), j] = True
+            else:
+                cut_x[i, min(j, j + step_j)] = True
+            i, j = i + step_i, j + step_j
+            if on_boundary(i, j) or cuts_at(i, j) > 1:
+                break
+
+    # Rectangles are the groups of cells not separated by a cut
+    label = -np.ones((nx, ny), dtype=np.int64)
+    rects = []
+    for start in zip(*np.nonzero(inside)):
+        if label[start] >= 0:
+            continue
+        label[start] = len(rects)
+        stack, cells = [start], []
+        while stack:
+            i, j = stack.pop()
+            cells.append((i, j))
+            for di, dj, blocked in ((1, 0, cut_x[i + 1, j] if i + 1 <= nx else True),
+                                    (-1, 0, cut_x[i, j]),
+                                    (0, 1, cut_y[i, j + 1] if j + 1 <= ny else True),
+                                    (0, -1, cut_y[i, j])):
+                neighbour = (i + di, j + dj)
+                if not blocked and filled(*neighbour) and label[neighbour] < 0:
+                    label[neighbour] = len(rects)
+                    stack.append(neighbour)
+        cells = np.array(cells)
+        i0, j0 = cells.min(axis=0)
+        i1, j1 = cells.max(axis=0) + 1
+        if len(cells) != (i1 - i0) * (j1 - j0):
+            # Not a rectangle (should not happen for simple polygons), keep the exact slabs instead
+            return decompose_polygon(polygon)
+        rects.append((xs[i0], ys[j0], xs[i1], ys[j1]))
+    return np.array(rects, dtype=float).reshape(-1, 4)
@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import datetime
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+from app.services import config, tracing, metrics
+from app.services.config import DEFAULT_PAYLOAD_CHARS, DEFAULT_PAYLOAD_ITEMS
+from app.services.request_journal import SECRET_PATTERN, REDACTED_KEYS
+
+# Noisy third-party loggers, overridable through FLOORPLAN_LOG_LEVELS
+DEFAULT_MODULE_LEVELS = {"urllib3": "WARNING"}
+# Records waiting for the writer thread; beyond this, new records are dropped rather than block requests
+QUEUE_SIZE = 10000
+TEXT_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+
+# Attribute set through extra= on records that may be sampled out (request payloads)
+SAMPLED = {"sampled": True}
+
+_configured = False
+# Payload caps, read from the settings by setup_logging
+_payload_items = DEFAULT_PAYLOAD_ITEMS
+_payload_chars = DEFAULT_PAYLOAD_CHARS
+_listener = None
+_queue_handler = None
+_setup_lock = threading.Lock()
+
+
+def parse_levels(value):
+    """
+    Per-logger levels from "app.routes=WARNING,werkzeug=ERROR"
+
+    Returns:
+    - Dict of logger name -> level name (unknown levels are skipped)
+    """
+    levels = {}
+    for item in (value or "").split(","):
+        name, _, level = item.partition("=")
+        level = level.strip().upper()
+        if name.strip() and isinstance(logging.getLevelName(level), int):
+            levels[name.strip()] = level
+    return levels
+
+
+def _cap(value, items, chars):
+    """Copy of a JSON-like value with lists/dicts cut to the first items and strings to chars"""
+    if isinstance(value, dict):
+        capped = {k: "[REDACTED]" if str(k).lower() in REDACTED_KEYS else _cap(v, items, chars)
+                  for k, v in list(value.items())[:items]}
+        if len(value) > items:
+            capped["..."] = f"+{len(value) - items} more"
+        return capped
+    if isinstance(value, (list, tuple)):
+        capped = [_cap(v, items, chars) for v in value[:items]]
+        if len(value) > items:
+            capped.append(f"... +{len(value) - items} more")
+        return capped
+    if isinstance(value, str) and len(value) > chars:
+        return value[:chars] + "..."
+    return value
+
+
+class Payload(object):
+    """
+    Request/response body passed as a logging argument. Nothing is formatted unless the record
+    is emitted, and then only the first items of each list/dict and the first characters of
+    the text, so a large boundary costs the same as a small one.
+    """
+
+    __slots__ = ("value", "items", "chars")
+
+    def __init__(self, value, items=None, chars=None):
+        self.value = value
+        self.items = items or _payload_items
+        self.chars = chars or _payload_chars
+
+    def __str__(self):
+        text = json.dumps(_cap(self.value, self.items, self.chars), ensure_ascii=False,
+                          separators=(",", ":"), default=str)
+        return text if len(text) <= self.chars else text[:self.chars] + "..."
+
+
+def payload(value):
+    return Payload(value)
+
+
+class SampleFilter(logging.Filter):
+    """Keep records marked with extra=SAMPLED at the given rate, all other records pass"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, "sampled", False) and self.rate < 1.0:
+            return random.random() < self.rate
+        return True
+
+
+class RedactingFormatter(logging.Formatter):
+    """Text formatter masking OpenRouter keys and bearer tokens in the final line"""
+
+    def format(self, record):
+        return SECRET_PATTERN.sub("[REDACTED]", super().format(record))
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, trace_id and exc when present"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return SECRET_PATTERN.sub("[REDACTED]", json.dumps(entry, ensure_ascii=False, default=str))
+
+
+class AsyncHandler(QueueHandler):
+    """
+    Queue handler that only renders the message in the calling thread (arguments may change
+    after the call); level names, timestamps, JSON encoding, redaction and the write itself
+    happen in the listener thread. Records are dropped and counted when the queue is full.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._exception_formatter = logging.Formatter()
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        span = tracing.current_span()
+        record.trace_id = span.trace_id if span is not None else None
+        if record.exc_info:
+            # Tracebacks hold frames of the calling thread, only their text is handed over
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            metrics.LOG_RECORDS_DROPPED.inc()
+
+
+def setup_logging(force=False, settings=None):
+    """
+    Configure the root logger once per process from the settings (see config.Settings):
+
+    - FLOORPLAN_LOG_LEVEL: Root level (default INFO)
+    - FLOORPLAN_LOG_LEVELS: Per-module levels, e.g. "app.routes=WARNING,app.services.floor_plan_service=DEBUG"
+    - FLOORPLAN_LOG_FORMAT: "text" (default) or "json"
+    - FLOORPLAN_LOG_FILE: Write to this file instead of stderr
+    - FLOORPLAN_LOG_ASYNC: Write through a queue and a background thread (default on)
+    - FLOORPLAN_LOG_SAMPLE: Share of request payload lines kept (default 1.0)
+    - FLOORPLAN_LOG_PAYLOAD_ITEMS / FLOORPLAN_LOG_PAYLOAD_CHARS: Caps of logged payloads (default 5 / 500)
+
+    Parameters:
+    - force: Replace an existing configuration (used by tests and benchmarks)
+    - settings: Settings to apply instead of the current ones
+
+    Returns:
+    - The AsyncHandler, or None when logging is synchronous
+    """
+    global _configured, _listener, _queue_handler, _payload_items, _payload_chars
+    with _setup_lock:
+        if _configured:
+            if not force:
+                return _queue_handler
+            shutdown_logging()
+
+        settings = settings or config.get_settings()
+        _payload_items, _payload_chars = settings.log_payload_items, settings.log_payload_chars
+
+        log_file = settings.log_file
+        if log_file:
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            output = logging.FileHandler(log_file, encoding="utf-8")
+        else:
+            output = logging.StreamHandler(sys.stderr)
+        if settings.log_format == "json":
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(RedactingFormatter(TEXT_FORMAT))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        if settings.log_async:
+            _queue_handler = AsyncHandler(queue.Queue(QUEUE_SIZE))
+            _listener = QueueListener(_queue_handler.queue, output, respect_handler_level=True)
+            _listener.start()
+            handler = _queue_handler
+        else:
+            handler = output
+        handler.addFilter(SampleFilter(settings.log_sample))
+        root.addHandler(handler)
+        root.setLevel(settings.log_level)
+
+        levels = dict(DEFAULT_MODULE_LEVELS)
+        levels.update(parse_levels(settings.log_levels))
+        for name, level in levels.items():
+            logging.getLogger(name).setLevel(level)
+        _configured = True
+        return _queue_handler
+
+
+def shutdown_logging():
+    """Write out queued records and stop the writer thread"""
+    global _configured, _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+    _configured, _listener, _queue_handler = False, None, None
+
+
+atexit.register(shutdown_logging)
+
+
+def init_app(app):
+    """
+    Set up process-wide logging before the blueprints are imported
+
+    Parameters:
+    - app: Flask application
+
+    Returns:
+    - The AsyncHandler, or None when logging is synchronous
+    """
+    handler = setup_logging()
+    app.extensions['floorplan_log_handler'] = handler
+    return handler
@@ -0,0 +1,230 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Default histogram buckets in seconds, from fast local stages up to long LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _label_key(label_names, labels):
+    return tuple(str(labels.get(name, "")) for name in label_names)
+
+
+def _format_labels(label_names, key, extra=None):
+    pairs = list(zip(label_names, key))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    """Base class: a named metric with fixed label names and one series per label combination"""
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, value in series:
+            lines.extend(self._render_series(key, value))
+        return lines
+
+    def _render_series(self, key, value):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"]
+
+    def value(self, **labels):
+        with self._lock:
+            return self._series.get(_label_key(self.label_names, labels))
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            self._series[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = _label_key(self.label_names, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (last one is +Inf), sum, count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def value(self, **labels):
+        with self._lock:
+            series = self._series.get(_label_key(self.label_names, labels))
+            return {"sum": series[1], "count": series[2]} if series else None
+
+    def _render_series(self, key, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.label_names, key, ("le", _format_value(float(bound))))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry(object):
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=()):
+        return self.register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self):
+        """Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "floorplan_stage_seconds",
+    "Time spent in each floor plan generation stage",
+    ("stage", "mode"))
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "floorplan_http_request_seconds",
+    "Flask request handling time (until the response starts for streams)",
+    ("endpoint", "method", "status"))
+LLM_TOKENS = REGISTRY.counter(
+    "floorplan_llm_tokens_total",
+    "Tokens reported by the provider usage field",
+    ("direction", "mode"))
+LLM_TOKEN_RATE = REGISTRY.histogram(
+    "floorplan_llm_tokens_per_second",
+    "Completion tokens per second of generation time",
+    ("mode",),
+    buckets=(5, 10, 20, 40, 60, 80, 100, 150, 200, 400, 800))
+LLM_USAGE_MISSING = REGISTRY.counter(
+    "floorplan_llm_usage_missing_total",
+    "Completed model responses without a provider usage field (their tokens are not counted)",
+    ("mode",))
+ERRORS = REGISTRY.counter(
+    "floorplan_errors_total",
+    "Generation errors by type",
+    ("type", "mode"))
+CACHE_REQUESTS = REGISTRY.counter(
+    "floorplan_cache_requests_total",
+    "Cache lookups by cache and result (hit or miss)",
+    ("cache", "result"))
+ACTIVE_STREAMS = REGISTRY.gauge(
+    "floorplan_active_streams",
+    "Streaming generations currently in progress")
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "floorplan_log_records_dropped_total",
+    "Log records dropped because the log queue was full")
+
+
+@contextmanager
+def stage(name, mode):
+    """Time a block as a generation stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name, mode=mode)
+
+
+def observe_stage(name, mode, seconds):
+    STAGE_SECONDS.observe(seconds, stage=name, mode=mode)
+
+
+def record_usage(usage, mode, generation_seconds=None):
+    """Count tokens from a provider usage object and derive the token rate"""
+    if not isinstance(usage, dict):
+        LLM_USAGE_MISSING.inc(mode=mode)
+        return
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    completion_tokens = usage.get("completion_tokens") or 0
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, direction="prompt", mode=mode)
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, direction="completion", mode=mode)
+        if generation_seconds:
+            LLM_TOKEN_RATE.observe(completion_tokens / generation_seconds, mode=mode)
+
+
+def record_error(error_type, mode):
+    ERRORS.inc(type=error_type, mode=mode)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def render():
+    return REGISTRY.render()
@@ -0,0 +1,112 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from app.services import plan_store, split_tree
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_WAIT_SECONDS = 25.0
+MAX_WAIT_SECONDS = 60.0
+# Saves made by other worker processes are only noticed by polling the index this often
+POLL_INTERVAL = 1.0
+# Decoded plans kept for diffing, so many subscribers of one channel share the work
+PLAN_CACHE_SIZE = 32
+
+
+class PlanFeed(object):
+    """
+    Versioned feed of saved plans per target path or session. Versions are plan store ids;
+    subscribers wait for a version newer than the one they have and receive a structural
+    diff (split_tree.diff_trees) instead of the whole plan.
+    """
+
+    def __init__(self, store, poll_interval=POLL_INTERVAL):
+        self.store = store
+        self.poll_interval = poll_interval
+        self._changed = threading.Condition()
+        self._plans = OrderedDict()
+        self._plans_lock = threading.Lock()
+
+    def notify(self):
+        """Wake up waiting subscribers after a save"""
+        with self._changed:
+            self._changed.notify_all()
+
+    def wait(self, since=0, timeout=DEFAULT_WAIT_SECONDS, target_path=None, session=None):
+        """
+        Block until the channel has a version newer than since
+
+        Returns:
+        - Record of the latest save, or None when nothing newer was saved within timeout
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            record = self.store.latest_record(target_path, session)
+            if record is not None and record["id"] > since:
+                return record
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            with self._changed:
+                self._changed.wait(min(remaining, self.poll_interval))
+
+    def _plan(self, digest):
+        with self._plans_lock:
+            plan = self._plans.get(digest)
+            if plan is not None:
+                self._plans.move_to_end(digest)
+                return plan
+        try:
+            plan = self.store.load(digest)
+        except FileNotFoundError:
+            # Deleted after its record was read
+            return None
+        with self._plans_lock:
+            self._plans[digest] = plan
+            while len(self._plans) > PLAN_CACHE_SIZE:
+                self._plans.popitem(last=False)
+        return plan
+
+    def update(self, record, since=0, rect=None):
+        """
+        Feed message bringing a subscriber at version since up to record
+
+        Returns:
+        - Dict with version, tree_hash, plan (the record) and either changes (a diff against
+          version since) or data (the whole plan, when since is 0 or no longer stored), or None
+          when record was deleted in the meantime
+        """
+        message = {
+            'version': record["id"],
+            'tree_hash': record.get("tree_hash"),
+            'plan': record
+        }
+        data = self._plan(record["hash"])
+        if data is None:
+            return None
+        base = self.store.get_record(since) if since else None
+        base_data = self._plan(base["hash"]) if base is not None else None
+        if base_data is None:
+            message['data'] = data
+            return message
+        diff = split_tree.diff_trees(base_data, data, rect)
+        message['from_version'] = since
+        message['changes'] = diff['changes']
+        return message
+
+
+_feed = None
+_feed_lock = threading.Lock()
+
+
+def get_feed():
+    """Process-wide feed over the plan store"""
+    global _feed
+    if _feed is None:
+        with _feed_lock:
+            if _feed is None:
+                _feed = PlanFeed(plan_store.get_store())
+    return _feed
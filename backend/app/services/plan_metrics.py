@@ -0,0 +1,451 @@
+import logging
+import threading
+
+import numpy as np
+
+from app.services import geometry, apartment_builder, plan_render
+from app.services.split_tree import get_split_root, is_leaf, node_area, uses_child_angles, REFERENCE_FIELDS
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Rectangle sides closer than this touch (same tolerance as apartment_builder.boundary_contacts)
+TOLERANCE = 1e-4
+# Shortest shared wall that fits a door, in plan units (meters in the database export)
+DOOR_WIDTH = 0.8
+# Weights of the components of the overall score, each component is in 0..1
+SCORE_WEIGHTS = {
+    "area": 0.3,
+    "shape": 0.2,
+    "daylight": 0.2,
+    "adjacency": 0.2,
+    "circulation": 0.1,
+}
+CATEGORIES = ("bed", "bath", "kitchen", "foyer", "living", "extra")
+DAYLIGHT_CATEGORIES = apartment_builder.FACADE_CATEGORIES
+# A pair of rooms referenced in several fields keeps the strongest connection
+LINK_PRIORITY = ("connected", "open", "door")
+
+ROOM_FIELDS = ("plan", "area", "target_area", "area_error", "aspect_ratio", "compactness",
+               "facade_length", "shared_wall_length", "circulation_distance")
+PLAN_FIELDS = ("area", "target_area", "area_error", "max_room_area_error", "mean_aspect_ratio",
+               "max_aspect_ratio", "mean_compactness", "facade_length", "daylight_coverage",
+               "shared_wall_length", "adjacency_satisfaction", "circulation_length",
+               "max_circulation_distance", "unreachable_rooms", "score")
+
+
+def _side_contacts(rects, segments, tolerance=TOLERANCE):
+    """
+    Length along which each rectangle side lies on the paired axis-aligned segment,
+    for equally long arrays of rectangles (n, 4) and segments (n, 4)
+    """
+    sx0, sy0, sx1, sy1 = segments.T
+    vertical = np.abs(sx0 - sx1) < tolerance
+    horizontal = np.abs(sy0 - sy1) < tolerance
+    on_x = (np.abs(rects[:, 0] - sx0) < tolerance) | (np.abs(rects[:, 2] - sx0) < tolerance)
+    on_y = (np.abs(rects[:, 1] - sy0) < tolerance) | (np.abs(rects[:, 3] - sy0) < tolerance)
+    along_y = np.minimum(rects[:, 3], np.maximum(sy0, sy1)) - np.maximum(rects[:, 1], np.minimum(sy0, sy1))
+    along_x = np.minimum(rects[:, 2], np.maximum(sx0, sx1)) - np.maximum(rects[:, 0], np.minimum(sx0, sx1))
+    return np.where(vertical & on_x, np.maximum(along_y, 0.0), 0.0) + \
+        np.where(horizontal & on_y, np.maximum(along_x, 0.0), 0.0)
+
+
+def _shared_lengths(a, b, tolerance=TOLERANCE):
+    """Length of the wall shared by paired rectangles a[i] and b[i] (0 when they only meet at a corner)"""
+    touch_x = (np.abs(a[:, 2] - b[:, 0]) < tolerance) | (np.abs(a[:, 0] - b[:, 2]) < tolerance)
+    touch_y = (np.abs(a[:, 3] - b[:, 1]) < tolerance) | (np.abs(a[:, 1] - b[:, 3]) < tolerance)
+    along_y = np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1])
+    along_x = np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0])
+    return np.where(touch_x, np.maximum(along_y, 0.0), 0.0) + np.where(touch_y, np.maximum(along_x, 0.0), 0.0)
+
+
+def _lookup(keys, values, queries):
+    """Values of queries in sorted unique keys, 0 for queries that are not there"""
+    if not len(keys):
+        return np.zeros(len(queries))
+    position = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+    return np.where(keys[position] == queries, values[position], 0.0)
+
+
+def _segment_array(segments):
+    result = []
+    for segment in segments or []:
+        if isinstance(segment, dict):
+            result.append(geometry.to_xy(segment["start"]) + geometry.to_xy(segment["end"]))
+        else:
+            result.append(tuple(float(v) for v in segment))
+    return result
+
+
+class PlanBatch(object):
+    """
+    Many laid-out plans flattened into arrays: rectangles grouped by room, rooms grouped by plan,
+    facade and circulation segments, and the room pairs the split trees ask to be connected
+    (with the strongest of connected / open / door)
+    """
+
+    def __init__(self):
+        self.rects, self.rect_room = [], []
+        self.room_plan, self.room_target, self.room_category, self.room_names = [], [], [], []
+        self.facade, self.facade_plan = [], []
+        self.circulation, self.circulation_plan = [], []
+        self.links, self.link_kind = [], []
+        self.errors = []
+        self.count = 0
+
+    def add(self, spec, target_areas=None):
+        """
+        Lay out one plan and append it (a plan that cannot be laid out is recorded in errors
+        and gets no rooms)
+
+        Parameters:
+        - spec: Apartment or plan with a split tree and a boundary, as for plan_render.render_svg
+        - target_areas: Optional dict of room name -> target area, defaults to the tree's areas
+        """
+        plan = self.count
+        self.count += 1
+        try:
+            self._add(plan, spec, target_areas or {})
+        except (ValueError, TypeError, KeyError, IndexError) as e:
+            self.errors.append({"index": plan, "error": str(e)})
+
+    def _add(self, plan, spec, target_areas):
+        root = get_split_root(spec.get("split", spec)) if isinstance(spec, dict) else None
+        if root is None:
+            raise ValueError("Missing split tree")
+        polygon, y_up = apartment_builder.boundary_polygon(spec)
+        placed = geometry.layout_region(root, geometry.decompose_polygon(polygon), y_up=y_up)
+        leaves = [(node, rects) for node, rects in placed.values() if is_leaf(node) and len(rects)]
+        facade, circulation = spec.get("facade"), spec.get("circulation")
+        if facade is None or circulation is None:
+            inferred_facade, inferred_circulation = apartment_builder.infer_facade_and_circulation(polygon, leaves)
+            facade = inferred_facade if facade is None else facade
+            circulation = inferred_circulation if circulation is None else circulation
+        facade, circulation = _segment_array(facade), _segment_array(circulation)
+
+        # Database leaves that share a mergeid (bed_1 cut in two) form one room
+        merged = uses_child_angles(root)
+        rooms, leaf_room = {}, {}
+        for node, rects in leaves:
+            key = (node.get("mergeid") if merged else None) or node.get("name") or str(id(node))
+            rooms.setdefault(key, []).append((node, rects))
+            leaf_room[node.get("name")] = key
+        room_index = {key: len(self.room_plan) + i for i, key in enumerate(rooms)}
+        links = {}
+        for node, _ in leaves:
+            for field in REFERENCE_FIELDS:
+                for ref in node.get(field) or []:
+                    a, b = leaf_room.get(node.get("name")), leaf_room.get(ref)
+                    if a is None or b is None or a == b:
+                        continue
+                    pair = tuple(sorted((room_index[a], room_index[b])))
+                    if pair not in links or LINK_PRIORITY.index(field) > LINK_PRIORITY.index(links[pair]):
+                        links[pair] = field
+
+        for key, parts in rooms.items():
+            self.room_plan.append(plan)
+            self.room_names.append(key)
+            self.room_category.append(CATEGORIES.index(apartment_builder.room_category(parts[0][0])))
+            self.room_target.append(float(target_areas.get(key, sum(node_area(node) for node, _ in parts))))
+            for _, rects in parts:
+                self.rects.extend(rects.tolist())
+                self.rect_room.extend([room_index[key]] * len(rects))
+        for pair, kind in links.items():
+            self.links.append(pair)
+            self.link_kind.append(kind)
+        self.facade.extend(facade)
+        self.facade_plan.extend([plan] * len(facade))
+        self.circulation.extend(circulation)
+        self.circulation_plan.extend([plan] * len(circulation))
+
+    def arrays(self):
+        return {
+            "rects": np.array(self.rects, dtype=float).reshape(-1, 4),
+            "rect_room": np.array(self.rect_room, dtype=np.int64),
+            "room_plan": np.array(self.room_plan, dtype=np.int64),
+            "room_target": np.array(self.room_target, dtype=float),
+            "room_category": np.array(self.room_category, dtype=np.int64),
+            "facade": np.array(self.facade, dtype=float).reshape(-1, 4),
+            "facade_plan": np.array(self.facade_plan, dtype=np.int64),
+            "circulation": np.array(self.circulation, dtype=float).reshape(-1, 4),
+            "circulation_plan": np.array(self.circulation_plan, dtype=np.int64),
+            "links": np.array(self.links, dtype=np.int64).reshape(-1, 2),
+            "link_door": np.array([kind == "door" for kind in self.link_kind], dtype=bool),
+        }
+
+
+def _circulation_distances(room_plan, centroids, entry, edges, plans):
+    """
+    Walking distance from the entry to every room: shortest paths between room centroids over
+    rooms joined by a wall, batched Floyd-Warshall over all plans with the same room count
+
+    Returns:
+    - Distance per room, inf for rooms that cannot be reached (or plans without an entry)
+    """
+    distances = np.full(len(room_plan), np.inf)
+    room_counts = np.bincount(room_plan, minlength=plans)
+    room_starts = np.concatenate([[0], np.cumsum(room_counts)[:-1]])
+    local = np.arange(len(room_plan)) - room_starts[room_plan]
+    for n in np.unique(room_counts[room_counts > 0]):
+        batch = np.nonzero(room_counts == n)[0]
+        slot = np.full(plans, -1)
+        slot[batch] = np.arange(len(batch))
+        matrix = np.full((len(batch), n, n), np.inf)
+        matrix[:, np.arange(n), np.arange(n)] = 0.0
+        a, b = edges[:, 0], edges[:, 1]
+        inside = slot[room_plan[a]] >= 0
+        a, b = a[inside], b[inside]
+        length = np.hypot(*(centroids[a] - centroids[b]).T)
+        matrix[slot[room_plan[a]], local[a], local[b]] = length
+        matrix[slot[room_plan[a]], local[b], local[a]] = length
+        for k in range(n):
+            matrix = np.minimum(matrix, matrix[:, :, k:k + 1] + matrix[:, k:k + 1, :])
+        rooms = np.nonzero(slot[room_plan] >= 0)[0]
+        is_entry = entry[rooms].reshape(len(batch), n)
+        from_entry = np.where(is_entry[:, :, None], matrix, np.inf).min(axis=1)
+        distances[rooms] = from_entry.ravel()
+    return distances
+
+
+class PlanMetrics(object):
+    """
+    Metrics of a batch of plans: rooms holds per-room arrays (ROOM_FIELDS plus name and category),
+    plans per-plan arrays (PLAN_FIELDS), walls the rooms sharing a wall and its length
+    """
+
+    def __init__(self, rooms, plans, walls, room_names, errors):
+        self.rooms = rooms
+        self.plans = plans
+        self.walls = walls
+        self.room_names = room_names
+        self.errors = errors
+
+    def __len__(self):
+        return len(self.plans["score"])
+
+    def ranking(self):
+        """Plan indices, best score first (plans that failed to lay out last)"""
+        return np.argsort(-np.nan_to_num(self.plans["score"], nan=-1.0), kind="stable")
+
+    def plan_records(self):
+        records = []
+        for i in range(len(self)):
+            record = {"index": i}
+            for field in PLAN_FIELDS:
+                value = self.plans[field][i]
+                record[field] = None if not np.isfinite(value) else round(float(value), 6)
+            records.append(record)
+        return records
+
+    def room_records(self, plan=None):
+        """Per-room metrics, optionally of one plan only"""
+        indices = np.arange(len(self.room_names)) if plan is None else np.nonzero(self.rooms["plan"] == plan)[0]
+        records = []
+        for i in indices:
+            record = {"name": self.room_names[i], "category": CATEGORIES[self.rooms["category"][i]]}
+            for field in ROOM_FIELDS:
+                value = self.rooms[field][i]
+                if field == "plan":
+                    record[field] = int(value)
+                else:
+                    record[field] = None if not np.isfinite(value) else round(float(value), 6)
+            records.append(record)
+        return records
+
+    def wall_records(self, plan=None):
+        a, b, length = self.walls["a"], self.walls["b"], self.walls["length"]
+        keep = np.ones(len(a), dtype=bool) if plan is None else self.rooms["plan"][a] == plan
+        return [{"plan": int(self.rooms["plan"][i]), "rooms": [self.room_names[i], self.room_names[j]],
+                 "length": round(float(l), 6)} for i, j, l in zip(a[keep], b[keep], length[keep])]
+
+
+def compute(specs, target_areas=None, door_width=DOOR_WIDTH):
+    """
+    Per-room and per-plan layout metrics of many plans at once
+
+    Parameters:
+    - specs: List of apartments/plans (split tree plus bounds.corners, corners or boundary_data);
+      facade and circulation segments are inferred like /apartments/build when missing
+    - target_areas: Optional list (one per spec) of dicts room name -> target area
+    - door_width: Shortest shared wall that counts as a door between two rooms
+
+    Returns:
+    - PlanMetrics
+    """
+    batch = PlanBatch()
+    for i, spec in enumerate(specs):
+        batch.add(spec, target_areas[i] if target_areas else None)
+    data = batch.arrays()
+    plans = batch.count
+    rects, rect_room, room_plan = data["rects"], data["rect_room"], data["room_plan"]
+    room_count = len(room_plan)
+
+    # Areas, bounding boxes and area-weighted centroids of rooms (rectangles are grouped by room)
+    rect_area = (rects[:, 2] - rects[:, 0]) * (rects[:, 3] - rects[:, 1])
+    area = np.bincount(rect_room, rect_area, minlength=room_count)
+    target = data["room_target"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        area_error = np.where(target > 0, (area - target) / target, np.nan)
+    if room_count:
+        starts = np.concatenate([[0], np.cumsum(np.bincount(rect_room, minlength=room_count))[:-1]])
+        width = np.maximum.reduceat(rects[:, 2], starts) - np.minimum.reduceat(rects[:, 0], starts)
+        height = np.maximum.reduceat(rects[:, 3], starts) - np.minimum.reduceat(rects[:, 1], starts)
+    else:
+        width = height = np.zeros(0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        aspect_ratio = np.maximum(width, height) / np.minimum(width, height)
+        centroids = np.column_stack([
+            np.bincount(rect_room, rect_area * (rects[:, 0] + rects[:, 2]) / 2, minlength=room_count),
+            np.bincount(rect_room, rect_area * (rects[:, 1] + rects[:, 3]) / 2, minlength=room_count)
+        ]) / area[:, None]
+
+    # Walls between rectangles of the same plan: inside a room they shorten its perimeter,
+    # between rooms they are shared walls
+    rect_plan = room_plan[rect_room]
+    left, right = geometry.group_pairs(rect_plan, rect_plan, plans)
+    ordered = left < right
+    left, right = left[ordered], right[ordered]
+    shared = _shared_lengths(rects[left], rects[right])
+    touching = shared > TOLERANCE
+    left, right, shared = left[touching], right[touching], shared[touching]
+    room_a, room_b = rect_room[left], rect_room[right]
+    same = room_a == room_b
+    perimeter = np.bincount(rect_room, 2 * ((rects[:, 2] - rects[:, 0]) + (rects[:, 3] - rects[:, 1])),
+                            minlength=room_count) - 2 * np.bincount(room_a[same], shared[same], minlength=room_count)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # 16 A / P^2: 1 for a square, lower for elongated or jagged rooms
+        compactness = 16 * area / perimeter ** 2
+    low, high = np.minimum(room_a[~same], room_b[~same]), np.maximum(room_a[~same], room_b[~same])
+    wall_keys, wall_inverse = np.unique(low * max(room_count, 1) + high, return_inverse=True)
+    wall_length = np.bincount(wall_inverse, shared[~same], minlength=len(wall_keys))
+    wall_a, wall_b = wall_keys // max(room_count, 1), wall_keys % max(room_count, 1)
+    shared_wall = np.bincount(wall_a, wall_length, minlength=room_count) + \
+        np.bincount(wall_b, wall_length, minlength=room_count)
+
+    # Facade exposure and entry rooms, from rectangle sides lying on the segments
+    def contact(segments, segment_plan):
+        order = np.argsort(segment_plan, kind="stable")
+        rect_index, segment_index = geometry.group_pairs(rect_plan, segment_plan[order], plans)
+        length = _side_contacts(rects[rect_index], segments[order][segment_index])
+        return np.bincount(rect_room[rect_index], length, minlength=room_count)
+
+    facade_length = contact(data["facade"], data["facade_plan"])
+    entry = contact(data["circulation"], data["circulation_plan"]) > TOLERANCE
+    # Where a foyer is on the circulation it is the entrance, not every room along the corridor
+    foyer = data["room_category"] == CATEGORIES.index("foyer")
+    foyer_entry = np.bincount(room_plan, entry & foyer, minlength=plans) > 0
+    entry &= foyer | ~foyer_entry[room_plan]
+    has_entry = np.bincount(room_plan, entry, minlength=plans) > 0
+
+    # Requested connections are satisfied by a shared wall, at least a door wide for doors
+    links = data["links"]
+    link_length = _lookup(wall_keys, wall_length, links[:, 0] * max(room_count, 1) + links[:, 1])
+    satisfied = link_length >= np.where(data["link_door"], door_width, TOLERANCE)
+
+    # Walk through doors: requested connections that are realised, or any door-wide wall in
+    # plans that request none
+    link_plan = room_plan[links[:, 0]]
+    requests_links = np.bincount(link_plan, minlength=plans) > 0
+    walkable = (wall_length >= door_width) & ~requests_links[room_plan[wall_a]]
+    edges = np.vstack([links[satisfied], np.column_stack([wall_a, wall_b])[walkable]])
+    circulation_distance = _circulation_distances(room_plan, np.nan_to_num(centroids), entry, edges, plans)
+
+    # Plan totals
+    def plan_sum(values, mask=None):
+        weights = values if mask is None else np.where(mask, values, 0.0)
+        return np.bincount(room_plan, weights, minlength=plans)
+
+    def plan_max(values):
+        result = np.full(plans, -np.inf)
+        np.maximum.at(result, room_plan, np.nan_to_num(values, nan=-np.inf))
+        return np.where(np.isneginf(result), np.nan, result)
+
+    rooms_per_plan = np.bincount(room_plan, minlength=plans).astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        plan_area = plan_sum(area)
+        plan_target = plan_sum(target)
+        mean_area_error = plan_sum(np.nan_to_num(np.abs(area_error))) / rooms_per_plan
+        mean_aspect = plan_sum(np.nan_to_num(aspect_ratio, nan=1.0, posinf=1.0)) / rooms_per_plan
+        mean_compactness = plan_sum(np.nan_to_num(compactness)) / rooms_per_plan
+        daylight_rooms = np.isin(data["room_category"], [CATEGORIES.index(c) for c in DAYLIGHT_CATEGORIES])
+        daylight_coverage = plan_sum(np.ones(room_count), daylight_rooms & (facade_length > TOLERANCE)) / \
+            plan_sum(np.ones(room_count), daylight_rooms)
+        link_count = np.bincount(link_plan, minlength=plans).astype(float)
+        adjacency = np.where(link_count > 0, np.bincount(link_plan, satisfied.astype(float), minlength=plans) / link_count, 1.0)
+        # Plans without an entry have no walking distances rather than unreachable rooms
+        circulation_distance = np.where(has_entry[room_plan], circulation_distance, np.nan)
+        reachable = np.isfinite(circulation_distance)
+        unreachable = np.where(has_entry, plan_sum(np.ones(room_count), ~reachable), np.nan)
+        circulation_length = np.where(has_entry, plan_sum(np.where(reachable, circulation_distance, 0.0)), np.nan)
+        max_circulation = plan_max(np.where(reachable, circulation_distance, np.nan))
+
+        components = {
+            "area": 1.0 - np.minimum(mean_area_error, 1.0),
+            "shape": mean_compactness,
+            "daylight": np.nan_to_num(daylight_coverage, nan=1.0),
+            "adjacency": adjacency,
+            "circulation": np.nan_to_num(1.0 - unreachable / rooms_per_plan, nan=1.0),
+        }
+    score = sum(weight * components[name] for name, weight in SCORE_WEIGHTS.items()) / sum(SCORE_WEIGHTS.values())
+    failed = rooms_per_plan == 0
+    score = np.where(failed, np.nan, score)
+
+    rooms = {
+        "plan": room_plan,
+        "category": data["room_category"],
+        "area": area,
+        "target_area": target,
+        "area_error": area_error,
+        "aspect_ratio": aspect_ratio,
+        "compactness": compactness,
+        "facade_length": facade_length,
+        "shared_wall_length": shared_wall,
+        "circulation_distance": circulation_distance,
+    }
+    plan_arrays = {
+        "area": plan_area,
+        "target_area": plan_target,
+        "area_error": mean_area_error,
+        "max_room_area_error": plan_max(np.abs(area_error)),
+        "mean_aspect_ratio": mean_aspect,
+        "max_aspect_ratio": plan_max(aspect_ratio),
+        "mean_compactness": mean_compactness,
+        "facade_length": plan_sum(facade_length),
+        "daylight_coverage": daylight_coverage,
+        "shared_wall_length": np.bincount(room_plan[wall_a], wall_length, minlength=plans),
+        "adjacency_satisfaction": adjacency,
+        "circulation_length": circulation_length,
+        "max_circulation_distance": max_circulation,
+        "unreachable_rooms": unreachable,
+        "score": score,
+    }
+    for name, values in plan_arrays.items():
+        plan_arrays[name] = np.where(failed, np.nan, values)
+    walls = {"a": wall_a, "b": wall_b, "length": wall_length}
+    return PlanMetrics(rooms, plan_arrays, walls, batch.room_names, batch.errors)
+
+
+def summarize(spec, target_areas=None):
+    """Plan-level metrics of a single plan as a dict, None when it cannot be laid out"""
+    result = compute([spec], [target_areas] if target_areas else None)
+    if result.errors:
+        return None
+    record = result.plan_records()[0]
+    record.pop("index")
+    return record
+
+
+_database_metrics = None
+_lock = threading.Lock()
+
+
+def database_metrics():
+    """Metrics of every apartment in the database export, computed once"""
+    global _database_metrics
+    if _database_metrics is None:
+        apartments = plan_render.load_database()
+        with _lock:
+            if _database_metrics is None:
+                _database_metrics = compute(apartments)
+                logger.info(f"Computed layout metrics of {len(apartments)} database apartments")
+    return _database_metrics
@@ -0,0 +1,515 @@
+import os
+import re
+import json
+import math
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+
+from app.services import admission, config, metrics, split_tree, startup
+from app.services.config import DEFAULT_POOL_FILE
+from app.services.plan_store import atomic_write
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# numpy-backed modules, only needed once the pool is filled or serves a request
+plan_metrics = startup.lazy_module("app.services.plan_metrics")
+plan_render = startup.lazy_module("app.services.plan_render")
+
+DEFAULT_PLANS_PER_KEY = config.DEFAULT_POOL_PLANS_PER_KEY
+DEFAULT_PROGRAMS = config.DEFAULT_POOL_PROGRAMS
+DEFAULT_TOKEN_BUDGET = config.DEFAULT_POOL_TOKEN_BUDGET
+# Tokens per plan assumed before any plan was generated
+DEFAULT_TOKENS_PER_PLAN = 4000
+DEFAULT_INTERVAL = config.DEFAULT_POOL_INTERVAL
+DEFAULT_IDLE_SECONDS = config.DEFAULT_POOL_IDLE_SECONDS
+DEFAULT_MAX_AGE = config.DEFAULT_POOL_MAX_AGE
+DEFAULT_MIN_SCORE = config.DEFAULT_POOL_MIN_SCORE
+# Requests whose area differs from the pooled plan by more than this factor are generated
+AREA_RATIO_LIMIT = 1.35
+
+# Plain rectangles by long side / short side: (class, upper limit, aspect the plans are generated at)
+ASPECT_CLASSES = (
+    ("rect-1.0", 1.2, 1.1),
+    ("rect-1.4", 1.6, 1.4),
+    ("rect-1.8", 2.1, 1.8),
+    ("rect-2.5", 3.0, 2.5),
+)
+
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+                "一": 1, "两": 2, "二": 2, "三": 3, "四": 4, "五": 5}
+BEDROOM_PATTERN = re.compile(r"(\d+|one|two|three|four|five)[\s-]*(?:bed(?:room)?s?\b|br\b)|(\d)b\d(?:b|ba)\b"
+                             r"|(\d|一|两|二|三|四|五)(?:室|居)")
+BATHROOM_PATTERN = re.compile(r"(\d+|one|two|three|four|five)[\s-]*(?:bath(?:room)?s?\b|ba\b)|\db(\d)(?:b|ba)\b"
+                              r"|(\d|一|两|二|三|四|五)卫")
+STUDIO_PATTERN = re.compile(r"\bstudio\b|单间|开间")
+# Rooms the pooled programs do not have; descriptions asking for them are always generated
+EXTRA_ROOM_PATTERN = re.compile(r"study|office|\bden\b|balcony|terrace|storage|laundry|garage|closet|"
+                                r"书房|阳台|储藏|洗衣")
+
+
+def pool_enabled():
+    return config.get_settings().pool
+
+
+def _count(groups):
+    value = next(g for g in groups if g)
+    return int(value) if value.isdigit() else NUMBER_WORDS[value]
+
+
+def parse_program(description):
+    """
+    Bedroom and bathroom counts asked for in a description ("2 bedroom 1 bath", "2B2B",
+    "studio", "两室一卫")
+
+    Returns:
+    - (bedrooms, bathrooms or None when not given), or None when the description is not a
+      plain program (no bedroom count, or rooms the pool does not have)
+    """
+    text = description.lower()
+    if EXTRA_ROOM_PATTERN.search(text):
+        return None
+    bedrooms = BEDROOM_PATTERN.search(text)
+    if bedrooms:
+        count = _count(bedrooms.groups())
+    elif STUDIO_PATTERN.search(text):
+        count = 0
+    else:
+        return None
+    bathrooms = BATHROOM_PATTERN.search(text)
+    return count, _count(bathrooms.groups()) if bathrooms else None
+
+
+def shape_class(processed_boundary):
+    """
+    Shape class of a processed boundary (see floor_plan_service.process_boundary_data)
+
+    Returns:
+    - (class, portrait), or None for anything but a plain rectangle in the aspect classes
+    """
+    if processed_boundary.get('corners') is not None:
+        return None
+    width, height = processed_boundary['bounding_box']['width'], processed_boundary['bounding_box']['height']
+    if width <= 0 or height <= 0:
+        return None
+    aspect = max(width, height) / min(width, height)
+    for name, limit, _ in ASPECT_CLASSES:
+        if aspect <= limit:
+            return name, height > width
+    return None
+
+
+def database_programs(count=DEFAULT_PROGRAMS):
+    """
+    The most common (bedrooms, bathrooms) programs of the database export with their median area
+
+    Returns:
+    - List of {"bedrooms", "bathrooms", "area", "share"}, most common first
+    """
+    apartments = plan_render.load_database()
+    groups = {}
+    for apartment in apartments:
+        if apartment.get('bedrooms') is None or not apartment.get('area'):
+            continue
+        key = (int(apartment['bedrooms']), int(apartment.get('bathrooms') or 1))
+        groups.setdefault(key, []).append(float(apartment['area']))
+    programs = []
+    for (bedrooms, bathrooms), areas in sorted(groups.items(), key=lambda item: -len(item[1]))[:count]:
+        areas.sort()
+        programs.append({"bedrooms": bedrooms, "bathrooms": bathrooms,
+                         "area": round(areas[len(areas) // 2], 1), "share": round(len(areas) / len(apartments), 4)})
+    return programs
+
+
+def program_key(program, shape):
+    return f"{program['bedrooms']}b{program['bathrooms']}b/{shape}"
+
+
+def program_description(program):
+    """Description the pooled plans of a program are generated from"""
+    baths = "one bathroom" if program["bathrooms"] == 1 else f"{program['bathrooms']} bathrooms"
+    if program["bedrooms"] == 0:
+        return f"A studio apartment of about {program['area']:.0f} square meters with {baths}, a kitchen and a living area"
+    return (f"A {program['bedrooms']} bedroom apartment of about {program['area']:.0f} square meters with "
+            f"{baths}, a kitchen, a living room and a foyer")
+
+
+def canonical_boundary(program, shape):
+    """Landscape rectangle of the program's area in the aspect of the shape class"""
+    aspect = next(a for name, _, a in ASPECT_CLASSES if name == shape)
+    width = round(math.sqrt(program["area"] * aspect), 1)
+    height = round(program["area"] / width, 1)
+    return [{"type": "rectangle", "x": 0, "y": 0, "width": width, "height": height,
+             "widthInUnits": width, "heightInUnits": height}]
+
+
+def adapt_tree(root, factor, transpose):
+    """Copy of a split tree with areas scaled by factor and, when transposing, cut directions swapped"""
+    node = {k: v for k, v in root.items() if k != "children"}
+    if isinstance(node.get("area"), (int, float)):
+        node["area"] = round(node["area"] * factor, 4)
+    if transpose and isinstance(node.get("angle"), (int, float)):
+        vertical = abs(node["angle"] - split_tree.VERTICAL_ANGLE) < split_tree.ANGLE_TOLERANCE
+        node["angle"] = 0 if vertical else round(split_tree.VERTICAL_ANGLE, 4)
+    if "children" in root:
+        node["children"] = [adapt_tree(child, factor, transpose) for child in root.get("children") or []]
+    return node
+
+
+def room_counts(json_result, boundary_data):
+    """(bedrooms, bathrooms) of a plan by room category, None when it cannot be laid out"""
+    root = split_tree.get_split_root(json_result)
+    if root is None:
+        return None
+    result = plan_metrics.compute([{"split": root, "boundary_data": boundary_data}])
+    if result.errors:
+        return None
+    categories = [room["category"] for room in result.room_records(0)]
+    return categories.count("bed"), categories.count("bath")
+
+
+class PlanPool(object):
+    """
+    Validated plans per (program, shape class), generated ahead of demand by a background
+    scheduler during idle time and under an hourly token budget. Requests for a pooled program
+    on a plain rectangle of a similar area get a pooled plan scaled to their area (and turned
+    for portrait boundaries) instead of a model call.
+    """
+
+    def __init__(self, path=DEFAULT_POOL_FILE, plans_per_key=DEFAULT_PLANS_PER_KEY, token_budget=DEFAULT_TOKEN_BUDGET,
+                 max_age=DEFAULT_MAX_AGE, min_score=DEFAULT_MIN_SCORE, programs=None):
+        self.path = path
+        self.plans_per_key = plans_per_key
+        self.token_budget = token_budget
+        self.max_age = max_age
+        self.min_score = min_score
+        self._programs = programs
+        self.entries = {}
+        self.demand = {}
+        self.hits = 0
+        self.misses = 0
+        self.last_request = 0.0
+        self._spent = deque()
+        self._served = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._load()
+
+    @property
+    def programs(self):
+        if self._programs is None:
+            self._programs = database_programs(config.get_settings().pool_programs)
+        return self._programs
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.entries = data.get("entries", {})
+            self.demand = data.get("demand", {})
+            logger.info(f"Loaded {sum(len(e) for e in self.entries.values())} pooled plans from {self.path}")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cannot read plan pool {self.path}, starting empty: {str(e)}")
+
+    def _save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps({"entries": self.entries, "demand": self.demand}, ensure_ascii=False)
+        atomic_write(self.path, data.encode("utf-8"))
+
+    def _fresh(self, entries, now=None):
+        now = time.time() if now is None else now
+        return [e for e in entries if now - e["created_at"] <= self.max_age]
+
+    def match(self, processed_boundary, description, preferences=None):
+        """
+        Pool key a request belongs to
+
+        Returns:
+        - (key, program, portrait), or None for requests the pool does not cover
+        """
+        if preferences:
+            return None
+        parsed = parse_program(description or "")
+        shape = shape_class(processed_boundary)
+        if parsed is None or shape is None:
+            return None
+        bedrooms, bathrooms = parsed
+        # Programs are sorted by frequency, so an unspecified bathroom count takes the most common one
+        program = next((p for p in self.programs if p["bedrooms"] == bedrooms
+                        and (bathrooms is None or p["bathrooms"] == bathrooms)), None)
+        if program is None:
+            return None
+        ratio = processed_boundary['total_area'] / program["area"]
+        if not 1 / AREA_RATIO_LIMIT <= ratio <= AREA_RATIO_LIMIT:
+            return None
+        return program_key(program, shape[0]), program, shape[1]
+
+    def candidates(self, processed_boundary):
+        """
+        Programs the pool could answer for a boundary, whatever the description turns out to be
+
+        Returns:
+        - List of {"key", "bedrooms", "bathrooms", "plans"} (fresh pooled plans), most common program first
+        """
+        shape = shape_class(processed_boundary)
+        if shape is None:
+            return []
+        now = time.time()
+        result = []
+        for program in self.programs:
+            ratio = processed_boundary['total_area'] / program["area"]
+            if not 1 / AREA_RATIO_LIMIT <= ratio <= AREA_RATIO_LIMIT:
+                continue
+            key = program_key(program, shape[0])
+            with self._lock:
+                plans = len(self._fresh(self.entries.get(key, []), now))
+            result.append({"key": key, "bedrooms": program["bedrooms"], "bathrooms": program["bathrooms"],
+                           "plans": plans})
+        return result
+
+    def lookup(self, boundary_data, processed_boundary, description, preferences=None):
+        """
+        Pooled plan adapted to the request's boundary, or None when the request has to be generated
+
+        Returns:
+        - Response dict like a generated one (thinking_steps, json_result, metrics) plus "pool"
+        """
+        self.last_request = time.monotonic()
+        matched = self.match(processed_boundary, description, preferences)
+        if matched is None:
+            return None
+        key, program, portrait = matched
+        with self._lock:
+            self.demand[key] = self.demand.get(key, 0) + 1
+            entries = self._fresh(self.entries.get(key, [])) or list(self.entries.get(key, []))
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+        if not entries:
+            self.misses += 1
+            metrics.record_cache("plan_pool", False)
+            return None
+
+        from app.services import floor_plan_service
+        # Rotate through the pooled plans so that repeated requests see different layouts
+        entry = entries[served % len(entries)]
+        root = split_tree.get_split_root(entry["json_result"])
+        factor = processed_boundary['total_area'] / (split_tree.node_area(root) or program["area"])
+        adapted = {"split": adapt_tree(root, factor, portrait)}
+        scored = floor_plan_service.score_plan(adapted, boundary_data)
+        if scored is None:
+            self.misses += 1
+            metrics.record_cache("plan_pool", False)
+            return None
+        self.hits += 1
+        metrics.record_cache("plan_pool", True)
+        return {
+            "thinking_steps": entry["thinking_steps"],
+            "json_result": adapted,
+            "metrics": scored,
+            "pool": {"key": key, "plan_id": entry["id"], "created_at": entry["created_at"],
+                     "scale": round(factor, 4), "transposed": portrait},
+        }
+
+    def add(self, key, entry):
+        """
+        Add a validated plan; plans with the same tree hash are kept once, and stale or
+        lower-scoring plans make room beyond plans_per_key
+        """
+        with self._lock:
+            entries = [e for e in self.entries.get(key, []) if e["hash"] != entry["hash"]]
+            entries.append(entry)
+            now = time.time()
+            entries.sort(key=lambda e: (now - e["created_at"] <= self.max_age, e["metrics"]["score"]), reverse=True)
+            self.entries[key] = entries[:self.plans_per_key]
+        self._save()
+
+    def tokens_spent(self, window=3600.0):
+        """Tokens the scheduler spent within the last window seconds"""
+        cutoff = time.monotonic() - window
+        with self._lock:
+            while self._spent and self._spent[0][0] < cutoff:
+                self._spent.popleft()
+            return sum(tokens for _, tokens in self._spent)
+
+    def _next_tokens(self):
+        with self._lock:
+            recent = [tokens for _, tokens in self._spent]
+        return sum(recent) / len(recent) if recent else DEFAULT_TOKENS_PER_PLAN
+
+    def needs(self):
+        """
+        Keys short of fresh plans, most wanted first (requests seen, then database share)
+
+        Returns:
+        - List of (key, program, shape)
+        """
+        now = time.time()
+        wanted = []
+        for program in self.programs:
+            for shape, _, _ in ASPECT_CLASSES:
+                key = program_key(program, shape)
+                with self._lock:
+                    fresh = len(self._fresh(self.entries.get(key, []), now))
+                    demand = self.demand.get(key, 0)
+                if fresh < self.plans_per_key:
+                    wanted.append(((demand, program["share"], -fresh), key, program, shape))
+        wanted.sort(key=lambda item: item[0], reverse=True)
+        return [item[1:] for item in wanted]
+
+    def idle(self, idle_seconds):
+        controller = admission.get_controller()
+        return controller.inflight == 0 and controller.waiting == 0 and \
+            time.monotonic() - self.last_request >= idle_seconds
+
+    def fill_one(self, key, program, shape):
+        """
+        Generate, validate and pool one plan for a key
+
+        Returns:
+        - Whether a plan was added
+        """
+        from app.services import floor_plan_service
+        boundary_data = canonical_boundary(program, shape)
+        description = program_description(program)
+        with self._lock:
+            option = len(self.entries.get(key, [])) + 1
+        # The design option keeps refreshes from being answered by the response cache
+        floor_plan_json, success, message = floor_plan_service.generate_floor_plan(
+            boundary_data, description, {"design_option": option}, use_pool=False)
+        if not success or not floor_plan_json:
+            logger.warning(f"Plan pool generation for {key} failed: {message}")
+            return False
+        try:
+            response = json.loads(floor_plan_json)
+        except ValueError:
+            response = {}
+        usage = response.get("usage") or {}
+        tokens = usage.get("total_tokens") or (usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)) \
+            or DEFAULT_TOKENS_PER_PLAN
+        with self._lock:
+            self._spent.append((time.monotonic(), tokens))
+
+        json_result = response.get("json_result")
+        scored = response.get("metrics")
+        if not isinstance(json_result, dict) or not scored or (scored.get("score") or 0) < self.min_score:
+            logger.info(f"Plan pool discarded a plan for {key}: score {scored and scored.get('score')}")
+            return False
+        counts = room_counts(json_result, boundary_data)
+        if counts != (program["bedrooms"], program["bathrooms"]):
+            logger.info(f"Plan pool discarded a plan for {key}: {counts} bedrooms/bathrooms")
+            return False
+        self.add(key, {
+            "id": uuid.uuid4().hex[:12],
+            "hash": split_tree.tree_hash(json_result),
+            "program": program,
+            "shape": shape,
+            "boundary_data": boundary_data,
+            "description": description,
+            "thinking_steps": response.get("thinking_steps"),
+            "json_result": json_result,
+            "metrics": scored,
+            "tokens": tokens,
+            "created_at": time.time(),
+        })
+        logger.info(f"Pooled a plan for {key} (score {scored['score']}, {tokens} tokens)")
+        return True
+
+    def run_once(self, idle_seconds=DEFAULT_IDLE_SECONDS):
+        """
+        One scheduler step: fill the most wanted key if the service is idle and the budget allows
+
+        Returns:
+        - The key that was worked on, or None
+        """
+        if not self.idle(idle_seconds):
+            return None
+        if self.tokens_spent() + self._next_tokens() > self.token_budget:
+            return None
+        wanted = self.needs()
+        if not wanted:
+            return None
+        key, program, shape = wanted[0]
+        self.fill_one(key, program, shape)
+        return key
+
+    def start(self, interval=DEFAULT_INTERVAL, idle_seconds=DEFAULT_IDLE_SECONDS):
+        """Start the background scheduler thread (once)"""
+        if self._thread is not None:
+            return self._thread
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.run_once(idle_seconds)
+                except Exception as e:
+                    logger.warning(f"Plan pool scheduler step failed: {str(e)}")
+
+        self._thread = threading.Thread(target=loop, name="floorplan-plan-pool", daemon=True)
+        self._thread.start()
+        logger.info(f"Plan pool scheduler started: every {interval}s when idle for {idle_seconds}s, "
+                    f"{self.token_budget} tokens per hour")
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        now = time.time()
+        with self._lock:
+            keys = {key: {"plans": len(entries), "fresh": len(self._fresh(entries, now)),
+                          "scores": [e["metrics"]["score"] for e in entries],
+                          "oldest_age": round(now - min(e["created_at"] for e in entries)) if entries else None,
+                          "demand": self.demand.get(key, 0)}
+                    for key, entries in self.entries.items()}
+            for key, count in self.demand.items():
+                keys.setdefault(key, {"plans": 0, "fresh": 0, "scores": [], "oldest_age": None, "demand": count})
+        return {
+            "keys": keys,
+            "hits": self.hits,
+            "misses": self.misses,
+            "tokens_last_hour": self.tokens_spent(),
+            "token_budget": self.token_budget,
+            "plans_per_key": self.plans_per_key,
+            "scheduler_running": self._thread is not None and not self._stop.is_set(),
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide plan pool"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                settings = config.get_settings()
+                _pool = PlanPool(settings.pool_file, settings.pool_plans_per_key, settings.pool_token_budget,
+                                 settings.pool_max_age, settings.pool_min_score)
+    return _pool
+
+
+def init_app(app):
+    """
+    Start the pool scheduler when FLOORPLAN_POOL is set; the programs (from the database
+    export) are only worked out by the first scheduler step or pooled request
+
+    Returns:
+    - PlanPool, or None when the pool is disabled
+    """
+    if not pool_enabled():
+        return None
+    settings = config.get_settings()
+    pool = get_pool()
+    pool.start(settings.pool_interval, settings.pool_idle_seconds)
+    app.extensions['floorplan_plan_pool'] = pool
+    return pool
@@ -0,0 +1,284 @@
+import os
+import json
+import math
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from app.services import config, geometry, apartment_builder, metrics
+from app.services.config import DEFAULT_THUMBNAIL_DIR
+from app.services.split_tree import get_split_root, is_leaf, node_area
+from app.services.plan_store import atomic_write
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTH = 480
+THUMBNAIL_WIDTH = 160
+MAX_WIDTH = 4096
+PADDING = 8
+# Rendered SVGs kept in memory in front of the thumbnail directory
+MEMORY_CACHE_SIZE = 512
+# Batches with fewer misses than this are rendered in the request thread, the pool is not worth it
+MIN_POOL_BATCH = 8
+# Bump when the drawing changes so cached thumbnails are not reused
+RENDER_VERSION = 1
+CACHE_NAME = "thumbnail"
+
+ROOM_COLORS = {
+    "bed": "#9ecae1",
+    "bath": "#a1d99b",
+    "kitchen": "#fdd0a2",
+    "foyer": "#d9d9d9",
+    "living": "#fdae6b",
+    "extra": "#dadaeb",
+}
+WALL_COLOR = "#333333"
+FACADE_COLOR = "#3182bd"
+CIRCULATION_COLOR = "#e6550d"
+
+
+def _spec_polygon(spec, root):
+    """Boundary polygon of a spec; plans without a boundary get a square of the tree's area"""
+    try:
+        return apartment_builder.boundary_polygon(spec)
+    except ValueError:
+        rect = spec.get("rect")
+        if rect:
+            x, y, w, h = (float(rect[k]) for k in ("x", "y", "width", "height"))
+        else:
+            x, y = 0.0, 0.0
+            w = h = math.sqrt(node_area(root))
+        return np.array([(x, y), (x + w, y), (x + w, y + h), (x, y + h)], dtype=float), False
+
+
+def render_key(spec, width=DEFAULT_WIDTH, labels=True):
+    """Content hash of a spec and the render options, used as thumbnail cache key and ETag"""
+    content = json.dumps([RENDER_VERSION, spec, width, bool(labels)], sort_keys=True,
+                         ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def render_svg(spec, width=DEFAULT_WIDTH, labels=True):
+    """
+    Draw a plan as SVG: laid-out rooms coloured by category, room labels, the boundary,
+    and facade and circulation segments (given in the spec or inferred like /apartments/build)
+
+    Parameters:
+    - spec: Apartment or plan with a split tree and a boundary (bounds.corners, corners,
+      boundary_data or rect); without a boundary the plan is drawn in a square of its area
+    - width: Image width in pixels, the height follows the plan's proportions
+    - labels: Whether to write room names
+
+    Returns:
+    - SVG document as a string
+    """
+    root = get_split_root(spec.get("split", spec)) if isinstance(spec, dict) else None
+    if root is None:
+        raise ValueError("Missing split tree")
+    polygon, y_up = _spec_polygon(spec, root)
+    if len(polygon) < 3:
+        raise ValueError("Boundary needs at least 3 corners")
+    width = min(max(int(width), 16), MAX_WIDTH)
+
+    placed = geometry.layout_region(root, geometry.decompose_polygon(polygon), y_up=y_up)
+    leaves = [(node, rects) for node, rects in placed.values() if is_leaf(node) and len(rects)]
+    facade, circulation = spec.get("facade"), spec.get("circulation")
+    if facade is None or circulation is None:
+        inferred_facade, inferred_circulation = apartment_builder.infer_facade_and_circulation(polygon, leaves)
+        facade = inferred_facade if facade is None else facade
+        circulation = inferred_circulation if circulation is None else circulation
+
+    min_x, min_y = polygon.min(axis=0)
+    max_x, max_y = polygon.max(axis=0)
+    scale = (width - 2 * PADDING) / max(max_x - min_x, geometry.EPSILON)
+    height = int(math.ceil((max_y - min_y) * scale)) + 2 * PADDING
+
+    def sx(x):
+        return round((x - min_x) * scale + PADDING, 2)
+
+    def sy(y):
+        return round(((max_y - y) if y_up else (y - min_y)) * scale + PADDING, 2)
+
+    def points(corners):
+        return " ".join(f"{sx(x)},{sy(y)}" for x, y in corners)
+
+    def segment_xy(segment):
+        if isinstance(segment, dict):
+            return geometry.to_xy(segment["start"]) + geometry.to_xy(segment["end"])
+        return tuple(float(v) for v in segment)
+
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+             f'viewBox="0 0 {width} {height}">']
+    font_size = max(6, min(14, width // 40))
+    for node, rects in leaves:
+        color = ROOM_COLORS[apartment_builder.room_category(node)]
+        outline = geometry.rects_outline(rects) if len(rects) > 1 else \
+            [(rects[0, 0], rects[0, 1]), (rects[0, 2], rects[0, 1]), (rects[0, 2], rects[0, 3]), (rects[0, 0], rects[0, 3])]
+        parts.append(f'<polygon points="{points(outline)}" fill="{color}" stroke="{WALL_COLOR}" stroke-width="1"/>')
+        if labels:
+            sizes = (rects[:, 2] - rects[:, 0]) * (rects[:, 3] - rects[:, 1])
+            x0, y0, x1, y1 = rects[int(np.argmax(sizes))]
+            label = escape(str(node.get("mergeid") or node.get("name") or ""))
+            parts.append(f'<text x="{sx((x0 + x1) / 2)}" y="{sy((y0 + y1) / 2)}" font-size="{font_size}" '
+                         f'font-family="sans-serif" text-anchor="middle" dominant-baseline="middle">{label}</text>')
+    parts.append(f'<polygon points="{points(polygon)}" fill="none" stroke="{WALL_COLOR}" stroke-width="2"/>')
+    for segments, color in ((facade, FACADE_COLOR), (circulation, CIRCULATION_COLOR)):
+        for segment in segments or []:
+            x0, y0, x1, y1 = segment_xy(segment)
+            parts.append(f'<line x1="{sx(x0)}" y1="{sy(y0)}" x2="{sx(x1)}" y2="{sy(y1)}" '
+                         f'stroke="{color}" stroke-width="3" stroke-linecap="round"/>')
+    parts.append('</svg>')
+    return "".join(parts)
+
+
+class ThumbnailCache(object):
+    """
+    Rendered SVGs keyed by render_key, in an in-memory LRU backed by a directory
+    (<key>.svg files, written atomically). A directory of None keeps them in memory only.
+    """
+
+    def __init__(self, directory=DEFAULT_THUMBNAIL_DIR, max_entries=MEMORY_CACHE_SIZE):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.svg")
+
+    def _remember(self, key, svg):
+        with self._lock:
+            self._entries[key] = svg
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            svg = self._entries.get(key)
+            if svg is not None:
+                self._entries.move_to_end(key)
+        if svg is None and self.directory:
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    svg = f.read()
+                self._remember(key, svg)
+            except OSError:
+                svg = None
+        metrics.record_cache(CACHE_NAME, svg is not None)
+        return svg
+
+    def put(self, key, svg):
+        self._remember(key, svg)
+        if self.directory:
+            try:
+                atomic_write(self._path(key), svg.encode("utf-8"))
+            except OSError as e:
+                logger.warning(f"Failed to write thumbnail {key}: {str(e)}")
+
+
+def _render_item(args):
+    """Process pool task: (svg, None) or (None, error message)"""
+    spec, width, labels = args
+    try:
+        return render_svg(spec, width, labels), None
+    except (ValueError, TypeError, KeyError, IndexError) as e:
+        return None, str(e)
+
+
+_cache = None
+_pool = None
+_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide thumbnail cache under FLOORPLAN_THUMBNAIL_DIR (default backend/data/thumbnails)"""
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = ThumbnailCache(config.get_settings().thumbnail_dir)
+    return _cache
+
+
+def get_pool():
+    """Render worker processes, FLOORPLAN_RENDER_WORKERS of them (default: CPU count)"""
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                workers = config.get_settings().render_workers or os.cpu_count() or 1
+                _pool = ProcessPoolExecutor(max_workers=workers)
+    return _pool
+
+
+def render_cached(spec, width=DEFAULT_WIDTH, labels=True):
+    """
+    Returns:
+    - (svg, cache key)
+    """
+    cache = get_cache()
+    key = render_key(spec, width, labels)
+    svg = cache.get(key)
+    if svg is None:
+        svg = render_svg(spec, width, labels)
+        cache.put(key, svg)
+    return svg, key
+
+
+def render_many(specs, width=THUMBNAIL_WIDTH, labels=False):
+    """
+    Render many plans, cached ones from the thumbnail cache and the rest in worker processes
+
+    Returns:
+    - svgs: List of SVG strings (None where rendering failed)
+    - errors: List of {"index", "error"}
+    - cached: Number of plans served from the cache
+    """
+    cache = get_cache()
+    keys = [render_key(spec, width, labels) for spec in specs]
+    svgs = [cache.get(key) for key in keys]
+    missing = [i for i, svg in enumerate(svgs) if svg is None]
+    tasks = [(specs[i], width, labels) for i in missing]
+    if len(tasks) >= MIN_POOL_BATCH:
+        results = list(get_pool().map(_render_item, tasks, chunksize=max(1, len(tasks) // 32)))
+    else:
+        results = [_render_item(task) for task in tasks]
+    errors = []
+    for i, (svg, error) in zip(missing, results):
+        if error is not None:
+            errors.append({"index": i, "error": error})
+            continue
+        svgs[i] = svg
+        cache.put(keys[i], svg)
+    logger.info(f"Rendered {len(missing) - len(errors)} plan(s), {len(specs) - len(missing)} from cache, "
+                f"{len(errors)} failed")
+    return svgs, errors, len(specs) - len(missing)
+
+
+_database = None
+
+
+def load_database():
+    """Apartments of the database export (FLOORPLAN_DATABASE_EXPORT), loaded once"""
+    global _database
+    if _database is None:
+        with _lock:
+            if _database is None:
+                with open(config.get_settings().database_export, "r", encoding="utf-8") as f:
+                    _database = json.load(f)
+    return _database
+
+
+def find_apartment(apartment_id):
+    """Database apartment with the given id (the first one, ids are not unique in the export)"""
+    for apartment in load_database():
+        if str(apartment.get("id")) == str(apartment_id):
+            return apartment
+    return None
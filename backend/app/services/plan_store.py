@@ -0,0 +1,321 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import datetime
+import tempfile
+import threading
+
+from app.services import config, split_tree
+from app.services.config import DEFAULT_STORE_DIR
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+TARGET_FILENAME = "floor_plan.json"
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+# Windows refuses to replace a file another process (e.g. Grasshopper) has open, retry briefly
+REPLACE_RETRIES = 10
+REPLACE_RETRY_DELAY = 0.05
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hash TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    session TEXT,
+    description TEXT,
+    room_count INTEGER,
+    bedroom_count INTEGER,
+    target_path TEXT,
+    size INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL,
+    tree_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS plans_created_at ON plans (created_at);
+CREATE INDEX IF NOT EXISTS plans_session ON plans (session, created_at);
+CREATE INDEX IF NOT EXISTS plans_target_path ON plans (target_path, id);
+CREATE INDEX IF NOT EXISTS plans_hash ON plans (hash);
+CREATE TABLE IF NOT EXISTS published (
+    target TEXT PRIMARY KEY,
+    plan_id INTEGER NOT NULL
+);
+"""
+COLUMNS = ("id", "hash", "created_at", "session", "description", "room_count", "bedroom_count",
+           "target_path", "size", "stored_size", "tree_hash")
+
+
+def canonical_json(data):
+    """Byte representation the content hash is computed over (sorted keys, no whitespace)"""
+    return json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def content_hash(data):
+    return hashlib.sha256(canonical_json(data)).hexdigest()
+
+
+def atomic_write(path, data):
+    """
+    Write bytes to path so that readers see either the old or the new file, never a partial one:
+    write a temporary file next to it, flush it to disk, then rename it over the target
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        for attempt in range(REPLACE_RETRIES):
+            try:
+                os.replace(tmp_path, path)
+                break
+            except PermissionError:
+                if attempt == REPLACE_RETRIES - 1:
+                    raise
+                time.sleep(REPLACE_RETRY_DELAY)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def room_counts(data):
+    """
+    Number of rooms (leaves of the split tree) and of bedrooms among them
+
+    Returns:
+    - (room_count, bedroom_count), (None, None) when the data holds no split tree
+    """
+    root = split_tree.get_split_root(data)
+    if root is None:
+        return None, None
+    rooms = bedrooms = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        if split_tree.is_leaf(node):
+            rooms += 1
+            label = str(node.get("mergeid") or node.get("type") or node.get("name") or "").lower()
+            if "bed" in label:
+                bedrooms += 1
+        else:
+            stack.extend(node.get("children") or [])
+    return rooms, bedrooms
+
+
+def _record(row):
+    record = dict(zip(COLUMNS, row))
+    record["created_at"] = datetime.datetime.fromtimestamp(
+        record["created_at"], datetime.timezone.utc).isoformat()
+    return record
+
+
+class PlanStore(object):
+    """
+    History of saved floor plans. Plan JSON is stored once per distinct content as
+    gzip-compressed blobs named by their SHA-256 (blobs/ab/abcd....json.gz); every save adds
+    a row to an SQLite index with its time, session, description, room counts and target path.
+    """
+
+    def __init__(self, root=DEFAULT_STORE_DIR):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        index_path = os.path.join(root, "index.sqlite3")
+        self._db = sqlite3.connect(index_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+        # Publishing holds a write transaction while the file is written, on its own connection
+        # so that reads and saves of this process are not queued behind it
+        self._publish_db = sqlite3.connect(index_path, check_same_thread=False, isolation_level=None)
+        self._publish_lock = threading.Lock()
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], f"{digest}.json.gz")
+
+    def save(self, data, session=None, description=None, target_path=None):
+        """
+        Store a plan and index the save
+
+        Returns:
+        - Index record of the save, with deduplicated set when the content was already stored
+        """
+        raw = canonical_json(data)
+        digest = hashlib.sha256(raw).hexdigest()
+        blob_path = self._blob_path(digest)
+        compressed = gzip.compress(raw, mtime=0)
+        rooms, bedrooms = room_counts(data)
+        structure_hash = split_tree.tree_hash(data)
+        # Checked under the lock so a concurrent delete cannot remove the blob in between
+        with self._lock:
+            deduplicated = os.path.exists(blob_path)
+            if not deduplicated:
+                atomic_write(blob_path, compressed)
+            cursor = self._db.execute(
+                "INSERT INTO plans (hash, created_at, session, description, room_count, bedroom_count,"
+                " target_path, size, stored_size, tree_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (digest, time.time(), session, description, rooms, bedrooms, target_path,
+                 len(raw), len(compressed), structure_hash))
+            self._db.commit()
+            plan_id = cursor.lastrowid
+        record = self.get_record(plan_id)
+        record["deduplicated"] = deduplicated
+        return record
+
+    def publish(self, plan_id, data, directory):
+        """
+        Atomically write a plan to directory/floor_plan.json for tools that read the file.
+        The published table keeps the highest plan id written to each file; it is only raised
+        inside the transaction that writes the file, so a slower earlier save (in this or another
+        process) cannot overwrite a newer one.
+
+        Returns:
+        - The file path, or None when a newer plan was already written there
+        """
+        file_path = os.path.join(directory, TARGET_FILENAME)
+        key = os.path.normcase(os.path.abspath(file_path))
+        content = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+        with self._publish_lock:
+            self._publish_db.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._publish_db.execute(
+                    "INSERT INTO published (target, plan_id) VALUES (?, ?) ON CONFLICT (target) DO UPDATE"
+                    " SET plan_id = excluded.plan_id WHERE excluded.plan_id >= published.plan_id",
+                    (key, plan_id))
+                if cursor.rowcount == 0:
+                    self._publish_db.execute("ROLLBACK")
+                    return None
+                atomic_write(file_path, content)
+            except BaseException:
+                self._publish_db.execute("ROLLBACK")
+                raise
+            self._publish_db.execute("COMMIT")
+        return file_path
+
+    def get_record(self, plan_id):
+        with self._lock:
+            row = self._db.execute(f"SELECT {', '.join(COLUMNS)} FROM plans WHERE id = ?", (plan_id,)).fetchone()
+        return _record(row) if row else None
+
+    def load(self, digest):
+        with gzip.open(self._blob_path(digest), "rb") as f:
+            return json.loads(f.read().decode("utf-8"))
+
+    def _with_data(self, record):
+        if record is None:
+            return None, None
+        try:
+            return record, self.load(record["hash"])
+        except FileNotFoundError:
+            # Deleted after the record was read
+            return None, None
+
+    def get(self, plan_id):
+        """(record, plan data), or (None, None) for an unknown or just deleted id"""
+        return self._with_data(self.get_record(plan_id))
+
+    def latest_record(self, target_path=None, session=None):
+        """Record of the most recent save, optionally for one target path or session"""
+        clauses, params = self._filters(target_path=target_path, session=session)
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM plans {clauses} ORDER BY id DESC LIMIT 1", params).fetchone()
+        return _record(row) if row else None
+
+    def latest(self, target_path=None, session=None):
+        """(record, plan data) of the most recent save, or (None, None)"""
+        return self._with_data(self.latest_record(target_path, session))
+
+    def _filters(self, session=None, query=None, rooms=None, bedrooms=None, target_path=None,
+                 since=None, until=None):
+        clauses, params = [], []
+        if session:
+            clauses.append("session = ?")
+            params.append(session)
+        if query:
+            clauses.append("description LIKE ? ESCAPE '\\'")
+            params.append("%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if rooms is not None:
+            clauses.append("room_count = ?")
+            params.append(rooms)
+        if bedrooms is not None:
+            clauses.append("bedroom_count = ?")
+            params.append(bedrooms)
+        if target_path:
+            clauses.append("target_path = ?")
+            params.append(target_path)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def list(self, limit=DEFAULT_PAGE_SIZE, offset=0, **filters):
+        """
+        Page of saves, newest first
+
+        Parameters:
+        - limit / offset: Page size (at most MAX_PAGE_SIZE) and start
+        - filters: session, query (description substring), rooms, bedrooms, target_path,
+          since / until (Unix timestamps)
+
+        Returns:
+        - (records, total number of matching saves)
+        """
+        limit = min(max(int(limit), 1), MAX_PAGE_SIZE)
+        offset = max(int(offset), 0)
+        clauses, params = self._filters(**filters)
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM plans {clauses}", params).fetchone()[0]
+            rows = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM plans {clauses} ORDER BY id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]).fetchall()
+        return [_record(row) for row in rows], total
+
+    def delete(self, plan_id):
+        """Remove a save; the blob goes too once no other save references it"""
+        with self._lock:
+            row = self._db.execute("SELECT hash FROM plans WHERE id = ?", (plan_id,)).fetchone()
+            if row is None:
+                return False
+            self._db.execute("DELETE FROM plans WHERE id = ?", (plan_id,))
+            self._db.commit()
+            remaining = self._db.execute("SELECT COUNT(*) FROM plans WHERE hash = ?", (row[0],)).fetchone()[0]
+            if not remaining:
+                try:
+                    os.remove(self._blob_path(row[0]))
+                except OSError as e:
+                    logger.warning(f"Failed to remove plan blob {row[0]}: {str(e)}")
+        return True
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+        with self._publish_lock:
+            self._publish_db.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Process-wide plan store under FLOORPLAN_PLAN_STORE (default backend/data/plans)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PlanStore(config.get_settings().plan_store)
+    return _store
@@ -0,0 +1,319 @@
+import os
+import sys
+import time
+import random
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+
+from app.services import admin, config
+from app.services.config import DEFAULT_PROFILE_DIR
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL_MS = config.DEFAULT_PROFILE_INTERVAL_MS
+MAX_STACK_DEPTH = 128
+# Allocation tracking: frames kept per allocation, sites reported, and how often (in samples)
+# the sampler checks whether traced memory reached a new peak worth a snapshot
+ALLOC_FRAMES = 8
+ALLOC_TOP = 20
+ALLOC_CHECK_EVERY = 20
+ALLOC_SNAPSHOT_GROWTH = 1.1
+
+# Endpoints never sampled (the profiling surface itself and the metrics scrape)
+EXCLUDED_ENDPOINTS = ('metrics', 'profiling_status', 'profiling_stacks', 'static')
+
+
+def profiling_enabled():
+    return config.get_settings().profiling
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame):
+    """Collapsed stack of a frame (root first, ';'-separated) as used by flamegraph tools"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class RequestProfile(object):
+    """Samples and allocation data of one profiled request"""
+
+    def __init__(self, endpoint, thread_id, allocations):
+        self.endpoint = endpoint
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self.samples = 0
+        self.start = time.perf_counter()
+        self.allocations = allocations
+        self.alloc_start = None
+        self.alloc_peak_snapshot = None
+        self.alloc_peak_current = 0
+
+
+class Profiler(object):
+    """
+    Low-overhead sampling profiler for request threads. A background thread wakes every
+    interval and records the current stack of each thread with a profiled request in
+    flight; it exits when no request is being profiled.
+    """
+
+    def __init__(self, profile_dir=DEFAULT_PROFILE_DIR, sample_rate=0.0, interval_ms=DEFAULT_INTERVAL_MS,
+                 allocations="stream"):
+        self.profile_dir = profile_dir
+        self.sample_rate = sample_rate
+        self.interval_ms = interval_ms
+        # "stream": track allocations for streaming endpoints, "all", or "off"
+        self.allocations = allocations
+        self._lock = threading.Lock()
+        self._active = {}
+        self._sampler = None
+        self._alloc_users = 0
+        self.results = {}
+
+    # Request lifecycle
+
+    def should_profile(self, forced=False):
+        return forced or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self, endpoint, streaming=False):
+        track_allocations = self.allocations == "all" or (self.allocations == "stream" and streaming)
+        profile = RequestProfile(endpoint, threading.get_ident(), track_allocations)
+        with self._lock:
+            self._active[profile.thread_id] = profile
+            if track_allocations:
+                self._start_allocations(profile)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+                self._sampler.start()
+        return profile
+
+    def stop(self, profile):
+        with self._lock:
+            if self._active.get(profile.thread_id) is profile:
+                del self._active[profile.thread_id]
+            allocation_sites, peak_bytes = self._stop_allocations(profile) if profile.allocations else (None, None)
+        self._record(profile, time.perf_counter() - profile.start, allocation_sites, peak_bytes)
+
+    # Sampling
+
+    def _run(self):
+        checks = 0
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                active = list(self._active.values())
+            frames = sys._current_frames()
+            for profile in active:
+                frame = frames.get(profile.thread_id)
+                if frame is not None:
+                    profile.stacks[collapse_stack(frame)] += 1
+                    profile.samples += 1
+            del frames
+            checks += 1
+            if checks % ALLOC_CHECK_EVERY == 0:
+                self._check_allocation_peak(active)
+            time.sleep(self.interval_ms / 1000.0)
+
+    # Allocation tracking (tracemalloc is process-wide, so sites include concurrent requests)
+
+    def _start_allocations(self, profile):
+        if self._alloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(ALLOC_FRAMES)
+        self._alloc_users += 1
+        profile.alloc_start = tracemalloc.take_snapshot()
+
+    def _check_allocation_peak(self, active):
+        tracked = [profile for profile in active if profile.allocations]
+        if not tracked or not tracemalloc.is_tracing():
+            return
+        current, _ = tracemalloc.get_traced_memory()
+        snapshot = None
+        for profile in tracked:
+            if current > profile.alloc_peak_current * ALLOC_SNAPSHOT_GROWTH:
+                # Keep the live allocations at the highest point seen during the request
+                try:
+                    snapshot = snapshot or tracemalloc.take_snapshot()
+                except RuntimeError:
+                    # Tracing stopped in the meantime
+                    return
+                profile.alloc_peak_current = current
+                profile.alloc_peak_snapshot = snapshot
+
+    def _stop_allocations(self, profile):
+        peak_bytes = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+        sites = []
+        snapshot = profile.alloc_peak_snapshot
+        if snapshot is not None and profile.alloc_start is not None:
+            for stat in snapshot.compare_to(profile.alloc_start, 'lineno')[:ALLOC_TOP]:
+                frame = stat.traceback[0]
+                sites.append({
+                    'site': f"{frame.filename}:{frame.lineno}",
+                    'size_diff': stat.size_diff,
+                    'count_diff': stat.count_diff,
+                })
+        self._alloc_users -= 1
+        if self._alloc_users == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        profile.alloc_start = profile.alloc_peak_snapshot = None
+        return sites, peak_bytes
+
+    # Results
+
+    def _record(self, profile, seconds, allocation_sites, peak_bytes):
+        with self._lock:
+            result = self.results.setdefault(profile.endpoint, {
+                'requests': 0, 'samples': 0, 'seconds': 0.0, 'stacks': Counter(),
+                'allocations': None, 'peak_traced_bytes': None
+            })
+            result['requests'] += 1
+            result['samples'] += profile.samples
+            result['seconds'] += seconds
+            result['stacks'].update(profile.stacks)
+            if allocation_sites is not None:
+                result['allocations'] = allocation_sites
+                result['peak_traced_bytes'] = max(result['peak_traced_bytes'] or 0, peak_bytes or 0)
+            folded = self.collapsed(profile.endpoint)
+        self._write(profile.endpoint, folded, allocation_sites)
+
+    def collapsed(self, endpoint):
+        """Collapsed-stack text ("frame;frame;frame count" lines) for flamegraph.pl or speedscope"""
+        result = self.results.get(endpoint)
+        if not result:
+            return ""
+        return "".join(f"{stack} {count}\n" for stack, count in result['stacks'].most_common())
+
+    def _write(self, endpoint, folded, allocation_sites):
+        name = endpoint.replace(".", "_").replace("/", "_")
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            with open(os.path.join(self.profile_dir, f"{name}.folded"), 'w', encoding='utf-8') as f:
+                f.write(folded)
+            if allocation_sites is not None:
+                with open(os.path.join(self.profile_dir, f"{name}.alloc.txt"), 'w', encoding='utf-8') as f:
+                    for site in allocation_sites:
+                        f.write(f"{site['size_diff']:>12} B {site['count_diff']:>8} blocks  {site['site']}\n")
+        except OSError as e:
+            logger.error(f"Failed to write profile for {endpoint}: {str(e)}")
+
+    def summary(self, top=10):
+        with self._lock:
+            endpoints = {}
+            for endpoint, result in self.results.items():
+                own = Counter()
+                for stack, count in result['stacks'].items():
+                    own[stack.rsplit(";", 1)[-1]] += count
+                endpoints[endpoint] = {
+                    'requests': result['requests'],
+                    'samples': result['samples'],
+                    'seconds': result['seconds'],
+                    'top_frames': [{'frame': frame, 'samples': count} for frame, count in own.most_common(top)],
+                    'allocations': (result['allocations'] or [])[:top],
+                    'peak_traced_bytes': result['peak_traced_bytes'],
+                }
+            return {
+                'sample_rate': self.sample_rate,
+                'interval_ms': self.interval_ms,
+                'allocations': self.allocations,
+                'active': len(self._active),
+                'profile_dir': self.profile_dir,
+                'endpoints': endpoints,
+            }
+
+    def configure(self, sample_rate=None, interval_ms=None, allocations=None, reset=False):
+        with self._lock:
+            if sample_rate is not None:
+                self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+            if interval_ms is not None:
+                self.interval_ms = max(float(interval_ms), 1.0)
+            if allocations is not None:
+                if allocations not in ("stream", "all", "off"):
+                    raise ValueError("allocations must be 'stream', 'all' or 'off'")
+                self.allocations = allocations
+            if reset:
+                self.results = {}
+
+
+def _authorized(request):
+    """Profiling needs FLOORPLAN_PROFILING_TOKEN in X-Profile-Token, or a local caller when no token is set"""
+    return admin.authorized(request, config.get_settings().profiling_token, "X-Profile-Token")
+
+
+def init_app(app):
+    """
+    Install the profiling hooks and admin endpoints. Nothing is installed unless
+    FLOORPLAN_PROFILING is set, so requests pay no cost when profiling is off.
+
+    Parameters:
+    - app: Flask application
+
+    Returns:
+    - Profiler instance, or None when profiling is disabled
+    """
+    if not profiling_enabled():
+        return None
+
+    from flask import g, request, jsonify, Response
+
+    settings = config.get_settings()
+    profiler = Profiler(
+        profile_dir=settings.profile_dir,
+        sample_rate=settings.profile_sample_rate,
+        interval_ms=settings.profile_interval_ms,
+        allocations=settings.profile_allocations,
+    )
+    app.extensions['floorplan_profiler'] = profiler
+    logger.warning(f"Profiling enabled: sample rate {profiler.sample_rate}, output in {profiler.profile_dir}")
+
+    @app.before_request
+    def start_profile():
+        if request.endpoint in EXCLUDED_ENDPOINTS:
+            return
+        forced = request.headers.get('X-Profile') == '1' and _authorized(request)
+        if profiler.should_profile(forced):
+            g.profile = profiler.start(request.endpoint or 'unknown', streaming=request.path.endswith('-stream'))
+
+    @app.after_request
+    def stop_profile(response):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            # Streamed bodies are produced after this hook, stop once the response is closed
+            response.call_on_close(lambda: profiler.stop(profile))
+        return response
+
+    @app.teardown_request
+    def abandon_profile(exc):
+        # Only left over when the request failed before after_request ran
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profiler.stop(profile)
+
+    @app.route('/admin/profiling', methods=['GET', 'POST'], endpoint='profiling_status')
+    def profiling_status():
+        if not _authorized(request):
+            return jsonify({'error': 'Profiling access denied'}), 403
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            try:
+                profiler.configure(data.get('sample_rate'), data.get('interval_ms'),
+                                   data.get('allocations'), bool(data.get('reset')))
+            except (TypeError, ValueError) as e:
+                return jsonify({'error': str(e)}), 400
+        return jsonify(profiler.summary())
+
+    @app.route('/admin/profiling/<endpoint>.folded', methods=['GET'], endpoint='profiling_stacks')
+    def profiling_stacks(endpoint):
+        if not _authorized(request):
+            return jsonify({'error': 'Profiling access denied'}), 403
+        return Response(profiler.collapsed(endpoint), mimetype='text/plain')
+
+    return profiler
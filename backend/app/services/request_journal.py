@@ -0,0 +1,183 @@
+import os
+import re
+import gzip
+import json
+import queue
+import shutil
+import logging
+import datetime
+import threading
+from logging.handlers import RotatingFileHandler, QueueListener
+
+from app.services import config
+from app.services.config import DEFAULT_JOURNAL_FILE
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = config.DEFAULT_JOURNAL_MAX_BYTES
+DEFAULT_BACKUP_COUNT = config.DEFAULT_JOURNAL_BACKUPS
+# Entries waiting for the writer thread; beyond this, new entries are dropped rather than block requests
+QUEUE_SIZE = 10000
+
+# OpenRouter keys and bearer tokens that might end up in request or response text
+SECRET_PATTERN = re.compile(r"sk-or-[A-Za-z0-9_\-]+|Bearer\s+[A-Za-z0-9_\-\.=]+")
+REDACTED_KEYS = ("authorization", "api_key", "apikey", "token", "password", "secret")
+
+
+def journal_enabled():
+    return config.get_settings().journal and not _journal_failed
+
+
+def redact(value):
+    """Copy of a JSON-like value with credential fields and key-like strings masked"""
+    if isinstance(value, dict):
+        return {k: "[REDACTED]" if str(k).lower() in REDACTED_KEYS else redact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        return SECRET_PATTERN.sub("[REDACTED]", value)
+    return value
+
+
+def _gzip_namer(name):
+    return name + ".gz"
+
+
+def _gzip_rotator(source, dest):
+    """Compress the rotated-out file"""
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+class RequestJournal(object):
+    """
+    Append-only JSONL journal of generation requests and their upstream responses.
+    Entries are queued and written by a background thread; rotated files are gzip-compressed
+    (generations.jsonl.1.gz, generations.jsonl.2.gz, ...).
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_FILE, max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT):
+        self.path = path
+        self.dropped = 0
+        self._queue = queue.Queue(QUEUE_SIZE)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+        self._handler.namer = _gzip_namer
+        self._handler.rotator = _gzip_rotator
+        self._listener = QueueListener(self._queue, self._handler)
+        self._listener.start()
+        logger.info(f"Journaling generation requests to {path}")
+
+    def record(self, entry):
+        line = json.dumps(redact(entry), ensure_ascii=False, separators=(",", ":"), default=str)
+        try:
+            self._queue.put_nowait(logging.makeLogRecord({"msg": line, "levelno": logging.INFO}))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Write out queued entries and stop the writer thread"""
+        self._listener.stop()
+        self._handler.close()
+
+
+_journal = None
+_journal_lock = threading.Lock()
+# Set when the journal file cannot be opened, journaling then stays off for this process
+_journal_failed = False
+
+
+def get_journal():
+    """Process-wide journal, or None unless FLOORPLAN_JOURNAL is set"""
+    global _journal, _journal_failed
+    if _journal is None and journal_enabled():
+        with _journal_lock:
+            if _journal is None and not _journal_failed:
+                settings = config.get_settings()
+                try:
+                    _journal = RequestJournal(settings.journal_file, settings.journal_max_bytes,
+                                              settings.journal_backups)
+                except OSError as e:
+                    logger.error(f"Cannot open request journal, journaling disabled: {str(e)}")
+                    _journal_failed = True
+    return _journal
+
+
+# Fields of the upstream request body journaled with each entry (the messages are rebuilt from the request inputs)
+PAYLOAD_FIELDS = ("model", "temperature", "max_tokens", "n")
+
+
+def record_generation(mode, boundary_data, description, preferences, payload, status_code,
+                      content=None, usage=None, latency_ms=None, error=None, cached=False, trace_id=None,
+                      variants=1):
+    """
+    Journal one generation request and the upstream answer; does nothing when journaling is off
+
+    Parameters:
+    - mode: "generate" or "stream"
+    - boundary_data / description / preferences: The request inputs
+    - payload: Upstream request body; its PAYLOAD_FIELDS are journaled, so that the response
+      cache can be warmed under the exact key of the request
+    - status_code: Upstream HTTP status (None when the request failed before a response)
+    - content / usage: Upstream response text and token usage
+    - latency_ms: Upstream latency
+    - error: Error message for failed requests
+    - cached: Whether the answer came from the response cache
+    - variants: Number of layouts asked for
+    """
+    journal = get_journal()
+    if journal is None:
+        return
+    journal.record({
+        "ts": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "mode": mode,
+        "trace_id": trace_id,
+        "request": {
+            "boundary_data": boundary_data,
+            "description": description,
+            "preferences": preferences,
+            "variants": variants,
+        },
+        "upstream": {
+            **{k: payload[k] for k in PAYLOAD_FIELDS if k in payload},
+            "status_code": status_code,
+            "latency_ms": latency_ms,
+            "cached": cached,
+            "content": content,
+            "usage": usage,
+            "error": error,
+        },
+    })
+
+
+def journal_files(path=DEFAULT_JOURNAL_FILE):
+    """Journal file and its rotated backups, oldest first"""
+    directory = os.path.dirname(os.path.abspath(path)) or "."
+    base = os.path.basename(path)
+    backups = []
+    for name in os.listdir(directory) if os.path.isdir(directory) else []:
+        match = re.match(re.escape(base) + r"\.(\d+)(\.gz)?$", name)
+        if match:
+            backups.append((int(match.group(1)), os.path.join(directory, name)))
+    files = [p for _, p in sorted(backups, reverse=True)]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def read_entries(paths):
+    """Journal entries from plain or gzip-compressed JSONL files, in file order"""
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping malformed journal line in {path}")
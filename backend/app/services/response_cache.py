@@ -0,0 +1,107 @@
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from app.services import config, metrics, admin
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = "llm_response"
+
+
+def request_key(payload):
+    """
+    Cache key of an upstream chat completion request: the model, messages and sampling
+    settings (including the number of completions), but not whether the answer is streamed
+    """
+    relevant = {k: payload.get(k) for k in ("model", "messages", "temperature", "max_tokens", "n")}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ResponseCache(object):
+    """
+    Thread-safe LRU cache of upstream model responses ({"content", "usage"}), with an
+    optional time to live. A max_entries of 0 disables the cache.
+    """
+
+    def __init__(self, max_entries=0, ttl=0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, payload):
+        if not self.enabled:
+            return None
+        key = request_key(payload)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        metrics.record_cache(CACHE_NAME, entry is not None)
+        return entry[1] if entry is not None else None
+
+    def put(self, payload, content, usage=None):
+        if not self.enabled or not content:
+            return
+        key = request_key(payload)
+        with self._lock:
+            self._entries[key] = (time.time(), {"content": content, "usage": usage})
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide response cache, sized by FLOORPLAN_RESPONSE_CACHE_SIZE (0, the default, disables it)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                settings = config.get_settings()
+                _cache = ResponseCache(settings.response_cache_size, settings.response_cache_ttl)
+    return _cache
+
+
+def init_app(app):
+    """
+    Register the cache warm-up endpoint: POST /admin/cache/warm with {"entries": [journal entries]}
+    (see replay_journal.py --warm-cache)
+    """
+    from flask import request, jsonify
+
+    @app.route('/admin/cache/warm', methods=['POST'], endpoint='cache_warm')
+    def cache_warm():
+        if not admin.authorized(request, config.get_settings().admin_token):
+            return jsonify({'error': 'Admin access denied'}), 403
+        data = request.get_json(silent=True) or {}
+        entries = data.get('entries')
+        if not isinstance(entries, list):
+            return jsonify({'error': 'Missing journal entries'}), 400
+        from app.services import floor_plan_service
+        count, success, message = floor_plan_service.warm_response_cache(entries)
+        if not success:
+            return jsonify({'error': message}), 400
+        return jsonify({'message': message, 'cached': count, 'size': len(get_cache())})
@@ -0,0 +1,470 @@
+import os
+import json
+import math
+import heapq
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+from app.services import config, geometry, apartment_builder
+from app.services.split_tree import get_split_root, is_leaf
+from app.services.config import DEFAULT_EXPORT
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+NODE_CAPACITY = 16
+# Bump when the index layout changes so persisted indexes are rebuilt
+INDEX_VERSION = 1
+LAYERS = ("apartments", "rooms", "facade", "circulation")
+SEGMENT_LAYERS = ("facade", "circulation")
+# Defaults of facing(): how far away and how far from parallel a facade may be
+DEFAULT_FACING_DISTANCE = 20.0
+DEFAULT_FACING_ANGLE = 15.0
+
+
+def _str_order(boxes, capacity):
+    """
+    Sort-Tile-Recursive packing order: sort by centre x, cut into vertical slices of
+    ceil(sqrt(leaf count)) leaves, sort each slice by centre y
+    """
+    count = len(boxes)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64)
+    slices = int(math.ceil(math.sqrt(math.ceil(count / capacity))))
+    per_slice = slices * capacity
+    cx = (boxes[:, 0] + boxes[:, 2]) / 2.0
+    cy = (boxes[:, 1] + boxes[:, 3]) / 2.0
+    order = np.argsort(cx, kind="stable")
+    chunks = [order[s:s + per_slice] for s in range(0, count, per_slice)]
+    return np.concatenate([chunk[np.argsort(cy[chunk], kind="stable")] for chunk in chunks])
+
+
+def _boxes_intersect(boxes, box):
+    return (boxes[:, 0] <= box[2]) & (boxes[:, 2] >= box[0]) & (boxes[:, 1] <= box[3]) & (boxes[:, 3] >= box[1])
+
+
+def _box_distance(boxes, x, y):
+    dx = np.maximum(np.maximum(boxes[:, 0] - x, 0.0), x - boxes[:, 2])
+    dy = np.maximum(np.maximum(boxes[:, 1] - y, 0.0), y - boxes[:, 3])
+    return np.hypot(dx, dy)
+
+
+class STRTree(object):
+    """
+    Static R-tree bulk-loaded with Sort-Tile-Recursive packing. levels[0] holds the item boxes
+    in packed order, levels[i] the boxes of nodes grouping `capacity` consecutive entries of
+    levels[i - 1], so child ranges need no pointers. order maps packed positions to item ids.
+    """
+
+    def __init__(self, levels, order, capacity=NODE_CAPACITY):
+        self.levels = levels
+        self.order = order
+        self.capacity = capacity
+
+    @classmethod
+    def build(cls, boxes, capacity=NODE_CAPACITY):
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        order = _str_order(boxes, capacity)
+        levels = [boxes[order]]
+        while len(levels[-1]) > capacity:
+            below = levels[-1]
+            starts = np.arange(0, len(below), capacity)
+            levels.append(np.column_stack([
+                np.minimum.reduceat(below[:, 0], starts),
+                np.minimum.reduceat(below[:, 1], starts),
+                np.maximum.reduceat(below[:, 2], starts),
+                np.maximum.reduceat(below[:, 3], starts)
+            ]))
+        return cls(levels, order, capacity)
+
+    def __len__(self):
+        return len(self.order)
+
+    def _children(self, level, nodes):
+        children = (nodes[:, None] * self.capacity + np.arange(self.capacity)[None, :]).ravel()
+        return children[children < len(self.levels[level - 1])]
+
+    def query(self, box):
+        """Ids of the items whose boxes intersect box [min_x, min_y, max_x, max_y]"""
+        if not len(self.order):
+            return np.zeros(0, dtype=np.int64)
+        top = len(self.levels) - 1
+        nodes = np.arange(len(self.levels[top]))
+        for level in range(top, 0, -1):
+            nodes = nodes[_boxes_intersect(self.levels[level][nodes], box)]
+            nodes = self._children(level, nodes)
+        nodes = nodes[_boxes_intersect(self.levels[0][nodes], box)]
+        return self.order[nodes]
+
+    def nearest(self, x, y, k=1, distance=None, max_distance=math.inf):
+        """
+        The k items closest to (x, y), best-first over node boxes
+
+        Parameters:
+        - distance: Optional function(item ids array) -> exact distances, for items whose
+          geometry is not their box; box distances are used as lower bounds
+        - max_distance: Ignore items farther than this
+
+        Returns:
+        - List of (distance, item id), closest first
+        """
+        if not len(self.order):
+            return []
+        top = len(self.levels) - 1
+        heap = []
+        nodes = np.arange(len(self.levels[top]))
+        for node, d in zip(nodes, _box_distance(self.levels[top], x, y)):
+            heapq.heappush(heap, (float(d), top, int(node), False))
+        results = []
+        while heap and len(results) < k:
+            d, level, node, exact = heapq.heappop(heap)
+            if d > max_distance:
+                break
+            if exact or (level == 0 and distance is None):
+                results.append((d, int(self.order[node])))
+                continue
+            if level == 0:
+                heapq.heappush(heap, (float(distance(self.order[[node]])[0]), 0, node, True))
+                continue
+            children = self._children(level, np.array([node]))
+            for child, child_d in zip(children, _box_distance(self.levels[level - 1][children], x, y)):
+                heapq.heappush(heap, (float(child_d), level - 1, int(child), False))
+        return results
+
+
+class SpatialLayer(object):
+    """
+    Indexed geometries of one kind: polygons (flat coords with offsets) or segments (n, 4),
+    with one metadata dict per item
+    """
+
+    def __init__(self, name, items, boxes, coords=None, offsets=None, segments=None, normals=None, tree=None):
+        self.name = name
+        self.items = items
+        self.boxes = boxes
+        self.coords = coords
+        self.offsets = offsets
+        self.segments = segments
+        self.normals = normals
+        self.tree = tree or STRTree.build(boxes)
+
+    @property
+    def is_segments(self):
+        return self.segments is not None
+
+    def polygon(self, item_id):
+        return self.coords[self.offsets[item_id]:self.offsets[item_id + 1]]
+
+    def geometry(self, item_id):
+        if self.is_segments:
+            x0, y0, x1, y1 = self.segments[item_id]
+            return {"start": [float(x0), float(y0)], "end": [float(x1), float(y1)]}
+        return {"corners": self.polygon(item_id).tolist()}
+
+    def result(self, item_id, **extra):
+        result = dict(self.items[item_id])
+        result["layer"] = self.name
+        result["geometry"] = self.geometry(item_id)
+        result.update(extra)
+        return result
+
+    def window(self, box):
+        """Items intersecting box [min_x, min_y, max_x, max_y]"""
+        candidates = self.tree.query(box)
+        if self.is_segments:
+            return [int(i) for i in candidates[geometry.segments_cross_box(self.segments[candidates], box)]]
+        hits = []
+        box_corners = np.array([(box[0], box[1]), (box[2], box[1]), (box[2], box[3]), (box[0], box[3])])
+        for item_id in candidates:
+            polygon = self.polygon(item_id)
+            if geometry.segments_cross_box(geometry.polygon_edges(polygon), box).any() or \
+                    geometry.points_in_polygon(box_corners, polygon).any():
+                hits.append(int(item_id))
+        return hits
+
+    def distances(self, item_ids, x, y):
+        if self.is_segments:
+            return geometry.point_segments_distance(x, y, self.segments[item_ids])
+        result = []
+        for item_id in item_ids:
+            polygon = self.polygon(item_id)
+            inside = geometry.points_in_polygon([(x, y)], polygon)[0]
+            result.append(0.0 if inside else float(geometry.point_segments_distance(
+                x, y, geometry.polygon_edges(polygon)).min()))
+        return np.array(result)
+
+    def nearest(self, x, y, k=1, max_distance=math.inf):
+        found = self.tree.nearest(x, y, k, lambda ids: self.distances(ids, x, y), max_distance)
+        return [(distance, item_id) for distance, item_id in found]
+
+    def intersect_segment(self, segment):
+        """Items touched or crossed by segment [x0, y0, x1, y1]"""
+        box = [min(segment[0], segment[2]), min(segment[1], segment[3]),
+               max(segment[0], segment[2]), max(segment[1], segment[3])]
+        candidates = self.tree.query(box)
+        if self.is_segments:
+            return [int(i) for i in candidates[geometry.segments_intersect(segment, self.segments[candidates])]]
+        hits = []
+        for item_id in candidates:
+            polygon = self.polygon(item_id)
+            if geometry.segments_intersect(segment, geometry.polygon_edges(polygon)).any() or \
+                    geometry.points_in_polygon([segment[:2]], polygon)[0]:
+                hits.append(int(item_id))
+        return hits
+
+
+def _polygon_layer(name, polygons, items):
+    offsets = np.concatenate([[0], np.cumsum([len(p) for p in polygons])]).astype(np.int64)
+    coords = np.concatenate(polygons) if polygons else np.zeros((0, 2))
+    boxes = geometry.polygon_bounds(polygons) if polygons else np.zeros((0, 4))
+    return SpatialLayer(name, items, boxes, coords=coords, offsets=offsets)
+
+
+def _segment_layer(name, segments, items, normals):
+    segments = np.array(segments, dtype=float).reshape(-1, 4)
+    boxes = np.column_stack([
+        np.minimum(segments[:, 0], segments[:, 2]), np.minimum(segments[:, 1], segments[:, 3]),
+        np.maximum(segments[:, 0], segments[:, 2]), np.maximum(segments[:, 1], segments[:, 3])
+    ])
+    return SpatialLayer(name, items, boxes, segments=segments, normals=np.array(normals, dtype=float).reshape(-1, 2))
+
+
+def _outward_normal(segment, polygon):
+    """Unit normal of a boundary segment pointing out of its apartment"""
+    x0, y0, x1, y1 = segment
+    length = math.hypot(x1 - x0, y1 - y0) or 1.0
+    nx, ny = (y1 - y0) / length, -(x1 - x0) / length
+    probe = ((x0 + x1) / 2 + nx * 1e-3, (y0 + y1) / 2 + ny * 1e-3)
+    if geometry.points_in_polygon([probe], polygon)[0]:
+        nx, ny = -nx, -ny
+    return nx, ny
+
+
+class SiteIndex(object):
+    """
+    Spatial index over a set of apartments in world coordinates: apartment bounds, laid-out
+    rooms and facade / circulation segments, one STR-packed R-tree per layer
+    """
+
+    def __init__(self, layers, source=None):
+        self.layers = layers
+        self.source = source
+
+    @classmethod
+    def build(cls, apartments, source=None):
+        polygons, apartment_items = [], []
+        rooms, room_items = [], []
+        segments = {name: ([], [], []) for name in SEGMENT_LAYERS}
+        for index, apartment in enumerate(apartments):
+            apartment_id = str(apartment.get("id", index))
+            try:
+                polygon, y_up = apartment_builder.boundary_polygon(apartment)
+            except (ValueError, TypeError, KeyError) as e:
+                logger.warning(f"Skipping apartment {apartment_id} without bounds: {str(e)}")
+                continue
+            if len(polygon) < 3:
+                continue
+            polygons.append(polygon)
+            apartment_items.append({"apartment_id": apartment_id, "apartment_index": index,
+                                    "bedrooms": apartment.get("bedrooms"), "area": apartment.get("area")})
+            root = get_split_root(apartment.get("split", apartment))
+            if root is not None:
+                placed = geometry.layout_region(root, geometry.decompose_polygon(polygon), y_up=y_up)
+                for path, (node, rects) in placed.items():
+                    if not is_leaf(node) or not len(rects):
+                        continue
+                    rooms.append(geometry.rects_outline(rects) if len(rects) > 1 else np.array(
+                        [(rects[0, 0], rects[0, 1]), (rects[0, 2], rects[0, 1]),
+                         (rects[0, 2], rects[0, 3]), (rects[0, 0], rects[0, 3])]))
+                    room_items.append({"apartment_id": apartment_id, "apartment_index": index, "path": path,
+                                       "name": node.get("mergeid") or node.get("name"),
+                                       "category": apartment_builder.room_category(node)})
+            for name in SEGMENT_LAYERS:
+                layer_segments, layer_items, layer_normals = segments[name]
+                for segment in apartment.get(name) or []:
+                    try:
+                        xy = geometry.to_xy(segment["start"]) + geometry.to_xy(segment["end"])
+                    except (KeyError, TypeError, ValueError, IndexError):
+                        continue
+                    layer_segments.append(xy)
+                    layer_items.append({"apartment_id": apartment_id, "apartment_index": index})
+                    layer_normals.append(_outward_normal(xy, polygon))
+
+        layers = {
+            "apartments": _polygon_layer("apartments", polygons, apartment_items),
+            "rooms": _polygon_layer("rooms", rooms, room_items),
+        }
+        for name in SEGMENT_LAYERS:
+            layers[name] = _segment_layer(name, *segments[name])
+        return cls(layers, source)
+
+    def layer(self, name):
+        if name not in self.layers:
+            raise ValueError(f"Unknown layer '{name}', expected one of {', '.join(LAYERS)}")
+        return self.layers[name]
+
+    def window(self, box, layer="apartments"):
+        target = self.layer(layer)
+        return [target.result(i) for i in target.window(box)]
+
+    def nearest(self, x, y, layer="apartments", k=1, max_distance=math.inf):
+        target = self.layer(layer)
+        return [target.result(i, distance=d) for d, i in target.nearest(x, y, k, max_distance)]
+
+    def intersect_segment(self, segment, layer="facade"):
+        target = self.layer(layer)
+        return [target.result(i) for i in target.intersect_segment(segment)]
+
+    def facing(self, segment, max_distance=DEFAULT_FACING_DISTANCE, max_angle=DEFAULT_FACING_ANGLE,
+               layer="facade"):
+        """
+        Segments of a layer that face a line: roughly parallel to it (within max_angle degrees),
+        overlapping it when projected onto it, within max_distance, with their outward normal
+        pointing towards it
+
+        Returns:
+        - Results sorted by distance, each with distance and overlap (length along the line)
+        """
+        target = self.layer(layer)
+        if not target.is_segments:
+            raise ValueError(f"Layer '{layer}' has no segments")
+        x0, y0, x1, y1 = (float(v) for v in segment)
+        length = math.hypot(x1 - x0, y1 - y0)
+        if length <= geometry.EPSILON:
+            raise ValueError("Line has no length")
+        ux, uy = (x1 - x0) / length, (y1 - y0) / length
+        box = [min(x0, x1) - max_distance, min(y0, y1) - max_distance,
+               max(x0, x1) + max_distance, max(y0, y1) + max_distance]
+        candidates = target.tree.query(box)
+        if not len(candidates):
+            return []
+        segments = target.segments[candidates]
+        sx, sy = segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1]
+        seg_length = np.hypot(sx, sy)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sine = np.abs(sx * uy - sy * ux) / seg_length
+        parallel = (seg_length > geometry.EPSILON) & (sine <= math.sin(math.radians(max_angle)))
+        # Positions of the segment ends along the line, and the overlap with [0, length]
+        t0 = (segments[:, 0] - x0) * ux + (segments[:, 1] - y0) * uy
+        t1 = (segments[:, 2] - x0) * ux + (segments[:, 3] - y0) * uy
+        overlap = np.minimum(np.maximum(t0, t1), length) - np.maximum(np.minimum(t0, t1), 0.0)
+        mid_x = (segments[:, 0] + segments[:, 2]) / 2.0
+        mid_y = (segments[:, 1] + segments[:, 3]) / 2.0
+        distance = geometry.point_segments_distance(0, 0, np.column_stack([
+            np.full(len(segments), x0) - mid_x, np.full(len(segments), y0) - mid_y,
+            np.full(len(segments), x1) - mid_x, np.full(len(segments), y1) - mid_y]))
+        # Offset from the segment midpoint to the line, against the outward normal
+        t_mid = np.clip((mid_x - x0) * ux + (mid_y - y0) * uy, 0.0, length)
+        to_line_x, to_line_y = x0 + t_mid * ux - mid_x, y0 + t_mid * uy - mid_y
+        normals = target.normals[candidates]
+        towards = normals[:, 0] * to_line_x + normals[:, 1] * to_line_y > 0
+        keep = parallel & (overlap > geometry.EPSILON) & (distance <= max_distance) & towards
+        results = [target.result(int(i), distance=float(d), overlap=float(o))
+                   for i, d, o in zip(candidates[keep], distance[keep], overlap[keep])]
+        return sorted(results, key=lambda r: r["distance"])
+
+    def stats(self):
+        return {name: {"items": len(layer.items), "levels": len(layer.tree.levels)} for name, layer in self.layers.items()}
+
+    # Persistence: one compressed .npz with the arrays of every layer and a JSON header
+
+    def save(self, path):
+        arrays = {}
+        header = {"version": INDEX_VERSION, "source": self.source, "capacity": NODE_CAPACITY, "layers": {}}
+        for name, layer in self.layers.items():
+            fields = {"boxes": layer.boxes, "order": layer.tree.order}
+            if layer.is_segments:
+                fields.update(segments=layer.segments, normals=layer.normals)
+            else:
+                fields.update(coords=layer.coords, offsets=layer.offsets)
+            for i, level in enumerate(layer.tree.levels):
+                fields[f"level{i}"] = level
+            for field, value in fields.items():
+                arrays[f"{name}.{field}"] = value
+            header["layers"][name] = {"items": layer.items, "levels": len(layer.tree.levels)}
+        arrays["header"] = np.array(json.dumps(header, ensure_ascii=False))
+        directory = os.path.dirname(os.path.abspath(path))
+        tmp_path = os.path.join(directory, f".tmp-{os.getpid()}-{os.path.basename(path)}")
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            header = json.loads(str(data["header"]))
+            if header.get("version") != INDEX_VERSION:
+                raise ValueError(f"Index version {header.get('version')} is not {INDEX_VERSION}")
+            layers = {}
+            for name, info in header["layers"].items():
+                levels = [data[f"{name}.level{i}"] for i in range(info["levels"])]
+                tree = STRTree(levels, data[f"{name}.order"], header.get("capacity", NODE_CAPACITY))
+                if name in SEGMENT_LAYERS:
+                    layers[name] = SpatialLayer(name, info["items"], data[f"{name}.boxes"],
+                                                segments=data[f"{name}.segments"], normals=data[f"{name}.normals"],
+                                                tree=tree)
+                else:
+                    layers[name] = SpatialLayer(name, info["items"], data[f"{name}.boxes"],
+                                                coords=data[f"{name}.coords"], offsets=data[f"{name}.offsets"],
+                                                tree=tree)
+        return cls(layers, header.get("source"))
+
+
+def file_fingerprint(path):
+    """SHA-256 of a file, to tell whether a persisted index still matches its source"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def index_path(export_path):
+    """Persisted index next to the export: <export name>.spatial.npz"""
+    return os.path.splitext(export_path)[0] + ".spatial.npz"
+
+
+def load_or_build(export_path=DEFAULT_EXPORT, path=None):
+    """
+    The persisted index of an export, rebuilt (and saved again) when missing or out of date
+
+    Returns:
+    - SiteIndex
+    """
+    path = path or index_path(export_path)
+    fingerprint = file_fingerprint(export_path)
+    if os.path.exists(path):
+        try:
+            index = SiteIndex.load(path)
+            if index.source == fingerprint:
+                return index
+            logger.info(f"Spatial index {path} is out of date, rebuilding")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Cannot read spatial index {path}, rebuilding: {str(e)}")
+    with open(export_path, "r", encoding="utf-8") as f:
+        apartments = json.load(f)
+    index = SiteIndex.build(apartments, fingerprint)
+    try:
+        index.save(path)
+        logger.info(f"Saved spatial index of {len(apartments)} apartments to {path}")
+    except OSError as e:
+        logger.warning(f"Cannot save spatial index to {path}: {str(e)}")
+    return index
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Process-wide index of FLOORPLAN_DATABASE_EXPORT (persisted at FLOORPLAN_SPATIAL_INDEX if set)"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                settings = config.get_settings()
+                _index = load_or_build(settings.database_export, settings.spatial_index)
+    return _index
@@ -0,0 +1,206 @@
+import gzip
+import json
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = "http://localhost:5294"
+APARTMENT_ENDPOINT = "/api/apartment"
+BATCH_ENDPOINT = "/api/apartment/batch"
+
+# Status codes worth retrying: throttling and transient server errors
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# Status codes meaning the batch endpoint does not exist on this service
+BATCH_UNSUPPORTED_STATUS = (404, 405, 501)
+
+
+class SpatialOSClient(object):
+    """
+    Client for the Spatial OS apartment endpoint that reuses pooled connections,
+    sends gzip bodies and pushes many apartments concurrently with retries.
+
+    Results are reported per apartment, in input order:
+    {"index", "id", "success", "status_code", "attempts", "elapsed_ms", "response"/"error"}
+    """
+
+    def __init__(self, api_url=DEFAULT_API_URL, max_workers=8, gzip_body=True, retries=3,
+                 backoff=0.5, max_backoff=10.0, timeout=10, batch_size=0):
+        self.api_url = api_url.rstrip("/")
+        self.max_workers = max_workers
+        self.gzip_body = gzip_body
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.batch_supported = batch_size > 1
+
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip'
+        })
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _encode(self, payload):
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if self.gzip_body:
+            return gzip.compress(body, compresslevel=5), {'Content-Encoding': 'gzip'}
+        return body, {}
+
+    def _delay(self, attempt, response=None):
+        """Exponential backoff with jitter, honoring Retry-After when the service sends it"""
+        if response is not None and response.headers.get("Retry-After"):
+            try:
+                return min(float(response.headers["Retry-After"]), self.max_backoff)
+            except ValueError:
+                pass
+        return min(self.backoff * (2 ** attempt), self.max_backoff) * (0.5 + random.random() / 2)
+
+    def _post(self, endpoint, payload):
+        """
+        POST with retries
+
+        Returns:
+        - (response or None, attempts, error message or None)
+        """
+        url = f"{self.api_url}{endpoint}"
+        response = None
+        error = None
+        attempt = 0
+        for attempt in range(self.retries + 1):
+            body, headers = self._encode(payload)
+            try:
+                response = self.session.post(url, data=body, headers=headers, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                response, error = None, str(e)
+            else:
+                if response.status_code == 415 and self.gzip_body:
+                    # Service does not accept compressed bodies, resend plain JSON from now on
+                    logger.warning("Spatial OS rejected gzip body, sending uncompressed")
+                    with self._lock:
+                        self.gzip_body = False
+                    continue
+                if response.status_code not in RETRY_STATUS:
+                    return response, attempt + 1, None
+                error = f"HTTP {response.status_code}"
+            if attempt < self.retries:
+                time.sleep(self._delay(attempt, response))
+        return response, attempt + 1, error
+
+    @staticmethod
+    def _response_body(response):
+        try:
+            return response.json()
+        except ValueError:
+            return response.text
+
+    def send(self, apartment, index=0):
+        """Send one apartment and return its result"""
+        start = time.perf_counter()
+        response, attempts, error = self._post(APARTMENT_ENDPOINT, apartment)
+        result = {
+            'index': index,
+            'id': apartment.get('id'),
+            'attempts': attempts,
+            'elapsed_ms': (time.perf_counter() - start) * 1000,
+            'status_code': response.status_code if response is not None else None,
+        }
+        if response is not None and response.status_code < 400 and error is None:
+            result['success'] = True
+            result['response'] = self._response_body(response)
+        else:
+            result['success'] = False
+            result['error'] = error or f"HTTP {response.status_code}: {response.text[:200]}"
+        return result
+
+    def _send_batch(self, indexed):
+        """
+        Send a chunk of apartments in one request
+
+        Returns:
+        - List of results, or None when the service has no batch endpoint
+        """
+        start = time.perf_counter()
+        response, attempts, error = self._post(BATCH_ENDPOINT, {'apartments': [a for _, a in indexed]})
+        if response is not None and response.status_code in BATCH_UNSUPPORTED_STATUS:
+            logger.info("Spatial OS has no batch endpoint, falling back to one request per apartment")
+            with self._lock:
+                self.batch_supported = False
+            return None
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        item_results = []
+        if response is not None and response.status_code < 400 and error is None:
+            body = self._response_body(response)
+            item_results = body.get('results', []) if isinstance(body, dict) else []
+
+        results = []
+        for position, (index, apartment) in enumerate(indexed):
+            result = {
+                'index': index,
+                'id': apartment.get('id'),
+                'attempts': attempts,
+                'elapsed_ms': elapsed_ms,
+                'status_code': response.status_code if response is not None else None,
+            }
+            item = item_results[position] if position < len(item_results) else None
+            if isinstance(item, dict) and item.get('success', True) and not item.get('error'):
+                result['success'] = True
+                result['response'] = item
+            else:
+                result['success'] = False
+                if isinstance(item, dict) and item.get('error'):
+                    result['error'] = item['error']
+                else:
+                    result['error'] = error or (f"HTTP {response.status_code}" if response is not None else "No response")
+            results.append(result)
+        return results
+
+    def send_many(self, apartments):
+        """
+        Push many apartments with bounded concurrency, in batches when the service supports them
+
+        Returns:
+        - List of per-apartment results in input order
+        """
+        indexed = list(enumerate(apartments))
+        results = [None] * len(indexed)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = indexed
+            if self.batch_supported:
+                chunks = [indexed[i:i + self.batch_size] for i in range(0, len(indexed), self.batch_size)]
+                pending = []
+                for chunk, chunk_results in zip(chunks, pool.map(self._send_batch, chunks)):
+                    if chunk_results is None:
+                        pending.extend(chunk)
+                        continue
+                    for result in chunk_results:
+                        results[result['index']] = result
+            for result in pool.map(lambda item: self.send(item[1], item[0]), pending):
+                results[result['index']] = result
+
+        failed = sum(1 for r in results if not r['success'])
+        logger.info(f"Pushed {len(results)} apartment(s) to Spatial OS, {failed} failed")
+        return results
@@ -0,0 +1,554 @@
+import math
+import copy
+import json
+import hashlib
+import logging
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Nodes whose angle is close to π/2 are split by a vertical line (children side by side),
+# everything else is split by a horizontal line (children stacked), same as the frontend
+VERTICAL_ANGLE = math.pi / 2
+ANGLE_TOLERANCE = 0.1
+
+ROOT_PATH = "root"
+
+# Fields of the database export that reference other nodes by name
+REFERENCE_FIELDS = ("connected", "door", "open")
+
+# Node fields that identify a room, and the digest size of tree hashes (16 hex characters)
+LABEL_FIELDS = ("name", "mergeid", "type")
+TREE_HASH_BYTES = 8
+# Areas and angles are rounded before hashing so float noise does not count as a change
+HASH_PRECISION = 6
+
+
+def get_split_root(data):
+    """
+    Find the root node of a split tree in the formats produced by the LLM or stored in the database
+    """
+    if not isinstance(data, dict):
+        return None
+    if "json_result" in data:
+        return get_split_root(data["json_result"])
+    if isinstance(data.get("split"), dict):
+        return data["split"]
+    if isinstance(data.get("root"), dict):
+        return data["root"]
+    if isinstance(data.get("floorPlan"), dict) and isinstance(data["floorPlan"].get("root"), dict):
+        return data["floorPlan"]["root"]
+    if "children" in data or "name" in data:
+        return data
+    return None
+
+
+def is_leaf(node):
+    """Final nodes and nodes without children are rooms"""
+    return bool(node.get("final", False)) or not node.get("children")
+
+
+def uses_child_angles(root):
+    """
+    Database trees store the angle of a cut on the two children it produces,
+    LLM trees store it on the node being cut. Database trees carry mergeid.
+    """
+    return "mergeid" in root
+
+
+def is_vertical_split(node, child_angles=False):
+    if child_angles:
+        children = node.get("children") or []
+        node = children[0] if children else node
+    try:
+        angle = float(node.get("angle", 0) or 0)
+    except (TypeError, ValueError):
+        angle = 0.0
+    return abs(angle - VERTICAL_ANGLE) < ANGLE_TOLERANCE
+
+
+def node_area(node):
+    """Area of a node, falling back to the sum of its children (and 100 like the frontend)"""
+    area = node.get("area")
+    try:
+        area = float(area)
+    except (TypeError, ValueError):
+        area = None
+    if area is not None and area > 0:
+        return area
+    children = node.get("children") or []
+    if children:
+        return sum(node_area(child) for child in children)
+    return 100.0
+
+
+def child_path(path, index, count):
+    """
+    Path of a child node. Binary splits use the database naming (rootL, rootLR, ...),
+    other splits the bracketed child index (root[0], root[10], ...), so that no path is
+    the beginning of another one unless it is an ancestor of it
+    """
+    if count == 2:
+        return path + ("L" if index == 0 else "R")
+    return f"{path}[{index}]"
+
+
+def is_descendant(path, ancestor):
+    """Whether path lies strictly below ancestor (paths are built by child_path)"""
+    return path != ancestor and path.startswith(ancestor)
+
+
+def boundary_rect(boundary_data):
+    """
+    Bounding rectangle of the boundary shapes, in the same coordinates the frontend draws with
+    """
+    if not boundary_data:
+        return None
+    min_x = min(shape.get('x', 0) for shape in boundary_data)
+    min_y = min(shape.get('y', 0) for shape in boundary_data)
+    max_x = max(shape.get('x', 0) + shape.get('width', shape.get('widthInUnits', 0)) for shape in boundary_data)
+    max_y = max(shape.get('y', 0) + shape.get('height', shape.get('heightInUnits', 0)) for shape in boundary_data)
+    return {'x': min_x, 'y': min_y, 'width': max_x - min_x, 'height': max_y - min_y}
+
+
+def split_rect(node, rect, child_angles=False):
+    """
+    Divide a node's rectangle between its children proportionally to their areas
+    """
+    children = node.get("children") or []
+    total_area = sum(node_area(child) for child in children)
+    vertical = is_vertical_split(node, child_angles)
+    rects = []
+    offset = 0.0
+    for child in children:
+        ratio = node_area(child) / total_area if total_area else 1.0 / len(children)
+        if vertical:
+            width = rect['width'] * ratio
+            rects.append({'x': rect['x'] + offset, 'y': rect['y'], 'width': width, 'height': rect['height']})
+            offset += width
+        else:
+            height = rect['height'] * ratio
+            rects.append({'x': rect['x'], 'y': rect['y'] + offset, 'width': rect['width'], 'height': height})
+            offset += height
+    return rects
+
+
+class SplitLayout(object):
+    """
+    Laid-out split tree. Keeps the rectangle of every node keyed by its path so that
+    edits only need to lay out the subtree they touch.
+    """
+
+    def __init__(self, root, rect):
+        self.root = root
+        self.child_angles = uses_child_angles(root)
+        self.rects = {}
+        self.nodes = {}
+        self.parents = {}
+        self._index(root, ROOT_PATH, None)
+        self.rects[ROOT_PATH] = dict(rect)
+        self.relayout(ROOT_PATH)
+
+    def _index(self, node, path, parent_path):
+        self.nodes[path] = node
+        self.parents[path] = parent_path
+        if is_leaf(node):
+            return
+        children = node.get("children") or []
+        for i, child in enumerate(children):
+            self._index(child, child_path(path, i, len(children)), path)
+
+    def _forget(self, path):
+        """Remove a subtree's paths from the index (the node at path itself is kept)"""
+        prefix_paths = [p for p in self.nodes if is_descendant(p, path)]
+        for p in prefix_paths:
+            self.nodes.pop(p, None)
+            self.parents.pop(p, None)
+            self.rects.pop(p, None)
+
+    def node(self, path):
+        if path not in self.nodes:
+            raise ValueError(f"Node not found: {path}")
+        return self.nodes[path]
+
+    def find(self, name):
+        """Path of the node with the given name"""
+        paths = [path for path, node in self.nodes.items() if node.get("name") == name]
+        if not paths:
+            raise ValueError(f"Node not found: {name}")
+        if len(paths) > 1:
+            raise ValueError(f"Node name is ambiguous, use a path instead: {name}")
+        return paths[0]
+
+    def relayout(self, path):
+        """
+        Recompute the rectangles below path from the rectangle stored for path
+
+        Returns:
+        - List of paths whose rectangles were recomputed
+        """
+        node = self.node(path)
+        self._forget(path)
+        self._index(node, path, self.parents.get(path))
+        updated = [path]
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            current_node = self.nodes[current]
+            if is_leaf(current_node):
+                continue
+            children = current_node.get("children") or []
+            for i, child_rect in enumerate(split_rect(current_node, self.rects[current], self.child_angles)):
+                p = child_path(current, i, len(children))
+                self.rects[p] = child_rect
+                updated.append(p)
+                stack.append(p)
+        return updated
+
+    def rooms(self):
+        """Leaf rectangles in tree order"""
+        rooms = []
+        stack = [ROOT_PATH]
+        while stack:
+            path = stack.pop()
+            node = self.nodes[path]
+            if is_leaf(node):
+                rect = self.rects[path]
+                rooms.append({
+                    'path': path,
+                    'name': node.get("name", "Unnamed"),
+                    'type': node.get("mergeid") or node.get("type") or node.get("name", "room"),
+                    'area': node_area(node),
+                    'x': rect['x'],
+                    'y': rect['y'],
+                    'width': rect['width'],
+                    'height': rect['height'],
+                    'angle': node.get("angle", 0)
+                })
+                continue
+            children = node.get("children") or []
+            for i in reversed(range(len(children))):
+                stack.append(child_path(path, i, len(children)))
+        return rooms
+
+
+def _scale_areas(node, factor):
+    node["area"] = node_area(node) * factor
+    if not is_leaf(node):
+        for child in node["children"]:
+            _scale_areas(child, factor)
+
+
+def _leaf_names(node):
+    if is_leaf(node):
+        return [node.get("name")]
+    names = []
+    for child in node["children"]:
+        names.extend(_leaf_names(child))
+    return names
+
+
+def _replace_references(root, old_names, new_name):
+    """Point connected/door/open lists that referenced old_names at new_name"""
+    old_names = set(old_names)
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        for field in REFERENCE_FIELDS:
+            refs = node.get(field)
+            if not refs:
+                continue
+            updated = []
+            for ref in refs:
+                ref = new_name if ref in old_names else ref
+                if ref not in updated and ref != node.get("name"):
+                    updated.append(ref)
+            node[field] = updated
+        stack.extend(node.get("children") or [])
+
+
+def _resolve_path(layout, operation):
+    for field in ("path", "name"):
+        if operation.get(field) is not None and not isinstance(operation[field], str):
+            raise ValueError(f"Operation {operation.get('op')}: {field} must be a string")
+    if operation.get("path"):
+        path = operation["path"]
+        if path != ROOT_PATH and not path.startswith(ROOT_PATH):
+            path = ROOT_PATH + path
+        layout.node(path)
+        return path
+    if operation.get("name"):
+        return layout.find(operation["name"])
+    raise ValueError(f"Operation {operation.get('op')} needs a path or name")
+
+
+def _split_node(layout, path, op_name):
+    node = layout.node(path)
+    if is_leaf(node):
+        raise ValueError(f"{op_name} needs a split node, {path} is a room")
+    if len(node["children"]) != 2:
+        raise ValueError(f"{op_name} only supports binary splits, {path} has {len(node['children'])} children")
+    return node
+
+
+def move_partition(layout, path, ratio=None, position=None):
+    """
+    Move the partition line of a binary split, either to a ratio of the node
+    (share of the first child) or to an absolute coordinate
+    """
+    node = _split_node(layout, path, "move_partition")
+    if ratio is None:
+        if position is None:
+            raise ValueError("move_partition needs a ratio or position")
+        rect = layout.rects[path]
+        if is_vertical_split(node, layout.child_angles):
+            ratio = (float(position) - rect['x']) / rect['width'] if rect['width'] else 0.5
+        else:
+            ratio = (float(position) - rect['y']) / rect['height'] if rect['height'] else 0.5
+    ratio = float(ratio)
+    if not 0 < ratio < 1:
+        raise ValueError(f"Partition must stay inside the node, got ratio {ratio}")
+
+    total_area = node_area(node)
+    first, second = node["children"]
+    _scale_areas(first, total_area * ratio / node_area(first))
+    _scale_areas(second, total_area * (1 - ratio) / node_area(second))
+    return layout.relayout(path)
+
+
+def swap(layout, path):
+    """Swap the two children of a split node"""
+    node = _split_node(layout, path, "swap")
+    node["children"].reverse()
+    return layout.relayout(path)
+
+
+def merge(layout, path, mergeid=None):
+    """
+    Merge all rooms below a split node into a single room at that node
+    """
+    node = layout.node(path)
+    if is_leaf(node):
+        raise ValueError(f"merge needs a split node, {path} is already a room")
+    leaves = [layout.nodes[p] for p in layout.nodes if is_descendant(p, path) and is_leaf(layout.nodes[p])]
+    merged_names = _leaf_names(node)
+    largest = max(leaves, key=node_area)
+
+    node["area"] = node_area(node)
+    node["final"] = True
+    node["children"] = []
+    if mergeid or "mergeid" in largest:
+        node["mergeid"] = mergeid or largest["mergeid"]
+    for field in REFERENCE_FIELDS:
+        if any(field in leaf for leaf in leaves):
+            refs = []
+            for leaf in leaves:
+                for ref in leaf.get(field) or []:
+                    if ref not in merged_names and ref not in refs:
+                        refs.append(ref)
+            node[field] = refs
+    _replace_references(layout.root, merged_names, node.get("name"))
+    return layout.relayout(path)
+
+
+def rename(layout, path, name=None, mergeid=None):
+    """Rename a node and/or change its room type (the database mergeid)"""
+    node = layout.node(path)
+    if name is None and mergeid is None:
+        raise ValueError("rename needs a name or mergeid")
+    if name is not None and name != node.get("name"):
+        old_name = node.get("name")
+        node["name"] = name
+        _replace_references(layout.root, [old_name], name)
+    if mergeid is not None:
+        node["mergeid"] = mergeid
+    return []
+
+
+def apply_edit(layout, operation):
+    """
+    Apply one edit operation to a laid-out tree
+
+    Returns:
+    - List of paths whose rectangles changed
+    """
+    if not isinstance(operation, dict):
+        raise ValueError(f"Each operation must be an object, got {type(operation).__name__}")
+    op = operation.get("op")
+    path = _resolve_path(layout, operation)
+    if op == "move_partition":
+        return move_partition(layout, path, operation.get("ratio"), operation.get("position"))
+    if op == "swap":
+        return swap(layout, path)
+    if op == "merge":
+        return merge(layout, path, operation.get("mergeid"))
+    if op == "rename":
+        return rename(layout, path, operation.get("new_name"), operation.get("mergeid", operation.get("type")))
+    raise ValueError(f"Unknown edit operation: {op}")
+
+
+def edit_floor_plan(split_data, operations, rect=None, boundary_data=None):
+    """
+    Apply geometric edits to a split tree without calling the LLM
+
+    Parameters:
+    - split_data: Split tree, or an object containing it under split/root/json_result
+    - operations: List of edits, each with an "op" (move_partition, swap, merge, rename)
+      and a "path" (e.g. "rootLR") or "name" of the node
+    - rect: Rectangle of the root node, defaults to the bounding box of boundary_data
+    - boundary_data: Boundary shapes from the frontend
+
+    Returns:
+    - result: Updated tree, rooms, node rectangles, the paths that changed and the tree hash
+    - success: Whether the operation was successful
+    - message: Status or error message
+    """
+    root = get_split_root(split_data)
+    if root is None:
+        return None, False, "Missing split tree"
+    if not isinstance(operations, list):
+        return None, False, "Operations must be a list"
+
+    if rect is not None and not isinstance(rect, dict):
+        return None, False, "rect must be an object with x, y, width and height"
+    if boundary_data is not None and (not isinstance(boundary_data, list)
+                                      or not all(isinstance(shape, dict) for shape in boundary_data)):
+        return None, False, "boundary_data must be a list of shapes"
+    rect = rect or boundary_rect(boundary_data)
+    if not rect:
+        return None, False, "Missing rect or boundary data"
+
+    try:
+        root = copy.deepcopy(root)
+        layout = SplitLayout(root, rect)
+        changed = []
+        for operation in operations:
+            for path in apply_edit(layout, operation):
+                if path not in changed:
+                    changed.append(path)
+    except (ValueError, TypeError, KeyError, ZeroDivisionError) as e:
+        logger.warning(f"Edit rejected: {str(e)}")
+        return None, False, str(e)
+
+    return {
+        'split': root,
+        'rooms': layout.rooms(),
+        'layout': layout.rects,
+        'changed': changed,
+        'tree_hash': node_hashes(root)[ROOT_PATH]
+    }, True, f"Applied {len(operations)} edit(s)"
+
+
+def _node_own(node):
+    """Fields of a node itself that matter for layout and labels, in canonical form (labels, area, angle, leaf)"""
+    try:
+        angle = round(float(node.get("angle", 0) or 0), HASH_PRECISION)
+    except (TypeError, ValueError):
+        angle = 0.0
+    return [node.get(field) for field in LABEL_FIELDS] + [round(node_area(node), HASH_PRECISION), angle, is_leaf(node)]
+
+
+def node_hashes(root):
+    """
+    Merkle hash of every node keyed by path: a node's hash covers its own fields and the
+    hashes of its children, so equal hashes mean equal subtrees
+    """
+    hashes = {}
+
+    def visit(node, path):
+        children = [] if is_leaf(node) else node.get("children") or []
+        child_hashes = [visit(child, child_path(path, i, len(children))) for i, child in enumerate(children)]
+        own = json.dumps(_node_own(node), ensure_ascii=False, separators=(",", ":"))
+        digest = hashlib.blake2b((own + "|" + ",".join(child_hashes)).encode("utf-8"),
+                                 digest_size=TREE_HASH_BYTES).hexdigest()
+        hashes[path] = digest
+        return digest
+
+    visit(root, ROOT_PATH)
+    return hashes
+
+
+def tree_hash(data):
+    """Canonical hash of a split tree (or an object containing one), None when there is no tree"""
+    root = get_split_root(data)
+    return node_hashes(root)[ROOT_PATH] if root is not None else None
+
+
+def _subtree(node, path):
+    """(path, node) pairs of a subtree, parents first"""
+    stack = [(path, node)]
+    while stack:
+        current_path, current = stack.pop()
+        yield current_path, current
+        if not is_leaf(current):
+            children = current.get("children") or []
+            for i in reversed(range(len(children))):
+                stack.append((child_path(current_path, i, len(children)), children[i]))
+
+
+def _change(op, path, node, rect=None, **fields):
+    change = {'op': op, 'path': path, 'name': node.get("name"), 'area': node_area(node), 'final': is_leaf(node)}
+    if rect is not None:
+        change['rect'] = rect
+    change.update(fields)
+    return change
+
+
+def diff_trees(old_data, new_data, rect=None):
+    """
+    Structural diff between two versions of a split tree, keyed by node path
+
+    Parameters:
+    - old_data / new_data: Split trees, or objects containing them
+    - rect: Optional rectangle of the root node; when given, nodes whose laid-out rectangle
+      moved are reported as resized too, with their new rectangle
+
+    Returns:
+    - Dict with from_hash, to_hash and changes, a list of {op, path, name, area, final, ...}
+      where op is "added", "removed", "resized" (old_area) or "renamed" (old_name, mergeid)
+    """
+    old_root = get_split_root(old_data)
+    new_root = get_split_root(new_data)
+    old_hashes = node_hashes(old_root) if old_root is not None else {}
+    new_hashes = node_hashes(new_root) if new_root is not None else {}
+    old_rects = new_rects = {}
+    if rect and old_root is not None and new_root is not None:
+        old_rects = SplitLayout(old_root, rect).rects
+        new_rects = SplitLayout(new_root, rect).rects
+
+    changes = []
+    stack = [(ROOT_PATH, old_root, new_root)] if old_root is not None or new_root is not None else []
+    while stack:
+        path, old, new = stack.pop()
+        if old is None:
+            changes.extend(_change('added', p, n, new_rects.get(p)) for p, n in _subtree(new, path))
+            continue
+        if new is None:
+            changes.extend(_change('removed', p, n) for p, n in _subtree(old, path))
+            continue
+        if old_hashes[path] == new_hashes[path] and old_rects.get(path) == new_rects.get(path):
+            continue
+        new_rect = new_rects.get(path)
+        if any(old.get(field) != new.get(field) for field in LABEL_FIELDS):
+            changes.append(_change('renamed', path, new, new_rect, old_name=old.get("name"),
+                                   mergeid=new.get("mergeid")))
+        if _node_own(old)[-3:-1] != _node_own(new)[-3:-1] or old_rects.get(path) != new_rect:
+            changes.append(_change('resized', path, new, new_rect, old_area=node_area(old)))
+        old_children = [] if is_leaf(old) else old.get("children") or []
+        new_children = [] if is_leaf(new) else new.get("children") or []
+        if len(old_children) != len(new_children):
+            # Child paths depend on the number of children, so the subtrees are replaced
+            # (pushed in reverse so removals come out first, in path order)
+            for i in reversed(range(len(new_children))):
+                stack.append((child_path(path, i, len(new_children)), None, new_children[i]))
+            for i in reversed(range(len(old_children))):
+                stack.append((child_path(path, i, len(old_children)), old_children[i], None))
+            continue
+        for i in reversed(range(len(new_children))):
+            stack.append((child_path(path, i, len(new_children)), old_children[i], new_children[i]))
+
+    return {
+        'from_hash': old_hashes.get(ROOT_PATH),
+        'to_hash': new_hashes.get(ROOT_PATH),
+        'changes': changes
+    }
@@ -0,0 +1,125 @@
+import time
+import logging
+import importlib
+import threading
+
+from app.services import config
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+
+class LazyModule(object):
+    """
+    Stand-in for a service module that is imported on first attribute access, so that numpy
+    and the modules built on it are not loaded until a request needs them. importlib keeps
+    concurrent first uses safe (one thread imports, the others wait for it).
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}{' (loaded)' if self._module is not None else ''}>"
+
+
+def lazy_module(name):
+    return LazyModule(name)
+
+
+def _prewarm_llm():
+    from app.services import floor_plan_service
+    return floor_plan_service.prewarm_connection()
+
+
+def _prewarm_geometry():
+    importlib.import_module("app.services.plan_metrics")
+    importlib.import_module("app.services.boundary")
+    return True
+
+
+def _prewarm_spatial():
+    from app.services import spatial_index
+    return spatial_index.get_index() is not None
+
+
+def _prewarm_metrics():
+    from app.services import plan_metrics
+    return plan_metrics.database_metrics() is not None
+
+
+# Task name -> function returning whether there was anything to warm up
+PREWARM_TASKS = {
+    "llm": _prewarm_llm,
+    "geometry": _prewarm_geometry,
+    "spatial": _prewarm_spatial,
+    "metrics": _prewarm_metrics,
+}
+
+
+def prewarm_tasks(value=None):
+    """
+    Task names from FLOORPLAN_PREWARM (or value), in the given order; unknown names are logged
+    and skipped
+    """
+    if value is None:
+        value = config.get_settings().prewarm
+    names = []
+    for name in value.split(","):
+        name = name.strip().lower()
+        if not name or name == "none":
+            continue
+        if name not in PREWARM_TASKS:
+            logger.warning(f"Unknown prewarm task {name!r}, expected one of {', '.join(PREWARM_TASKS)}")
+        elif name not in names:
+            names.append(name)
+    return names
+
+
+def prewarm(names):
+    """
+    Run prewarm tasks one after the other; failures are logged, the service then initializes
+    on first use as usual
+
+    Returns:
+    - Dict of task name -> seconds taken (None when the task failed or had nothing to do)
+    """
+    timings = {}
+    for name in names:
+        start = time.perf_counter()
+        try:
+            done = PREWARM_TASKS[name]()
+        except Exception as e:
+            logger.warning(f"Prewarming {name} failed: {str(e)}")
+            done = False
+        timings[name] = time.perf_counter() - start if done else None
+        if done:
+            logger.info(f"Prewarmed {name} in {timings[name] * 1000:.0f} ms")
+    return timings
+
+
+def init_app(app):
+    """
+    Start the configured prewarm tasks in a background thread, so that create_app returns
+    without waiting for them
+
+    Parameters:
+    - app: Flask application
+
+    Returns:
+    - The prewarm thread, or None when nothing is configured
+    """
+    names = prewarm_tasks()
+    if not names:
+        return None
+    thread = threading.Thread(target=prewarm, args=(names,), name="floorplan-prewarm", daemon=True)
+    thread.start()
+    app.extensions['floorplan_prewarm'] = thread
+    return thread
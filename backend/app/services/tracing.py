@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler, QueueListener
+
+from app.services import config
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar("floorplan_current_span", default=None)
+
+# Spans waiting for the writer thread; beyond this, new spans are dropped rather than block requests
+QUEUE_SIZE = 10000
+
+# Spans are queued and written one JSON object per line by a rotating file handler in a
+# background thread. The queue is fed directly rather than through a logger so that log
+# levels and logging.disable() don't drop spans.
+_export_queue = None
+_export_listener = None
+_export_lock = threading.Lock()
+_export_configured = False
+dropped_spans = 0
+
+
+def tracing_enabled():
+    return config.get_settings().tracing
+
+
+def get_trace_file():
+    return config.get_settings().trace_file
+
+
+def _configure_export():
+    global _export_queue, _export_listener, _export_configured
+    with _export_lock:
+        if _export_configured:
+            return
+        settings = config.get_settings()
+        path = settings.trace_file
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=settings.trace_max_bytes,
+                                          backupCount=settings.trace_backups, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            _export_queue = queue.Queue(QUEUE_SIZE)
+            _export_listener = QueueListener(_export_queue, handler)
+            _export_listener.start()
+            logger.info(f"Writing trace spans to {path}")
+        except OSError as e:
+            logger.error(f"Cannot open trace file {path}, spans will not be exported: {str(e)}")
+        _export_configured = True
+
+
+def _export(span):
+    global dropped_spans
+    if not tracing_enabled():
+        return
+    if not _export_configured:
+        _configure_export()
+    if _export_queue is not None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, separators=(",", ":"), default=str)
+        try:
+            _export_queue.put_nowait(logging.makeLogRecord({"msg": line, "levelno": logging.INFO}))
+        except queue.Full:
+            dropped_spans += 1
+
+
+def shutdown_export():
+    """Write out queued spans and stop the writer thread"""
+    global _export_queue, _export_listener, _export_configured
+    with _export_lock:
+        if _export_listener is not None:
+            _export_listener.stop()
+            for handler in _export_listener.handlers:
+                handler.close()
+        _export_queue, _export_listener, _export_configured = None, None, False
+
+
+atexit.register(shutdown_export)
+
+
+def _new_id(bits):
+    return format(random.getrandbits(bits), f"0{bits // 4}x")
+
+
+def _wall_ns(perf_time):
+    """Wall clock time in ns for a time.perf_counter() reading"""
+    return time.time_ns() - int((time.perf_counter() - perf_time) * 1e9)
+
+
+class Span(object):
+    """
+    One timed operation of a trace. Field names follow the OTLP JSON span format
+    (traceId, spanId, parentSpanId, startTimeUnixNano, endTimeUnixNano).
+    """
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None, start=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start = time.perf_counter() if start is None else start
+        self.start_ns = _wall_ns(self.start)
+        self.end_time = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self, end=None, error=None):
+        """Finish and export the span; later calls are ignored"""
+        if self.end_time is not None:
+            return
+        self.end_time = time.perf_counter() if end is None else end
+        if error is not None:
+            self.error = str(error)
+        _export(self)
+
+    @property
+    def duration(self):
+        return (self.end_time if self.end_time is not None else time.perf_counter()) - self.start
+
+    def traceparent(self):
+        """W3C trace context header value"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self):
+        end_ns = self.start_ns + int(self.duration * 1e9)
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": end_ns,
+            "durationMs": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+
+
+class _NoopSpan(object):
+    """Stand-in returned when there is no active trace, so callers need no checks"""
+
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def end(self, end=None, error=None):
+        pass
+
+    def traceparent(self):
+        return None
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def parse_traceparent(value):
+    """
+    Parse a W3C traceparent header
+
+    Returns:
+    - (trace_id, parent span id), or (None, None) when the header is missing or malformed
+    """
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+    except ValueError:
+        return None, None
+    return parts[1], parts[2]
+
+
+def start_trace(name, traceparent=None, **attributes):
+    """
+    Root span of a new trace, continuing the caller's trace when a traceparent header is given.
+    The span is not made current, use activate() for that.
+    """
+    trace_id, parent_id = parse_traceparent(traceparent)
+    return Span(name, trace_id or _new_id(128), parent_id, attributes)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def attach(span):
+    """Make a span current, returns a token for detach()"""
+    return _current_span.set(span)
+
+
+def detach(token):
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        # Token from another context (e.g. a generator closed elsewhere), just clear the span
+        _current_span.set(None)
+
+
+@contextmanager
+def activate(span):
+    token = attach(span)
+    try:
+        yield span
+    finally:
+        detach(token)
+
+
+def start_span(name, parent=None, **attributes):
+    """Child span of the given (or current) span; NOOP_SPAN outside of a trace"""
+    parent = parent or current_span()
+    if parent is None or parent is NOOP_SPAN:
+        return NOOP_SPAN
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Trace a block as a child of the current span and make it current while it runs"""
+    child = start_span(name, **attributes)
+    if child is NOOP_SPAN:
+        yield child
+        return
+    token = attach(child)
+    try:
+        yield child
+    except Exception as e:
+        child.end(error=e)
+        raise
+    finally:
+        detach(token)
+        child.end()
+
+
+def traced_stream(span, generator):
+    """
+    Keep a span current while a generator (e.g. a streamed response) runs, and end the span
+    once the generator is exhausted or closed
+    """
+    with activate(span):
+        try:
+            yield from generator
+        except Exception as e:
+            span.end(error=e)
+            raise
+        finally:
+            span.end()
+
+
+def record_span(name, start, end, parent=None, **attributes):
+    """Record an already measured interval (time.perf_counter() readings) as a span"""
+    child = start_span(name, parent, **attributes)
+    if child is NOOP_SPAN:
+        return child
+    child.start = start
+    child.start_ns = _wall_ns(start)
+    child.end(end)
+    return child
+
+
+def propagation_headers(span=None):
+    """Headers carrying the trace context to an outbound request"""
+    span = span or current_span()
+    value = span.traceparent() if span is not None else None
+    return {"traceparent": value} if value else {}
@@ -0,0 +1,262 @@
+import logging
+
+import numpy as np
+
+from app.services import plan_metrics
+from app.services.plan_metrics import CATEGORIES, DAYLIGHT_CATEGORIES
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Coordinates are snapped to this grid (plan units, meters in the database export) before
+# endpoints are hashed, so walls computed from different rooms meet exactly
+SNAP = 1e-4
+DOOR_WIDTH = 0.9
+WINDOW_WIDTH = 1.2
+# Openings take at most this share of their wall
+MAX_OPENING_SHARE = 0.8
+# Facade walls shorter than this get no window
+MIN_WINDOW_WALL = 1.0
+
+# Room types of the rooms/walls/openings format (example_floorplan.json) per room category
+ROOM_TYPES = {
+    "bed": "bedroom",
+    "bath": "bathroom",
+    "kitchen": "kitchen",
+    "foyer": "hallway",
+    "living": "living_room",
+    "extra": "room",
+}
+
+# Side markers of facade and circulation segments in the sweep (rooms are >= 0)
+FACADE = -1
+CIRCULATION = -2
+
+
+def _coord(key):
+    """Snapped grid coordinate back in plan units"""
+    return round(key * SNAP, 6)
+
+
+def _sides(rects, rect_room):
+    """
+    The four sides of every rectangle as axis-aligned intervals on snapped lines
+
+    Returns:
+    - Arrays orientation (0 horizontal, 1 vertical), line (snapped fixed coordinate), start, end
+      (snapped, along the line), room, and side (+1 when the room is on the high side of the line)
+    """
+    keys = np.round(rects / SNAP).astype(np.int64)
+    x0, y0, x1, y1 = keys.T
+    count = len(rects)
+    orientation = np.repeat([0, 0, 1, 1], count)
+    line = np.concatenate([y0, y1, x0, x1])
+    start = np.concatenate([x0, x0, y0, y0])
+    end = np.concatenate([x1, x1, y1, y1])
+    room = np.tile(rect_room, 4)
+    side = np.repeat([1, -1, 1, -1], count)
+    return orientation, line, start, end, room, side
+
+
+def _segment_sides(segments, marker):
+    """Axis-aligned facade or circulation segments as sweep intervals (sloped ones are skipped)"""
+    keys = np.round(segments.reshape(-1, 4) / SNAP).astype(np.int64)
+    x0, y0, x1, y1 = keys.T
+    horizontal = (y0 == y1) & (x0 != x1)
+    vertical = (x0 == x1) & (y0 != y1)
+    orientation = np.concatenate([np.zeros(horizontal.sum(), dtype=np.int64), np.ones(vertical.sum(), dtype=np.int64)])
+    line = np.concatenate([y0[horizontal], x0[vertical]])
+    start = np.concatenate([np.minimum(x0, x1)[horizontal], np.minimum(y0, y1)[vertical]])
+    end = np.concatenate([np.maximum(x0, x1)[horizontal], np.maximum(y0, y1)[vertical]])
+    marker = np.full(len(line), marker)
+    return orientation, line, start, end, marker, np.zeros(len(line), dtype=np.int64)
+
+
+def _sweep(orientation, line, start, end, room, side):
+    """
+    Split every line into pieces with the same room on each side and merge consecutive pieces,
+    after one sort of all interval end points (O(n log n) for the whole batch)
+
+    Returns:
+    - List of [orientation, line, start, end, low room, high room, facade, circulation], rooms
+      being None on the outside
+    """
+    event_orientation = np.concatenate([orientation, orientation])
+    event_line = np.concatenate([line, line])
+    event_at = np.concatenate([start, end])
+    event_delta = np.concatenate([np.ones(len(start), dtype=np.int64), -np.ones(len(end), dtype=np.int64)])
+    event_room = np.concatenate([room, room])
+    event_side = np.concatenate([side, side])
+    order = np.lexsort((event_at, event_line, event_orientation))
+
+    pieces = []
+    current = None
+    active = {}
+    for i in order:
+        key = (int(event_orientation[i]), int(event_line[i]))
+        at = int(event_at[i])
+        if key != current:
+            current, active, previous = key, {}, at
+        if at > previous:
+            rooms = {1: None, -1: None}
+            for (s, r), count in active.items():
+                if count > 0 and s != 0 and (rooms[s] is None or r < rooms[s]):
+                    rooms[s] = r
+            facade = active.get((0, FACADE), 0) > 0
+            circulation = active.get((0, CIRCULATION), 0) > 0
+            # Rooms on both sides of a piece are (low, high): the room below/left, the room above/right
+            state = (rooms[-1], rooms[1], facade, circulation)
+            if state[0] != state[1]:
+                last = pieces[-1] if pieces else None
+                if last is not None and (last[0], last[1]) == key and last[3] == previous and tuple(last[4:]) == state:
+                    last[3] = at
+                else:
+                    pieces.append([key[0], key[1], previous, at] + list(state))
+            previous = at
+        pair = (int(event_side[i]), int(event_room[i]))
+        active[pair] = active.get(pair, 0) + int(event_delta[i])
+    return pieces
+
+
+def build_wall_graph(specs):
+    """
+    Convert laid-out split trees into the rooms / walls / openings format of example_floorplan.json
+
+    All specs go through one sweep, so walls between apartments of a building are shared.
+    Walls are split where the rooms on either side change, merged where they do not, and get
+    start_node / end_node ids from their hashed snapped end points. Doors and open passages
+    come from the trees' door / open fields, windows are put on facade walls of bedrooms,
+    living rooms and kitchens, and the entrance on the circulation wall of the entry room.
+
+    Parameters:
+    - specs: List of apartments/plans (split tree plus bounds.corners, corners or boundary_data);
+      facade and circulation segments are inferred like /apartments/build when missing
+
+    Returns:
+    - graph: Dict with rooms, walls, openings, nodes and unplaced (door/open requests between
+      rooms that share no wall); room ids are prefixed with the apartment id when there are
+      several specs
+    - errors: List of {"index", "error"} for the specs that could not be laid out
+    """
+    batch = plan_metrics.PlanBatch()
+    for spec in specs:
+        batch.add(spec)
+    data = batch.arrays()
+    room_plan = data["room_plan"]
+
+    def room_id(room):
+        if len(specs) == 1:
+            return batch.room_names[room]
+        spec = specs[room_plan[room]]
+        return f"{spec.get('id') or room_plan[room]}/{batch.room_names[room]}"
+
+    room_ids = [room_id(room) for room in range(len(room_plan))]
+    parts = [_sides(data["rects"], data["rect_room"]),
+             _segment_sides(data["facade"], FACADE),
+             _segment_sides(data["circulation"], CIRCULATION)]
+    pieces = _sweep(*(np.concatenate(arrays) for arrays in zip(*parts)))
+
+    nodes, node_points = {}, []
+
+    def node(x, y):
+        if (x, y) not in nodes:
+            nodes[(x, y)] = f"node_{len(nodes) + 1}"
+            node_points.append([_coord(x), _coord(y)])
+        return nodes[(x, y)]
+
+    walls, walls_between = [], {}
+    for orientation, line, start, end, low, high, facade, circulation in pieces:
+        if orientation == 0:
+            a, b = (start, line), (end, line)
+        else:
+            a, b = (line, start), (line, end)
+        sides = [r for r in (low, high) if r is not None]
+        wall = {
+            "id": f"wall_{len(walls) + 1}",
+            "start_point": [_coord(a[0]), _coord(a[1])],
+            "end_point": [_coord(b[0]), _coord(b[1])],
+            "start_node": node(*a),
+            "end_node": node(*b),
+            "room_ids": [room_ids[r] for r in sides],
+            "length": _coord(end - start),
+            "exterior": len(sides) == 1,
+            "facade": bool(facade) and len(sides) == 1,
+            "circulation": bool(circulation) and len(sides) == 1,
+        }
+        walls.append(wall)
+        if len(sides) == 2:
+            walls_between.setdefault((min(sides), max(sides)), []).append(len(walls) - 1)
+
+    openings, unplaced, counters = [], [], {}
+
+    def opening(kind, wall, width, **fields):
+        counters[kind] = counters.get(kind, 0) + 1
+        record = {"id": f"{kind}_{counters[kind]}", "type": kind, "wall_id": wall["id"], "position": 0.5,
+                  "width": round(width, 6)}
+        record.update(fields)
+        openings.append(record)
+
+    for (a, b), kind in zip(data["links"], batch.link_kind):
+        if kind == "connected":
+            continue
+        candidates = walls_between.get((int(min(a, b)), int(max(a, b))))
+        if not candidates:
+            unplaced.append({"type": kind, "room_ids": [room_ids[a], room_ids[b]]})
+            continue
+        wall = walls[max(candidates, key=lambda w: walls[w]["length"])]
+        if kind == "door":
+            opening("door", wall, min(DOOR_WIDTH, wall["length"] * MAX_OPENING_SHARE))
+        else:
+            # An open passage leaves the whole shared wall out
+            opening("open", wall, wall["length"])
+
+    category = data["room_category"]
+    room_index = {room: i for i, room in enumerate(room_ids)}
+    daylight = {CATEGORIES.index(c) for c in DAYLIGHT_CATEGORIES}
+    entrances = {}
+    for wall in walls:
+        if not wall["exterior"]:
+            continue
+        room = room_index[wall["room_ids"][0]]
+        if wall["facade"] and category[room] in daylight and wall["length"] >= MIN_WINDOW_WALL:
+            opening("window", wall, min(WINDOW_WIDTH, wall["length"] * MAX_OPENING_SHARE))
+        if wall["circulation"]:
+            # Foyers first, then the longest wall
+            rank = (category[room] == CATEGORIES.index("foyer"), wall["length"])
+            plan = room_plan[room]
+            if plan not in entrances or rank > entrances[plan][0]:
+                entrances[plan] = (rank, wall)
+    for plan in sorted(entrances):
+        wall = entrances[plan][1]
+        opening("door", wall, min(DOOR_WIDTH, wall["length"] * MAX_OPENING_SHARE), entrance=True)
+
+    adjacent = {room: [] for room in range(len(room_ids))}
+    for a, b in walls_between:
+        adjacent[a].append(room_ids[b])
+        adjacent[b].append(room_ids[a])
+    rects, rect_room = data["rects"], data["rect_room"]
+    areas = np.bincount(rect_room, (rects[:, 2] - rects[:, 0]) * (rects[:, 3] - rects[:, 1]), minlength=len(room_ids))
+    rooms = []
+    for room, rid in enumerate(room_ids):
+        name = batch.room_names[room]
+        record = {
+            "id": rid,
+            "name": name,
+            "type": ROOM_TYPES[CATEGORIES[category[room]]],
+            "area": round(float(areas[room]), 6),
+            "adjacent_rooms": sorted(adjacent[room]),
+        }
+        if len(specs) > 1:
+            record["apartment_id"] = specs[room_plan[room]].get("id") or int(room_plan[room])
+        rooms.append(record)
+
+    logger.info(f"Built wall graph of {len(specs) - len(batch.errors)} plan(s): {len(rooms)} rooms, "
+                f"{len(walls)} walls, {len(openings)} openings, {len(unplaced)} unplaced")
+    graph = {
+        "rooms": rooms,
+        "walls": walls,
+        "openings": openings,
+        "nodes": [{"id": f"node_{i + 1}", "point": point} for i, point in enumerate(node_points)],
+        "unplaced": unplaced,
+    }
+    return graph, batch.errors
@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Load and latency benchmark for the Flask API.
+
+Starts the backend in a subprocess pointed at a local OpenRouter stand-in (mock_openrouter.py),
+drives /api/generate-floor-plan, /api/generate-floor-plan-stream and /api/save-local at the
+given concurrency, and reports throughput, p50/p95/p99 latency, time to first SSE event,
+time to first token chunk, bytes per response and server CPU/RSS. Results are written as JSON so releases can be diffed.
+
+Usage:
+    python benchmark_api.py [--concurrency 8] [--requests 64] [--scenarios generate,stream,save]
+                            [--ttft 200] [--token-rate 400] [--output bench.json]
+                            [--baseline previous.json --threshold 0.2]
+    python benchmark_api.py --target http://localhost:5000   # benchmark a running server instead
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import logging
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+from mock_openrouter import create_mock_app
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLE_BOUNDARY = [{
+    "id": "shape-1", "type": "rectangle", "x": 100, "y": 100, "width": 400, "height": 300,
+    "widthInUnits": 12, "heightInUnits": 9
+}]
+SAMPLE_DESCRIPTIONS = [
+    "A two bedroom apartment with an open kitchen and a living room",
+    "A 1 bedroom unit with one bathroom and a foyer",
+    "A 3 bedroom family apartment with two bathrooms",
+    "A studio with a kitchenette and a bathroom",
+]
+
+# Metrics compared in regression mode: name -> True when higher is better
+REGRESSION_METRICS = {
+    "throughput_rps": True,
+    "latency_ms.p95": False,
+    "ttfe_ms.p95": False,
+    "ttft_ms.p95": False,
+    "server.cpu_seconds": False,
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(values):
+    if not values:
+        return None
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": sum(values) / len(values),
+        "max": max(values),
+    }
+
+
+class ProcessSampler(object):
+    """Samples CPU time and RSS of a process from /proc (Linux only)"""
+
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self.available = pid is not None and os.path.exists(f"/proc/{pid}/stat")
+
+    def cpu_seconds(self):
+        if not self.available:
+            return None
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def rss_bytes(self):
+        if not self.available:
+            return None
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, self.rss_bytes() or 0)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.start_cpu = self.cpu_seconds()
+        if self.available:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.end_cpu = self.cpu_seconds()
+
+    def report(self):
+        if not self.available:
+            return None
+        return {
+            "cpu_seconds": self.end_cpu - self.start_cpu,
+            "peak_rss_mb": self.peak_rss / (1024 * 1024),
+            "rss_mb": (self.rss_bytes() or 0) / (1024 * 1024),
+        }
+
+
+def start_mock(ttft_ms, token_rate, seed):
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    port = free_port()
+    server = make_server("127.0.0.1", port, create_mock_app(ttft_ms, token_rate, seed=seed), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{port}/api/v1"
+
+
+def start_backend(mock_url):
+    port = free_port()
+    # Load comes from one client, so per-client rate limits would reject most of it
+    env = dict(os.environ, OPENROUTER_BASE_URL=mock_url, OPENROUTER_API_KEY="sk-or-benchmark",
+               FLOORPLAN_RATE_LIMIT=os.environ.get("FLOORPLAN_RATE_LIMIT", "0"))
+    command = [sys.executable, "-c",
+               "from app import create_app; "
+               f"create_app().run(host='127.0.0.1', port={port}, threaded=True)"]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f"{url}/api/", timeout=1)
+            return process, url
+        except requests.exceptions.ConnectionError:
+            if process.poll() is not None:
+                raise RuntimeError("Backend exited during startup")
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Backend did not start in time")
+
+
+def request_generate(session, url, index, save_dir):
+    body = {"boundary_data": SAMPLE_BOUNDARY, "description": SAMPLE_DESCRIPTIONS[index % len(SAMPLE_DESCRIPTIONS)]}
+    start = time.perf_counter()
+    response = session.post(f"{url}/api/generate-floor-plan", json=body, timeout=120)
+    return {
+        "ok": response.status_code == 200,
+        "latency_ms": (time.perf_counter() - start) * 1000,
+        "bytes": len(response.content),
+    }
+
+
+def request_stream(session, url, index, save_dir):
+    body = {"boundary_data": SAMPLE_BOUNDARY, "description": SAMPLE_DESCRIPTIONS[index % len(SAMPLE_DESCRIPTIONS)]}
+    start = time.perf_counter()
+    ttfe = None
+    ttft = None
+    size = 0
+    ok = False
+    with session.post(f"{url}/api/generate-floor-plan-stream", json=body, timeout=120, stream=True) as response:
+        for line in response.iter_lines():
+            size += len(line) + 1
+            if not line.startswith(b"data: "):
+                continue
+            if ttfe is None:
+                ttfe = (time.perf_counter() - start) * 1000
+            if ttft is None and b'"type": "chunk"' in line:
+                ttft = (time.perf_counter() - start) * 1000
+            if b'"type": "final"' in line:
+                ok = response.status_code == 200
+                # The dev server keeps the connection open, so stop at the final event
+                break
+            if b'"type": "error"' in line or b'"error":' in line:
+                break
+    return {
+        "ok": ok,
+        "latency_ms": (time.perf_counter() - start) * 1000,
+        "ttfe_ms": ttfe,
+        "ttft_ms": ttft,
+        "bytes": size,
+    }
+
+
+def request_save(session, url, index, save_dir):
+    body = {"data": {"split": {"name": "root", "area": 100, "angle": 0, "final": True, "children": []}, "index": index},
+            "path": save_dir}
+    start = time.perf_counter()
+    response = session.post(f"{url}/api/save-local", json=body, timeout=30)
+    return {
+        "ok": response.status_code == 200,
+        "latency_ms": (time.perf_counter() - start) * 1000,
+        "bytes": len(response.content),
+    }
+
+
+SCENARIOS = {
+    "generate": request_generate,
+    "stream": request_stream,
+    "save": request_save,
+}
+
+
+def run_scenario(name, url, concurrency, total, pid, save_dir):
+    worker = SCENARIOS[name]
+    local = threading.local()
+
+    def call(index):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        try:
+            return worker(local.session, url, index, save_dir)
+        except requests.exceptions.RequestException as e:
+            return {"ok": False, "error": str(e)}
+
+    # Warm up connections and lazy initialization outside the measurement
+    call(0)
+    with ProcessSampler(pid) as sampler:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(call, range(total)))
+        elapsed = time.perf_counter() - start
+
+    succeeded = [r for r in results if r.get("ok")]
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": total - len(succeeded),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(succeeded) / elapsed if elapsed else None,
+        "latency_ms": summarize([r["latency_ms"] for r in succeeded]),
+        "ttfe_ms": summarize([r["ttfe_ms"] for r in succeeded if r.get("ttfe_ms") is not None]),
+        "ttft_ms": summarize([r["ttft_ms"] for r in succeeded if r.get("ttft_ms") is not None]),
+        "bytes_per_response": (sum(r["bytes"] for r in succeeded) / len(succeeded)) if succeeded else None,
+        "server": sampler.report(),
+    }
+
+
+def metric(result, dotted):
+    value = result
+    for key in dotted.split("."):
+        if not isinstance(value, dict) or value.get(key) is None:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare scenario results with a baseline run
+
+    Returns:
+    - List of regression descriptions (empty when within threshold)
+    """
+    regressions = []
+    for name, result in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for dotted, higher_is_better in REGRESSION_METRICS.items():
+            old, new = metric(previous, dotted), metric(result, dotted)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -threshold) or (not higher_is_better and change > threshold):
+                regressions.append(f"{name}.{dotted}: {old:.2f} -> {new:.2f} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the floor plan API")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=64, help="Requests per scenario")
+    parser.add_argument("--scenarios", default="generate,stream,save")
+    parser.add_argument("--ttft", type=float, default=200, help="Stand-in time to first token in ms")
+    parser.add_argument("--token-rate", type=float, default=400, help="Stand-in tokens per second")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--target", help="Benchmark an already running backend (server stats unavailable)")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Previous results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    mock_server = process = None
+    if args.target:
+        url, pid = args.target.rstrip("/"), None
+    else:
+        mock_server, mock_url = start_mock(args.ttft, args.token_rate, args.seed)
+        process, url = start_backend(mock_url)
+        pid = process.pid
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "scenarios": {},
+    }
+    try:
+        with tempfile.TemporaryDirectory() as save_dir:
+            for name in scenarios:
+                print(f"=== {name}: {args.requests} requests, concurrency {args.concurrency} ===")
+                result = run_scenario(name, url, args.concurrency, args.requests, pid, save_dir)
+                results["scenarios"][name] = result
+                latency = result["latency_ms"] or {}
+                print(f"  throughput {result['throughput_rps'] or 0:.1f} req/s, errors {result['errors']}, "
+                      f"p50 {latency.get('p50') or 0:.0f} ms, p95 {latency.get('p95') or 0:.0f} ms, "
+                      f"p99 {latency.get('p99') or 0:.0f} ms, {result['bytes_per_response'] or 0:.0f} B/response")
+                if result["ttfe_ms"]:
+                    print(f"  time to first event p50 {result['ttfe_ms']['p50']:.0f} ms, p95 {result['ttfe_ms']['p95']:.0f} ms")
+                if result["ttft_ms"]:
+                    print(f"  time to first token p50 {result['ttft_ms']['p50']:.0f} ms, p95 {result['ttft_ms']['p95']:.0f} ms")
+                if result["server"]:
+                    print(f"  server CPU {result['server']['cpu_seconds']:.2f} s, peak RSS {result['server']['peak_rss_mb']:.1f} MB")
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=10)
+        if mock_server:
+            mock_server.shutdown()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Per-request logging overhead benchmark.
+
+Replays the log calls one generation request makes, once with the previous setup
+(logging.basicConfig in the modules, f-string lines at INFO with the whole request body and
+the key prefix, written synchronously) and once with app.services.log_setup (capped lazy
+payload, debug-level step lines, queue handler). Reports the time spent in the request
+threads per request, the time until everything is written, and the bytes written.
+
+Usage:
+    python benchmark_logging.py [--requests 2000] [--threads 8] [--shapes 200] [--format text|json]
+                                [--output bench_logging.json]
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+
+from app.services import config, log_setup
+
+API_KEY = "sk-or-v1-0123456789abcdef0123456789abcdef"
+
+
+def sample_request(shapes):
+    """Request body with a large boundary (one polygon shape per entry)"""
+    boundary = [{
+        "id": f"shape-{i}", "type": "polygon", "x": 10 * i, "y": 0, "width": 10, "height": 8,
+        "points": [[0, 0], [10, 0], [10, 4], [6, 4], [6, 8], [0, 8]],
+    } for i in range(shapes)]
+    return {"boundary_data": boundary, "description": "A two bedroom apartment with an open kitchen " * 4,
+            "preferences": {"style": "modern"}}
+
+
+def legacy_request(routes, service, data):
+    """Log calls of one request before log_setup"""
+    description = data["description"]
+    routes.info(f"Received request data: {data}")
+    routes.info(f"Starting floor plan generation, description: {description[:50]}...")
+    service.info(f"Processed boundary data: Total area={64 * len(data['boundary_data'])} square meters, shapes count={len(data['boundary_data'])}")
+    service.info("Sending API request to OpenRouter using requests library")
+    service.info(f"API request Authorization header: Bearer {API_KEY[:10]}...")
+    service.info("Successfully received API response")
+    service.info("Extracting JSON content from ```json``` block")
+    service.info("JSON validation successful")
+    routes.info("Floor plan generated successfully")
+
+
+def current_request(routes, service, data):
+    """Log calls of one request with log_setup"""
+    description = data["description"]
+    routes.info("Received request data: %s", log_setup.payload(data), extra=log_setup.SAMPLED)
+    routes.info("Starting floor plan generation, description: %.50s...", description)
+    service.debug("Processed boundary data: Total area=%s square meters, shapes count=%s",
+                  64 * len(data['boundary_data']), len(data['boundary_data']))
+    service.debug("Sending API request to OpenRouter using requests library")
+    service.debug("Successfully received API response")
+    service.debug("Extracting JSON content from ```json``` block")
+    service.debug("JSON validation successful")
+    routes.info("Floor plan generated successfully")
+
+
+def configure_legacy(log_file):
+    log_setup.shutdown_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    logging.basicConfig(level=logging.INFO, filename=log_file)
+
+
+def configure_current(log_file, log_format):
+    os.environ.update(FLOORPLAN_LOG_FILE=log_file, FLOORPLAN_LOG_FORMAT=log_format)
+    log_setup.setup_logging(force=True, settings=config.Settings(os.environ))
+
+
+def run(request_fn, data, requests, threads):
+    """Run requests split over threads, returns thread seconds per request and wall time"""
+    routes, service = logging.getLogger("app.routes"), logging.getLogger("app.services.floor_plan_service")
+    per_thread = requests // threads
+    thread_seconds = []
+
+    def worker():
+        start = time.thread_time()
+        for _ in range(per_thread):
+            request_fn(routes, service, data)
+        thread_seconds.append(time.thread_time() - start)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    request_wall = time.perf_counter() - start
+    # Includes writing out what is still queued
+    log_setup.shutdown_logging()
+    for handler in logging.getLogger().handlers:
+        handler.flush()
+    total_wall = time.perf_counter() - start
+    count = per_thread * threads
+    return {
+        "requests": count,
+        "thread_us_per_request": 1e6 * sum(thread_seconds) / count,
+        "request_wall_ms": 1000 * request_wall,
+        "total_wall_ms": 1000 * total_wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-request logging overhead")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--shapes", type=int, default=200, help="Boundary shapes in the request body")
+    parser.add_argument("--format", default="text", choices=("text", "json"))
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    data = sample_request(args.shapes)
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "body_bytes": len(json.dumps(data)),
+    }
+    with tempfile.TemporaryDirectory() as log_dir:
+        for name, configure, request_fn in (
+                ("before", configure_legacy, legacy_request),
+                ("after", lambda path: configure_current(path, args.format), current_request)):
+            log_file = os.path.join(log_dir, f"{name}.log")
+            configure(log_file)
+            result = run(request_fn, data, args.requests, args.threads)
+            result["bytes_per_request"] = os.path.getsize(log_file) / result["requests"]
+            results[name] = result
+            print(f"{name:>6}: {result['thread_us_per_request']:9.1f} us/request in request threads, "
+                  f"{result['total_wall_ms']:8.1f} ms total, {result['bytes_per_request']:9.1f} bytes/request")
+    logging.shutdown()
+
+    before, after = results["before"], results["after"]
+    results["speedup"] = before["thread_us_per_request"] / max(after["thread_us_per_request"], 1e-9)
+    print(f"Request thread logging time {results['speedup']:.1f}x lower")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
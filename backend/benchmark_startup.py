@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Cold-start benchmark and import-time report for the backend.
+
+Starts fresh interpreters that import the app, call create_app() and serve a first request
+(through the test client), and reports the time of each step. A python -X importtime run
+gives the breakdown: the slowest modules by own import time, grouped by top-level package,
+and the cumulative time of every app module.
+
+The budget check fails (exit code 1) when the median create_app() time is over --budget-ms
+or when a module listed in --forbid is imported by create_app() with prewarming off.
+
+Usage:
+    python benchmark_startup.py [--runs 5] [--budget-ms 400] [--forbid numpy,requests]
+                                [--top 15] [--output startup.json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_BUDGET_MS = 400
+# Loaded on first use only (see app/services/startup.py)
+DEFAULT_FORBIDDEN = "numpy,requests,app.services.geometry,app.services.plan_metrics"
+
+STARTUP_SCRIPT = """
+import sys, json, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get('/metrics')
+served = time.perf_counter()
+print(json.dumps({
+    "import_ms": 1000 * (imported - start),
+    "create_app_ms": 1000 * (created - imported),
+    "first_request_ms": 1000 * (served - created),
+    "status": response.status_code,
+    "modules": sorted(sys.modules),
+}))
+"""
+
+
+def _environment():
+    env = dict(os.environ)
+    # Measure what create_app itself does: no background prewarming, no trace or journal files
+    env.update(FLOORPLAN_PREWARM="none", FLOORPLAN_TRACING="0", FLOORPLAN_JOURNAL="0",
+               FLOORPLAN_LOG_LEVEL="WARNING", PYTHONPATH=BACKEND_DIR)
+    return env
+
+
+def measure_startup():
+    """One cold start in a new interpreter, with the wall time of the whole process"""
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=BACKEND_DIR, env=_environment(),
+                            capture_output=True, text=True, check=True)
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    result["process_ms"] = 1000 * (time.perf_counter() - start)
+    return result
+
+
+def import_times():
+    """
+    Parse python -X importtime for the app import and create_app()
+
+    Returns:
+    - List of (module, self_us, cumulative_us) in import order
+    """
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "from app import create_app; create_app()"],
+                            cwd=BACKEND_DIR, env=_environment(), capture_output=True, text=True, check=True)
+    rows = []
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark backend cold start")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Allowed median time of importing the app plus create_app()")
+    parser.add_argument("--forbid", default=DEFAULT_FORBIDDEN,
+                        help="Modules create_app() must not import (comma-separated, empty for none)")
+    parser.add_argument("--top", type=int, default=15, help="Packages listed in the import breakdown")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    runs = [measure_startup() for _ in range(args.runs)]
+    steps = ("import_ms", "create_app_ms", "first_request_ms", "process_ms")
+    summary = {step: median([run[step] for run in runs]) for step in steps}
+    startup_ms = summary["import_ms"] + summary["create_app_ms"]
+    print(f"=== Cold start, median of {args.runs} runs ===")
+    for step in steps:
+        print(f"{step:>18}: {summary[step]:8.1f} ms")
+
+    rows = import_times()
+    packages = {}
+    for name, self_us, _ in rows:
+        top = name.split(".")[0]
+        packages[top] = packages.get(top, 0) + self_us
+    ranked = sorted(packages.items(), key=lambda item: -item[1])
+    print(f"=== Import time by top-level package ({sum(packages.values()) / 1000:.1f} ms in total) ===")
+    for top, self_us in ranked[:args.top]:
+        print(f"{top:>24}: {self_us / 1000:8.1f} ms")
+    app_modules = [(name, cumulative_us) for name, _, cumulative_us in rows if name.split(".")[0] == "app"]
+    print("=== App modules (cumulative, including what they import) ===")
+    for name, cumulative_us in sorted(app_modules, key=lambda item: -item[1]):
+        print(f"{name:>36}: {cumulative_us / 1000:8.1f} ms")
+
+    loaded = set(runs[0]["modules"])
+    forbidden = [m.strip() for m in args.forbid.split(",") if m.strip()]
+    violations = [m for m in forbidden if m in loaded]
+    failures = []
+    if startup_ms > args.budget_ms:
+        failures.append(f"import + create_app() took {startup_ms:.1f} ms, budget {args.budget_ms:.0f} ms")
+    if violations:
+        failures.append(f"create_app() imported {', '.join(violations)}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "config": {k: v for k, v in vars(args).items() if k != "output"},
+                "startup_ms": summary,
+                "packages_ms": {top: self_us / 1000 for top, self_us in ranked},
+                "app_modules_ms": {name: cumulative_us / 1000 for name, cumulative_us in app_modules},
+                "failures": failures,
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        return 1
+    print(f"OK: import + create_app() {startup_ms:.1f} ms within {args.budget_ms:.0f} ms, "
+          f"none of {', '.join(forbidden) or '(nothing)'} imported")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
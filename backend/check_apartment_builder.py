@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Round-trip check of the apartment builder against the database export.
+
+Rebuilds every apartment from its bounds and split tree and compares the result with the
+exported object (facade and circulation are site data and pass through unchanged). A second pass
+drops facade/circulation and reports how well they are inferred from the laid-out rooms; the
+thresholds are asserted in tests/test_apartment_builder.py.
+
+Usage: python check_apartment_builder.py [path/to/_250324_databaseExport.json]
+"""
+
+import os
+import sys
+import json
+import time
+import math
+
+from app.services import apartment_builder, geometry
+from app.services.split_tree import get_split_root
+
+DEFAULT_EXPORT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '_250324_databaseExport.json')
+TOLERANCE = 1e-6
+
+
+def _same_points(a, b):
+    return len(a) == len(b) and all(
+        abs(p["X"] - q["X"]) < TOLERANCE and abs(p["Y"] - q["Y"]) < TOLERANCE for p, q in zip(a, b)
+    )
+
+
+def _same_segments(a, b):
+    return _same_points([s["start"] for s in a], [s["start"] for s in b]) and \
+        _same_points([s["end"] for s in a], [s["end"] for s in b])
+
+
+def _overlap(segments, reference):
+    """Length of segments lying on reference segments (both axis aligned)"""
+    total = 0.0
+    for s in segments:
+        (ax0, ay0), (ax1, ay1) = geometry.to_xy(s["start"]), geometry.to_xy(s["end"])
+        for r in reference:
+            (bx0, by0), (bx1, by1) = geometry.to_xy(r["start"]), geometry.to_xy(r["end"])
+            if abs(ax0 - ax1) < 1e-3 and abs(bx0 - bx1) < 1e-3 and abs(ax0 - bx0) < 1e-3:
+                total += max(0.0, min(max(ay0, ay1), max(by0, by1)) - max(min(ay0, ay1), min(by0, by1)))
+            elif abs(ay0 - ay1) < 1e-3 and abs(by0 - by1) < 1e-3 and abs(ay0 - by0) < 1e-3:
+                total += max(0.0, min(max(ax0, ax1), max(bx0, bx1)) - max(min(ax0, ax1), min(bx0, bx1)))
+    return total
+
+
+def _length(segments):
+    return sum(math.dist(geometry.to_xy(s["start"]), geometry.to_xy(s["end"])) for s in segments)
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_EXPORT
+    with open(path, 'r', encoding='utf-8') as f:
+        exported = json.load(f)
+    print(f"=== Apartment builder round trip: {len(exported)} apartments ===")
+
+    # 1. Full round trip, site data passed through (checks bounds, area, rooms and the split)
+    start = time.perf_counter()
+    built, errors = apartment_builder.build_apartments(exported)
+    elapsed = time.perf_counter() - start
+    failures = [f"#{e['index']}: {e['error']}" for e in errors]
+    for i, (original, apartment) in enumerate(zip(exported, built)):
+        if apartment is None:
+            continue
+        checks = {
+            'bounds': _same_points(original['bounds']['corners'], apartment['bounds']['corners']),
+            'facade': _same_segments(original['facade'], apartment['facade']),
+            'circulation': _same_segments(original['circulation'], apartment['circulation']),
+            'split': original['split'] == apartment['split'],
+            'bedrooms': original['bedrooms'] == apartment['bedrooms'],
+            'bathrooms': original['bathrooms'] == apartment['bathrooms'],
+            # The split tree divides the boundary polygon (the exported area field is measured differently)
+            'area': abs(get_split_root(original['split'])['area'] - apartment['area']) <= 1e-9 * apartment['area'],
+        }
+        failed = [name for name, ok in checks.items() if not ok]
+        if failed:
+            failures.append(f"#{i} {original['id']}: {', '.join(failed)}")
+    print(f"Round trip: {len(exported) - len(failures)}/{len(exported)} match ({elapsed * 1000:.1f} ms)")
+    for failure in failures[:20]:
+        print(f"  mismatch {failure}")
+
+    # 2. Facade and circulation inferred from the laid-out rooms
+    stripped = [{k: v for k, v in a.items() if k not in ('facade', 'circulation')} for a in exported]
+    start = time.perf_counter()
+    inferred, _ = apartment_builder.build_apartments(stripped)
+    elapsed = time.perf_counter() - start
+    for kind in ('facade', 'circulation'):
+        predicted = sum(_length(a[kind]) for a in inferred if a)
+        actual = sum(_length(a[kind]) for a in exported)
+        hit = sum(_overlap(b[kind], a[kind]) for a, b in zip(exported, inferred) if b)
+        print(f"Inferred {kind}: precision {hit / predicted if predicted else 0:.2f}, "
+              f"recall {hit / actual if actual else 0:.2f}")
+    print(f"Inference pass: {elapsed * 1000:.1f} ms")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
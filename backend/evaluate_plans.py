@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Offline quality-versus-latency evaluation over the apartment database export.
+
+For every apartment a description and a boundary are synthesized from its area, bedroom and
+bathroom counts, room types and bounds.corners, then run through generate_floor_plan in the
+chosen modes with a worker pool. Each result is scored for area error, room-count match,
+tree validity, room aspect ratios, latency and tokens.
+
+Modes:
+- llm: the configured OpenRouter model (uses real tokens)
+- mock: a local OpenRouter stand-in (mock_openrouter.py), no network needed
+- database: the exported split tree itself, as the quality ceiling
+
+Usage: python evaluate_plans.py [--modes mock,database] [--limit 50] [--workers 8]
+                                [--model anthropic/claude-3.7-sonnet] [--output eval.json]
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import make_server
+
+from app.services import floor_plan_service, geometry
+from app.services.apartment_builder import count_rooms, room_category
+from app.services.split_tree import get_split_root, is_leaf, node_area
+from mock_openrouter import create_mock_app
+
+DEFAULT_EXPORT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '_250324_databaseExport.json')
+
+# Children areas may deviate this much from their parent before a tree counts as invalid
+AREA_TOLERANCE = 0.05
+
+
+def synthesize_request(apartment):
+    """
+    Description and frontend-style boundary_data for an exported apartment.
+    The boundary polygon is split into rectangles so that L-shapes keep their real area.
+    """
+    polygon = geometry.polygon_array(apartment['bounds']['corners'])
+    rects = geometry.decompose_polygon(polygon)
+    min_x, min_y = rects[:, 0].min(), rects[:, 1].min()
+    boundary_data = []
+    for i, (x0, y0, x1, y1) in enumerate(rects):
+        boundary_data.append({
+            "id": f"shape-{i + 1}",
+            "type": "rectangle",
+            "x": float(x0 - min_x),
+            "y": float(y0 - min_y),
+            "width": float(x1 - x0),
+            "height": float(y1 - y0),
+            "widthInUnits": float(x1 - x0),
+            "heightInUnits": float(y1 - y0),
+        })
+
+    categories = set()
+    stack = [apartment['split']]
+    while stack:
+        node = stack.pop()
+        if is_leaf(node):
+            categories.add(room_category(node))
+        else:
+            stack.extend(node['children'])
+    extras = [name for category, name in (("living", "a living room"), ("kitchen", "a kitchen"),
+                                          ("foyer", "an entry foyer"), ("extra", "a storage room"))
+              if category in categories]
+    bedrooms = apartment.get('bedrooms', 0)
+    rooms = "studio" if bedrooms == 0 else f"{bedrooms} bedroom"
+    description = (f"A {rooms} apartment with {apartment.get('bathrooms', 1)} bathroom(s), "
+                   f"about {apartment.get('area', 0):.0f} square meters, with {', '.join(extras) or 'open space'}.")
+    return boundary_data, description
+
+
+def validate_tree(root):
+    """
+    Structural problems of a split tree
+
+    Returns:
+    - List of problem descriptions (empty when the tree is valid)
+    """
+    problems = []
+    stack = [(root, "root")]
+    while stack:
+        node, path = stack.pop()
+        try:
+            area = float(node.get("area"))
+        except (TypeError, ValueError):
+            problems.append(f"{path}: missing area")
+            continue
+        if area <= 0:
+            problems.append(f"{path}: non-positive area")
+        if is_leaf(node):
+            continue
+        children = node["children"]
+        if len(children) < 2:
+            problems.append(f"{path}: split with {len(children)} child")
+        total = sum(node_area(child) for child in children)
+        if area > 0 and abs(total - area) / area > AREA_TOLERANCE:
+            problems.append(f"{path}: children sum to {total:.1f} of {area:.1f}")
+        for i, child in enumerate(children):
+            stack.append((child, f"{path}.{i}"))
+    return problems
+
+
+def aspect_ratios(root, apartment):
+    """Aspect ratio (long side / short side) of every room laid out in the real boundary"""
+    polygon = geometry.polygon_array(apartment['bounds']['corners'])
+    placed = geometry.layout_region(root, geometry.decompose_polygon(polygon))
+    ratios = []
+    for node, rects in placed.values():
+        if not is_leaf(node) or len(rects) == 0:
+            continue
+        x0, y0, x1, y1 = geometry.region_bounds(rects)
+        short, long = sorted((x1 - x0, y1 - y0))
+        ratios.append(long / short if short > 0 else math.inf)
+    return ratios
+
+
+def score(apartment, root, latency_ms, usage):
+    record = {
+        "id": apartment['id'],
+        "latency_ms": latency_ms,
+        "prompt_tokens": (usage or {}).get("prompt_tokens"),
+        "completion_tokens": (usage or {}).get("completion_tokens"),
+    }
+    if root is None:
+        record.update({"valid": False, "problems": ["no split tree"]})
+        return record
+
+    problems = validate_tree(root)
+    bedrooms, bathrooms = count_rooms(root)
+    ratios = aspect_ratios(root, apartment) if not problems else []
+    record.update({
+        "valid": not problems,
+        "problems": problems[:5],
+        "area_error": abs(node_area(root) - apartment['area']) / apartment['area'],
+        "bedrooms_match": bedrooms == apartment['bedrooms'],
+        "bathrooms_match": bathrooms == apartment['bathrooms'],
+        "rooms": sum(1 for _ in _leaves(root)),
+        "max_aspect_ratio": max(ratios) if ratios else None,
+        "mean_aspect_ratio": sum(ratios) / len(ratios) if ratios else None,
+    })
+    return record
+
+
+def _leaves(root):
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if is_leaf(node):
+            yield node
+        else:
+            stack.extend(node["children"])
+
+
+def run_generation(apartment):
+    boundary_data, description = synthesize_request(apartment)
+    start = time.perf_counter()
+    floor_plan_json, success, message = floor_plan_service.generate_floor_plan(boundary_data, description)
+    latency_ms = (time.perf_counter() - start) * 1000
+    root, usage = None, None
+    if success:
+        try:
+            result = json.loads(floor_plan_json)
+            root = get_split_root(result)
+            usage = result.get("usage")
+        except (TypeError, ValueError):
+            pass
+    record = score(apartment, root, latency_ms, usage)
+    if not success:
+        record["error"] = message
+    return record
+
+
+def run_database(apartment):
+    return score(apartment, apartment['split'], 0.0, None)
+
+
+MODES = {
+    "llm": run_generation,
+    "mock": run_generation,
+    "database": run_database,
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(1, int(math.ceil(pct / 100.0 * len(ordered)))) - 1]
+
+
+def summarize(records, elapsed):
+    def mean(key):
+        values = [r[key] for r in records if r.get(key) is not None and r[key] != math.inf]
+        return sum(values) / len(values) if values else None
+
+    latencies = [r["latency_ms"] for r in records]
+    return {
+        "apartments": len(records),
+        "elapsed_s": elapsed,
+        "errors": sum(1 for r in records if r.get("error")),
+        "valid_rate": sum(1 for r in records if r.get("valid")) / len(records),
+        "bedrooms_match_rate": sum(1 for r in records if r.get("bedrooms_match")) / len(records),
+        "bathrooms_match_rate": sum(1 for r in records if r.get("bathrooms_match")) / len(records),
+        "mean_area_error": mean("area_error"),
+        "mean_aspect_ratio": mean("mean_aspect_ratio"),
+        "mean_max_aspect_ratio": mean("max_aspect_ratio"),
+        "latency_ms": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95)},
+        "mean_prompt_tokens": mean("prompt_tokens"),
+        "mean_completion_tokens": mean("completion_tokens"),
+    }
+
+
+def start_mock(ttft_ms, token_rate):
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, create_mock_app(ttft_ms, token_rate, seed=0), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/api/v1"
+    os.environ.setdefault("OPENROUTER_API_KEY", "sk-or-mock")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate generation quality and latency on the database export")
+    parser.add_argument("--export", default=DEFAULT_EXPORT)
+    parser.add_argument("--modes", default="mock,database")
+    parser.add_argument("--limit", type=int, default=0, help="Only evaluate the first N apartments")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--model", help="Model used by generate_floor_plan (sets OPENROUTER_MODEL)")
+    parser.add_argument("--ttft", type=float, default=100, help="Stand-in time to first token in ms (mock mode)")
+    parser.add_argument("--token-rate", type=float, default=0, help="Stand-in tokens per second (mock mode)")
+    parser.add_argument("--output", help="Write per-apartment records and summaries to this JSON file")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        parser.error(f"Unknown modes: {', '.join(unknown)}")
+    if "mock" in modes and "llm" in modes:
+        parser.error("llm and mock modes need separate runs (they share the OpenRouter base URL)")
+
+    if args.model:
+        os.environ["OPENROUTER_MODEL"] = args.model
+
+    with open(args.export, "r", encoding="utf-8") as f:
+        apartments = json.load(f)
+    if args.limit:
+        apartments = apartments[:args.limit]
+
+    mock_server = start_mock(args.ttft, args.token_rate) if "mock" in modes else None
+    results = {"config": vars(args), "modes": {}}
+    try:
+        for mode in modes:
+            print(f"=== {mode}: {len(apartments)} apartments, {args.workers} workers ===")
+            runner = MODES[mode]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                records = list(pool.map(runner, apartments))
+            summary = summarize(records, time.perf_counter() - start)
+            results["modes"][mode] = {"summary": summary, "records": records}
+            print(f"  valid {summary['valid_rate']:.0%}, bedrooms match {summary['bedrooms_match_rate']:.0%}, "
+                  f"bathrooms match {summary['bathrooms_match_rate']:.0%}, "
+                  f"area error {summary['mean_area_error'] or 0:.1%}, "
+                  f"aspect ratio {summary['mean_aspect_ratio'] or 0:.2f}, "
+                  f"p50 {summary['latency_ms']['p50'] or 0:.0f} ms, errors {summary['errors']}")
+    finally:
+        if mock_server:
+            mock_server.shutdown()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
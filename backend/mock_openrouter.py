@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the OpenRouter /api/v1/chat/completions endpoint, for network-free and
+token-free load testing of generate_floor_plan / generate_floor_plan_stream.
+
+Answers with a thinking section followed by a ```json split tree taken from the apartment
+database export (matching the bedroom count in the prompt when possible), either as a single
+JSON response or as SSE "data:" chunks ending with [DONE]. Prompts asking for several layouts
+("Produce K clearly different layouts") get K thinking/JSON sections in one answer, and the n
+request field gets n choices (interleaved by choice index when streaming).
+
+Point the backend at it with:
+    OPENROUTER_BASE_URL=http://localhost:5055/api/v1 OPENROUTER_API_KEY=sk-or-mock python main.py
+
+Usage: python mock_openrouter.py [--port 5055] [--ttft 300] [--token-rate 80]
+                                 [--rate-limit-rate 0] [--error-rate 0] [--truncate-rate 0] [--seed 0]
+
+Single requests can force a failure with the X-Mock-Error header (429, 500, 502, 503, truncate).
+"""
+
+import os
+import re
+import json
+import time
+import random
+import argparse
+import logging
+import threading
+from flask import Flask, request, jsonify, Response, stream_with_context
+
+# 设置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXPORT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '_250324_databaseExport.json')
+
+# Rough token boundaries: words with their leading whitespace, or single punctuation marks
+TOKEN_PATTERN = re.compile(r"\s*[A-Za-z0-9_.]+|\s*[^\sA-Za-z0-9_.]")
+
+FALLBACK_TREE = {
+    "name": "root", "area": 100, "angle": 0, "final": False,
+    "children": [
+        {"name": "livingRoom", "area": 60, "angle": 1.5708, "final": True, "children": []},
+        {"name": "rootR", "area": 40, "angle": 1.5708, "final": False, "children": [
+            {"name": "bedroom", "area": 28, "angle": 0, "final": True, "children": []},
+            {"name": "bathroom", "area": 12, "angle": 0, "final": True, "children": []}
+        ]}
+    ]
+}
+
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "studio": 0}
+
+
+def load_trees(path=DEFAULT_EXPORT):
+    """Split trees from the database export, grouped by bedroom count"""
+    trees = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for apartment in json.load(f):
+                trees.setdefault(apartment.get('bedrooms', 0), []).append(apartment['split'])
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Could not load database export, using a fixed tree: {str(e)}")
+    return trees
+
+
+def requested_bedrooms(text):
+    """Bedroom count asked for in the prompt, e.g. "2 bedroom", "two-bedroom", "2B2B" or "studio" """
+    text = text.lower()
+    match = re.search(r"(\d+|one|two|three|four|five)[\s-]*(?:bed|b\d*b\b)", text)
+    if match:
+        value = match.group(1)
+        return int(value) if value.isdigit() else NUMBER_WORDS[value]
+    if "studio" in text:
+        return 0
+    return None
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text)
+
+
+def create_mock_app(ttft_ms=300, token_rate=80.0, rate_limit_rate=0.0, error_rate=0.0,
+                    truncate_rate=0.0, seed=None, export_path=DEFAULT_EXPORT, canned=None):
+    """
+    Build the stand-in app
+
+    Parameters:
+    - ttft_ms: Delay before the first token (and before non-streaming responses start)
+    - token_rate: Tokens per second after the first one (0 for no delay)
+    - rate_limit_rate / error_rate / truncate_rate: Share of requests answered with 429,
+      with a 5xx, or cut off in the middle of the JSON
+    - seed: Seed for the random choices, for reproducible runs
+    - canned: Optional list of fixed response texts used instead of database trees
+    """
+    app = Flask(__name__)
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    trees = load_trees(export_path) if canned is None else {}
+    stats = {'requests': 0, 'streams': 0, 'rate_limited': 0, 'errors': 0, 'truncated': 0, 'completion_tokens': 0}
+    app.config['MOCK_STATS'] = stats
+
+    def choose(options):
+        with rng_lock:
+            return rng.choice(options)
+
+    def roll():
+        with rng_lock:
+            return rng.random()
+
+    def response_text(prompt):
+        if canned:
+            return choose(canned)
+        layouts = re.search(r"Produce (\d+) clearly different layouts", prompt)
+        return "\n".join(layout_text(prompt) for _ in range(int(layouts.group(1)) if layouts else 1))
+
+    def layout_text(prompt):
+        bedrooms = requested_bedrooms(prompt)
+        candidates = trees.get(bedrooms) or [tree for group in trees.values() for tree in group] or [FALLBACK_TREE]
+        tree = choose(candidates)
+        return (
+            "THINKING STEPS:\n"
+            f"0. The description asks for {bedrooms if bedrooms is not None else 'an unspecified number of'} bedroom(s).\n"
+            f"1. The total area of the boundary is used as the root area ({tree.get('area', 0):.2f}).\n"
+            "2. Room areas are adjusted so that they sum to the total area.\n"
+            "3. Each node is split horizontally or vertically into two children.\n"
+            "4. Splitting continues until every leaf is a single room.\n\n"
+            "FINAL JSON OUTPUT:\n"
+            "```json\n" + json.dumps({"split": tree}, indent=2) + "\n```\n"
+        )
+
+    def failure():
+        """Pick the failure for this request, if any"""
+        forced = request.headers.get('X-Mock-Error')
+        if forced:
+            return forced
+        value = roll()
+        if value < rate_limit_rate:
+            return '429'
+        if value < rate_limit_rate + error_rate:
+            return '502'
+        if value < rate_limit_rate + error_rate + truncate_rate:
+            return 'truncate'
+        return None
+
+    def usage(prompt, tokens):
+        prompt_tokens = len(tokenize(prompt))
+        return {'prompt_tokens': prompt_tokens, 'completion_tokens': tokens, 'total_tokens': prompt_tokens + tokens}
+
+    @app.route('/api/v1/chat/completions', methods=['POST'])
+    def chat_completions():
+        stats['requests'] += 1
+        if not request.headers.get('Authorization', '').startswith('Bearer '):
+            return jsonify({'error': {'message': 'Missing Authorization header', 'code': 401}}), 401
+
+        payload = request.get_json(silent=True) or {}
+        model = payload.get('model', 'mock/model')
+        prompt = "\n".join(str(m.get('content', '')) for m in payload.get('messages', []))
+        choices = max(1, int(payload.get('n') or 1))
+        choice_tokens = [tokenize(response_text(prompt)) for _ in range(choices)]
+
+        problem = failure()
+        if problem == '429':
+            stats['rate_limited'] += 1
+            response = jsonify({'error': {'message': 'Rate limit exceeded', 'code': 429}})
+            response.status_code = 429
+            response.headers['Retry-After'] = '1'
+            return response
+        if problem and problem.isdigit():
+            stats['errors'] += 1
+            return jsonify({'error': {'message': 'Simulated upstream error', 'code': int(problem)}}), int(problem)
+        if problem == 'truncate':
+            stats['truncated'] += 1
+            # Stop in the middle of the (first) JSON block
+            for index, tokens in enumerate(choice_tokens):
+                json_start = next((i for i, t in enumerate(tokens) if '```' in t), len(tokens) // 2)
+                choice_tokens[index] = tokens[:json_start + (len(tokens) - json_start) // 2]
+        completion_tokens = sum(len(tokens) for tokens in choice_tokens)
+
+        completion_id = f"gen-mock-{int(time.time() * 1000)}-{stats['requests']}"
+        created = int(time.time())
+        delay = 1.0 / token_rate if token_rate else 0.0
+
+        if not payload.get('stream'):
+            # Choices are generated in parallel
+            time.sleep(ttft_ms / 1000.0 + delay * max(len(tokens) for tokens in choice_tokens))
+            stats['completion_tokens'] += completion_tokens
+            return jsonify({
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': created,
+                'model': model,
+                'choices': [{
+                    'index': index,
+                    'message': {'role': 'assistant', 'content': "".join(tokens)},
+                    'finish_reason': 'length' if problem == 'truncate' else 'stop'
+                } for index, tokens in enumerate(choice_tokens)],
+                'usage': usage(prompt, completion_tokens)
+            })
+
+        def generate():
+            stats['streams'] += 1
+            time.sleep(ttft_ms / 1000.0)
+            for i in range(max(len(tokens) for tokens in choice_tokens)):
+                if i and delay:
+                    time.sleep(delay)
+                for index, tokens in enumerate(choice_tokens):
+                    if i >= len(tokens):
+                        continue
+                    chunk = {
+                        'id': completion_id,
+                        'object': 'chat.completion.chunk',
+                        'created': created,
+                        'model': model,
+                        'choices': [{'index': index, 'delta': {'content': tokens[i]}, 'finish_reason': None}]
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+            stats['completion_tokens'] += completion_tokens
+            if problem == 'truncate':
+                # Connection drops without a finish reason or [DONE]
+                return
+            final = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+                'usage': usage(prompt, completion_tokens)
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache'})
+
+    @app.route('/api/v1/mock/stats', methods=['GET'])
+    def get_stats():
+        return jsonify(stats)
+
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='OpenRouter stand-in server')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--ttft', type=float, default=300, help='Time to first token in ms')
+    parser.add_argument('--token-rate', type=float, default=80, help='Tokens per second (0 for no delay)')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Share of requests answered with 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 502')
+    parser.add_argument('--truncate-rate', type=float, default=0.0, help='Share of responses cut off mid-JSON')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--export', default=DEFAULT_EXPORT, help='Database export used for canned split trees')
+    parser.add_argument('--canned', help='JSON file with a list of fixed response texts')
+    args = parser.parse_args()
+
+    canned = None
+    if args.canned:
+        with open(args.canned, 'r', encoding='utf-8') as f:
+            canned = json.load(f)
+
+    app = create_mock_app(args.ttft, args.token_rate, args.rate_limit_rate, args.error_rate,
+                          args.truncate_rate, args.seed, args.export, canned)
+    print(f"启动OpenRouter模拟服务器在 http://127.0.0.1:{args.port}/api/v1")
+    app.run(host='0.0.0.0', port=args.port, threaded=True)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the Spatial OS apartment API, for exercising the bulk client
+without the real service. Simulates latency, throttling and server errors, rejects
+apartments without a split tree (per item in batches) and counts client connections.
+
+Usage: python mock_spatial_os.py [--port 5294] [--latency 50] [--jitter 20]
+                                 [--error-rate 0.05] [--throttle-rate 0.05] [--fail-first 0]
+                                 [--no-batch] [--no-gzip]
+"""
+
+import gzip
+import json
+import time
+import random
+import argparse
+import threading
+import logging
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, ServerHandler
+from flask import Flask, request, jsonify
+
+# 设置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """
+    Serves several requests per connection (HTTP/1.1 keep-alive), unlike the Werkzeug dev server
+    which closes every connection, so the connection count shows whether a client pools them.
+    Safe because the mock reads every request body before answering.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def handle(self):
+        self.close_connection = False
+        while not self.close_connection:
+            self.raw_requestline = self.rfile.readline(65537)
+            if not self.raw_requestline or not self.parse_request():
+                return
+            handler = ServerHandler(self.rfile, self.wfile, self.get_stderr(), self.get_environ(), multithread=True)
+            handler.http_version = "1.1"
+            handler.request_handler = self
+            handler.run(self.server.get_app())
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class MockServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+def make_mock_server(app, host='127.0.0.1', port=0):
+    """Threaded keep-alive server for the mock app, port 0 picks a free port (see server.server_port)"""
+    server = MockServer((host, port), KeepAliveRequestHandler)
+    server.set_app(app)
+    return server
+
+
+def create_mock_app(latency_ms=50, jitter_ms=20, error_rate=0.0, throttle_rate=0.0, batch=True, seed=None,
+                    fail_first=0, accept_gzip=True):
+    """
+    Parameters:
+    - fail_first: Answer the first requests with 503 regardless of error_rate
+    - accept_gzip: False answers gzip bodies with 415 like a service without decompression
+    """
+    app = Flask(__name__)
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    stats = {'requests': 0, 'apartments': 0, 'errors': 0, 'throttled': 0, 'gzip': 0, 'connections': 0}
+    peers = set()
+    app.config['MOCK_STATS'] = stats
+
+    @app.before_request
+    def drain_body():
+        # Read the body of every request, unknown routes included, so kept-alive connections stay in sync
+        request.get_data()
+
+    def read_body():
+        body = request.get_data()
+        if request.headers.get('Content-Encoding') == 'gzip':
+            stats['gzip'] += 1
+            body = gzip.decompress(body)
+        return json.loads(body)
+
+    def simulate():
+        """Sleep like the real service and decide whether this call fails"""
+        with lock:
+            stats['requests'] += 1
+            # Every client port is one TCP connection, pooled clients reuse theirs
+            peers.add(request.environ.get('REMOTE_PORT'))
+            stats['connections'] = len(peers)
+            failing = stats['requests'] <= fail_first
+            roll = rng.random()
+        time.sleep(max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000.0)
+        if request.headers.get('Content-Encoding') == 'gzip' and not accept_gzip:
+            return jsonify({'error': 'Unsupported content encoding'}), 415
+        if failing:
+            stats['errors'] += 1
+            return jsonify({'error': 'Simulated server error'}), 503
+        if roll < throttle_rate:
+            stats['throttled'] += 1
+            response = jsonify({'error': 'Too many requests'})
+            response.status_code = 429
+            response.headers['Retry-After'] = '0.05'
+            return response
+        if roll < throttle_rate + error_rate:
+            stats['errors'] += 1
+            return jsonify({'error': 'Simulated server error'}), 503
+        return None
+
+    def summarize(apartment):
+        if not isinstance(apartment.get('split'), dict):
+            return {'success': False, 'error': 'Apartment needs a split tree'}
+        rooms = []
+        stack = [apartment.get('split') or {}]
+        while stack:
+            node = stack.pop()
+            if node.get('final') or not node.get('children'):
+                rooms.append({'id': node.get('name'), 'type': node.get('mergeid', node.get('name')), 'area': node.get('area', 0)})
+            else:
+                stack.extend(node['children'])
+        return {'success': True, 'data': {'id': apartment.get('id'), 'name': apartment.get('name'), 'rooms': rooms}}
+
+    @app.route('/api/apartment', methods=['POST'])
+    def apartment():
+        failure = simulate()
+        if failure is not None:
+            return failure
+        result = summarize(read_body())
+        stats['apartments'] += 1
+        return jsonify(result), 200 if result['success'] else 400
+
+    if batch:
+        @app.route('/api/apartment/batch', methods=['POST'])
+        def apartment_batch():
+            failure = simulate()
+            if failure is not None:
+                return failure
+            apartments = read_body().get('apartments', [])
+            stats['apartments'] += len(apartments)
+            return jsonify({'results': [summarize(a) for a in apartments]})
+
+    @app.route('/api/stats', methods=['GET'])
+    def get_stats():
+        return jsonify(stats)
+
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Spatial OS stand-in server')
+    parser.add_argument('--port', type=int, default=5294)
+    parser.add_argument('--latency', type=float, default=50, help='Mean latency per request in ms')
+    parser.add_argument('--jitter', type=float, default=20, help='Latency jitter in ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests answered with 429')
+    parser.add_argument('--fail-first', type=int, default=0, help='Answer the first N requests with 503')
+    parser.add_argument('--no-batch', action='store_true', help='Do not offer the batch endpoint')
+    parser.add_argument('--no-gzip', action='store_true', help='Answer gzip bodies with 415')
+    args = parser.parse_args()
+
+    app = create_mock_app(args.latency, args.jitter, args.error_rate, args.throttle_rate, not args.no_batch,
+                          fail_first=args.fail_first, accept_gzip=not args.no_gzip)
+    print(f"启动Spatial OS模拟服务器在 http://127.0.0.1:{args.port}")
+    make_mock_server(app, '0.0.0.0', args.port).serve_forever()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Push many apartments to the Spatial OS /api/apartment endpoint with the pooled bulk client.
+
+Usage: python push_apartments.py apartments.json [--url http://localhost:5294]
+                                 [--workers 8] [--batch-size 0] [--no-gzip] [--retries 3]
+"""
+
+import sys
+import json
+import time
+import argparse
+
+from app.services.spatial_os_client import SpatialOSClient, DEFAULT_API_URL
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk push apartments to Spatial OS')
+    parser.add_argument('file', help='JSON file with a list of apartment objects')
+    parser.add_argument('--url', default=DEFAULT_API_URL)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=0, help='Apartments per batch request (0 disables batching)')
+    parser.add_argument('--no-gzip', action='store_true')
+    parser.add_argument('--retries', type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.file, 'r', encoding='utf-8') as f:
+        apartments = json.load(f)
+    if isinstance(apartments, dict):
+        apartments = [apartments]
+
+    print(f"=== Pushing {len(apartments)} apartments to {args.url} ===")
+    start = time.perf_counter()
+    with SpatialOSClient(args.url, max_workers=args.workers, gzip_body=not args.no_gzip,
+                         retries=args.retries, batch_size=args.batch_size) as client:
+        results = client.send_many(apartments)
+    elapsed = time.perf_counter() - start
+
+    failed = [r for r in results if not r['success']]
+    retried = sum(1 for r in results if r['attempts'] > 1)
+    print(f"完成: {len(results) - len(failed)} 成功, {len(failed)} 失败, {retried} 重试, "
+          f"{elapsed:.2f}s ({len(results) / elapsed:.1f} apartments/s)")
+    for result in failed:
+        print(f"  #{result['index']} {result['id']}: {result['error']}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Re-drive journaled generation requests (see app/services/request_journal.py) against a running
+backend, at the original pacing or accelerated, or pre-populate its response cache.
+
+Usage:
+    python replay_journal.py [--journal logs/journal/generations.jsonl] [--target http://localhost:5000]
+                             [--speed 1] [--concurrency 8] [--mode keep|generate|stream] [--limit 100]
+                             [--output replay.json]
+    python replay_journal.py --warm-cache [--target http://localhost:5000] [--admin-token ...]
+
+--speed 2 replays twice as fast as recorded, --speed 0 sends requests as fast as the
+concurrency allows. Cache warm-up sends the recorded upstream answers, so no model calls are made;
+the backend needs FLOORPLAN_RESPONSE_CACHE_SIZE set.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from app.services.request_journal import DEFAULT_JOURNAL_FILE, journal_files, read_entries
+
+ENDPOINTS = {
+    "generate": "/api/generate-floor-plan",
+    "stream": "/api/generate-floor-plan-stream",
+}
+WARM_BATCH_SIZE = 200
+
+
+def load_entries(journal, limit=0):
+    """Journal entries with a replayable request, ordered by time"""
+    entries = [e for e in read_entries(journal_files(journal))
+               if (e.get("request") or {}).get("boundary_data") and (e.get("request") or {}).get("description")]
+    entries.sort(key=lambda e: e.get("ts", ""))
+    return entries[:limit] if limit else entries
+
+
+def entry_time(entry):
+    try:
+        return datetime.datetime.fromisoformat(entry["ts"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def send(session, target, entry, mode):
+    """Send one journaled request, returns a result record"""
+    mode = entry.get("mode", "generate") if mode == "keep" else mode
+    body = {k: entry["request"].get(k) for k in ("boundary_data", "description", "preferences")}
+    if entry["request"].get("variants"):
+        body["variants"] = entry["request"]["variants"]
+    start = time.perf_counter()
+    record = {"mode": mode, "trace_id": entry.get("trace_id")}
+    try:
+        if mode == "stream":
+            with session.post(target + ENDPOINTS["stream"], json=body, stream=True, timeout=120) as response:
+                record["status_code"] = response.status_code
+                for line in response.iter_lines():
+                    # The server keeps the connection open, stop at the last event
+                    if line.startswith(b"data: ") and (b'"type": "final"' in line[:40] or b'"error"' in line[:40]):
+                        record["ok"] = b'"type": "final"' in line[:40]
+                        break
+        else:
+            response = session.post(target + ENDPOINTS["generate"], json=body, timeout=120)
+            record["status_code"] = response.status_code
+            record["ok"] = response.status_code == 200
+    except requests.exceptions.RequestException as e:
+        record["error"] = str(e)
+    record.setdefault("ok", False)
+    record["latency_ms"] = (time.perf_counter() - start) * 1000
+    return record
+
+
+def replay(entries, target, speed, concurrency, mode):
+    """
+    Send entries on the recorded schedule (divided by speed)
+
+    Returns:
+    - List of result records with the scheduling lag of each request
+    """
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+    results = [None] * len(entries)
+    slots = threading.Semaphore(concurrency)
+    first = entry_time(entries[0]) if entries else None
+    record_start = [0.0] * len(entries)
+    start = time.perf_counter()
+
+    def run(index, entry, due):
+        try:
+            record = send(session, target, entry, mode)
+            record["lag_ms"] = max(0.0, (record_start[index] - due) * 1000)
+            results[index] = record
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index, entry in enumerate(entries):
+            offset = 0.0
+            recorded = entry_time(entry)
+            if speed > 0 and first is not None and recorded is not None:
+                offset = (recorded - first) / speed
+            due = start + offset
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # Wait for a free slot, requests that have to wait show up as scheduling lag
+            slots.acquire()
+            record_start[index] = time.perf_counter()
+            pool.submit(run, index, entry, due)
+    return results
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(1, int(math.ceil(pct / 100.0 * len(ordered)))) - 1]
+
+
+def summarize(results, elapsed):
+    latencies = [r["latency_ms"] for r in results if r["ok"]]
+    lags = [r["lag_ms"] for r in results]
+    statuses = {}
+    for r in results:
+        key = str(r.get("status_code") or "error")
+        statuses[key] = statuses.get(key, 0) + 1
+    return {
+        "requests": len(results),
+        "ok": sum(1 for r in results if r["ok"]),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(results) / elapsed if elapsed else None,
+        "status_codes": statuses,
+        "latency_ms": {p: percentile(latencies, int(p[1:])) for p in ("p50", "p95", "p99")},
+        "schedule_lag_ms": {"p50": percentile(lags, 50), "p95": percentile(lags, 95), "max": max(lags) if lags else None},
+    }
+
+
+def warm_cache(entries, target, admin_token=None):
+    headers = {"X-Admin-Token": admin_token} if admin_token else {}
+    cached = 0
+    for i in range(0, len(entries), WARM_BATCH_SIZE):
+        response = requests.post(target + "/admin/cache/warm", json={"entries": entries[i:i + WARM_BATCH_SIZE]},
+                                 headers=headers, timeout=60)
+        if response.status_code != 200:
+            print(f"缓存预热失败: HTTP {response.status_code} {response.text[:200]}")
+            return None
+        cached += response.json().get("cached", 0)
+    return cached
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay journaled generation requests or warm the response cache")
+    parser.add_argument("--journal", default=os.environ.get("FLOORPLAN_JOURNAL_FILE", DEFAULT_JOURNAL_FILE))
+    parser.add_argument("--target", default="http://localhost:5000")
+    parser.add_argument("--speed", type=float, default=1.0, help="Pacing factor (0 for no pacing)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=("keep", "generate", "stream"), default="keep",
+                        help="Endpoint to use; keep uses the recorded one")
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument("--warm-cache", action="store_true", help="Pre-populate the response cache instead of replaying")
+    parser.add_argument("--admin-token", default=os.environ.get("FLOORPLAN_ADMIN_TOKEN"))
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    target = args.target.rstrip("/")
+    entries = load_entries(args.journal, args.limit)
+    if not entries:
+        print(f"No journal entries found for {args.journal}")
+        return 1
+
+    if args.warm_cache:
+        cached = warm_cache(entries, target, args.admin_token)
+        if cached is None:
+            return 1
+        print(f"已预热 {cached} 条缓存（共 {len(entries)} 条记录）")
+        return 0
+
+    print(f"Replaying {len(entries)} request(s) against {target} at speed {args.speed or 'max'}, "
+          f"concurrency {args.concurrency}")
+    start = time.perf_counter()
+    results = replay(entries, target, args.speed, args.concurrency, args.mode)
+    summary = summarize(results, time.perf_counter() - start)
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "summary": summary, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0 if summary["ok"] == summary["requests"] else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
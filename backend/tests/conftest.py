@@ -0,0 +1,7 @@
+import os
+
+# No trace, journal or prewarm side effects from the apps the tests create
+os.environ.setdefault("FLOORPLAN_TRACING", "0")
+os.environ.setdefault("FLOORPLAN_JOURNAL", "0")
+os.environ.setdefault("FLOORPLAN_PREWARM", "none")
+os.environ.setdefault("FLOORPLAN_LOG_LEVEL", "WARNING")
@@ -0,0 +1,43 @@
+import logging
+
+from app import create_app
+from app.services import admission
+
+API_KEY = "client-secret-key-123"
+
+
+def test_client_label_hashes_the_api_key():
+    app = create_app()
+    with app.test_request_context(headers={"X-API-Key": API_KEY}):
+        first = admission.client_label(admission.request)
+    with app.test_request_context(headers={"X-API-Key": API_KEY}):
+        again = admission.client_label(admission.request)
+    with app.test_request_context(headers={"X-API-Key": API_KEY + "4"}):
+        other = admission.client_label(admission.request)
+    assert first == again != other
+    address, key_hash = first.split(" key:")
+    assert address.startswith("ip:") and len(key_hash) == admission.KEY_HASH_LENGTH
+    assert API_KEY not in first
+
+
+def test_rotating_api_keys_share_the_address_bucket(monkeypatch):
+    controller = admission.AdmissionController(4, 4, 0.1, 60, 2)
+    monkeypatch.setattr(admission, "_controller", controller)
+    client = create_app().test_client()
+    body = {"boundary_data": [{"x": 0, "y": 0, "width": 10, "height": 8}]}
+    statuses = [client.post("/api/generate-floor-plan", json=body, headers={"X-API-Key": f"key-{i}"}).status_code
+                for i in range(3)]
+    assert 429 not in statuses[:2] and statuses[2] == 429
+
+
+def test_rejection_log_does_not_contain_the_api_key(monkeypatch, caplog):
+    controller = admission.AdmissionController(4, 4, 0.1, 60, 1)
+    monkeypatch.setattr(admission, "_controller", controller)
+    client = create_app().test_client()
+    body = {"boundary_data": [{"x": 0, "y": 0, "width": 10, "height": 8}]}
+    with caplog.at_level(logging.WARNING, logger=admission.__name__):
+        statuses = [client.post("/api/generate-floor-plan", json=body, headers={"X-API-Key": API_KEY}).status_code
+                    for _ in range(2)]
+    assert statuses[-1] == 429
+    rejected = [record.getMessage() for record in caplog.records if "Rejected" in record.getMessage()]
+    assert rejected and all(API_KEY not in message for message in rejected)
@@ -0,0 +1,112 @@
+import copy
+
+import numpy as np
+import pytest
+
+from app.services import apartment_builder, geometry, plan_render
+from app.services.split_tree import get_split_root
+
+# Measured on the database export when facade and circulation were added to the inference
+MIN_FACADE_PRECISION, MIN_FACADE_RECALL = 0.42, 0.93
+MIN_CIRCULATION_PRECISION, MIN_CIRCULATION_RECALL = 0.38, 0.48
+
+
+@pytest.fixture(scope="module")
+def database():
+    return plan_render.load_database()
+
+
+@pytest.fixture(scope="module")
+def stripped(database):
+    return [{k: v for k, v in apartment.items() if k not in ("facade", "circulation")} for apartment in database]
+
+
+@pytest.fixture(scope="module")
+def built(stripped):
+    return apartment_builder.build_apartments(copy.deepcopy(stripped))
+
+
+def _segments(segments):
+    return np.array([geometry.to_xy(s["start"]) + geometry.to_xy(s["end"]) for s in segments]).reshape(-1, 4)
+
+
+def _overlap(segments, reference, tolerance=1e-3):
+    """Length of the axis-aligned segments lying on the reference segments"""
+    total = 0.0
+    for x0, y0, x1, y1 in segments:
+        for u0, v0, u1, v1 in reference:
+            if abs(x0 - x1) < tolerance and abs(u0 - u1) < tolerance and abs(x0 - u0) < tolerance:
+                total += max(0.0, min(max(y0, y1), max(v0, v1)) - max(min(y0, y1), min(v0, v1)))
+            elif abs(y0 - y1) < tolerance and abs(v0 - v1) < tolerance and abs(y0 - v0) < tolerance:
+                total += max(0.0, min(max(x0, x1), max(u0, u1)) - max(min(x0, x1), min(u0, u1)))
+    return total
+
+
+def _length(segments):
+    return float(np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1]).sum())
+
+
+def test_rebuilt_bounds_area_and_rooms_are_exact(database, built):
+    apartments, errors = built
+    assert errors == []
+    for original, apartment in zip(database, apartments):
+        corners = np.array([geometry.to_xy(c) for c in original["bounds"]["corners"]])
+        assert np.array_equal(corners, np.array([geometry.to_xy(c) for c in apartment["bounds"]["corners"]]))
+        # The boundary area is what the split tree divides
+        assert apartment["area"] == pytest.approx(get_split_root(original["split"])["area"], rel=1e-9)
+        assert apartment["area"] == pytest.approx(geometry.polygon_areas([corners])[0], rel=1e-12)
+        assert (apartment["bedrooms"], apartment["bathrooms"]) == (original["bedrooms"], original["bathrooms"])
+        assert apartment["split"] == original["split"]
+
+
+def test_inferred_segments_lie_on_the_boundary(built):
+    for apartment in built[0]:
+        polygon = geometry.polygon_array(apartment["bounds"]["corners"])
+        edges = geometry.polygon_edges(polygon)
+        facade, circulation = _segments(apartment["facade"]), _segments(apartment["circulation"])
+        for segments in (facade, circulation):
+            assert _overlap(segments, edges) == pytest.approx(_length(segments), abs=1e-6)
+        # Entry walls are not facade
+        assert _overlap(facade, circulation) == pytest.approx(0.0, abs=1e-6)
+
+
+def test_inferred_segments_match_the_database(database, built):
+    apartments = built[0]
+    for kind, min_precision, min_recall in (("facade", MIN_FACADE_PRECISION, MIN_FACADE_RECALL),
+                                            ("circulation", MIN_CIRCULATION_PRECISION, MIN_CIRCULATION_RECALL)):
+        predicted = [_segments(a[kind]) for a in apartments]
+        actual = [_segments(a[kind]) for a in database]
+        hit = sum(_overlap(p, a) for p, a in zip(predicted, actual))
+        assert hit / sum(_length(p) for p in predicted) >= min_precision, kind
+        assert hit / sum(_length(a) for a in actual) >= min_recall, kind
+
+
+def test_batch_matches_single_builds(stripped, built):
+    for index in range(0, len(stripped), 37):
+        (single,), errors = apartment_builder.build_apartments([copy.deepcopy(stripped[index])])
+        assert errors == []
+        assert single["facade"] == built[0][index]["facade"]
+        assert single["circulation"] == built[0][index]["circulation"]
+
+
+def test_batched_layout_matches_single_layout(database):
+    specs = database[:40]
+    polygons = [apartment_builder.boundary_polygon(spec)[0] for spec in specs]
+    roots = [get_split_root(spec["split"]) for spec in specs]
+    for y_up in (True, False):
+        batched = geometry.layout_regions(roots, *geometry.decompose_polygons(polygons), [y_up] * len(specs))
+        for root, polygon, placed in zip(roots, polygons, batched):
+            single = geometry.layout_region(root, geometry.decompose_polygon(polygon), y_up=y_up)
+            assert placed.keys() == single.keys()
+            for path, (node, rects) in single.items():
+                assert placed[path][0] is node
+                assert np.array_equal(placed[path][1], rects)
+
+
+def test_failed_specs_do_not_affect_the_batch(stripped):
+    specs = [copy.deepcopy(stripped[0]), {"bounds": stripped[1]["bounds"]}, copy.deepcopy(stripped[2]),
+             {"split": stripped[3]["split"], "corners": [[0, 0], [1, 0]]}]
+    apartments, errors = apartment_builder.build_apartments(specs)
+    assert [e["index"] for e in errors] == [1, 3]
+    assert apartments[1] is None and apartments[3] is None
+    assert apartments[0]["facade"] and apartments[2]["facade"]
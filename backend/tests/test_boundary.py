@@ -0,0 +1,64 @@
+import pytest
+
+from app import create_app
+from app.services import boundary, floor_plan_service, plan_pool
+
+SQUARE = {"x": 0, "y": 0, "width": 10, "height": 10}
+# Touches the square along part of its right side
+WING = {"x": 10, "y": 0, "width": 5, "height": 5}
+# Same size, but 10 units away from the square
+ISLAND = {"x": 20, "y": 0, "width": 5, "height": 5}
+# Meets the square only at its bottom-right corner
+DIAGONAL = {"x": 10, "y": 10, "width": 5, "height": 5}
+TRAPEZOID = {"type": "polygon", "x": 0, "y": 0, "points": [[0, 0], [10, 2], [10, 8], [0, 10]]}
+RING = [{"x": 0, "y": 0, "width": 10, "height": 2}, {"x": 0, "y": 8, "width": 10, "height": 2},
+        {"x": 0, "y": 2, "width": 2, "height": 6}, {"x": 8, "y": 2, "width": 2, "height": 6}]
+
+
+def test_touching_shapes_merge_into_one_outline():
+    processed = floor_plan_service.process_boundary_data([SQUARE, WING])
+    assert processed["total_area"] == 125
+    assert processed["shapes_count"] == 2
+    assert processed["corners"] is not None
+
+
+def test_sloped_quadrilateral_keeps_its_corners():
+    processed = floor_plan_service.process_boundary_data([TRAPEZOID])
+    assert processed["total_area"] == 80
+    assert not processed["rectilinear"]
+    assert processed["corners"] == [[0, 0], [10, 2], [10, 8], [0, 10]]
+    assert not floor_plan_service.describe_boundary(processed).startswith("Rectangle")
+    # Only plain rectangles are answered from the plan pool
+    assert plan_pool.shape_class(processed) is None
+
+
+def test_separate_shapes_are_rejected():
+    with pytest.raises(ValueError, match="2 separate parts"):
+        boundary.boundary_polygon([SQUARE, ISLAND])
+
+
+def test_shapes_touching_at_a_corner_are_rejected():
+    with pytest.raises(ValueError, match=r"touch only at a corner \(10, 10\)"):
+        boundary.boundary_polygon([SQUARE, DIAGONAL])
+    # Sharing part of an edge is fine
+    assert len(boundary.boundary_polygon([SQUARE, WING])) == 6
+
+
+def test_shapes_around_a_hole_are_rejected():
+    with pytest.raises(ValueError, match="hole"):
+        boundary.boundary_polygon(RING)
+
+
+@pytest.mark.parametrize("path", ["/api/generate-floor-plan", "/api/generate-floor-plan-stream", "/api/boundaries"])
+@pytest.mark.parametrize("boundary_data, message", [
+    ([SQUARE, ISLAND], "separate parts"),
+    (RING, "hole"),
+    ([SQUARE, DIAGONAL], "corner"),
+    ([SQUARE, "wing"], "list of shape objects"),
+])
+def test_endpoints_answer_400_for_unusable_boundaries(path, boundary_data, message):
+    client = create_app().test_client()
+    response = client.post(path, json={"boundary_data": boundary_data, "description": "two bedrooms"})
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Invalid boundary data")
+    assert message in response.get_json()["error"]
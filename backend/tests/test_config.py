@@ -0,0 +1,31 @@
+import os
+
+from app.services import config
+
+
+def test_limits_and_options_come_from_settings():
+    settings = config.Settings({"FLOORPLAN_MAX_INFLIGHT": "4", "FLOORPLAN_RATE_LIMIT": "12.5",
+                                "FLOORPLAN_VARIANTS_MODE": "N", "FLOORPLAN_POOL": "yes",
+                                "FLOORPLAN_COMPRESSION": "off", "FLOORPLAN_LLM_POOL_SIZE": "many"})
+    assert (settings.max_inflight, settings.rate_limit) == (4, 12.5)
+    assert settings.variants_mode == "n" and settings.pool is True and settings.compression is False
+    # Unparsable values fall back to the default
+    assert settings.llm_pool_size == config.DEFAULT_LLM_POOL_SIZE
+    assert config.Settings({}).max_queue == config.DEFAULT_MAX_QUEUE
+
+
+def test_env_file_created_after_start_is_loaded(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("FLOORPLAN_ENV_FILE", raising=False)
+    monkeypatch.delenv("FLOORPLAN_MAX_QUEUE", raising=False)
+    monkeypatch.setattr(config, "BACKEND_DIR", str(tmp_path))
+    provider = config.ConfigProvider(check_interval=0)
+    try:
+        assert provider.get().env_file is None
+        (tmp_path / ".env").write_text("FLOORPLAN_MAX_QUEUE=3\n")
+        settings = provider.get()
+        assert settings.env_file == str(tmp_path / ".env")
+        assert settings.max_queue == 3
+    finally:
+        provider._export({})
+    assert "FLOORPLAN_MAX_QUEUE" not in os.environ
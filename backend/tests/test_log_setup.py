@@ -0,0 +1,34 @@
+import os
+import sys
+import json
+import subprocess
+
+from app.services import config, log_setup
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_log_options_in_env_file_apply(tmp_path):
+    env_file = tmp_path / ".env"
+    env_file.write_text("FLOORPLAN_LOG_FORMAT=json\nFLOORPLAN_LOG_LEVEL=INFO\n")
+    env = {k: v for k, v in os.environ.items() if not k.startswith("FLOORPLAN_LOG_")}
+    env.update(FLOORPLAN_ENV_FILE=str(env_file), FLOORPLAN_PREWARM="none", FLOORPLAN_TRACING="0",
+               FLOORPLAN_JOURNAL="0", PYTHONPATH=BACKEND_DIR)
+    output = subprocess.run([sys.executable, "-c", "from app import create_app; create_app()"], cwd=BACKEND_DIR,
+                            env=env, capture_output=True, text=True, check=True)
+    lines = output.stderr.strip().splitlines()
+    # INFO from .env lets the settings line through, FORMAT=json formats it
+    records = [json.loads(line) for line in lines]
+    assert any(record["msg"].startswith("Loaded settings") for record in records)
+
+
+def test_payload_caps_are_read_once():
+    settings = config.Settings({"FLOORPLAN_LOG_PAYLOAD_ITEMS": "2", "FLOORPLAN_LOG_PAYLOAD_CHARS": "40"})
+    try:
+        log_setup.setup_logging(force=True, settings=settings)
+        settings.log_payload_items = 50
+        logged = log_setup.payload({"rooms": list(range(10)), "description": "x" * 100})
+        assert (logged.items, logged.chars) == (2, 40)
+        assert str(logged) == '{"rooms":[0,1,"... +8 more"],"descriptio...'
+    finally:
+        log_setup.setup_logging(force=True)
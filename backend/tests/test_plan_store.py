@@ -0,0 +1,74 @@
+import os
+import json
+
+import pytest
+
+from app import create_app
+from app.services import plan_feed, plan_store
+from app.services.plan_feed import PlanFeed
+from app.services.plan_store import PlanStore
+
+PLAN = {"name": "root", "split": "vertical", "ratio": 0.5, "children": [{"name": "bedroom"}, {"name": "kitchen"}]}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PlanStore(str(tmp_path / "plans"))
+    yield store
+    store.close()
+
+
+def test_missing_blob_is_not_found(store, monkeypatch):
+    record = store.save(PLAN)
+    os.remove(store._blob_path(record["hash"]))
+    assert store.get(record["id"]) == (None, None)
+    assert store.latest() == (None, None)
+
+    monkeypatch.setattr(plan_store, "_store", store)
+    response = create_app().test_client().get(f"/api/plans/{record['id']}")
+    assert response.status_code == 404
+
+
+def test_newest_publish_wins_across_store_instances(store, tmp_path):
+    target = tmp_path / "target"
+    older, newer = store.save(PLAN), store.save(dict(PLAN, ratio=0.6))
+    assert store.publish(newer["id"], {"ratio": 0.6}, str(target))
+    # Another process on the same index sees the version in SQLite
+    other = PlanStore(store.root)
+    try:
+        assert other.publish(older["id"], {"ratio": 0.5}, str(target)) is None
+    finally:
+        other.close()
+    assert json.loads((target / plan_store.TARGET_FILENAME).read_text()) == {"ratio": 0.6}
+    # Publishing the same version again is allowed
+    assert store.publish(newer["id"], {"ratio": 0.6}, str(target))
+
+
+def test_failed_write_does_not_claim_the_version(store, tmp_path, monkeypatch):
+    target = tmp_path / "target"
+
+    def fail(path, data):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(plan_store, "atomic_write", fail)
+        with pytest.raises(OSError):
+            store.publish(5, {"version": 5}, str(target))
+    assert store.publish(3, {"version": 3}, str(target))
+
+
+def test_feed_skips_plans_deleted_mid_read(store, monkeypatch):
+    older, newer = store.save(PLAN), store.save(dict(PLAN, ratio=0.6))
+    feed = PlanFeed(store)
+    os.remove(store._blob_path(older["hash"]))
+    # The base version is gone, so the whole plan is sent instead of a diff
+    message = feed.update(newer, older["id"])
+    assert message["data"]["ratio"] == 0.6 and "changes" not in message
+
+    os.remove(store._blob_path(newer["hash"]))
+    feed = PlanFeed(store)
+    assert feed.update(newer) is None
+    monkeypatch.setattr(plan_store, "_store", store)
+    monkeypatch.setattr(plan_feed, "_feed", feed)
+    response = create_app().test_client().get("/api/plans/feed?timeout=0")
+    assert response.status_code == 204
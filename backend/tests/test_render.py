@@ -0,0 +1,8 @@
+from app import create_app
+
+
+def test_bulk_render_answers_400_for_a_non_numeric_width():
+    client = create_app().test_client()
+    response = client.post("/api/render/bulk", json={"plans": [{"id": "a"}], "width": "abc"})
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Invalid request parameter")
@@ -0,0 +1,107 @@
+import json as json_module
+import datetime
+
+import pytest
+
+from app.services import config, floor_plan_service, metrics, request_journal, response_cache
+
+BOUNDARY = [{"x": 0, "y": 0, "width": 10, "height": 8}]
+ANSWER = '```json\n{"name": "root", "split": "vertical", "ratio": 0.5, "children": []}\n```'
+
+
+class FakeResponse(object):
+    status_code = 200
+    elapsed = datetime.timedelta(0)
+
+    def __init__(self, choices):
+        self.choices = choices
+
+    def json(self):
+        return {"choices": [{"message": {"content": c}} for c in self.choices], "usage": {"total_tokens": 1}}
+
+
+class FakeStream(object):
+    """Streamed answer without a usage field"""
+    status_code = 200
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_lines(self):
+        for index in range(0, len(ANSWER), 8):
+            chunk = {"choices": [{"index": 0, "delta": {"content": ANSWER[index:index + 8]}}]}
+            yield ("data: " + json_module.dumps(chunk)).encode("utf-8")
+        yield b"data: [DONE]"
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.payloads = []
+
+    def post(self, url, headers=None, json=None, timeout=None, stream=False):
+        self.payloads.append(json)
+        return FakeStream() if stream else FakeResponse([ANSWER] * json.get("n", 1))
+
+
+class Journal(object):
+    def __init__(self):
+        self.entries = []
+
+    def record(self, entry):
+        self.entries.append(entry)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    def configure(variants_mode):
+        settings = config.Settings({"OPENROUTER_API_KEY": "sk-or-test", "FLOORPLAN_RESPONSE_CACHE_SIZE": "16",
+                                    "FLOORPLAN_VARIANTS_MODE": variants_mode})
+        monkeypatch.setattr(config, "get_settings", lambda: settings)
+        monkeypatch.setattr(response_cache, "_cache", None)
+        session, journal = FakeSession(), Journal()
+        monkeypatch.setattr(floor_plan_service, "get_http_session", lambda: session)
+        monkeypatch.setattr(request_journal, "get_journal", lambda: journal)
+        return session, journal
+    return configure
+
+
+@pytest.mark.parametrize("variants_mode", ["prompt", "n"])
+@pytest.mark.parametrize("variants", [1, 3])
+def test_warmed_entries_answer_the_same_request(upstream, variants_mode, variants):
+    session, journal = upstream(variants_mode)
+    floor_plan_service.generate_floor_plan(BOUNDARY, "two bedrooms", use_pool=False, variants=variants)
+    assert len(session.payloads) == 1
+    (entry,) = journal.entries
+    assert entry["request"]["variants"] == variants
+    assert entry["upstream"]["max_tokens"] == session.payloads[0]["max_tokens"]
+
+    response_cache.get_cache().clear()
+    count, success, _ = floor_plan_service.warm_response_cache(journal.entries)
+    assert (count, success) == (1, True)
+    floor_plan_service.generate_floor_plan(BOUNDARY, "two bedrooms", use_pool=False, variants=variants)
+    assert len(session.payloads) == 1
+    assert journal.entries[-1]["upstream"]["cached"] is True
+
+
+def test_multi_variant_entries_do_not_answer_single_requests(upstream):
+    session, journal = upstream("n")
+    floor_plan_service.generate_floor_plan(BOUNDARY, "two bedrooms", use_pool=False, variants=3)
+    response_cache.get_cache().clear()
+    floor_plan_service.warm_response_cache(journal.entries)
+    floor_plan_service.generate_floor_plan(BOUNDARY, "two bedrooms", use_pool=False)
+    assert len(session.payloads) == 2
+
+
+def test_streams_without_usage_count_no_tokens(upstream):
+    session, journal = upstream("prompt")
+    completion = metrics.LLM_TOKENS.value(direction="completion", mode="stream")
+    missing = metrics.LLM_USAGE_MISSING.value(mode="stream") or 0
+    list(floor_plan_service.generate_floor_plan_stream(BOUNDARY, "two bedrooms"))
+    assert len(session.payloads) == 1
+    assert metrics.LLM_TOKENS.value(direction="completion", mode="stream") == completion
+    assert metrics.LLM_USAGE_MISSING.value(mode="stream") == missing + 1
+    assert journal.entries[-1]["upstream"]["usage"] is None
+    assert response_cache.get_cache().get(session.payloads[0])["usage"] is None
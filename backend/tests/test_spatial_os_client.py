@@ -0,0 +1,128 @@
+import gzip
+import json
+import time
+import threading
+import contextlib
+
+import pytest
+
+import mock_spatial_os
+from app.services import spatial_os_client
+from app.services.spatial_os_client import SpatialOSClient
+
+
+@contextlib.contextmanager
+def mock_service(**options):
+    """Run mock_spatial_os on a free port, yield (url, stats)"""
+    options.setdefault("latency_ms", 5)
+    options.setdefault("jitter_ms", 0)
+    app = mock_spatial_os.create_mock_app(seed=0, **options)
+    server = mock_spatial_os.make_mock_server(app)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}", app.config["MOCK_STATS"]
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def apartments(count, missing_split=()):
+    return [{"id": f"apt-{i}", "name": f"Unit {i}"} if i in missing_split else
+            {"id": f"apt-{i}", "name": f"Unit {i}", "split": {"name": "root", "area": 50.0, "final": True}}
+            for i in range(count)]
+
+
+def test_connections_are_pooled():
+    with mock_service(batch=False) as (url, stats):
+        with SpatialOSClient(url, max_workers=4, backoff=0.01) as client:
+            results = client.send_many(apartments(40))
+    assert all(r["success"] for r in results)
+    assert stats["requests"] == 40
+    # One keep-alive connection per worker at most, not one per apartment
+    assert stats["connections"] <= 4
+
+
+def test_bodies_are_gzipped():
+    with mock_service() as (url, stats):
+        with SpatialOSClient(url) as client:
+            body, headers = client._encode({"id": "apt-0"})
+            result = client.send(apartments(1)[0])
+    assert headers == {"Content-Encoding": "gzip"}
+    assert json.loads(gzip.decompress(body)) == {"id": "apt-0"}
+    assert result["success"] and result["attempts"] == 1
+    assert stats["gzip"] == 1
+
+
+def test_gzip_rejected_falls_back_to_plain_json():
+    with mock_service(accept_gzip=False) as (url, stats):
+        with SpatialOSClient(url, backoff=0.01) as client:
+            first = client.send(apartments(1)[0])
+            second = client.send(apartments(2)[1], index=1)
+    assert first["success"] and first["attempts"] == 2
+    # Later requests go out uncompressed straight away
+    assert second["success"] and second["attempts"] == 1
+    assert client.gzip_body is False
+
+
+def test_transient_errors_are_retried_with_backoff():
+    with mock_service(fail_first=2) as (url, stats):
+        with SpatialOSClient(url, retries=3, backoff=0.05) as client:
+            start = time.perf_counter()
+            result = client.send(apartments(1)[0])
+            elapsed = time.perf_counter() - start
+    assert result["success"] and result["attempts"] == 3
+    assert stats["errors"] == 2
+    # Two waits of at least half of 0.05 s and 0.1 s (jitter scales them by 0.5-1)
+    assert elapsed >= 0.075
+
+
+def test_retries_give_up_with_the_last_error():
+    with mock_service(fail_first=10) as (url, stats):
+        with SpatialOSClient(url, retries=2, backoff=0.01) as client:
+            result = client.send(apartments(1)[0])
+    assert not result["success"]
+    assert result["attempts"] == 3 and stats["requests"] == 3
+    assert result["status_code"] == 503 and result["error"] == "HTTP 503"
+
+
+def test_throttling_honors_retry_after():
+    with mock_service(throttle_rate=0.5) as (url, stats):
+        with SpatialOSClient(url, retries=10, backoff=5.0) as client:
+            start = time.perf_counter()
+            results = client.send_many(apartments(6))
+            elapsed = time.perf_counter() - start
+    assert all(r["success"] for r in results)
+    assert stats["throttled"] > 0
+    # Waits follow the service's 0.05 s Retry-After instead of the 5 s backoff
+    assert elapsed < 2.0
+
+
+def test_backoff_grows_exponentially_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(spatial_os_client.random, "random", lambda: 1.0)
+    client = SpatialOSClient(backoff=0.5, max_backoff=3.0)
+    assert [client._delay(attempt) for attempt in range(5)] == [0.5, 1.0, 2.0, 3.0, 3.0]
+    client.close()
+
+
+def test_batches_report_per_item_results():
+    with mock_service() as (url, stats):
+        with SpatialOSClient(url, batch_size=4) as client:
+            results = client.send_many(apartments(10, missing_split={3, 7}))
+    assert stats["requests"] == 3
+    assert [r["index"] for r in results] == list(range(10))
+    assert [r["success"] for r in results] == [i not in (3, 7) for i in range(10)]
+    assert results[3]["error"] == "Apartment needs a split tree"
+    assert results[0]["response"]["data"]["id"] == "apt-0"
+
+
+def test_missing_batch_endpoint_falls_back_to_single_requests():
+    with mock_service(batch=False) as (url, stats):
+        with SpatialOSClient(url, batch_size=4) as client:
+            results = client.send_many(apartments(5, missing_split={2}))
+            assert client.batch_supported is False
+    assert [r["success"] for r in results] == [True, True, False, True, True]
+    assert results[2]["status_code"] == 400
+    # The two chunks got 404 without reaching the mock, then one request per apartment
+    assert stats["requests"] == 5
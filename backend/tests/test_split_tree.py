@@ -0,0 +1,92 @@
+import math
+import copy
+
+import pytest
+
+from app import create_app
+from app.services import split_tree
+
+RECT = {"x": 0, "y": 0, "width": 10, "height": 8}
+
+
+def binary_tree():
+    return {"name": "root", "area": 80, "angle": math.pi / 2, "children": [
+        {"name": "living", "area": 40, "final": True},
+        {"name": "rest", "area": 40, "angle": 0, "children": [
+            {"name": "bed", "area": 20, "final": True},
+            {"name": "bath", "area": 20, "final": True},
+        ]},
+    ]}
+
+
+def wide_tree(count=12):
+    """Root split into count rooms side by side"""
+    return {"name": "root", "area": 10.0 * count, "angle": math.pi / 2,
+            "children": [{"name": f"room{i}", "area": 10.0, "final": True} for i in range(count)]}
+
+
+def test_child_paths_never_collide():
+    root = wide_tree()
+    root["children"][1] = {"name": "pair", "area": 10.0, "angle": 0, "children": [
+        {"name": f"sub{i}", "area": 1.0, "final": True} for i in range(11)]}
+    layout = split_tree.SplitLayout(root, RECT)
+    # root[1][0] (child 0 of child 1) and root[10] (child 10) are different nodes
+    assert layout.node("root[1][0]")["name"] == "sub0"
+    assert layout.node("root[10]")["name"] == "room10"
+    assert len(layout.nodes) == 1 + 12 + 11
+
+
+def test_merge_only_touches_its_own_subtree():
+    root = wide_tree()
+    root["children"][1] = {"name": "pair", "area": 10.0, "angle": 0, "children": [
+        {"name": "a", "area": 5.0, "final": True}, {"name": "b", "area": 5.0, "final": True}]}
+    result, success, message = split_tree.edit_floor_plan(root, [{"op": "merge", "path": "root[1]"}], rect=RECT)
+    assert success, message
+    names = [room["name"] for room in result["rooms"]]
+    assert names == ["room0", "pair"] + [f"room{i}" for i in range(2, 12)]
+    assert "root[10]" in result["layout"]
+
+
+@pytest.mark.parametrize("operations, error", [
+    (["swap"], "Each operation must be an object"),
+    ([{"op": "swap", "path": 3}], "path must be a string"),
+    ([{"op": "rename", "name": ["living"], "new_name": "x"}], "name must be a string"),
+    ([{"op": "move_partition", "path": "root", "ratio": "half"}], None),
+])
+def test_malformed_operations_are_rejected(operations, error):
+    result, success, message = split_tree.edit_floor_plan(binary_tree(), operations, rect=RECT)
+    assert not success and result is None
+    if error:
+        assert error in message
+
+
+def test_edit_endpoint_returns_400_for_malformed_input():
+    client = create_app().test_client()
+    for body in ({"split": binary_tree(), "operations": ["swap"], "rect": RECT},
+                 {"split": binary_tree(), "operations": [{"op": "swap", "path": None, "name": 1}], "rect": RECT},
+                 {"split": binary_tree(), "operations": [], "boundary_data": ["not a shape"]},
+                 {"split": binary_tree(), "operations": [], "rect": [0, 0, 10, 8]}):
+        response = client.post("/api/edit-floor-plan", json=body)
+        assert response.status_code == 400, response.get_json()
+        assert "detail" not in response.get_json()
+
+
+def test_layout_follows_the_submitted_tree():
+    client = create_app().test_client()
+    first = client.post("/api/edit-floor-plan", json={
+        "split": binary_tree(), "rect": RECT,
+        "operations": [{"op": "move_partition", "path": "root", "ratio": 0.25}]}).get_json()
+    assert first["layout"]["rootL"]["width"] == pytest.approx(2.5)
+    # A stale layout sent along with another tree is not used for the new tree's rooms
+    response = client.post("/api/edit-floor-plan", json={
+        "split": binary_tree(), "rect": RECT, "layout": first["layout"], "operations": []}).get_json()
+    living = next(room for room in response["rooms"] if room["name"] == "living")
+    assert living["width"] == pytest.approx(5.0)
+
+
+def test_edits_do_not_modify_the_request_tree():
+    root = binary_tree()
+    before = copy.deepcopy(root)
+    result, success, _ = split_tree.edit_floor_plan(root, [{"op": "swap", "path": "rootR"}], rect=RECT)
+    assert success and root == before
+    assert [room["name"] for room in result["rooms"]] == ["living", "bath", "bed"]
@@ -0,0 +1,18 @@
+import benchmark_startup
+
+# Cold starts measured; the median absorbs one slow run on a busy machine
+RUNS = 3
+
+
+def test_cold_start_stays_within_budget():
+    runs = [benchmark_startup.measure_startup() for _ in range(RUNS)]
+    startup_ms = benchmark_startup.median([run["import_ms"] + run["create_app_ms"] for run in runs])
+    assert startup_ms <= benchmark_startup.DEFAULT_BUDGET_MS, \
+        f"import + create_app() took {startup_ms:.1f} ms, budget {benchmark_startup.DEFAULT_BUDGET_MS} ms"
+    assert all(run["status"] == 200 for run in runs)
+
+
+def test_create_app_defers_heavy_modules():
+    loaded = set(benchmark_startup.measure_startup()["modules"])
+    forbidden = benchmark_startup.DEFAULT_FORBIDDEN.split(",")
+    assert [module for module in forbidden if module in loaded] == []
@@ -0,0 +1,26 @@
+import json
+
+from app.services import config, tracing
+
+
+def test_tracing_is_off_by_default():
+    assert config.Settings({}).tracing is False
+
+
+def test_spans_are_written_by_the_background_writer(tmp_path, monkeypatch):
+    trace_file = tmp_path / "traces.jsonl"
+    settings = config.Settings({"FLOORPLAN_TRACING": "1", "FLOORPLAN_TRACE_FILE": str(trace_file)})
+    monkeypatch.setattr(config, "get_settings", lambda: settings)
+    tracing.shutdown_export()
+    try:
+        root = tracing.start_trace("request")
+        with tracing.activate(root):
+            with tracing.span("stage", mode="generate"):
+                pass
+        root.end()
+    finally:
+        # Stopping the writer writes out what is still queued
+        tracing.shutdown_export()
+    spans = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    assert [span["name"] for span in spans] == ["stage", "request"]
+    assert spans[0]["parentSpanId"] == spans[1]["spanId"]
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Summarize the span file written by app/services/tracing.py: the slowest traces with their
+critical path, and per-stage timing statistics over all traces.
+
+Usage: python trace_summary.py [logs/traces.jsonl] [--top 10] [--name generate-floor-plan-stream]
+                               [--no-rotated] [--json]
+"""
+
+import os
+import sys
+import glob
+import json
+import math
+import argparse
+import datetime
+
+from app.services.config import DEFAULT_TRACE_FILE
+
+# Clock readings of parent and child spans may disagree by this much (ns)
+END_TOLERANCE_NS = 1000000
+
+
+def load_spans(path, rotated=True):
+    """Spans from the trace file and, optionally, its rotated backups (oldest first)"""
+    paths = [path]
+    if rotated:
+        backups = glob.glob(glob.escape(path) + ".*")
+        backups = [p for p in backups if p.rsplit(".", 1)[1].isdigit()]
+        paths = sorted(backups, key=lambda p: int(p.rsplit(".", 1)[1]), reverse=True) + paths
+    spans = []
+    for p in paths:
+        if not os.path.exists(p):
+            continue
+        with open(p, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    span = json.loads(line)
+                except ValueError:
+                    continue
+                span["start"] = int(span["startTimeUnixNano"])
+                span["end"] = int(span["endTimeUnixNano"])
+                spans.append(span)
+    return spans
+
+
+def group_traces(spans):
+    """
+    Returns:
+    - Dict trace id -> {"root", "spans", "children"}; the root is the span whose parent is
+      not part of the trace (the caller's span for propagated traces)
+    """
+    traces = {}
+    for span in spans:
+        traces.setdefault(span["traceId"], []).append(span)
+    result = {}
+    for trace_id, trace_spans in traces.items():
+        ids = {s["spanId"] for s in trace_spans}
+        roots = [s for s in trace_spans if s.get("parentSpanId") not in ids]
+        children = {}
+        for s in trace_spans:
+            if s not in roots:
+                children.setdefault(s["parentSpanId"], []).append(s)
+        root = max(roots, key=lambda s: s["end"] - s["start"])
+        result[trace_id] = {"root": root, "spans": trace_spans, "children": children}
+    return result
+
+
+def critical_path(span, children, depth=0):
+    """
+    Spans that determine when `span` finishes: walking back from its end, the child that ends
+    last, then the child that ends last before that one started, and so on, recursively
+
+    Returns:
+    - List of (depth, span) in chronological order
+    """
+    chain = []
+    cursor = span["end"] + END_TOLERANCE_NS
+    for child in sorted(children.get(span["spanId"], []), key=lambda c: c["end"], reverse=True):
+        if child["end"] <= cursor:
+            chain.append(child)
+            cursor = child["start"] + END_TOLERANCE_NS
+    path = [(depth, span)]
+    for child in reversed(chain):
+        path.extend(critical_path(child, children, depth + 1))
+    return path
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(1, int(math.ceil(pct / 100.0 * len(ordered)))) - 1]
+
+
+def stage_stats(spans):
+    durations = {}
+    for span in spans:
+        durations.setdefault(span["name"], []).append((span["end"] - span["start"]) / 1e6)
+    stats = []
+    for name, values in durations.items():
+        stats.append({
+            "name": name,
+            "count": len(values),
+            "mean_ms": sum(values) / len(values),
+            "p50_ms": percentile(values, 50),
+            "p95_ms": percentile(values, 95),
+            "max_ms": max(values),
+        })
+    return sorted(stats, key=lambda s: s["mean_ms"] * s["count"], reverse=True)
+
+
+def duration_ms(span):
+    return (span["end"] - span["start"]) / 1e6
+
+
+def summarize(traces, top):
+    slowest = sorted(traces.items(), key=lambda item: duration_ms(item[1]["root"]), reverse=True)[:top]
+    result = []
+    for trace_id, trace in slowest:
+        root = trace["root"]
+        total = duration_ms(root) or 1.0
+        result.append({
+            "trace_id": trace_id,
+            "name": root["name"],
+            "start": datetime.datetime.fromtimestamp(root["start"] / 1e9).isoformat(timespec="seconds"),
+            "duration_ms": duration_ms(root),
+            "status": root.get("status", {}).get("code", "OK"),
+            "spans": len(trace["spans"]),
+            "critical_path": [
+                {
+                    "depth": depth,
+                    "name": span["name"],
+                    "offset_ms": (span["start"] - root["start"]) / 1e6,
+                    "duration_ms": duration_ms(span),
+                    "share": duration_ms(span) / total,
+                    "status": span.get("status", {}).get("code", "OK"),
+                }
+                for depth, span in critical_path(root, trace["children"])
+            ],
+        })
+    return result
+
+
+def print_report(slowest, stats):
+    for trace in slowest:
+        print(f"{trace['trace_id']}  {trace['name']}  {trace['duration_ms']:.1f} ms  "
+              f"{trace['start']}  {trace['status']}  ({trace['spans']} spans)")
+        for step in trace["critical_path"][1:]:
+            status = "" if step["status"] == "OK" else f"  {step['status']}"
+            label = '  ' * (step['depth'] - 1) + step['name']
+            print(f"  {label:<34} +{step['offset_ms']:>9.1f} ms "
+                  f"{step['duration_ms']:>9.1f} ms {step['share']:>6.1%}{status}")
+        print()
+
+    print(f"{'stage':<40} {'count':>6} {'mean':>10} {'p50':>10} {'p95':>10} {'max':>10}")
+    for s in stats:
+        print(f"{s['name'][:40]:<40} {s['count']:>6} {s['mean_ms']:>8.1f}ms {s['p50_ms']:>8.1f}ms "
+              f"{s['p95_ms']:>8.1f}ms {s['max_ms']:>8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize traced requests: slowest traces and critical paths")
+    parser.add_argument("trace_file", nargs="?", default=os.environ.get("FLOORPLAN_TRACE_FILE", DEFAULT_TRACE_FILE))
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest traces to show")
+    parser.add_argument("--name", help="Only traces whose root span name contains this text")
+    parser.add_argument("--no-rotated", action="store_true", help="Ignore rotated backup files")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    spans = load_spans(args.trace_file, rotated=not args.no_rotated)
+    traces = group_traces(spans)
+    if args.name:
+        traces = {k: v for k, v in traces.items() if args.name in v["root"]["name"]}
+    if not traces:
+        print(f"No traces found in {args.trace_file}")
+        return 1
+
+    slowest = summarize(traces, args.top)
+    stats = stage_stats([span for trace in traces.values() for span in trace["spans"]])
+    if args.json:
+        print(json.dumps({"traces": len(traces), "slowest": slowest, "stages": stats}, indent=2))
+    else:
+        print(f"{len(traces)} trace(s), {len(spans)} span(s)\n")
+        print_report(slowest, stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())